@@ -1,56 +1,123 @@
-#!/usr/bin/python
-import numpy as np
-import pandas as pd
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# Copyright (c) 2017 Interstellar Technologies Inc. All Rights Reserved.
+# ==============================================================================
+# Extended outputs (make_extend_output_mc.py) of all the cases of a mission.
+#
+# The cases are no longer extended by one "python make_extend_output_mc.py"
+# per case: the trajectories are read from the campaign store in batches of
+# cases, every worker of the pool imports the libraries and makes its Geod
+# once, and the extended columns of every dynamics_<k> body are written back
+# to the store as the body dynamics_<k>_extend (the columns of dynamics_<k>
+# and the ones added by make_extend_output_mc.py, as the _extend.csv files).
+#
+# extend.json (optional):
+# {
+#     "antenna LLH[deg,deg,m]": [42.5039248, 143.44954216, 25.0],
+#     "IIP cut-off time[s]": 2.0,
+#     "stations": [{"name": "Taiki", "LLH[deg,deg,m]": [42.5039248, 143.44954216, 25.0]}],
+#     "kepler IIP(bool)": false,
+#     "batch size": 64,
+#     "csv output(bool)": true
+# }
+# "stations" (optional, see ground_station.py) adds the per station columns.
+# "kepler IIP(bool)" adds the Keplerian IIP of every row (iip.kepler_IIP).
+# "csv output(bool)" (default true) also writes
+# caseNNNNN_<suffix>_dynamics_<k>_extend.csv to raw/output for the tools
+# reading the csv files (stat_datapoint_extend.py, stat_covariance_extend.py).
+#
+# usage: python apply_extend_output_mc.py (mission_name) [extend.json]
+import sys
 import os
 import json
-import sys
+import shutil
 import multiprocessing as mp
+import numpy as np
+import pandas as pd
+from pyproj import Geod
+import campaign_store
+import coordinate_transform
+from ground_station import parse_stations
+from make_extend_output_mc import extend_columns
+
+# 源泉: MOMO 地上局アンテナゲイン UHF (make_extend_output_mc.py と同じ)
+default_antenna_LLH = [42.5039248, 143.44954216, 25.0]
+default_cutoff_time = 2.0
+
+
+def _init_worker():
+    # one Geod of the worker for all its batches
+    coordinate_transform.g = Geod(ellps='WGS84')
+
+
+def extend_batch(arg):
+    """
+    extended columns of the cases [start, stop) (case index) of the body, runs on the pool
+    Returns:
+        start, stop and the OrderedDict of the added columns of the rows of the cases
+    """
+    [store_dir, body, start, stop, antenna_LLH, cutoff_time, stations, kepler] = arg
+    store = campaign_store.CampaignStore(store_dir)
+    offsets = store.offsets(body)
+    r0, r1 = offsets[start], offsets[stop]
+    columns = store.columns(body)
+    values = np.empty((r1 - r0, len(columns)), dtype=np.float64)
+    for j, c in enumerate(columns):
+        values[:, j] = store.column(body, c)[r0:r1]
+    attitude_elevation = values[:, columns.index("attitude_elevation(deg)")]
+    return start, stop, extend_columns(values, attitude_elevation, np.asarray(antenna_LLH, dtype=np.float64),
+                                       cutoff_time, stations, kepler)
+
+
+def extend_body(store, body, antenna_LLH, cutoff_time, stations=None, kepler=False, pool=None, batch=64):
+    """
+    Args:
+        store (CampaignStore) : campaign store
+        body (str) : dynamics_<k>
+        antenna_LLH (list) : antenna lat, lon, alt [deg, deg, m]
+        cutoff_time (float) : engine cut-off time for the IIP radius [s]
+        stations (tuple) : names and LLH of the ground stations (ground_station.parse_stations) or None
+        kepler (bool) : also add the Keplerian IIP
+        pool (multiprocessing.Pool) : workers made with _init_worker, None to run in this process
+        batch (int) : number of cases of a batch
+    Returns:
+        name of the extended body, None if the body has no rows
+    """
+    cases = store.cases(body)
+    offsets = store.offsets(body)
+    if len(cases) == 0 or offsets[-1] == 0:
+        return None
+    args = [(store.store_dir, body, k, min(k + batch, len(cases)), antenna_LLH, cutoff_time, stations, kepler)
+            for k in range(0, len(cases), batch)]
+    imap = pool.imap_unordered if pool is not None else map
+    added = None
+    for start, stop, data in imap(extend_batch, args):
+        if added is None:
+            added = {name: np.empty(int(offsets[-1]), dtype=np.float64) for name in data}
+        for name, value in data.items():
+            added[name][offsets[start]:offsets[stop]] = value
+
+    name = body + "_extend"
+    shutil.rmtree(os.path.join(store.store_dir, name), ignore_errors=True)
+    data = {c: store.column(body, c) for c in store.columns(body)}
+    data.update(added)
+    store.add_columns(name, cases, offsets, data)
+    return name
+
+
+def write_csv(store, body, suffix, directory):
+    """ caseNNNNN_<suffix>_<body>.csv of every case of the body """
+    os.makedirs(directory, exist_ok=True)
+    columns = store.columns(body)
+    offsets = store.offsets(body)
+    for k, caseNo in enumerate(store.cases(body)):
+        df = pd.DataFrame({c: store.column(body, c)[offsets[k]:offsets[k + 1]] for c in columns}, columns=columns)
+        df.to_csv(os.path.join(directory, "case{0:05d}_{1:s}_{2:s}.csv".format(int(caseNo), suffix, body)),
+                  index=False)
 
-def apply_extend(arg):
-    [id_proc, Nproc, input_directory, input_file_template, output_file_template, number_of_sample, nominalfile, suffix] = arg
-
-    shou  = int((number_of_sample + 1) / Nproc)
-    amari = number_of_sample + 1 - shou * Nproc
-    start_index = shou *  id_proc      + min(amari, id_proc)
-    end_index   = shou * (id_proc + 1) + min(amari, id_proc + 1)
-
-    for i in range(start_index, end_index):
-        caseNo = i
-        if id_proc == 0: print("{0:}/{1:}".format(caseNo, end_index))
-
-        # make filename
-        input_file  = input_file_template.format(caseNo)
-        output_file = output_file_template.format(caseNo)
-        os.system("aws s3 cp "+ input_directory + input_file + " output/ > /dev/null")
-        #os.system("cp data/"+filename+" .") ######## FOR DEBUG########################
-
-        # load nominal json
-        fp = open(nominalfile)
-        data = json.load(fp)
-        fp.close()
-
-        # modify json
-        data["name(str)"] = "case{0:05d}_{1:s}".format(caseNo, suffix)
-
-        # writeout json
-        tmpjson = "tmp_{}.json".format(id_proc)
-        fo = open(tmpjson, "w")
-        json.dump(data, fo, indent=4)
-        fo.close()
-
-        os.system("python make_extend_output_mc.py {} > /dev/null".format(tmpjson))
-
-        os.system("aws s3 cp output/" + output_file + " " + input_directory + "  > /dev/null")
-
-      
-        # remove temporary csv
-        os.system("rm {}".format(tmpjson))
-        os.system("rm output/{}".format(input_file))
-        os.system("rm output/{}".format(output_file))
 
 if __name__ == "__main__":
-    #Nproc = 1
-    Nproc = mp.cpu_count()-1
+    Nproc = max(mp.cpu_count() - 1, 1)
 
     print("IST EXTEND APPLYER")
     print("libraries load done.")
@@ -59,26 +126,50 @@ if __name__ == "__main__":
     if len(argv) > 1:
         otmc_mission_name = argv[1]
     else:
-        print "PLEASE INPUT mission_name as the command line argument."
+        print("PLEASE INPUT mission_name as the command line argument.")
         exit()
+    missionpath = campaign_store.mission_path(otmc_mission_name)
 
-    os.system("aws s3 cp s3://otmc/{0:s}/raw/inp/mc.json .".format(otmc_mission_name))
-
-    fp = open("mc.json")
-    data = json.load(fp)
-    fp.close()
-
-    number_of_sample     = data["Ntask"]
-    nominalfile          = data["nominalfile"]
-    suffix               = data["suffix"]
-    input_directory      = "s3://otmc/" + otmc_mission_name + "/raw/output/"
-    input_file_template  = "case{0:05d}"+"_{0:s}_dynamics_1.csv".format(suffix)
-    output_file_template = "case{0:05d}"+"_{0:s}_dynamics_1_extend.csv".format(suffix)
-
-    os.system("aws s3 cp s3://otmc/{0:s}/raw/inp/".format(otmc_mission_name) + nominalfile + " .")
-
-    # parallel processing 
-    pool = mp.Pool(Nproc)
-    callback = pool.map(apply_extend, [(id_proc, Nproc, input_directory, input_file_template, output_file_template, number_of_sample, nominalfile, suffix) for id_proc in range(Nproc)])
-    pool.terminate()
-    pool.close()
+    if len(argv) > 2:
+        stat_input = argv[2]
+    else:
+        stat_input = "extend.json"
+        campaign_store.fetch(missionpath + "/stat/inp/extend.json", stat_input)
+    stat = {}
+    if os.path.exists(stat_input):
+        with open(stat_input) as fp:
+            stat = json.load(fp)
+    antenna_LLH = stat.get("antenna LLH[deg,deg,m]", default_antenna_LLH)
+    cutoff_time = float(stat.get("IIP cut-off time[s]", default_cutoff_time))
+    stations = parse_stations(stat["stations"]) if "stations" in stat else None
+    kepler = stat.get("kepler IIP(bool)", False)
+    batch = int(stat.get("batch size", 64))
+    csv_output = stat.get("csv output(bool)", True)
+
+    campaign_store.fetch(missionpath + "/raw/inp/mc.json", "mc.json")
+    with open("mc.json") as fp:
+        suffix = json.load(fp)["suffix"]
+    store = campaign_store.open_store(otmc_mission_name, "store", Nproc)
+
+    # only the files of this run are uploaded
+    shutil.rmtree("extend_csv", ignore_errors=True)
+    pool = mp.Pool(Nproc, initializer=_init_worker) if Nproc > 1 else None
+    for body in store.bodies:
+        if not body.startswith("dynamics_") or body.count("_") != 1:
+            continue
+        name = extend_body(store, body, antenna_LLH, cutoff_time, stations, kepler, pool, batch)
+        if name is None:
+            print("{0:s}: no rows, skipped".format(body))
+            continue
+        print("{0:s}: {1:d} cases extended".format(name, len(store.cases(name))))
+        if csv_output:
+            write_csv(store, name, suffix, "extend_csv")
+    if pool is not None:
+        pool.close()
+        pool.join()
+
+    if csv_output:
+        if missionpath.startswith("s3://"):
+            os.system("aws s3 cp extend_csv/ " + missionpath + "/raw/output/ --recursive > /dev/null")
+        else:
+            os.system("cp extend_csv/*.csv " + missionpath + "/raw/output/")
@@ -0,0 +1,521 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# Copyright (c) 2017 Interstellar Technologies Inc. All Rights Reserved.
+# ==============================================================================
+# Batched ballistic propagator for dumping products and debris.
+#
+# Thousands of 3DoF ballistic bodies are advanced in lockstep by a fixed step
+# RK4. The state is held as a structure of arrays (6, N) of ECI position and
+# velocity, and the bodies which hit the ground are dropped from the active
+# set. The models are the ones of the C++ engine (free_flight_ballistic):
+#   atmosphere : U.S. standard atmosphere 1976 with the density variation
+#                (variation ratio [%] or air density variation file)
+#   gravity    : WGS84 with J2 (barC20)
+#   wind       : const wind or wind file, linear in altitude
+#   drag       : dynamic pressure / ballistic coefficient against the air velocity
+# Each body starts at its separation time from the state of its parent
+# trajectory (cubic Hermite of pos/vel/acc_ECI of the output rows) with the
+# additional speed in the NED frame, as the engine does at the dump.
+#
+# The dumping products of every case (stage "dumping product" of the case
+# json) are written to the campaign store as the dynamics_<k>_dump bodies, and
+# the debris of ballistic.json as the bodies of their names. The last row of a
+# body is the impact point, interpolated to the ground.
+#
+# ballistic.json (optional):
+# {
+#     "integration step[s]": 0.5,
+#     "debris": [{"name": "fairing", "parent": "dynamics_1", "separation time[s]": 120.0,
+#                 "mass[kg]": 20.0, "ballistic coefficient[kg/m2]": 50.0,
+#                 "additional speed at separation NED[m/s,m/s,m/s]": [0.0, 3.0, 0.0]}]
+# }
+#
+# output/ballistic_impact.csv (impact point of every body and case) is written.
+#
+# usage: python ballistic.py (mission_name) [ballistic.json]
+import sys
+import os
+import json
+import shutil
+import multiprocessing as mp
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+import campaign_store
+from coordinate_transform import wgs84, omega_engine, posLLH, posECEF, posECEF_from_LLH, dcmECI2ECEF, dcmECEF2NED
+
+# WGS84 (coordinate_transform.py); the earth rotates at the rate of the C++
+# engine, which wrote the parent states
+re_a, re_b, e2, ed2 = wgs84.re_a, wgs84.re_b, wgs84.e2, wgs84.ed2
+mu = 3.986004418e14
+barC20 = -0.484165371736e-3
+omega_earth = omega_engine
+
+# U.S. standard atmosphere 1976 (air.hpp)
+g_air = 9.80655
+gamma_air = 1.4
+R_air = 287.0531
+HAL = np.array([0, 11000, 20000, 32000, 47000, 51000, 71000, 84852], dtype=np.float64)
+LR = np.array([-0.0065, 0.0, 0.001, 0.0028, 0, -0.0028, -0.002, 0.0])
+T0 = np.array([288.15, 216.65, 216.65, 228.65, 270.65, 270.65, 214.65, 186.95])
+P0 = np.array([101325, 22632, 5474.9, 868.02, 110.91, 66.939, 3.9564, 0.3734])
+
+# density variation [%] vs altitude [m] (U.S. standard atmosphere PART2 2.1.4)
+variation_minus = ([1010, 4300, 8030, 10220, 16360, 20300, 26220, 29950, 40250, 50110, 59970, 70270, 80140, 90220],
+                   [21.6, 7.4, -1.3, -14.3, -15.9, -18.6, -32.1, -38.6, -50.0, -55.3, -65.0, -68.1, -76.7, -42.2])
+variation_plus = ([1230, 4300, 8030, 10000, 16360, 20300, 26220, 29950, 40250, 50110, 59970, 70270, 80360, 90880],
+                  [-12.8, -7.9, 1.5, 5.3, 26.7, 20.2, 14.3, 18.2, 33.6, 47.4, 59.5, 72.2, 58.7, 41.4])
+
+
+def standard_atmosphere(altitude):
+    """ temperature [K], speed of sound [m/s], pressure [Pa] and density [kg/m3] """
+    k = np.clip(np.searchsorted(HAL, altitude, side="right") - 1, 0, len(HAL) - 1)
+    h = altitude - HAL[k]
+    temperature = T0[k] + LR[k] * h
+    lapse = LR[k] != 0.0
+    lr = np.where(lapse, LR[k], 1.0)
+    with np.errstate(invalid="ignore", over="ignore"):
+        pressure = np.where(lapse, P0[k] * (temperature / T0[k]) ** (g_air / -lr / R_air),
+                            P0[k] * np.exp(g_air / R_air * -h / T0[k]))
+    return temperature, np.sqrt(temperature * gamma_air * R_air), pressure, pressure / R_air / temperature
+
+
+def gravity_eci(x, y, z):
+    """ gravity acceleration [m/s2] in the ECI frame, the same as gravity.cpp """
+    r = np.sqrt(x * x + y * y + z * z)
+    r_inv = np.where(r > 0.0, 1.0 / np.where(r > 0.0, r, 1.0), 0.0)
+    irx, iry, irz = x * r_inv, y * r_inv, z * r_inv
+    barP20 = np.sqrt(5.0) * (3.0 * irz * irz - 1.0) * 0.5
+    barP20d = np.sqrt(5.0) * 3.0 * irz
+    r = np.maximum(r, re_b)  # under the ground
+    ar2 = (re_a / r) ** 2
+    g_ir = -mu / (r * r) * (1.0 + barC20 * ar2 * (3.0 * barP20 + irz * barP20d))
+    g_iz = mu / (r * r) * ar2 * barC20 * barP20d
+    return g_ir * irx, g_ir * iry, g_ir * irz + g_iz
+
+
+def altitude_eci(pos, t):
+    """ altitude [m] of the ECI positions (3, n) at the times [s] """
+    return posLLH(posECEF(dcmECI2ECEF(t, omega_earth), pos.T), bitwise=False)[:, 2]
+
+
+class Profile:
+    """
+    Piecewise linear profiles vs altitude, one for every body, constant outside
+    of their altitude range (interp_matrix). The distinct profiles are sampled
+    on the union of their altitudes, where the interpolation is still exact.
+    Args:
+        profiles (list) : (altitude array, value array) of every body
+    """
+    def __init__(self, profiles):
+        keys = {}
+        index = []
+        for altitude, value in profiles:
+            altitude = np.atleast_1d(np.asarray(altitude, dtype=np.float64))
+            value = np.atleast_1d(np.asarray(value, dtype=np.float64))
+            key = (altitude.tobytes(), value.tobytes())
+            if key not in keys:
+                keys[key] = (len(keys), altitude, value)
+            index.append(keys[key][0])
+        self.index = np.array(index, dtype=np.int64)
+        unique = sorted(keys.values(), key=lambda v: v[0])
+        self.grid = np.unique(np.concatenate([altitude for i, altitude, value in unique]))
+        self.table = np.array([np.interp(self.grid, altitude, value) for i, altitude, value in unique])
+
+    def __call__(self, altitude, body):
+        """ values at the altitudes [m] of the bodies (index of the profiles) """
+        M = len(self.grid)
+        if M == 1:
+            return self.table[self.index[body], 0]
+        i = np.clip(np.searchsorted(self.grid, altitude, side="right") - 1, 0, M - 2)
+        g0, g1 = self.grid[i], self.grid[i + 1]
+        w = np.clip((altitude - g0) / (g1 - g0), 0.0, 1.0)
+        flat = self.index[body] * M + i
+        v0, v1 = self.table.ravel()[flat], self.table.ravel()[flat + 1]
+        return v0 + w * (v1 - v0)
+
+    def take(self, body):
+        """ Profile of the bodies (index array) only, the table is shared """
+        part = Profile.__new__(Profile)
+        part.index, part.grid, part.table = self.index[body], self.grid, self.table
+        return part
+
+
+class Environment:
+    """
+    Wind and air density variation of every body, from the case jsons
+    Args:
+        settings (list) : input json (dict) of the case of every body
+        directory (str) : directory of the wind / air density variation files
+    """
+    def __init__(self, settings, directory="."):
+        files = {}
+
+        def load(name, columns):
+            if name not in files:
+                df = pd.read_csv(os.path.join(directory, name), index_col=False)
+                df.columns = [c.strip() for c in df.columns]
+                files[name] = [df[c].to_numpy(dtype=np.float64) for c in columns]
+            return files[name]
+
+        wind_u, wind_v, density = [], [], []
+        for s in settings:
+            wind = s["wind"]
+            if wind["wind file exist?(bool)"]:
+                altitude, speed, direction = load(wind["wind file name(str)"],
+                                                  ["altitude[m]", "wind_speed[m/s]", "direction[deg]"])
+            else:
+                altitude = 0.0
+                speed, direction = wind["const wind[m/s,deg]"]
+            wind_u.append((altitude, -np.asarray(speed) * np.sin(np.deg2rad(direction))))
+            wind_v.append((altitude, -np.asarray(speed) * np.cos(np.deg2rad(direction))))
+
+            calc = s["calculate condition"]
+            percent = calc.get("variation ratio of air density[%](-100to100, default=0)", 0.0) or 0.0
+            if calc.get("air density variation file exist?(bool)", False):
+                altitude, variation = load(calc["air density variation file name(str)"],
+                                           ["altitude[m]", "air density variation[percent]"])
+                density.append((altitude, variation / 100.0))
+            elif percent == 0.0:
+                density.append((0.0, 0.0))
+            else:
+                altitude, variation = variation_minus if percent < 0 else variation_plus
+                density.append((altitude, np.asarray(variation) / 100.0 * abs(percent) / 100.0))
+        self.wind_u = Profile(wind_u)
+        self.wind_v = Profile(wind_v)
+        self.density_coef = Profile(density)
+
+    def take(self, body):
+        """ Environment of the bodies (index array) only """
+        part = Environment.__new__(Environment)
+        part.wind_u, part.wind_v, part.density_coef = self.wind_u.take(body), self.wind_v.take(body), self.density_coef.take(body)
+        return part
+
+    def wind_ned(self, altitude, body):
+        """ north, east wind [m/s] (the air moves to this direction) """
+        return self.wind_v(altitude, body), self.wind_u(altitude, body)
+
+    def air(self, altitude, body):
+        """ speed of sound [m/s] and density [kg/m3] with the density variation """
+        temperature, airspeed, pressure, density = standard_atmosphere(altitude)
+        return airspeed, density * (1.0 + self.density_coef(altitude, body))
+
+
+def derivative(t, state, body, ballistic_coef, env, full=False):
+    """
+    Args:
+        t (array) : (n,) time [s] of the bodies
+        state (array) : (6, n) ECI position [m] and velocity [m/s]
+        body (array) : (n,) index of the bodies
+        ballistic_coef (array) : ballistic coefficient [kg/m2] of all the bodies
+        env (Environment)
+        full (bool) : also return the intermediate values of the output columns
+    Returns:
+        (6, n) time derivative of the state (not stopped under the ground,
+        the landing is found by propagate)
+    """
+    x, y, z, vx, vy, vz = state
+    # coordinate_transformのdcmECI2ECEF, posLLH, dcmECEF2NEDを展開したもの
+    # (the rotations share the sines and cosines, lon from the ECEF position)
+    c, s = np.cos(omega_earth * t), np.sin(omega_earth * t)
+    xe, ye = c * x + s * y, -s * x + c * y
+    p = np.sqrt(xe * xe + ye * ye)
+    theta = np.arctan2(z * re_a, p * re_b)
+    lat = np.arctan2(z + ed2 * re_b * np.sin(theta) ** 3, p - e2 * re_a * np.cos(theta) ** 3)
+    sa, ca = np.sin(lat), np.cos(lat)
+    p_inv = 1.0 / np.where(p > 0.0, p, 1.0)
+    co, so = np.where(p > 0.0, xe * p_inv, 1.0), ye * p_inv
+    altitude = p / ca - re_a / np.sqrt(1.0 - e2 * sa * sa)
+    # velocity relative to the ground in the NED frame
+    ux, uy = vx + omega_earth * y, vy - omega_earth * x
+    ue, ve = c * ux + s * uy, -s * ux + c * uy
+    vn = -sa * co * ue - sa * so * ve + ca * vz
+    veast = -so * ue + co * ve
+    vd = -ca * co * ue - ca * so * ve - sa * vz
+    wind_n, wind_e = env.wind_ned(altitude, body)
+    an, ae = vn - wind_n, veast - wind_e
+    v_air = np.sqrt(an * an + ae * ae + vd * vd)
+    airspeed, density = env.air(altitude, body)
+    dynamic_pressure = 0.5 * density * v_air * v_air
+    f = np.where(v_air > 0.0, -dynamic_pressure / ballistic_coef[body] / np.where(v_air > 0.0, v_air, 1.0), 0.0)
+    fn, fe, fd = f * an, f * ae, f * vd
+    fxe = -sa * co * fn - so * fe - ca * co * fd
+    fye = -sa * so * fn + co * fe - ca * so * fd
+    fz = ca * fn - sa * fd
+    gx, gy, gz = gravity_eci(x, y, z)
+    dstate = np.stack([vx, vy, vz, c * fxe - s * fye + gx, s * fxe + c * fye + gy, fz + gz])
+    if full:
+        return dstate, OrderedDict([("lat(deg)", np.rad2deg(lat)), ("lon(deg)", np.rad2deg(np.arctan2(ye, xe))),
+                                    ("altitude(m)", altitude),
+                                    ("vel_NED", (vn, veast, vd)), ("Mach number", v_air / airspeed),
+                                    ("dynamic pressure(Pa)", dynamic_pressure),
+                                    ("wind", (wind_n, wind_e)), ("ECEF", (xe, ye, z))])
+    return dstate
+
+
+def propagate(t0, pos, vel, ballistic_coef, env, t_end, step=0.5, output_step=1.0):
+    """
+    Args:
+        t0 (array) : (N,) start time [s] of the bodies
+        pos, vel (array) : (N, 3) ECI position [m] and velocity [m/s] at t0
+        ballistic_coef (array) : (N,) [kg/m2]
+        env (Environment) : of the N bodies
+        t_end (array) : (N,) end time [s] of the calculation
+        step (float) : integration step [s]
+        output_step (float) : output interval [s], a multiple of the step
+    Returns:
+        dict of the output rows ordered by body then time ("body", "time(s)",
+        "state" (6, rows)) and the "impact" time [s] of the bodies (nan if not landed)
+    """
+    N = len(t0)
+    t0 = np.asarray(t0, dtype=np.float64)
+    t_end = np.broadcast_to(np.asarray(t_end, dtype=np.float64), (N,))
+    ballistic_coef = np.broadcast_to(np.asarray(ballistic_coef, dtype=np.float64), (N,))
+    every = max(int(round(output_step / step)), 1)
+    state = np.concatenate([np.asarray(pos, dtype=np.float64), np.asarray(vel, dtype=np.float64)], axis=1).T.copy()
+    active = np.arange(N)
+    altitude = altitude_eci(state[:3], t0)
+    impact = np.full(N, np.nan)
+    rows_body, rows_time, rows_state = [active], [t0], [state]
+
+    n = 0
+    while len(active) > 0:
+        n += 1
+        t = t0[active] + (n - 1) * step
+        h = np.minimum(step, t_end[active] - t)
+        k1 = derivative(t, state, active, ballistic_coef, env)
+        k2 = derivative(t + 0.5 * h, state + 0.5 * h * k1, active, ballistic_coef, env)
+        k3 = derivative(t + 0.5 * h, state + 0.5 * h * k2, active, ballistic_coef, env)
+        k4 = derivative(t + h, state + h * k3, active, ballistic_coef, env)
+        new = state + h / 6.0 * (k1 + 2.0 * k2 + 2.0 * k3 + k4)
+        t_new = t + h
+        altitude_new = altitude_eci(new[:3], t_new)
+
+        # impact point interpolated to the ground between the steps
+        landed = altitude_new < 0.0
+        if np.any(landed):
+            w = altitude[landed] / (altitude[landed] - altitude_new[landed])
+            impact[active[landed]] = t[landed] + w * h[landed]
+            rows_body.append(active[landed])
+            rows_time.append(impact[active[landed]])
+            rows_state.append(state[:, landed] + w * (new[:, landed] - state[:, landed]))
+        ended = landed | (t_new >= t_end[active] - 1e-9)
+        output = ~landed & ((n % every == 0) | ended)
+        if np.any(output):
+            rows_body.append(active[output])
+            rows_time.append(t_new[output])
+            rows_state.append(new[:, output])
+        keep = ~ended
+        active, state, altitude = active[keep], new[:, keep], altitude_new[keep]
+
+    body = np.concatenate(rows_body)
+    time = np.concatenate(rows_time)
+    order = np.lexsort((time, body))
+    return {"body": body[order], "time(s)": time[order],
+            "state": np.concatenate(rows_state, axis=1)[:, order], "impact": impact}
+
+
+def output_columns(result, ballistic_coef, env, mass=None, launch_llh=None):
+    """
+    Returns:
+        OrderedDict of the columns (the names of the engine output) of all the rows
+    """
+    body, time, state = result["body"], result["time(s)"], result["state"]
+    ballistic_coef = np.broadcast_to(np.asarray(ballistic_coef, dtype=np.float64), (body.max() + 1,))
+    dstate, v = derivative(time, state, body, ballistic_coef, env, full=True)
+    columns = OrderedDict([("time(s)", time)])
+    if mass is not None:
+        columns["mass(kg)"] = np.asarray(mass, dtype=np.float64)[body]
+    for name in ["lat(deg)", "lon(deg)", "altitude(m)"]:
+        columns[name] = v[name]
+    for j, name in enumerate(["pos_ECI_X(m)", "pos_ECI_Y(m)", "pos_ECI_Z(m)",
+                              "vel_ECI_X(m/s)", "vel_ECI_Y(m/s)", "vel_ECI_Z(m/s)"]):
+        columns[name] = state[j]
+    for j, name in enumerate(["vel_NED_X(m/s)", "vel_NED_Y(m/s)", "vel_NED_Z(m/s)"]):
+        columns[name] = v["vel_NED"][j]
+    for j, name in enumerate(["acc_ECI_X(m/s2)", "acc_ECI_Y(m/s2)", "acc_ECI_Z(m/s2)"]):
+        columns[name] = dstate[3 + j]
+    columns["Mach number"] = v["Mach number"]
+    columns["dynamic pressure(Pa)"] = v["dynamic pressure(Pa)"]
+    wind_n, wind_e = v["wind"]
+    columns["wind speed(m/s)"] = np.hypot(wind_n, wind_e)
+    columns["wind direction(deg)"] = np.rad2deg(np.arctan2(-wind_e, -wind_n)) % 360.0
+    if launch_llh is not None:
+        launch = posECEF_from_LLH(np.asarray(launch_llh, dtype=np.float64)).T[:, body]
+        ecef = np.stack(v["ECEF"])
+        cosine = np.sum(launch * ecef, axis=0) / np.linalg.norm(launch, axis=0) / np.linalg.norm(ecef, axis=0)
+        columns["downrange(m)"] = re_a * np.arccos(np.clip(cosine, -1.0, 1.0))
+    return columns
+
+
+def parent_state(store, body, case_index, t):
+    """
+    Args:
+        store (CampaignStore)
+        body (str) : parent body
+        case_index (array) : index (not caseNo) of the case of every child
+        t (array) : separation time [s] of every child
+    Returns:
+        (n, 3) ECI position, velocity by the cubic Hermite of the output rows,
+        nan if t is outside of the parent trajectory
+    """
+    offsets = store.offsets(body)
+    time = np.asarray(store.column(body, "time(s)"))
+    names = [[a + "_ECI_" + x + u for x in "XYZ"] for a, u in [("pos", "(m)"), ("vel", "(m/s)"), ("acc", "(m/s2)")]]
+    pos, vel, acc = [np.stack([np.asarray(store.column(body, c)) for c in n], axis=1) for n in names]
+    first, last = offsets[case_index], offsets[case_index + 1] - 1
+    i = np.array([f + np.searchsorted(time[f:l + 1], tc, side="right") - 1 for f, l, tc in zip(first, last, t)],
+                 dtype=np.int64)
+    valid = (i >= first) & (t <= time[np.maximum(last, first)]) & (last >= first)
+    i = np.clip(i, first, np.maximum(last - 1, first))
+    j = np.minimum(i + 1, np.maximum(last, first))
+    h = time[j] - time[i]
+    s = np.where(h > 0.0, (t - time[i]) / np.where(h > 0.0, h, 1.0), 0.0)[:, None]
+    h = h[:, None]
+    h00, h10, h01, h11 = 2 * s ** 3 - 3 * s ** 2 + 1, s ** 3 - 2 * s ** 2 + s, -2 * s ** 3 + 3 * s ** 2, s ** 3 - s ** 2
+    p = h00 * pos[i] + h10 * h * vel[i] + h01 * pos[j] + h11 * h * vel[j]
+    v = h00 * vel[i] + h10 * h * acc[i] + h01 * vel[j] + h11 * h * acc[j]
+    p[~valid], v[~valid] = np.nan, np.nan
+    return p, v
+
+
+def separation_state(pos, vel, t, additional_ned):
+    """ ECI velocity plus the additional speed [m/s] (n, 3) in the NED frame at the position """
+    dcmECI2ECEF_ = dcmECI2ECEF(t, omega_earth)
+    dcmNED2ECI_ = np.swapaxes(np.matmul(dcmECEF2NED(posLLH(posECEF(dcmECI2ECEF_, pos))), dcmECI2ECEF_), -1, -2)
+    return vel + np.matmul(dcmNED2ECI_, np.asarray(additional_ned, dtype=np.float64)[..., None])[..., 0]
+
+
+def children(store, body, settings, debris=None):
+    """
+    separation time, mass, ballistic coefficient and additional speed of the
+    child of every case of the parent body: the dumping product of the stage,
+    or the debris of ballistic.json
+    Returns:
+        dict of the case index and the arrays of the cases with a child
+    """
+    cases = store.cases(body)
+    stage = "stage" + body.split("_")[1]
+    rows = []
+    for k, caseNo in enumerate(cases):
+        if debris is not None:
+            d = debris
+            rows.append((k, d["separation time[s]"], d.get("mass[kg]", 0.0), d["ballistic coefficient[kg/m2]"],
+                         d.get("additional speed at separation NED[m/s,m/s,m/s]", [0.0, 0.0, 0.0])))
+            continue
+        d = settings[caseNo].get(stage, {}).get("dumping product", {})
+        if d.get("dumping product exist?(bool)", False):
+            rows.append((k, d["dumping product separation time[s]"], d["dumping product mass[kg]"],
+                         d["dumping product ballistic coefficient[kg/m2]"],
+                         d["additional speed at dumping NED[m/s,m/s,m/s]"]))
+    return {"case index": np.array([r[0] for r in rows], dtype=np.int64),
+            "time(s)": np.array([r[1] for r in rows], dtype=np.float64),
+            "mass(kg)": np.array([r[2] for r in rows], dtype=np.float64),
+            "ballistic coefficient": np.array([r[3] for r in rows], dtype=np.float64),
+            "additional speed NED": np.array([r[4] for r in rows], dtype=np.float64).reshape(-1, 3)}
+
+
+def fly_children(store, body, child, settings, inp_dir, step):
+    """
+    propagate the children of the parent body
+    Returns:
+        caseNo, offsets, columns and impact time of the children,
+        None if no separation time is on the parent trajectory
+    """
+    cases = store.cases(body)[child["case index"]]
+    case_settings = [settings[c] for c in cases]
+    pos, vel = parent_state(store, body, child["case index"], child["time(s)"])
+    vel = separation_state(pos, vel, child["time(s)"], child["additional speed NED"])
+    valid = np.all(np.isfinite(pos), axis=1)
+    if not np.any(valid):
+        return None
+    cases, pos, vel = cases[valid], pos[valid], vel[valid]
+    case_settings = [s for s, v in zip(case_settings, valid) if v]
+    t0 = child["time(s)"][valid]
+    beta = child["ballistic coefficient"][valid]
+    env = Environment(case_settings, inp_dir)
+    t_end = np.array([s["calculate condition"]["end time[s]"] for s in case_settings], dtype=np.float64)
+    output_step = case_settings[0]["calculate condition"]["time step for output[s]"]
+    result = propagate(t0, pos, vel, beta, env, t_end, step, output_step)
+    launch = np.array([s["launch"]["position LLH[deg,deg,m]"] for s in case_settings], dtype=np.float64)
+    columns = output_columns(result, beta, env, child["mass(kg)"][valid], launch)
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(result["body"], minlength=len(cases)))])
+    return cases, offsets, columns, result["impact"]
+
+
+if __name__ == "__main__":
+    Nproc = max(mp.cpu_count() - 1, 1)
+
+    print("IST BALLISTIC PROPAGATOR")
+    print("libraries load done.")
+
+    argv = sys.argv
+    if len(argv) > 1:
+        otmc_mission_name = argv[1]
+    else:
+        print("PLEASE INPUT mission_name as the command line argument.")
+        exit()
+    missionpath = campaign_store.mission_path(otmc_mission_name)
+
+    if len(argv) > 2:
+        stat_input = argv[2]
+    else:
+        stat_input = "ballistic.json"
+        campaign_store.fetch(missionpath + "/stat/inp/ballistic.json", stat_input)
+    stat = {}
+    if os.path.exists(stat_input):
+        with open(stat_input) as fp:
+            stat = json.load(fp)
+    step = stat.get("integration step[s]", 0.5)
+
+    # input json of every case and the wind / air density files of raw/inp
+    campaign_store.fetch(missionpath + "/raw/inp/mc.json", "mc.json")
+    with open("mc.json") as fp:
+        suffix = json.load(fp)["suffix"]
+    campaign_store.fetch(missionpath + "/raw/output/", "raw_json", ["case*_" + suffix + ".json"])
+    if missionpath.startswith("s3://"):
+        inp_dir = "raw_inp"
+        campaign_store.fetch(missionpath + "/raw/inp/", inp_dir, ["*"])
+    else:
+        inp_dir = missionpath + "/raw/inp"
+    settings = {}
+    for f in sorted(os.listdir("raw_json")):
+        if f.startswith("case") and f.endswith("_" + suffix + ".json"):
+            with open(os.path.join("raw_json", f)) as fp:
+                settings[int(f[4:9])] = json.load(fp)
+
+    os.makedirs("output", exist_ok=True)
+    store = campaign_store.open_store(otmc_mission_name, "store", Nproc)
+    jobs = [(b + "_dump", b, None) for b in store.bodies if b.count("_") == 1]
+    jobs += [(d["name"], d["parent"], d) for d in stat.get("debris", [])]
+    impacts = []
+    for name, parent, debris in jobs:
+        child = children(store, parent, settings, debris)
+        if len(child["case index"]) == 0:
+            continue
+        flown = fly_children(store, parent, child, settings, inp_dir, step)
+        if flown is None:
+            print("{0:s}: separation time is out of {1:s}".format(name, parent))
+            continue
+        cases, offsets, columns, impact = flown
+        shutil.rmtree(os.path.join(store.store_dir, name), ignore_errors=True)
+        store.add_columns(name, cases, offsets, columns)
+        last = offsets[1:] - 1
+        impacts.append(pd.DataFrame(OrderedDict([
+            ("body", name), ("caseNo", cases), ("impact time(s)", impact),
+            ("lat(deg)", np.where(np.isfinite(impact), columns["lat(deg)"][last], np.nan)),
+            ("lon(deg)", np.where(np.isfinite(impact), columns["lon(deg)"][last], np.nan)),
+            ("impact speed(m/s)", np.where(np.isfinite(impact), np.sqrt(
+                sum(columns[c][last] ** 2 for c in ["vel_NED_X(m/s)", "vel_NED_Y(m/s)", "vel_NED_Z(m/s)"])), np.nan))])))
+        print("{0:s}: {1:d} cases, {2:d} landed".format(name, len(cases), int(np.count_nonzero(np.isfinite(impact)))))
+
+    outputfile = "output/ballistic_impact.csv"
+    if len(impacts) > 0:
+        pd.concat(impacts, ignore_index=True).to_csv(outputfile, index=False)
+    else:
+        pd.DataFrame(columns=["body", "caseNo", "impact time(s)", "lat(deg)", "lon(deg)",
+                              "impact speed(m/s)"]).to_csv(outputfile, index=False)
+    if missionpath.startswith("s3://"):
+        os.system("aws s3 cp " + outputfile + " " + missionpath + "/stat/output/")
+    else:
+        os.system("cp " + outputfile + " " + missionpath + "/stat/output/")
@@ -0,0 +1,333 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2017 Interstellar Technologies Inc. All Rights Reserved.
+# ==============================================================================
+# Columnar campaign store.
+#
+# All case outputs of a Monte Carlo mission (raw/output/caseNNNNN_<suffix>_*.csv)
+# are ingested once into one directory per body (dynamics_1, dynamics_1_dump,
+# dynamics_1_extend, ...). Every column is one .npy file of the rows of all
+# cases concatenated in case order, so the statistics tools read only the
+# columns they need with numpy memory maps instead of parsing every csv.
+#
+#   <store>/<body>/columns.json  : column name -> npy file name
+#   <store>/<body>/cases.npy     : caseNo of each case
+#   <store>/<body>/offsets.npy   : first row of each case (len = Ncase + 1)
+#   <store>/<body>/c000.npy ...  : column data
+#   <store>/events.csv           : event tables of all cases (event_table.py)
+#   <store>/meta.json            : mission path and suffix the store was built from
+#
+# open_store returns an existing store only if it was built from the same
+# mission and suffix; otherwise the directory is removed and built again, so
+# that a tool run for another mission in the same working directory does not
+# read the cases of the former one.
+# usage: python campaign_store.py (mission_name or mission directory) [store directory]
+import sys
+import os
+import re
+import json
+import shutil
+import multiprocessing as mp
+import numpy as np
+import pandas as pd
+import event_table
+
+
+def mission_path(mission):
+    """ local mission directory as it is, otherwise the otmc bucket on s3 """
+    if os.path.isdir(mission):
+        return mission.rstrip("/")
+    return "s3://otmc/" + mission
+
+
+def fetch(src, dst, recursive_include=None):
+    """
+    Args:
+        src (str) : s3://... or local path
+        dst (str) : local path
+        recursive_include (list) : copy the directory src recursively with these --include patterns
+    Returns:
+        True if the copy succeeded
+    """
+    if src.startswith("s3://"):
+        cmd = "aws s3 cp " + src + " " + dst
+        if recursive_include is not None:
+            cmd += " --recursive --exclude '*'" + "".join(" --include '" + p + "'" for p in recursive_include)
+        return os.system(cmd + " > /dev/null") == 0
+    if recursive_include is not None:
+        os.makedirs(dst, exist_ok=True)
+        return os.system("cp " + " ".join(os.path.join(src, p) for p in recursive_include) + " " + dst + " 2> /dev/null") == 0
+    return os.system("cp " + src + " " + dst) == 0
+
+
+def read_case_csv(filename):
+    df = pd.read_csv(filename, index_col=False)
+    return df.apply(pd.to_numeric, errors="coerce")
+
+
+def _count_rows(filename):
+    with open(filename) as fp:
+        return max(sum(1 for line in fp if line.strip() != "") - 1, 0)
+
+
+def build_store(input_directory, suffix, store_dir, Nproc=1, mission=None):
+    """
+    Args:
+        input_directory (str) : local directory with caseNNNNN_<suffix>_*.csv
+        suffix (str) : "suffix" of mc.json
+        store_dir (str) : output store directory
+        Nproc (int) : number of csv reader processes
+        mission (str) : mission path written to meta.json (the input directory if None)
+    Returns:
+        CampaignStore
+    """
+    pattern = re.compile(r"^case(\d{5})_" + re.escape(suffix) + r"_(dynamics_\d+(?:_dump)?(?:_extend)?)\.csv$")
+    files = {}
+    for f in sorted(os.listdir(input_directory)):
+        m = pattern.match(f)
+        if m:
+            files.setdefault(m.group(2), []).append((int(m.group(1)), os.path.join(input_directory, f)))
+
+    pool = mp.Pool(Nproc) if Nproc > 1 else None
+    imap = pool.imap if pool is not None else map
+    for body, case_files in files.items():
+        # pass 1: row count of each case to allocate the columns
+        counts = np.array(list(imap(_count_rows, [f for caseNo, f in case_files])), dtype=np.int64)
+        keep = counts > 0
+        case_files = [cf for cf, k in zip(case_files, keep) if k]
+        counts = counts[keep]
+        if len(case_files) == 0:
+            continue
+        offsets = np.concatenate([[0], np.cumsum(counts)])
+        columns = list(read_case_csv(case_files[0][1]).columns)
+
+        body_dir = os.path.join(store_dir, body)
+        os.makedirs(body_dir, exist_ok=True)
+        column_files = {c: "c{0:03d}.npy".format(j) for j, c in enumerate(columns)}
+        arrays = {c: np.lib.format.open_memmap(os.path.join(body_dir, column_files[c]), mode="w+",
+                                               dtype=np.float64, shape=(int(offsets[-1]),))
+                  for c in columns}
+        # pass 2: fill the columns case by case
+        for j, df in enumerate(imap(read_case_csv, [f for caseNo, f in case_files])):
+            n = min(len(df), counts[j])
+            for c in columns:
+                arrays[c][offsets[j]:offsets[j] + n] = df[c].to_numpy()[:n] if c in df else np.nan
+                arrays[c][offsets[j] + n:offsets[j + 1]] = np.nan
+        for c in columns:
+            arrays[c].flush()
+        np.save(os.path.join(body_dir, "cases.npy"), np.array([caseNo for caseNo, f in case_files]))
+        np.save(os.path.join(body_dir, "offsets.npy"), offsets)
+        with open(os.path.join(body_dir, "columns.json"), "w") as fo:
+            json.dump(column_files, fo, indent=4)
+        print("stored {0:s}: {1:d} cases, {2:d} rows".format(body, len(case_files), int(offsets[-1])))
+
+    # event tables made by monte_carlo.py, detected here for the older campaigns
+    pattern = re.compile(r"^case(\d{5})_" + re.escape(suffix) + r"_events\.csv$")
+    tables = []
+    for f in sorted(os.listdir(input_directory)):
+        m = pattern.match(f)
+        if m:
+            table = pd.read_csv(os.path.join(input_directory, f), index_col=False)
+            table.insert(0, "caseNo", int(m.group(1)))
+            tables.append(table)
+    if len(tables) == 0:
+        for caseNo, f in files.get("dynamics_1", []):
+            events = event_table.detect_events(read_case_csv(f))
+            tables.append(pd.DataFrame({"caseNo": caseNo, "body": "dynamics_1",
+                                        "event": [e[0] for e in events],
+                                        "occurrence": [e[1] for e in events],
+                                        "row": [e[2] for e in events]}))
+    if len(tables) > 0:
+        pd.concat(tables, ignore_index=True).to_csv(os.path.join(store_dir, "events.csv"), index=False)
+
+    if pool is not None:
+        pool.close()
+        pool.join()
+    os.makedirs(store_dir, exist_ok=True)
+    with open(os.path.join(store_dir, "meta.json"), "w") as fo:
+        json.dump({"mission": mission if mission is not None else os.path.abspath(input_directory),
+                   "suffix": suffix}, fo, indent=4)
+    return CampaignStore(store_dir)
+
+
+class CampaignStore:
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        self._columns = {}
+        self._events = None
+
+    @property
+    def meta(self):
+        """ mission path and suffix of meta.json, empty for a store without it """
+        path = os.path.join(self.store_dir, "meta.json")
+        if not os.path.exists(path):
+            return {}
+        with open(path) as fp:
+            return json.load(fp)
+
+    @property
+    def bodies(self):
+        return sorted(b for b in os.listdir(self.store_dir)
+                      if os.path.exists(os.path.join(self.store_dir, b, "columns.json")))
+
+    def columns(self, body):
+        if body not in self._columns:
+            with open(os.path.join(self.store_dir, body, "columns.json")) as fp:
+                self._columns[body] = json.load(fp)
+        return list(self._columns[body].keys())
+
+    def column(self, body, name):
+        """ memory mapped column of all cases of the body """
+        self.columns(body)
+        return np.load(os.path.join(self.store_dir, body, self._columns[body][name]), mmap_mode="r")
+
+    def cases(self, body):
+        return np.load(os.path.join(self.store_dir, body, "cases.npy"))
+
+    def offsets(self, body):
+        return np.load(os.path.join(self.store_dir, body, "offsets.npy"))
+
+    def case_index(self, body):
+        """ index (0 ... Ncase-1) of the case of every row """
+        offsets = self.offsets(body)
+        return np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+
+    def resample(self, body, names, time_grid, start=0, stop=None):
+        """
+        Args:
+            body (str) : body of the store
+            names (list) : column names
+            time_grid (array) : common time grid [s]
+            start, stop (int) : range of the case index (not caseNo)
+        Returns:
+            array (Ncase, Ntime, Ncolumn) linearly interpolated on the grid,
+            nan outside of the time range of each case
+        """
+        offsets = self.offsets(body)
+        stop = len(offsets) - 1 if stop is None else min(stop, len(offsets) - 1)
+        offsets = offsets[start:stop + 1]
+        r0, r1 = offsets[0], offsets[-1]
+        lengths = np.diff(offsets)
+        first = offsets[:-1] - r0
+        last = offsets[1:] - r0 - 1
+        time_grid = np.asarray(time_grid, dtype=np.float64)
+        time = np.asarray(self.column(body, "time(s)")[r0:r1])
+
+        # all cases are searched at once on time shifted by case index * span
+        tmin = min(time.min(), time_grid.min())
+        span = max(time.max(), time_grid.max()) - tmin + 1.0
+        key = (time - tmin) + np.repeat(np.arange(len(lengths)), lengths) * span
+        query = (time_grid[None, :] - tmin) + np.arange(len(lengths))[:, None] * span
+        i0 = np.searchsorted(key, query, side="right") - 1
+        valid = (i0 >= first[:, None]) & (time_grid[None, :] <= time[last][:, None])
+        i0 = np.clip(i0, first[:, None], last[:, None])
+        i1 = np.minimum(i0 + 1, last[:, None])
+        t0, t1 = time[i0], time[i1]
+        w = np.where(t1 > t0, (time_grid[None, :] - t0) / np.where(t1 > t0, t1 - t0, 1.0), 0.0)
+
+        out = np.full((len(lengths), len(time_grid), len(names)), np.nan)
+        for j, name in enumerate(names):
+            x = np.asarray(self.column(body, name)[r0:r1])
+            value = np.where(w == 0.0, x[i0], x[i0] + w * (x[i1] - x[i0]))
+            out[:, :, j] = np.where(valid, value, np.nan)
+        return out
+
+    @property
+    def events(self):
+        if self._events is None:
+            filename = os.path.join(self.store_dir, "events.csv")
+            if os.path.exists(filename):
+                self._events = pd.read_csv(filename, index_col=False)
+            else:
+                self._events = pd.DataFrame(columns=["caseNo", "body", "event", "occurrence", "row"])
+        return self._events
+
+    def event_rows(self, body, event, occurrence=1):
+        """
+        Returns:
+            global row index of the event for every case of the body, -1 if the case has no such event
+        """
+        if event in event_table.EVENT_ALIAS:
+            event, occurrence = event_table.EVENT_ALIAS[event]
+        events = self.events
+        # events of the extended outputs are the ones of the original trajectory
+        source = body.replace("_extend", "")
+        hit = events[(events["body"] == source) & (events["event"] == event) & (events["occurrence"] == occurrence)]
+        cases = self.cases(body)
+        offsets = self.offsets(body)
+        rows = np.full(len(cases), -1, dtype=np.int64)
+        index = np.searchsorted(cases, hit["caseNo"].to_numpy())
+        valid = (index < len(cases))
+        valid[valid] = cases[index[valid]] == hit["caseNo"].to_numpy()[valid]
+        rows[index[valid]] = offsets[index[valid]] + hit["row"].to_numpy()[valid]
+        return rows
+
+    def add_columns(self, body, cases, offsets, data):
+        """
+        Args:
+            body (str) : body to write (e.g. "dynamics_1_extend")
+            cases (array) : caseNo of each case
+            offsets (array) : first row of each case (len = Ncase + 1)
+            data (dict) : column name -> array of all rows
+        """
+        body_dir = os.path.join(self.store_dir, body)
+        os.makedirs(body_dir, exist_ok=True)
+        column_files = {}
+        if os.path.exists(os.path.join(body_dir, "columns.json")):
+            if not np.array_equal(np.load(os.path.join(body_dir, "offsets.npy")), offsets):
+                raise ValueError("row layout of {0:s} does not match the store".format(body))
+            with open(os.path.join(body_dir, "columns.json")) as fp:
+                column_files = json.load(fp)
+        for name, value in data.items():
+            if name not in column_files:
+                column_files[name] = "c{0:03d}.npy".format(len(column_files))
+            np.save(os.path.join(body_dir, column_files[name]), np.asarray(value, dtype=np.float64))
+        np.save(os.path.join(body_dir, "cases.npy"), np.asarray(cases))
+        np.save(os.path.join(body_dir, "offsets.npy"), np.asarray(offsets))
+        with open(os.path.join(body_dir, "columns.json"), "w") as fo:
+            json.dump(column_files, fo, indent=4)
+        self._columns.pop(body, None)
+
+
+def open_store(mission, store_dir="store", Nproc=1):
+    """
+    open the local store of the mission, ingest raw/output first if there is none
+    or if it was built from another mission or suffix
+    """
+    missionpath = mission_path(mission)
+    if not missionpath.startswith("s3://"):
+        missionpath = os.path.abspath(missionpath)
+    fetch(missionpath + "/raw/inp/mc.json", "mc.json")
+    with open("mc.json") as fp:
+        suffix = json.load(fp)["suffix"]
+    if os.path.isdir(store_dir):
+        store = CampaignStore(store_dir)
+        if store.meta == {"mission": missionpath, "suffix": suffix} and len(store.bodies) > 0:
+            return store
+        print("store {0:s} was built from {1:}, rebuilt for {2:s}".format(
+            store_dir, store.meta.get("mission", "an unknown mission"), missionpath))
+        shutil.rmtree(store_dir)
+    if missionpath.startswith("s3://"):
+        input_directory = "raw_output"
+        fetch(missionpath + "/raw/output/", input_directory,
+              ["case*_" + suffix + "_dynamics_*.csv", "case*_" + suffix + "_events.csv"])
+    else:
+        input_directory = missionpath + "/raw/output"
+    return build_store(input_directory, suffix, store_dir, Nproc, missionpath)
+
+
+if __name__ == "__main__":
+    Nproc = max(mp.cpu_count() - 1, 1)
+
+    print("IST CAMPAIGN STORE MAKER")
+
+    argv = sys.argv
+    if len(argv) > 1:
+        otmc_mission_name = argv[1]
+    else:
+        print("PLEASE INPUT mission_name as the command line argument.")
+        exit()
+    store_dir = argv[2] if len(argv) > 2 else "store"
+
+    store = open_store(otmc_mission_name, store_dir, Nproc)
+    for body in store.bodies:
+        print("{0:s}: {1:d} cases, {2:d} columns".format(body, len(store.cases(body)), len(store.columns(body))))
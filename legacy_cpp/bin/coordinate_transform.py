@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2017 Interstellar Technologies Inc. All Rights Reserved.
+# ==============================================================================
+# Geodesy and frame transforms of the post processors.
+#
+# The WGS84 constants and the transforms that make_extend_output.py,
+# make_extend_output_mc.py and make_rfprop.py used to carry each on their own
+# copy. Every function takes a single vector (3,) as before, or a batch:
+#   vectors : (N, 3)     lat, lon, alt [deg, deg, m] / ECI / ECEF / NED [m]
+#   DCMs    : (N, 3, 3)  one matrix per row
+#   time    : (N,)       [s]
+# and the batch gives the same values, bit for bit, as the row by row calls:
+#   DCM products : np.matmul, which calls the BLAS of ndarray.dot per matrix
+#   powers       : libm pow element by element (numpy's array pow may differ
+#                  in the last bit)
+#   LLH          : Bowring's closed form
+#
+# Earth rotation: earth.omega (7.2921159e-5) is the value the python post
+# processors always used, kept so that their outputs do not change;
+# omega_engine (7.292115e-5) is the one of the C++ engine
+# (src/coordinate_transform.cpp). States that are integrated from or compared
+# with the engine ECI output (ballistic.py, the Keplerian IIP of iip.py)
+# rotate the earth with omega_engine, passed to dcmECI2ECEF.
+#
+# usage: from coordinate_transform import posLLH, dcmECEF2NED, ...
+import math
+from collections import namedtuple
+import numpy as np
+from numpy import sin, cos, sqrt, arctan2
+from pyproj import Geod
+
+# 定数の設定
+g = Geod(ellps='WGS84')
+WGS84 = namedtuple('WGS84', ['re_a',  # [m] WGS84の長軸
+                             'eccen1',  # First Eccentricity
+                             'eccen1sqr',  # First Eccentricity squared
+                             'one_f',  # 扁平率fの1/f（平滑度）
+                             're_b',  # [m] WGS84の短軸
+                             'e2',  # 第一離心率eの2乗
+                             'ed2'  # 第二離心率e'の2乗
+                             ])
+wgs84 = WGS84(6378137.0, 8.1819190842622e-2, 6.69437999014e-3, 298.257223563,
+              6356752.314245, 6.6943799901414e-3, 6.739496742276486e-3)
+R_mean = 6371008.8  # [m] WGS84の平均半径 (2a + b) / 3、球面近似の統計処理で使う
+Earth = namedtuple('Earth', ['omega']) # 地球の自転角速度 [rad/s])
+earth = Earth(7.2921159e-5)
+omega_engine = 7.292115e-5  # [rad/s] C++エンジンの地球の自転角速度
+
+deg2rad = lambda deg: deg * np.pi / 180.0
+rad2deg = lambda rad: rad * 180.0 / np.pi
+
+
+def _pow(x, n):
+    # 配列のべき乗は1要素ずつのlibmのpowと最終ビットが異なることがあるため、
+    # 出力を変えないよう要素ごとにmath.powを使う
+    return np.asarray(np.frompyfunc(math.pow, 2, 1)(x, n), dtype=np.float64)
+
+
+def dcmECI2ECEF(second, omega=earth.omega):
+    # 時刻の配列には(N, 3, 3)の配列を返す
+    theta = omega * np.asarray(second)
+    zero = np.zeros_like(theta)
+    one = np.ones_like(theta)
+    dcm = np.stack([np.stack([cos(theta),  sin(theta), zero], axis=-1),
+                    np.stack([-sin(theta), cos(theta), zero], axis=-1),
+                    np.stack([zero,        zero,       one], axis=-1)], axis=-2)
+    return dcm
+
+
+def n_posECEF2LLH(phi_n_deg):
+    return wgs84.re_a / sqrt(1.0 - wgs84.e2 * sin(deg2rad(phi_n_deg)) * sin(deg2rad(phi_n_deg)))
+
+
+def posLLH(posECEF_, bitwise=True):
+    # deg返し、(3,)または(N, 3)
+    # bitwise=Falseは配列のべき乗を使う（速いが最終ビットが行ごとの計算と異なり得る）
+    pow_ = _pow if bitwise else np.power
+    p = sqrt(pow_(posECEF_[..., 0], 2) + pow_(posECEF_[..., 1], 2))
+    theta = arctan2(posECEF_[..., 2] * wgs84.re_a, p * wgs84.re_b) # rad
+    lat = rad2deg(arctan2(posECEF_[..., 2] + wgs84.ed2 * wgs84.re_b * pow_(sin(theta), 3), p - wgs84.e2 * wgs84.re_a * pow_(cos(theta), 3)))
+    lon = rad2deg(arctan2(posECEF_[..., 1], posECEF_[..., 0]))
+    alt = p / cos(deg2rad(lat)) - n_posECEF2LLH(lat)
+    return np.stack([lat, lon, alt], axis=-1)
+
+
+def dcmECEF2NED(posLLH_):
+    lat = deg2rad(posLLH_[..., 0])
+    lon = deg2rad(posLLH_[..., 1])
+    zero = np.zeros_like(lat)
+    dcm = np.stack([np.stack([-sin(lat)*cos(lon), -sin(lat)*sin(lon), cos(lat)], axis=-1),
+                    np.stack([-sin(lon),           cos(lon),          zero], axis=-1),
+                    np.stack([-cos(lat)*cos(lon), -cos(lat)*sin(lon), -sin(lat)], axis=-1)], axis=-2)
+    return dcm
+
+
+def dcmECI2NED(dcmECEF2NED, dcmECI2ECEF):
+    # matmulは行ごとにdotと同じBLASを呼ぶので、結果はdotとビット単位で一致する
+    return np.matmul(dcmECEF2NED, dcmECI2ECEF)
+
+
+def posECEF(dcmECI2ECEF, posECI_):
+    return np.matmul(dcmECI2ECEF, posECI_[..., None])[..., 0]
+
+
+def posECEF_from_LLH(posLLH_):
+    lat = deg2rad(posLLH_[..., 0])
+    lon = deg2rad(posLLH_[..., 1])
+    alt = posLLH_[..., 2]
+    W = sqrt(1.0 - wgs84.e2 * sin(lat) * sin(lat))
+    N = wgs84.re_a / W
+    pos0 = (N + alt) * cos(lat) * cos(lon)
+    pos1 = (N + alt) * cos(lat) * sin(lon)
+    pos2 = (N * (1 - wgs84.e2) + alt) * sin(lat)
+    return np.stack([pos0, pos1, pos2], axis=-1)
+
+
+def posLLH_IIP(t, posECI_, vel_ECEF_NEDframe_):
+    g0 = 9.80665
+    dcmECI2ECEF_ = dcmECI2ECEF(t)
+    posLLH_ = posLLH(posECEF(dcmECI2ECEF_, posECI_))
+    dcmNED2ECI_ = np.swapaxes(dcmECI2NED(dcmECEF2NED(posLLH_), dcmECI2ECEF_), -1, -2)
+    vel_north_ = vel_ECEF_NEDframe_[..., 0]
+    vel_east_ = vel_ECEF_NEDframe_[..., 1]
+    vel_up_ = - vel_ECEF_NEDframe_[..., 2]
+    h = posLLH_[..., 2]
+    tau = 1.0/g0 * (vel_up_ + sqrt(_pow(vel_up_, 2) + 2 * h * g0))
+    dist_IIP_from_now_NED = np.stack([vel_north_ * tau, vel_east_ * tau, -h], axis=-1)
+    posECI_IIP_ = posECI_ + np.matmul(dcmNED2ECI_, dist_IIP_from_now_NED[..., None])[..., 0]
+    posECEF_IIP_ = posECEF(dcmECI2ECEF(t), posECI_IIP_)
+    return posLLH(posECEF_IIP_)
+
+
+def distance_surface(pos0_LLH_, pos1_LLH_):
+    earth_radius = 6378137 # 地球半径 m
+    pos0_ECEF_ = posECEF_from_LLH(pos0_LLH_)
+    pos1_ECEF_ = posECEF_from_LLH(pos1_LLH_)
+    inner = np.matmul(pos0_ECEF_[..., None, :], pos1_ECEF_[..., :, None])[..., 0, 0]
+    theta = np.arccos(inner / np.linalg.norm(pos0_ECEF_, axis=-1) / np.linalg.norm(pos1_ECEF_, axis=-1)) # radius
+    return earth_radius * theta
+
+
+def radius_IIP(t, posECI_, vel_ECEF_NEDframe_, cutoff_time, thrust, weight):
+    delta_vel = thrust / weight * cutoff_time
+    point_IIP = posLLH_IIP(t, posECI_, vel_ECEF_NEDframe_)
+    delta_IIP = posLLH_IIP(t, posECI_, vel_ECEF_NEDframe_ + np.asarray(delta_vel)[..., None] * np.array([1,1,0]))
+    _a, _b, distance_2d = g.inv(point_IIP[..., 1], point_IIP[..., 0], delta_IIP[..., 1], delta_IIP[..., 0])
+    return distance_2d
+
+
+def antenna_param(antenna_LLH_, rocket_LLH_):
+    # アンテナ(3,)または(S, 1, 3)とロケット(N, 3)をブロードキャストして(N,)または(S, N)を返す
+    lon0, lat0, lon1, lat1 = np.broadcast_arrays(antenna_LLH_[..., 1], antenna_LLH_[..., 0], rocket_LLH_[..., 1], rocket_LLH_[..., 0])
+    azimuth, back_azimuth, distance_2d = g.inv(lon0, lat0, lon1, lat1)
+    elevation = np.rad2deg(np.arctan2(rocket_LLH_[..., 2], distance_2d))
+    distance_3d = np.hypot(distance_2d, rocket_LLH_[..., 2])
+    return distance_2d, distance_3d, azimuth, elevation
+
+
+def topocentric(station_LLH_, target_ECEF_):
+    # 局から見た方位角 [deg]、仰角 [deg]、距離 [m]、地球の曲率込み
+    # 局(S, 1, 3)と目標(N, 3)または局(K, 3)と目標(K, 3)をブロードキャスト
+    rel = target_ECEF_ - posECEF_from_LLH(station_LLH_)
+    ned = np.matmul(dcmECEF2NED(station_LLH_), rel[..., None])[..., 0]
+    horizontal = np.hypot(ned[..., 0], ned[..., 1])
+    azimuth = rad2deg(arctan2(ned[..., 1], ned[..., 0])) % 360.0
+    elevation = rad2deg(arctan2(-ned[..., 2], horizontal))
+    return azimuth, elevation, np.hypot(horizontal, ned[..., 2])
+
+
+def radius_visible(altitude, invalid_angle_deg = 3):
+    # ロケットの高度と無効角度を入力して可視範囲の半径を計算
+    # 可視半径 m
+    re = 6378137 # 地球半径 m
+    epsilon = np.deg2rad(invalid_angle_deg)
+    phi = np.arccos(re/(re+altitude) * np.cos(epsilon)) - epsilon
+    return phi * re
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2017 Interstellar Technologies Inc. All Rights Reserved.
+# ==============================================================================
+# Dispersion manifest of a Monte Carlo campaign.
+#
+# Every dispersed parameter of gosa.json (the routes of monte_carlo.py's
+# error_loader) becomes one or more columns, named by the json keys joined
+# with "/", and every case (caseNNNNN_<suffix>.json) one row:
+#   number            : the value
+#   list of numbers   : one column per element, "<name>[i]"
+#   file name (str)   : index of the file in the candidates, "<name>#"
+# New dispersion sets are drawn with the same rules as error_applyer, for
+# all the samples at once.
+#
+# output/dispersion_manifest.csv is written.
+#
+# usage: python dispersion.py (mission_name)
+import sys
+import os
+import json
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+import campaign_store
+from monte_carlo import error_loader, normal_ppf
+
+
+def dispersion_routes(gosa):
+    """ list of (rule, argument, json keys) of the dispersed parameters """
+    return [(rule[0], rule[1], [k for t, k in route]) for rule, route in error_loader(gosa, [])]
+
+
+def lookup(data, keys):
+    for k in keys:
+        data = data[k]
+    return data
+
+
+def candidates(rule, argument):
+    """
+    candidate values of the from_error_files / from_error_directory rules, the files of the
+    directory listed as error_applyer does (load_mission_inputs fetches the directory)
+    """
+    if rule == "from_error_files":
+        return argument
+    if not os.path.isdir(argument):
+        raise ValueError("from_error_directory: " + argument + " is not found")
+    files = [f for f in os.listdir(argument) if not f.startswith(".")]
+    files = sorted(f for f in files if os.path.isfile(os.path.join(argument, f)))
+    if len(files) == 0:
+        raise ValueError("from_error_directory: " + argument + " has no file")
+    return [os.path.join(argument, f) for f in files]
+
+
+def _columns(name, values, choices=None):
+    """ manifest columns of the values of one parameter of all the cases """
+    first = values[0]
+    if isinstance(first, str):
+        choices = list(choices) if choices else sorted(set(values))
+        codes = [choices.index(v) if v in choices else -1 for v in values]
+        return OrderedDict([(name + "#", np.array(codes, dtype=np.float64))])
+    if np.ndim(first) > 0:
+        array = np.array(values, dtype=np.float64).reshape(len(values), -1)
+        return OrderedDict([("{0:s}[{1:d}]".format(name, i), array[:, i]) for i in range(array.shape[1])])
+    return OrderedDict([(name, np.array(values, dtype=np.float64))])
+
+
+def dispersion_manifest(gosa, settings):
+    """
+    Args:
+        gosa (dict) : gosa.json
+        settings (dict) : caseNo -> case json (dict)
+    Returns:
+        DataFrame of the dispersed parameters, index caseNo
+    """
+    cases = sorted(settings.keys())
+    columns = OrderedDict()
+    for rule, argument, keys in dispersion_routes(gosa):
+        values = [lookup(settings[c], keys) for c in cases]
+        choices = candidates(rule, argument) if rule in ("from_error_files", "from_error_directory") else None
+        columns.update(_columns("/".join(keys), values, choices))
+    return pd.DataFrame(columns, index=pd.Index(cases, name="caseNo"))
+
+
+def sample_dispersions(gosa, nominal, N, seed=None):
+    """
+    Args:
+        gosa (dict) : gosa.json
+        nominal (dict) : nominal json
+        N (int) : number of the samples
+        seed (int) : random seed
+    Returns:
+        DataFrame of N dispersion sets with the columns of the manifest
+    """
+    rng = np.random.default_rng(seed)
+    columns = OrderedDict()
+    for rule, argument, keys in dispersion_routes(gosa):
+        name = "/".join(keys)
+        value = lookup(nominal, keys)
+        if rule == "multiply_statistically":
+            columns.update(_columns(name, value * (1.0 + rng.normal(0.0, argument / 3.0, N))))
+        elif rule == "add_statistically":
+            columns.update(_columns(name, value + rng.normal(0.0, argument / 3.0, N)))
+        else:
+            choices = candidates(rule, argument)
+            index = (rng.random(N) * len(choices)).astype(np.int64)
+            if len(choices) > 0 and isinstance(choices[0], str):
+                columns[name + "#"] = index.astype(np.float64)
+            else:
+                columns.update(_columns(name, np.asarray(choices, dtype=np.float64)[index]))
+    return pd.DataFrame(columns)
+
+
+def dispersion_values(gosa, nominal, U):
+    """
+    Args:
+        gosa (dict) : gosa.json
+        nominal (dict) : nominal json
+        U (array) : (N, Nroute) uniform random numbers of a sampling plan (monte_carlo.saltelli_plan)
+    Returns:
+        DataFrame of the N dispersion sets made by error_applyer from the random numbers
+    """
+    columns = OrderedDict()
+    for j, (rule, argument, keys) in enumerate(dispersion_routes(gosa)):
+        name = "/".join(keys)
+        value = lookup(nominal, keys)
+        if rule == "multiply_statistically":
+            columns.update(_columns(name, value * (1.0 + argument / 3.0 * normal_ppf(U[:, j]))))
+        elif rule == "add_statistically":
+            columns.update(_columns(name, value + argument / 3.0 * normal_ppf(U[:, j])))
+        else:
+            choices = candidates(rule, argument)
+            index = (U[:, j] * len(choices)).astype(np.int64)
+            if len(choices) > 0 and isinstance(choices[0], str):
+                columns[name + "#"] = index.astype(np.float64)
+            else:
+                columns.update(_columns(name, np.asarray(choices, dtype=np.float64)[index]))
+    return pd.DataFrame(columns)
+
+
+def load_case_settings(missionpath, suffix, directory="raw_json"):
+    """ caseNo -> input json (dict) of every case of raw/output """
+    campaign_store.fetch(missionpath + "/raw/output/", directory, ["case*_" + suffix + ".json"])
+    settings = {}
+    for f in sorted(os.listdir(directory)):
+        if f.startswith("case") and f.endswith("_" + suffix + ".json"):
+            with open(os.path.join(directory, f)) as fp:
+                settings[int(f[4:9])] = json.load(fp)
+    return settings
+
+
+def load_mission_inputs(missionpath):
+    """ mc.json, gosa json and nominal json of raw/inp, and the directories of from_error_directory """
+    campaign_store.fetch(missionpath + "/raw/inp/mc.json", "mc.json")
+    with open("mc.json") as fp:
+        mc = json.load(fp)
+    inputs = [mc]
+    for key in ["gosafile", "nominalfile"]:
+        campaign_store.fetch(missionpath + "/raw/inp/" + mc[key], mc[key])
+        with open(mc[key]) as fp:
+            inputs.append(json.load(fp))
+    # the directories of from_error_directory, relative to raw/inp as monte_carlo.py runs
+    for rule, argument, keys in dispersion_routes(inputs[1]):
+        if rule == "from_error_directory" and not os.path.isdir(argument):
+            campaign_store.fetch(missionpath + "/raw/inp/" + argument, argument, ["*"])
+    return inputs
+
+
+if __name__ == "__main__":
+    print("IST DISPERSION MANIFEST MAKER")
+    print("libraries load done.")
+
+    argv = sys.argv
+    if len(argv) > 1:
+        otmc_mission_name = argv[1]
+    else:
+        print("PLEASE INPUT mission_name as the command line argument.")
+        exit()
+    missionpath = campaign_store.mission_path(otmc_mission_name)
+
+    mc, gosa, nominal = load_mission_inputs(missionpath)
+    settings = load_case_settings(missionpath, mc["suffix"])
+    df = dispersion_manifest(gosa, settings)
+    os.makedirs("output", exist_ok=True)
+    outputfile = "output/dispersion_manifest.csv"
+    df.to_csv(outputfile)
+    print("{0:d} cases, {1:d} dispersed parameters".format(len(df), len(df.columns)))
+
+    if missionpath.startswith("s3://"):
+        os.system("aws s3 cp " + outputfile + " " + missionpath + "/stat/output/")
+    else:
+        os.system("cp " + outputfile + " " + missionpath + "/stat/output/")
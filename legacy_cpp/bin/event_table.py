@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2017 Interstellar Technologies Inc. All Rights Reserved.
+# ==============================================================================
+# Per-case flight event table.
+#
+# Every output file (_dynamics_N.csv and _dynamics_N_dump.csv) is scanned once
+# for its flight events, and the full state row at each event is written to
+# output/<name>_events.csv next to the trajectory files. stat_datapoint.py,
+# make_html.py and make_kml.py look events up from this table instead of
+# rediscovering them from the trajectory on every run.
+#
+# usage: python event_table.py (input_json_file)
+import sys
+import os
+import json
+import numpy as np
+import pandas as pd
+
+EVENTS = ["ignition", "cutoff", "separation", "apogee", "max_Q", "max_acceleration", "impact"]
+
+# legacy datapoint.json sample point names -> (event, occurrence)
+EVENT_ALIAS = {"MECO": ("cutoff", 1), "landing_time": ("impact", 1)}
+
+col_powered = "is_powered(1=powered 0=free)"
+col_separated = "is_separated(1=already 0=still)"
+col_acc_body = ["acc_Body_X(m/s2)", "acc_Body_Y(m/s2)", "acc_Body_Z(m/s2)"]
+
+
+def body_names(name, output_dir="output"):
+    """
+    Args:
+        name (str) : rocket name ("name(str)" in the json file)
+        output_dir (str) : directory of the OpenTsiolkovsky output
+    Returns:
+        list of (body, stage, csv_file) of the existing output files,
+        body is "dynamics_N" or "dynamics_N_dump"
+    """
+    bodies = []
+    for stage in range(1, 10):
+        for dump_name in ["", "_dump"]:
+            body = "dynamics_" + str(stage) + dump_name
+            csv_file = os.path.join(output_dir, name + "_" + body + ".csv")
+            if os.path.exists(csv_file):
+                bodies.append((body, stage, csv_file))
+    return bodies
+
+
+def event_table_file(name, output_dir="output"):
+    return os.path.join(output_dir, name + "_events.csv")
+
+
+def detect_events(df):
+    """
+    Args:
+        df (pandas.DataFrame) : one OpenTsiolkovsky output file
+    Returns:
+        list of (event, occurrence, row index) sorted by row index
+        ignition/cutoff/separation : transitions of the is_powered / is_separated flags
+        apogee, max_Q, max_acceleration : maximum of altitude, dynamic pressure, |acc_Body|
+        impact : last row of the file (same as "landing_time" of stat_datapoint.py)
+    """
+    N = len(df)
+    if N == 0:
+        return []
+    events = []
+
+    powered = df[col_powered].to_numpy()
+    change = np.flatnonzero(np.diff(powered)) + 1
+    ignition = change[powered[change] == 1]
+    cutoff = change[powered[change] == 0]
+    if powered[0] == 1:
+        ignition = np.concatenate([[0], ignition])
+    for event, rows in [("ignition", ignition), ("cutoff", cutoff)]:
+        events.extend([(event, j + 1, int(row)) for j, row in enumerate(rows)])
+
+    separated = df[col_separated].to_numpy()
+    change = np.flatnonzero(np.diff(separated)) + 1
+    rows = change[separated[change] == 1]
+    events.extend([("separation", j + 1, int(row)) for j, row in enumerate(rows)])
+
+    acc = np.sqrt(np.sum(df[col_acc_body].to_numpy() ** 2, axis=1))
+    events.append(("apogee", 1, int(np.argmax(df["altitude(m)"].to_numpy()))))
+    events.append(("max_Q", 1, int(np.argmax(df["dynamic pressure(Pa)"].to_numpy()))))
+    events.append(("max_acceleration", 1, int(np.argmax(acc))))
+    events.append(("impact", 1, N - 1))
+
+    return sorted(events, key=lambda e: (e[2], EVENTS.index(e[0])))
+
+
+def make_event_table(name, output_dir="output"):
+    """
+    Args:
+        name (str) : rocket name ("name(str)" in the json file)
+        output_dir (str) : directory of the OpenTsiolkovsky output
+    Returns:
+        pandas.DataFrame, one line per event with the columns
+        body, stage, event, occurrence, row and the full output row at the event
+    """
+    tables = []
+    for body, stage, csv_file in body_names(name, output_dir):
+        df = pd.read_csv(csv_file, index_col=False)
+        events = detect_events(df)
+        if len(events) == 0:
+            continue
+        rows = [e[2] for e in events]
+        table = df.iloc[rows].reset_index(drop=True)
+        table.insert(0, "row", rows)
+        table.insert(0, "occurrence", [e[1] for e in events])
+        table.insert(0, "event", [e[0] for e in events])
+        table.insert(0, "stage", stage)
+        table.insert(0, "body", body)
+        tables.append(table)
+    if len(tables) == 0:
+        return pd.DataFrame(columns=["body", "stage", "event", "occurrence", "row"])
+    return pd.concat(tables, ignore_index=True)
+
+
+def write_event_table(name, output_dir="output"):
+    table = make_event_table(name, output_dir)
+    table.to_csv(event_table_file(name, output_dir), index=False)
+    return table
+
+
+def read_event_table(name, output_dir="output"):
+    """ read output/<name>_events.csv, (re)make it if it is missing or older than the output """
+    filename = event_table_file(name, output_dir)
+    if os.path.exists(filename):
+        mtime = os.path.getmtime(filename)
+        if all(os.path.getmtime(csv_file) <= mtime for body, stage, csv_file in body_names(name, output_dir)):
+            return pd.read_csv(filename, index_col=False)
+    return write_event_table(name, output_dir)
+
+
+def lookup_event(table, event, body="dynamics_1", occurrence=1):
+    """
+    Args:
+        table (pandas.DataFrame) : event table
+        event (str) : event name in EVENTS or EVENT_ALIAS
+        body (str) : "dynamics_N" or "dynamics_N_dump"
+        occurrence (int) : 1 for the first ignition, 2 for the second, ...
+    Returns:
+        pandas.Series of the event row, None if the event does not exist
+    """
+    if event in EVENT_ALIAS:
+        event, occurrence = EVENT_ALIAS[event]
+    hit = table[(table["body"] == body) & (table["event"] == event) & (table["occurrence"] == occurrence)]
+    if len(hit) == 0:
+        return None
+    return hit.iloc[0]
+
+
+if __name__ == '__main__':
+    if (len(sys.argv) != 1):
+        file_name = sys.argv[1]
+    else:
+        file_name = "param_sample_01.json"
+    try:
+        data = json.load(open(file_name))
+        name = data["name(str)"]
+    except:
+        print("JSON file can not be read...finish")
+        sys.exit()
+
+    print("INPUT FILE: %s" % (file_name))
+    table = write_event_table(name)
+    for i, row in table.iterrows():
+        print("%-16s %-16s T+%s[sec]" % (row["body"], row["event"], row["time(s)"]))
+    print("created event table: " + event_table_file(name))
@@ -0,0 +1,119 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# Copyright (c) 2017 Interstellar Technologies Inc. All Rights Reserved.
+# ==============================================================================
+# Ground station geometry of a trajectory for a list of stations.
+#
+# Distance, azimuth, elevation and body difference angle (the antenna columns
+# of make_extend_output.py) of every [station x time] pair are computed in one
+# broadcast pass, instead of one run of make_extend_output.py per station.
+#
+# station file, json:
+# [
+#     {"name": "Taiki", "LLH[deg,deg,m]": [42.5039248, 143.44954216, 25.0]},
+#     {"name": "Hiroo", "LLH[deg,deg,m]": [42.2920, 143.3240, 40.0]}
+# ]
+# ({"stations": [...]} is also accepted) or csv:
+#   name,lat(deg),lon(deg),altitude(m)
+#   Taiki,42.5039248,143.44954216,25.0
+#
+# output/<trajectory>_stations.csv (long format, one row per station and time)
+# is written.
+#
+# usage: python ground_station.py (dynamics csv file) (station file)
+import sys
+import os
+import json
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from coordinate_transform import antenna_param
+
+quantities = ["distance 2d(m)", "distance 3d(m)", "azimuth(deg)", "elevation(deg)", "body difference(deg)"]
+
+
+def parse_stations(stations):
+    """
+    Args:
+        stations (list) : [{"name": str, "LLH[deg,deg,m]": [lat, lon, alt]}, ...]
+    Returns:
+        names (list) and LLH (S, 3) [deg, deg, m] of the stations
+    """
+    names = [str(s["name"]) for s in stations]
+    LLH = np.array([s["LLH[deg,deg,m]"] for s in stations], dtype=np.float64).reshape(-1, 3)
+    if len(set(names)) != len(names):
+        raise ValueError("station names must be unique")
+    return names, LLH
+
+
+def read_stations(filename):
+    """ station list of a json or csv file, see the header """
+    if filename.endswith(".csv"):
+        df = pd.read_csv(filename, index_col=False, skipinitialspace=True)
+        return parse_stations([{"name": row["name"], "LLH[deg,deg,m]": [row["lat(deg)"], row["lon(deg)"], row["altitude(m)"]]}
+                               for _, row in df.iterrows()])
+    with open(filename) as fp:
+        stations = json.load(fp)
+    if isinstance(stations, dict):
+        stations = stations["stations"]
+    return parse_stations(stations)
+
+
+def station_geometry(stations_LLH, rocket_LLH, attitude_elevation):
+    """
+    Args:
+        stations_LLH (array) : (S, 3) lat, lon, alt of the stations [deg, deg, m]
+        rocket_LLH (array) : (N, 3) lat, lon, alt of the rocket [deg, deg, m]
+        attitude_elevation (array) : (N,) attitude_elevation(deg) of the rocket
+    Returns:
+        OrderedDict of the quantities, arrays (S, N)
+    """
+    stations_LLH = np.asarray(stations_LLH, dtype=np.float64).reshape(-1, 3)
+    distance_2d, distance_3d, azimuth, elevation = antenna_param(stations_LLH[:, None, :], rocket_LLH)
+    return OrderedDict([("distance 2d(m)", distance_2d),
+                        ("distance 3d(m)", distance_3d),
+                        ("azimuth(deg)", azimuth),
+                        ("elevation(deg)", elevation),
+                        ("body difference(deg)", np.asarray(attitude_elevation)[None, :] - elevation)])
+
+
+def station_columns(names, geometry):
+    """ per station columns "<name> <quantity>" of the geometry, arrays (N,) """
+    columns = OrderedDict()
+    for k, name in enumerate(names):
+        for q, value in geometry.items():
+            columns[name + " " + q] = value[k]
+    return columns
+
+
+def station_table(names, time, geometry):
+    """ long format DataFrame: station, time(s) and the quantities, one row per station and time """
+    S, N = len(names), len(time)
+    table = OrderedDict([("station", np.repeat(np.array(names, dtype=object), N)),
+                         ("time(s)", np.tile(np.asarray(time, dtype=np.float64), S))])
+    for q, value in geometry.items():
+        table[q] = value.reshape(-1)
+    return pd.DataFrame(table)
+
+
+if __name__ == "__main__":
+    print("IST GROUND STATION GEOMETRY MAKER")
+    print("libraries load done.")
+
+    argv = sys.argv
+    if len(argv) > 2:
+        file_name = argv[1]
+        station_file = argv[2]
+    else:
+        print("PLEASE INPUT the dynamics csv file and the station file as the command line arguments.")
+        exit()
+
+    names, stations_LLH = read_stations(station_file)
+    df = pd.read_csv(file_name, index_col=False)
+    rocket_LLH = df[["lat(deg)", "lon(deg)", "altitude(m)"]].to_numpy(dtype=np.float64)
+    geometry = station_geometry(stations_LLH, rocket_LLH, df["attitude_elevation(deg)"].to_numpy(dtype=np.float64))
+
+    os.makedirs("output", exist_ok=True)
+    outputfile = "output/" + os.path.splitext(os.path.basename(file_name))[0] + "_stations.csv"
+    station_table(names, df["time(s)"].to_numpy(), geometry).to_csv(outputfile, index=False)
+    print("{0:d} stations x {1:d} rows : {2:s}".format(len(names), len(df), outputfile))
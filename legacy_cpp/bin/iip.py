@@ -0,0 +1,262 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# Copyright (c) 2017 Interstellar Technologies Inc. All Rights Reserved.
+# ==============================================================================
+# IIP sensitivity to the velocity and the Keplerian IIP.
+#
+# radius_IIP (coordinate_transform.py) moves the IIP of every row by one
+# velocity perturbation along [1,1,0] NED and measures it with a geodesic
+# call. Here the Jacobian of the IIP (north, east shift [m]) with respect to
+# the NED velocity [m/s] is computed for all the rows at once by central
+# differences (6 batched IIP solves), and the IIP shift of any set of
+# perturbation directions is a matrix product with it:
+#   shift (N, M, 2) = delta_v (N,) * J (N, 2, 3) . directions (M, 3)
+# The horizontal displacement of the IIP model is linear in the velocity, so
+# the shift stays close to the IIP solve up to the curvature over the shift.
+#
+# output/<trajectory>_iip_sweep.csv is written: for every row the largest
+# IIP shift over an azimuth sweep of a horizontal velocity perturbation, its
+# azimuth, and the shift along [1,1,0] (the linearized radius_IIP). radius_IIP
+# adds thrust / mass * cut-off time to both the north and the east velocity,
+# a perturbation of sqrt(2) times that magnitude, and the sweep is scaled to
+# the same magnitude: the sweep at azimuth 45 deg is the linear radius.
+#
+# posLLH_IIP falls with a constant g on a flat earth, which is far off for
+# the upper stages and long coasts. kepler_IIP intersects the Kepler ellipse
+# of the ECI state with the WGS84 ellipsoid (fixed point on the ellipsoid
+# radius at the impact point) and rotates the earth by the time of flight
+# (Kepler's equation), for all the rows at once. With a ballistic
+# coefficient the Kepler arc stops at the entry interface altitude and the
+# drag is flown down to the ground by the batched RK4 of ballistic.py
+# (standard atmosphere, J2, no wind unless an Environment is given). The
+# Kepler arc and the drag leg both rotate the earth at the engine rate
+# (coordinate_transform.omega_engine).
+# The sweep csv also has the Keplerian IIP. With Numba installed the fixed
+# point runs row by row in a compiled loop (kernels.py).
+#
+# usage: python iip.py (dynamics csv file) [cut-off time [s]] [number of azimuths] [ballistic coefficient [kg/m2]]
+import sys
+import os
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from coordinate_transform import wgs84, deg2rad, posLLH_IIP, posLLH, posECEF, dcmECI2ECEF, posECEF_from_LLH, omega_engine
+import ballistic
+import kernels
+
+mu = ballistic.mu  # [m3/s2] 地球重力定数
+
+
+def iip_jacobian(t, posECI_, vel_ECEF_NEDframe_, step=1.0):
+    """
+    Args:
+        t (array) : (N,) time [s]
+        posECI_ (array) : (N, 3) ECI position [m]
+        vel_ECEF_NEDframe_ (array) : (N, 3) NED velocity [m/s]
+        step (float) : velocity step of the central differences [m/s]
+    Returns:
+        IIP (N, 3) lat, lon, alt [deg, deg, m] and
+        Jacobian (N, 2, 3) of the IIP north, east shift [m] by the NED velocity [m/s]
+    """
+    t = np.asarray(t, dtype=np.float64)
+    N = len(t)
+    perturbation = np.concatenate([np.eye(3), -np.eye(3)]) * step
+    vel = (np.asarray(vel_ECEF_NEDframe_)[None, :, :] + perturbation[:, None, :]).reshape(-1, 3)
+    iip = posLLH_IIP(np.tile(t, 6), np.tile(posECI_, (6, 1)), vel).reshape(6, N, 3)
+    center = posLLH_IIP(t, posECI_, vel_ECEF_NEDframe_)
+
+    dlat = (iip[:3, :, 0] - iip[3:, :, 0]) / (2.0 * step)
+    dlon = ((iip[:3, :, 1] - iip[3:, :, 1] + 180.0) % 360.0 - 180.0) / (2.0 * step)
+    # meridian and prime vertical radii at the IIP
+    lat = deg2rad(center[:, 0])
+    W = np.sqrt(1.0 - wgs84.e2 * np.sin(lat) ** 2)
+    radius_M = wgs84.re_a * (1.0 - wgs84.e2) / W ** 3
+    radius_N = wgs84.re_a / W
+    jacobian = np.stack([deg2rad(dlat).T * radius_M[:, None],
+                         deg2rad(dlon).T * (radius_N * np.cos(lat))[:, None]], axis=1)
+    return center, jacobian
+
+
+def azimuth_directions(azimuth_deg, elevation_deg=0.0):
+    """ (M, 3) NED unit vectors of the azimuths (from north) and elevation [deg] """
+    azimuth = np.deg2rad(np.asarray(azimuth_deg, dtype=np.float64))
+    elevation = np.deg2rad(elevation_deg)
+    return np.stack([np.cos(azimuth) * np.cos(elevation), np.sin(azimuth) * np.cos(elevation),
+                     np.full_like(azimuth, -np.sin(elevation))], axis=-1)
+
+
+def iip_shift(jacobian, directions, delta_v):
+    """
+    Args:
+        jacobian (array) : (N, 2, 3) of iip_jacobian
+        directions (array) : (M, 3) NED directions of the velocity perturbation
+        delta_v (array) : (N,) or scalar size of the perturbation [m/s]
+    Returns:
+        (N, M, 2) north, east shift of the IIP [m]
+    """
+    shift = np.swapaxes(np.matmul(jacobian, np.asarray(directions, dtype=np.float64).T), 1, 2)
+    return shift * np.reshape(delta_v, (-1, 1, 1))
+
+
+def iip_sweep(t, posECI_, vel_ECEF_NEDframe_, cutoff_time, thrust, weight, Nazimuth=36, step=1.0):
+    """
+    IIP shift by a horizontal velocity perturbation of the magnitude of radius_IIP,
+    thrust / weight * cutoff_time * |[1,1,0]|, over Nazimuth azimuths
+    Returns:
+        OrderedDict of (N,) arrays
+    """
+    center, jacobian = iip_jacobian(t, posECI_, vel_ECEF_NEDframe_, step)
+    delta_v = np.asarray(thrust, dtype=np.float64) / weight * cutoff_time * np.sqrt(2.0)
+    azimuth = np.arange(Nazimuth) * 360.0 / Nazimuth
+    distance = np.hypot(*np.moveaxis(iip_shift(jacobian, azimuth_directions(azimuth), delta_v), -1, 0))
+    linear = np.hypot(*np.moveaxis(iip_shift(jacobian, azimuth_directions([45.0]), delta_v)[:, 0, :], -1, 0))
+    k = np.argmax(np.where(np.isfinite(distance), distance, -np.inf), axis=1)
+    return OrderedDict([("IIP lat(deg)", center[:, 0]),
+                        ("IIP lon(deg)", center[:, 1]),
+                        ("IIP sweep radius(m)", distance[np.arange(len(k)), k]),
+                        ("IIP sweep azimuth(deg)", azimuth[k]),
+                        ("IIP linear radius(m)", linear)])
+
+
+def _dot(a, b):
+    return np.sum(a * b, axis=-1)
+
+
+def kepler_crossing(t, posECI_, velECI_, altitude=0.0, iterations=4):
+    """
+    descending crossing of the Kepler ellipse of the ECI states with the altitude
+    above the WGS84 ellipsoid
+    Args:
+        t (array) : (N,) time [s]
+        posECI_ (array) : (N, 3) ECI position [m]
+        velECI_ (array) : (N, 3) ECI (inertial) velocity [m/s]
+        altitude (float or array) : altitude of the crossing [m]
+        iterations (int) : fixed point iterations on the ellipsoid radius at the crossing
+    Returns:
+        time [s] (N,), ECI position (N, 3) and velocity (N, 3) at the crossing,
+        nan if the orbit does not come down to the altitude (escape, orbit above
+        it) or the state is already below it and descending
+    """
+    if kernels.enabled:
+        return kernels.kepler_crossing(t, posECI_, velECI_, altitude, iterations)
+    t = np.asarray(t, dtype=np.float64)
+    r = np.asarray(posECI_, dtype=np.float64)
+    v = np.asarray(velECI_, dtype=np.float64)
+    rn = np.linalg.norm(r, axis=-1)
+    h = np.cross(r, v)
+    hn = np.linalg.norm(h, axis=-1)
+    energy = 0.5 * _dot(v, v) - mu / rn
+    with np.errstate(divide="ignore", invalid="ignore"):
+        p = hn * hn / mu
+        e = np.sqrt(np.maximum(1.0 + 2.0 * energy * p / mu, 0.0))
+        a = -mu / (2.0 * energy)
+        # true anomaly of the state, e sin f = h (r.v) / (mu r), e cos f = p / r - 1
+        f0 = np.arctan2(hn * _dot(r, v) / (mu * rn), p / rn - 1.0)
+        u_r = r / rn[:, None]
+        u_t = np.cross(h / hn[:, None], u_r)
+        u_t = np.where(hn[:, None] > 0.0, u_t, 0.0)
+        E0 = 2.0 * np.arctan2(np.sqrt(1.0 - e) * np.sin(f0 / 2.0), np.sqrt(1.0 + e) * np.cos(f0 / 2.0))
+        M0 = E0 - e * np.sin(E0)
+
+        llh = posLLH(posECEF(dcmECI2ECEF(t, omega_engine), r))
+        llh[:, 2] = 0.0
+        radius = np.linalg.norm(posECEF_from_LLH(llh), axis=-1)
+        for k in range(iterations + 1):
+            R = radius + altitude
+            f = 2.0 * np.pi - np.arccos((p / R - 1.0) / e)
+            df = (f - f0) % (2.0 * np.pi)
+            E = 2.0 * np.arctan2(np.sqrt(1.0 - e) * np.sin(f / 2.0), np.sqrt(1.0 + e) * np.cos(f / 2.0))
+            M = E - e * np.sin(E)
+            tof = ((M - M0) % (2.0 * np.pi)) * np.sqrt(a ** 3 / mu)
+            u = np.cos(df)[:, None] * u_r + np.sin(df)[:, None] * u_t
+            pos = R[:, None] * u
+            if k == iterations:
+                break
+            llh = posLLH(posECEF(dcmECI2ECEF(t + tof, omega_engine), pos))
+            llh[:, 2] = 0.0
+            radius = np.linalg.norm(posECEF_from_LLH(llh), axis=-1)
+
+        # radial and transverse speed at the crossing
+        v_r = np.where(hn > 0.0, mu / hn * e * np.sin(f), -np.sqrt(np.maximum(2.0 * (energy + mu / R), 0.0)))
+        v_t = np.where(hn > 0.0, mu / hn * (1.0 + e * np.cos(f)), 0.0)
+        vel = v_r[:, None] * u + v_t[:, None] * np.cross(np.where(hn[:, None] > 0.0, h / hn[:, None], 0.0), u)
+    invalid = ~(energy < 0.0) | ~np.isfinite(f) | ((rn < R) & (df > np.pi))
+    tof[invalid] = np.nan
+    pos[invalid] = np.nan
+    vel[invalid] = np.nan
+    return t + tof, pos, vel
+
+
+def kepler_IIP(t, posECI_, velECI_, ballistic_coef=None, env=None, interface_altitude=1.0e5, step=0.5):
+    """
+    Args:
+        t (array) : (N,) time [s]
+        posECI_ (array) : (N, 3) ECI position [m]
+        velECI_ (array) : (N, 3) ECI (inertial) velocity [m/s]
+        ballistic_coef (float or array) : [kg/m2] for the drag correction, None in vacuum
+        env (ballistic.Environment) : wind and air density of the N rows, None for no wind
+        interface_altitude (float) : altitude where the drag starts [m]
+        step (float) : integration step of the drag [s]
+    Returns:
+        IIP lat, lon, alt [deg, deg, m] (N, 3) and impact time [s] (N,), nan without impact
+    """
+    t = np.asarray(t, dtype=np.float64)
+    if ballistic_coef is None:
+        t_impact, pos, vel = kepler_crossing(t, posECI_, velECI_)
+    else:
+        # Kepler down to the entry interface, drag from there (or from the state below it)
+        t_impact, pos, vel = kepler_crossing(t, posECI_, velECI_, interface_altitude)
+        below = kernels.posLLH(posECEF(dcmECI2ECEF(t, omega_engine), np.asarray(posECI_, dtype=np.float64)))[:, 2] < interface_altitude
+        t_impact[below] = t[below]
+        pos[below] = np.asarray(posECI_, dtype=np.float64)[below]
+        vel[below] = np.asarray(velECI_, dtype=np.float64)[below]
+        flying = np.nonzero(np.all(np.isfinite(pos), axis=1))[0]
+        if env is None:
+            env = ballistic.Environment([{"wind": {"wind file exist?(bool)": False, "const wind[m/s,deg]": [0.0, 0.0]},
+                                          "calculate condition": {}}] * len(t))
+        env = env.take(flying)
+        result = ballistic.propagate(t_impact[flying], pos[flying], vel[flying],
+                                     np.broadcast_to(np.asarray(ballistic_coef, dtype=np.float64), t.shape)[flying],
+                                     env, t_impact[flying] + 1.0e5, step, output_step=1.0e9)
+        last = np.concatenate([np.nonzero(np.diff(result["body"]))[0], [len(result["body"]) - 1]])
+        pos = np.full(pos.shape, np.nan)
+        t_impact = np.full(t.shape, np.nan)
+        landed = np.isfinite(result["impact"])
+        pos[flying[landed]] = result["state"][:3, last[landed]].T
+        t_impact[flying] = result["impact"]
+    llh = kernels.posLLH(posECEF(dcmECI2ECEF(t_impact, omega_engine), pos))
+    return llh, t_impact
+
+
+if __name__ == "__main__":
+    print("IST IIP SENSITIVITY MAKER")
+    print("libraries load done.")
+
+    argv = sys.argv
+    if len(argv) > 1:
+        file_name = argv[1]
+    else:
+        print("PLEASE INPUT the dynamics csv file as the command line argument.")
+        exit()
+    cutoff_time = float(argv[2]) if len(argv) > 2 else 2.0
+    Nazimuth = int(argv[3]) if len(argv) > 3 else 36
+    ballistic_coef = float(argv[4]) if len(argv) > 4 else None
+
+    df = pd.read_csv(file_name, index_col=False)
+    time = df.iloc[:, 0].to_numpy(dtype=np.float64)
+    mass = df.iloc[:, 1].to_numpy(dtype=np.float64)
+    thrust = df.iloc[:, 2].to_numpy(dtype=np.float64)
+    posECI_ = df.iloc[:, 6:9].to_numpy(dtype=np.float64)
+    vel_ECEF_NEDframe = df.iloc[:, 12:15].to_numpy(dtype=np.float64)
+    velECI_ = df.iloc[:, 9:12].to_numpy(dtype=np.float64)
+    sweep = iip_sweep(time, posECI_, vel_ECEF_NEDframe, cutoff_time, thrust, mass, Nazimuth)
+    llh, t_impact = kepler_IIP(time, posECI_, velECI_, ballistic_coef)
+    sweep["IIP kepler lat(deg)"] = llh[:, 0]
+    sweep["IIP kepler lon(deg)"] = llh[:, 1]
+    sweep["IIP kepler impact time(s)"] = t_impact
+
+    os.makedirs("output", exist_ok=True)
+    outputfile = "output/" + os.path.splitext(os.path.basename(file_name))[0] + "_iip_sweep.csv"
+    out = pd.DataFrame(OrderedDict([("time(s)", time)] + list(sweep.items())))
+    out.to_csv(outputfile, index=False)
+    print("{0:d} rows x {1:d} azimuths : {2:s}".format(len(time), Nazimuth, outputfile))
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2017 Interstellar Technologies Inc. All Rights Reserved.
+# ==============================================================================
+# Row loop kernels of the post processors, compiled by Numba when installed.
+#
+# Most of the post processing is batched NumPy (coordinate_transform.py). The
+# parts that are sequential per row (the fixed point of the Keplerian IIP, a
+# table walk) spend their time in temporaries of the whole batch instead. The
+# kernels here loop over the rows with scalars; with Numba (pip install numba)
+# they are compiled with @njit, without it the batched NumPy code of the
+# callers is used as before:
+#   posLLH           : ECEF -> lat, lon, alt (coordinate_transform.posLLH)
+#   kepler_crossing  : Kepler ellipse x ellipsoid crossing (iip.kepler_crossing)
+#   table_lookup     : bilinear lookup of a 2D table (DATA_2D of rf_link.py)
+# Set the environment variable OT_NUMBA=0 to use NumPy with Numba installed.
+# The compiled kernels agree with the NumPy code within the rounding of the
+# libm calls (~1e-12 relative), not bit for bit; the extend outputs keep
+# using coordinate_transform.
+#
+# usage: import kernels; kernels.enabled, kernels.posLLH(posECEF_), ...
+import os
+import math
+import numpy as np
+import coordinate_transform as ct
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+enabled = numba is not None and os.environ.get("OT_NUMBA", "1") != "0"
+
+# Numbaの関数はモジュールの大域変数を定数として取り込む
+mu = 3.986004418e14  # [m3/s2] 地球重力定数 (ballistic.mu)
+ct_re_a, ct_re_b, ct_e2, ct_ed2 = ct.wgs84.re_a, ct.wgs84.re_b, ct.wgs84.e2, ct.wgs84.ed2
+ct_omega = ct.omega_engine  # iip.kepler_crossingと同じエンジンの値
+
+
+def jit(function):
+    # Numbaが無ければ関数はそのまま（テストで同じループをPythonで走らせる）
+    if numba is None:
+        return function
+    return numba.njit(cache=True, error_model="numpy")(function)
+
+
+@jit
+def _llh(x, y, z):
+    # ct.posLLHと同じBowringの式
+    a = ct_re_a
+    b = ct_re_b
+    p = math.sqrt(math.pow(x, 2) + math.pow(y, 2))
+    theta = math.atan2(z * a, p * b)
+    lat = math.atan2(z + ct_ed2 * b * math.pow(math.sin(theta), 3),
+                     p - ct_e2 * a * math.pow(math.cos(theta), 3)) * 180.0 / math.pi
+    lon = math.atan2(y, x) * 180.0 / math.pi
+    s = math.sin(lat * math.pi / 180.0)
+    alt = p / math.cos(lat * math.pi / 180.0) - a / math.sqrt(1.0 - ct_e2 * s * s)
+    return lat, lon, alt
+
+
+@jit
+def _posLLH_rows(ecef):
+    llh = np.empty(ecef.shape)
+    for i in range(ecef.shape[0]):
+        llh[i, 0], llh[i, 1], llh[i, 2] = _llh(ecef[i, 0], ecef[i, 1], ecef[i, 2])
+    return llh
+
+
+@jit
+def _surface_radius(t, x, y, z):
+    # ECI位置の真下の楕円体面の地心距離
+    theta = ct_omega * t
+    c, s = math.cos(theta), math.sin(theta)
+    lat, lon, alt = _llh(c * x + s * y, -s * x + c * y, z)
+    lat = lat * math.pi / 180.0
+    lon = lon * math.pi / 180.0
+    N = ct_re_a / math.sqrt(1.0 - ct_e2 * math.sin(lat) * math.sin(lat))
+    return math.sqrt(math.pow(N * math.cos(lat), 2) + math.pow(N * (1.0 - ct_e2) * math.sin(lat), 2))
+
+
+@jit
+def _kepler_crossing_rows(t, pos, vel, altitude, iterations):
+    N = t.shape[0]
+    t_cross = np.full(N, np.nan)
+    pos_cross = np.full((N, 3), np.nan)
+    vel_cross = np.full((N, 3), np.nan)
+    two_pi = 2.0 * math.pi
+    for i in range(N):
+        rx, ry, rz = pos[i, 0], pos[i, 1], pos[i, 2]
+        vx, vy, vz = vel[i, 0], vel[i, 1], vel[i, 2]
+        rn = math.sqrt(rx * rx + ry * ry + rz * rz)
+        hx, hy, hz = ry * vz - rz * vy, rz * vx - rx * vz, rx * vy - ry * vx
+        hn = math.sqrt(hx * hx + hy * hy + hz * hz)
+        energy = 0.5 * (vx * vx + vy * vy + vz * vz) - mu / rn
+        if not energy < 0.0:
+            continue
+        p = hn * hn / mu
+        e = math.sqrt(max(1.0 + 2.0 * energy * p / mu, 0.0))
+        if not 0.0 < e <= 1.0:
+            continue
+        a = -mu / (2.0 * energy)
+        f0 = math.atan2(hn * (rx * vx + ry * vy + rz * vz) / (mu * rn), p / rn - 1.0)
+        urx, ury, urz = rx / rn, ry / rn, rz / rn
+        utx, uty, utz = 0.0, 0.0, 0.0
+        if hn > 0.0:
+            hx, hy, hz = hx / hn, hy / hn, hz / hn
+            utx, uty, utz = hy * urz - hz * ury, hz * urx - hx * urz, hx * ury - hy * urx
+        E0 = 2.0 * math.atan2(math.sqrt(1.0 - e) * math.sin(f0 / 2.0), math.sqrt(1.0 + e) * math.cos(f0 / 2.0))
+        M0 = E0 - e * math.sin(E0)
+        radius = _surface_radius(t[i], rx, ry, rz)
+        valid = True
+        R = f = df = tof = ux = uy = uz = 0.0
+        for k in range(iterations + 1):
+            R = radius + altitude[i]
+            c = (p / R - 1.0) / e
+            if not abs(c) <= 1.0:
+                valid = False
+                break
+            f = two_pi - math.acos(c)
+            df = (f - f0) % two_pi
+            E = 2.0 * math.atan2(math.sqrt(1.0 - e) * math.sin(f / 2.0), math.sqrt(1.0 + e) * math.cos(f / 2.0))
+            M = E - e * math.sin(E)
+            tof = ((M - M0) % two_pi) * math.sqrt(math.pow(a, 3) / mu)
+            cd, sd = math.cos(df), math.sin(df)
+            ux, uy, uz = cd * urx + sd * utx, cd * ury + sd * uty, cd * urz + sd * utz
+            if k == iterations:
+                break
+            radius = _surface_radius(t[i] + tof, R * ux, R * uy, R * uz)
+        if not valid or (rn < R and df > math.pi):
+            continue
+        # 交差点での動径・横方向速度
+        if hn > 0.0:
+            v_r = mu / hn * e * math.sin(f)
+            v_t = mu / hn * (1.0 + e * math.cos(f))
+        else:
+            v_r = -math.sqrt(max(2.0 * (energy + mu / R), 0.0))
+            v_t = 0.0
+        wx, wy, wz = hy * uz - hz * uy, hz * ux - hx * uz, hx * uy - hy * ux
+        t_cross[i] = t[i] + tof
+        pos_cross[i, 0], pos_cross[i, 1], pos_cross[i, 2] = R * ux, R * uy, R * uz
+        vel_cross[i, 0] = v_r * ux + v_t * wx
+        vel_cross[i, 1] = v_r * uy + v_t * wy
+        vel_cross[i, 2] = v_r * uz + v_t * wz
+    return t_cross, pos_cross, vel_cross
+
+
+@jit
+def _table_lookup_rows(x_grid, y_grid, data, x, y):
+    value = np.empty(x.shape[0])
+    for i in range(x.shape[0]):
+        ix = min(max(np.searchsorted(x_grid, x[i], side="right"), 1), x_grid.shape[0] - 1)
+        iy = min(max(np.searchsorted(y_grid, y[i], side="right"), 1), y_grid.shape[0] - 1)
+        ratio_x = (x[i] - x_grid[ix - 1]) / (x_grid[ix] - x_grid[ix - 1])
+        ratio_y = (y[i] - y_grid[iy - 1]) / (y_grid[iy] - y_grid[iy - 1])
+        y1 = data[iy - 1, ix - 1] * (1 - ratio_x) + data[iy - 1, ix] * ratio_x
+        y2 = data[iy, ix - 1] * (1 - ratio_x) + data[iy, ix] * ratio_x
+        value[i] = y1 * (1 - ratio_y) + y2 * ratio_y
+    return value
+
+
+def posLLH(posECEF_):
+    """ (N, 3) ECEF [m] -> (N, 3) lat, lon, alt [deg, deg, m] """
+    if not enabled:
+        return ct.posLLH(posECEF_)
+    return _posLLH_rows(np.ascontiguousarray(posECEF_, dtype=np.float64))
+
+
+def kepler_crossing(t, posECI_, velECI_, altitude, iterations):
+    """ iip.kepler_crossing by the row loop, only with Numba (see enabled) """
+    t = np.ascontiguousarray(t, dtype=np.float64)
+    altitude = np.ascontiguousarray(np.broadcast_to(np.asarray(altitude, dtype=np.float64), t.shape))
+    return _kepler_crossing_rows(t, np.ascontiguousarray(posECI_, dtype=np.float64),
+                                 np.ascontiguousarray(velECI_, dtype=np.float64), altitude, int(iterations))
+
+
+def table_lookup(x_grid, y_grid, data, x, y):
+    """
+    bilinear interpolation of a table, linear extrapolation out of the grid
+    Args:
+        x_grid (array) : (Nx,) increasing
+        y_grid (array) : (Ny,) increasing
+        data (array) : (Ny, Nx) table
+        x, y (array) : (N,) points
+    Returns:
+        (N,) values
+    """
+    x_grid = np.asarray(x_grid, dtype=np.float64)
+    y_grid = np.asarray(y_grid, dtype=np.float64)
+    data = np.asarray(data, dtype=np.float64)
+    x = np.atleast_1d(np.asarray(x, dtype=np.float64))
+    y = np.broadcast_to(np.asarray(y, dtype=np.float64), x.shape)
+    if enabled:
+        return _table_lookup_rows(x_grid, y_grid, data, x, np.ascontiguousarray(y))
+    # DATA_2D.funcと同じく x < x_grid[i] となる最初のiの区間で補間
+    ix = np.clip(np.searchsorted(x_grid, x, side="right"), 1, len(x_grid) - 1)
+    iy = np.clip(np.searchsorted(y_grid, y, side="right"), 1, len(y_grid) - 1)
+    ratio_x = (x - x_grid[ix - 1]) / (x_grid[ix] - x_grid[ix - 1])
+    ratio_y = (y - y_grid[iy - 1]) / (y_grid[iy] - y_grid[iy - 1])
+    y1 = data[iy - 1, ix - 1] * (1 - ratio_x) + data[iy - 1, ix] * ratio_x
+    y2 = data[iy, ix - 1] * (1 - ratio_x) + data[iy, ix] * ratio_x
+    return y1 * (1 - ratio_y) + y2 * ratio_y
+
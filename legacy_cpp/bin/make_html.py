@@ -29,6 +29,7 @@ import io
 import numpy as np
 import pandas as pd
 import json
+import event_table
 
 from jinja2 import Template
 
@@ -69,6 +70,9 @@ HOVER_SET = [("date (x,y)", "($x{0,0}, $y{0,0})")]
 HOVER_SET_F = [("date (x,y)", "($x{0,0}, $y{0,0.00})")]
 C = d3["Category10"][10]
 
+# ==== Flight events (burnout, apogee, ...) ====
+events = event_table.read_event_table(rocket_name, output_dir)
+
 # ==== Plot each stages ====
 for stage_str in ['1', '2', '3']:
     st = stage_str + ' stage: ' # stage string for title
@@ -93,11 +97,9 @@ for stage_str in ['1', '2', '3']:
     if not np.isfinite(time_min) or not np.isfinite(time_max) or time_max <= time_min:
         continue
     # ==== 燃焼終了 or 遠地点までのプロットの場合コメントオンオフ ====
-    time_burnout = df1[df1["thrust(N)"] == 0]["time(s)"][1:].min()
-    time_apogee = df1[df1["altitude(m)"] == df1["altitude(m)"].max()]["time(s)"]
-    # import pdb; pdb.set_trace()
-    if not isinstance(time_apogee, float):
-        time_apogee = time_apogee.iloc[0]
+    burnout = event_table.lookup_event(events, "cutoff", "dynamics_" + stage_str)
+    time_burnout = time_max if burnout is None else burnout["time(s)"]
+    time_apogee = event_table.lookup_event(events, "apogee", "dynamics_" + stage_str)["time(s)"]
     # df1 = df1[df1["time(s)"] < float(time_burnout)]
     # df1 = df1[df1["time(s)"] < float(time_apogee)]
     # ==== 燃焼終了 or 遠地点までのプロットの場合コメントオンオフ ====
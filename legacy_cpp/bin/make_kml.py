@@ -8,8 +8,10 @@ import simplekml
 import numpy as np
 import json
 import pandas as pd
+import event_table
 
 stage_literal = ["", "M", "S", "T", "F"]  # ex. MECO SECO etc...
+event_literal = {"cutoff": "ECO", "ignition": "EIG", "separation": "SEP"}
 kml = simplekml.Kml(open=1)
 
 def make_kml(name, div, stage, is_dump=False):
@@ -30,32 +32,16 @@ def make_kml(name, div, stage, is_dump=False):
         altitude = df["altitude(m)"]
         lat_IIP = df["IIP_lat(deg)"]
         lon_IIP = df["IIP_lon(deg)"]
-        is_powered = df["is_powered(1=powered 0=free)"]
-        is_separated = df["is_separated(1=already 0=still)"]
-        # イベント毎に点を打つために前の値からの変化を監視して変化していればcoord_pointに追加
-        is_powered_prev = is_powered[0]
-        is_separated_prev = is_separated[0]
-        for i in range(len(time)):
-            if (is_powered_prev == 1 and is_powered[i] == 0):
-                pnt = kml.newpoint(name=stage_literal[stage] + "ECO")
-                pnt.coords = [(lon.iloc[i], lat.iloc[i], altitude.iloc[i])]
-                pnt.description = "T+" + str(time.iloc[i]) + "[sec]"
-                pnt.style.iconstyle.icon.href = "http://earth.google.com/images/kml-icons/track-directional/track-none.png"
-                pnt.altitudemode = simplekml.AltitudeMode.absolute
-            if (is_powered_prev == 0 and is_powered[i] == 1):
-                pnt = kml.newpoint(name=stage_literal[stage] + "EIG")
-                pnt.coords = [(lon.iloc[i], lat.iloc[i], altitude.iloc[i])]
-                pnt.description = "T+" + str(time.iloc[i]) + "[sec]"
-                pnt.style.iconstyle.icon.href = "http://earth.google.com/images/kml-icons/track-directional/track-none.png"
-                pnt.altitudemode = simplekml.AltitudeMode.absolute
-            if (is_separated_prev == 0 and is_separated[i] == 1):
-                pnt = kml.newpoint(name=stage_literal[stage] + "SEP")
-                pnt.coords = [(lon.iloc[i], lat.iloc[i], altitude.iloc[i])]
-                pnt.description = "T+" + str(time.iloc[i]) + "[sec]"
-                pnt.style.iconstyle.icon.href = "http://earth.google.com/images/kml-icons/track-directional/track-none.png"
-                pnt.altitudemode = simplekml.AltitudeMode.absolute
-            is_powered_prev = is_powered[i]
-            is_separated_prev = is_separated[i]
+        # イベント毎に点を打つ（イベントはevent_table.pyで一度だけ検出したものを使う）
+        events = event_table.read_event_table(name)
+        events = events[events["body"] == "dynamics_" + str(stage) + dump_name]
+        for i, event in events.iterrows():
+            if (event["event"] not in event_literal or event["row"] == 0): continue
+            pnt = kml.newpoint(name=stage_literal[stage] + event_literal[event["event"]])
+            pnt.coords = [(event["lon(deg)"], event["lat(deg)"], event["altitude(m)"])]
+            pnt.description = "T+" + str(event["time(s)"]) + "[sec]"
+            pnt.style.iconstyle.icon.href = "http://earth.google.com/images/kml-icons/track-directional/track-none.png"
+            pnt.altitudemode = simplekml.AltitudeMode.absolute
         # 間引いた時点ごとに線を引く
         coord_line = []
         for i in range(len(time)//div):
@@ -2,6 +2,7 @@
 # coding: utf-8
 import json
 import copy
+import numpy as np
 from numpy import random
 from numpy.random import normal, rand
 import os
@@ -9,6 +10,7 @@ import sys
 import multiprocessing
 import subprocess
 from collections import OrderedDict
+import event_table
 
 
 def error_loader(data, route):
@@ -28,30 +30,89 @@ def error_loader(data, route):
     return result
 
 
-def error_applyer(value, route, data):
+def error_applyer(value, route, data, u=None):
+    # u : uniform random number in [0, 1) of a sampling plan, drawn here if None
     key = route.pop(0)
     key = key[1]
     if len(route) == 0:
         if   value[0] == "multiply_statistically":
-            random_number = normal(0, value[1] / 3)
+            random_number = normal(0, value[1] / 3) if u is None else value[1] / 3 * normal_ppf(u)
             data[key] *= 1 + random_number
         elif value[0] == "add_statistically":
-            random_number = normal(0, value[1] / 3)
+            random_number = normal(0, value[1] / 3) if u is None else value[1] / 3 * normal_ppf(u)
             data[key] += random_number
         elif value[0] == "from_error_files":
-            random_number = rand() * len(value[1])
+            random_number = (rand() if u is None else u) * len(value[1])
             data[key] = value[1][int(random_number)]
         elif value[0] == "from_error_directory":
             path = value[1]
             files = [f for f in os.listdir(path) if not f.startswith('.')]
             files_file = sorted([f for f in files if os.path.isfile(os.path.join(path, f))])
-            random_number = rand() * len(files_file)
+            random_number = (rand() if u is None else u) * len(files_file)
             data[key] = os.path.join(path, files_file[int(random_number)])
     else:
-        error_applyer(value, route, data[key])
-
-
-def error_input_maker(errorfile, nominalfile, inpfile, outfile, error_seed):
+        error_applyer(value, route, data[key], u)
+
+
+# Wichura AS241 (PPND16), the approximation of statistics.NormalDist.inv_cdf
+_ppf_central = ([2.5090809287301226727e+3, 3.3430575583588128105e+4, 6.7265770927008700853e+4,
+                 4.5921953931549871457e+4, 1.3731693765509461125e+4, 1.9715909503065514427e+3,
+                 1.3314166789178437745e+2, 3.3871328727963666080e+0],
+                [5.2264952788528545610e+3, 2.8729085735721942674e+4, 3.9307895800092710610e+4,
+                 2.1213794301586595867e+4, 5.3941960214247511077e+3, 6.8718700749205790830e+2,
+                 4.2313330701600911252e+1, 1.0])
+_ppf_tail = ([7.74545014278341407640e-4, 2.27238449892691845833e-2, 2.41780725177450611770e-1,
+              1.27045825245236838258e+0, 3.64784832476320460504e+0, 5.76949722146069140550e+0,
+              4.63033784615654529590e+0, 1.42343711074968357734e+0],
+             [1.05075007164441684324e-9, 5.47593808499534494600e-4, 1.51986665636164571966e-2,
+              1.48103976427480074590e-1, 6.89767334985100004550e-1, 1.67638483018380384940e+0,
+              2.05319162663775882187e+0, 1.0])
+_ppf_far = ([2.01033439929228813265e-7, 2.71155556874348757815e-5, 1.24266094738807843860e-3,
+             2.65321895265761230930e-2, 2.96560571828504891230e-1, 1.78482653991729133580e+0,
+             5.46378491116411436990e+0, 6.65790464350110377720e+0],
+            [2.04426310338993978564e-15, 1.42151175831644588870e-7, 1.84631831751005468180e-5,
+             7.86869131145613259100e-4, 1.48753612908506148525e-2, 1.36929880922735805310e-1,
+             5.99832206555887937690e-1, 1.0])
+
+
+def normal_ppf(u):
+    """
+    standard normal quantile of u (scalar or array), kept off the infinite tails
+    (AS241 on whole arrays, the same value as NormalDist().inv_cdf)
+    """
+    p = np.clip(np.asarray(u, dtype=np.float64), 1e-12, 1.0 - 1e-12)
+    q = p - 0.5
+    central = np.abs(q) <= 0.425
+    r = 0.180625 - q * q
+    x = q * np.polyval(_ppf_central[0], r) / np.polyval(_ppf_central[1], r)
+    r = np.sqrt(-np.log(np.where(q <= 0.0, p, 1.0 - p)))
+    tail = np.where(r <= 5.0, np.polyval(_ppf_tail[0], r - 1.6) / np.polyval(_ppf_tail[1], r - 1.6),
+                    np.polyval(_ppf_far[0], r - 5.0) / np.polyval(_ppf_far[1], r - 5.0))
+    x = np.where(central, x, np.where(q < 0.0, -tail, tail))
+    return float(x) if x.ndim == 0 else x
+
+
+def saltelli_plan(Ndim, Nbase, seed=0):
+    """
+    Saltelli sampling plan of the uniform random numbers of the dispersions
+    Args:
+        Ndim (int) : number of the dispersed parameters (routes of gosa.json)
+        Nbase (int) : number of the base samples
+        seed (int) : random seed
+    Returns:
+        (Nbase * (Ndim + 2), Ndim) array of the blocks A, B, AB_1, ..., AB_Ndim
+        (AB_i is A with the column i of B), case i uses the row i - 1
+    """
+    rs = random.RandomState(seed)
+    A = rs.random_sample((Nbase, Ndim))
+    B = rs.random_sample((Nbase, Ndim))
+    AB = np.repeat(A[None, :, :], Ndim, axis=0)
+    for i in range(Ndim):
+        AB[i, :, i] = B[:, i]
+    return np.concatenate([A, B, AB.reshape(-1, Ndim)])
+
+
+def error_input_maker(errorfile, nominalfile, inpfile, outfile, error_seed, u=None):
     random.seed(error_seed)
 
     # load gosa
@@ -68,8 +129,8 @@ def error_input_maker(errorfile, nominalfile, inpfile, outfile, error_seed):
 
     # apply gosa
     if error_seed > 0:
-        for gosa in data_gosa:
-            error_applyer(gosa[0], gosa[1], data)
+        for j, gosa in enumerate(data_gosa):
+            error_applyer(gosa[0], gosa[1], data, None if u is None else u[j])
 
     # save json w/ gosa
     json.dump(data, fo, indent=4)
@@ -77,12 +138,12 @@ def error_input_maker(errorfile, nominalfile, inpfile, outfile, error_seed):
     fp.close()
 
 
-def wrapper_opentsio(i, suffix, nominalfile, gosafile, missionpath):
+def wrapper_opentsio(i, suffix, nominalfile, gosafile, missionpath, u=None):
     inputfile  = "case{0:05d}_{1:s}.json".format(i, suffix)
     outputfile = "case{0:05d}_{1:s}".format(i, suffix)
     stdoutfile = "case{0:05d}_{1:s}.stdout.dat".format(i, suffix)
 
-    error_input_maker(gosafile, nominalfile, inputfile, outputfile, i)
+    error_input_maker(gosafile, nominalfile, inputfile, outputfile, i, u)
 
     for i in range(5):  # retry 5 times
         proc = subprocess.Popen("./OpenTsiolkovsky "+inputfile+" > "+stdoutfile, shell=True)
@@ -93,18 +154,25 @@ def wrapper_opentsio(i, suffix, nominalfile, gosafile, missionpath):
         except subprocess.TimeoutExpired:
             proc.kill()
 
+    # event table is made here once, the statistics tools only look it up
+    event_table.write_event_table(outputfile, "./output")
+    eventfile = event_table.event_table_file(outputfile, "./output")
+
     is_aws = missionpath.startswith("s3://")
     if is_aws:
         os.system("aws s3 cp " + inputfile  + " " + missionpath + "/raw/output/")
         os.system("aws s3 cp " + stdoutfile + " " + missionpath + "/raw/output/")
+        os.system("aws s3 cp " + eventfile  + " " + missionpath + "/raw/output/")
         os.system('aws s3 cp ./output/ ' + missionpath + '/raw/output/ --exclude "*" --include "'+outputfile+'_dynamics_?.csv" --recursive')
     else:
         os.system("cp " + inputfile  + " " + missionpath + "/raw/output/")
         os.system("cp " + stdoutfile + " " + missionpath + "/raw/output/")
+        os.system("cp " + eventfile  + " " + missionpath + "/raw/output/")
         os.system("cp ./output/"+outputfile+"_dynamics_?.csv " + missionpath + "/raw/output/")
 
     os.system("rm " + inputfile)
     os.system("rm " + stdoutfile)
+    os.system("rm " + eventfile)
     os.system("rm ./output/"+outputfile+"_dynamics_?.csv")
 
 
@@ -131,6 +199,22 @@ if __name__ == "__main__":
     nominalfile = data["nominalfile"]
     gosafile    = data["gosafile"]
 
+    # Saltelli sampling plan for the sensitivity analysis (sensitivity.py):
+    # "sampling": "saltelli", "Nbase": N, "seed": s, "Ntask": N * (Ndim + 2)
+    # (the array size of the batch job and the stat scripts read Ntask of mc.json)
+    plan = None
+    if data.get("sampling") == "saltelli":
+        with open(gosafile) as fp:
+            Ndim = len(error_loader(json.load(fp, object_pairs_hook=OrderedDict), []))
+        plan = saltelli_plan(Ndim, data["Nbase"], data.get("seed", 0))
+        if Ntask != len(plan):
+            print("ERROR: Ntask of mc.json must be Nbase * (Ndim + 2) = {0:d} * {1:d} = {2:d} "
+                  "for the Saltelli plan, not {3:d}".format(data["Nbase"], Ndim + 2, len(plan), Ntask))
+            exit(1)
+
+    def plan_row(id_task):
+        return plan[id_task - 1] if plan is not None and id_task > 0 else None
+
     if "NLoop" in data.keys():
         NLoop       = data["NLoop"]
         i = int(os.getenv("AWS_BATCH_JOB_ARRAY_INDEX"))
@@ -141,7 +225,8 @@ if __name__ == "__main__":
                 id_task = (NLoop * i + loop_index) * Nproc + j
                 if id_task > Ntask:
                     continue
-                p = multiprocessing.Process(target=wrapper_opentsio, args=(id_task, suffix, nominalfile, gosafile, missionpath))
+                p = multiprocessing.Process(target=wrapper_opentsio, args=(id_task, suffix, nominalfile, gosafile, missionpath,
+                                                                           plan_row(id_task)))
                 array_p.append(p)
                 p.start()
 
@@ -151,7 +236,7 @@ if __name__ == "__main__":
         pool = multiprocessing.Pool(Nproc)
 
         for id_task in range(Ntask + 1):
-            pool.apply_async(wrapper_opentsio, (id_task, suffix, nominalfile, gosafile, missionpath))
+            pool.apply_async(wrapper_opentsio, (id_task, suffix, nominalfile, gosafile, missionpath, plan_row(id_task)))
 
         pool.close()
         pool.join()
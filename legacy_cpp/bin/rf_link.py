@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2017 Interstellar Technologies Inc. All Rights Reserved.
+# ==============================================================================
+# RF link budget of the ground station antenna and the vehicle antenna.
+#
+# The gain tables and the link budget of make_rfprop.py, importable without
+# matplotlib (trajectory.py). All functions take a single row as before, or
+# arrays (N,) of the rows.
+#
+# gain table csv (DATA_2D): the first line is skipped, the second line has the
+# x grid after one label, every further line is y followed by the values.
+#
+# usage: from rf_link import DATA_2D, tautr, recv_power
+import numpy as np
+from kernels import table_lookup
+from numpy import sin, cos, arctan2, pi, arccos, log10
+
+class DATA_2D:
+    def __init__(self, fn):
+        fp = open(fn) 
+        self.y    = []
+        self.data = []
+        for i, line in enumerate(fp):
+            if i == 0:
+                continue
+            elif i == 1:
+                arr = line.split(",")
+                arr.pop(0)
+                self.x = list(map(float,arr))
+            else:
+                arr = line.split(",")
+                arr = list(map(float,arr))
+                self.y.append(arr.pop(0))
+                self.data.append(arr)
+        fp.close()
+
+    def func(self, x, y):
+        for i, val in enumerate(self.x):
+            if x < val:
+                ind_x = i
+                break
+        a = self.x[ind_x - 1]
+        b = self.x[ind_x]
+        ratio_x = (x - a) / (b - a)
+
+        for i, val in enumerate(self.y):
+            if y < val:
+                ind_y = i
+                break
+        a = self.y[ind_y - 1]
+        b = self.y[ind_y]
+        ratio_y = (y - a) / (b - a)
+
+        y1 = self.data[ind_y - 1][ind_x -1] * (1 - ratio_x) + self.data[ind_y - 1][ind_x] * ratio_x
+        y2 = self.data[ind_y    ][ind_x -1] * (1 - ratio_x) + self.data[ind_y    ][ind_x] * ratio_x
+
+        return y1 * (1 - ratio_y) + y2 * ratio_y
+
+    def lookup(self, x, y):
+        # funcを全行まとめて（配列、kernels.table_lookup）
+        return table_lookup(self.x, self.y, self.data, x, y)
+
+def ElAzRoll2D(el, az, roll):
+    # the unit of all inputs is deg. scalars or arrays (N,), columns (..., 3)
+    el, az, roll = np.broadcast_arrays(np.asarray(el, dtype=np.float64), np.asarray(az, dtype=np.float64),
+                                       np.asarray(roll, dtype=np.float64))
+    def rot_z(x):
+        zero, one = np.zeros_like(x), np.ones_like(x)
+        return np.stack([np.stack([ cos(x), -sin(x), zero], axis=-1),
+                         np.stack([ sin(x),  cos(x), zero], axis=-1),
+                         np.stack([   zero,    zero,  one], axis=-1)], axis=-2)
+
+    def rot_y(x):
+        zero, one = np.zeros_like(x), np.ones_like(x)
+        return np.stack([np.stack([ cos(x), zero,  sin(x)], axis=-1),
+                         np.stack([   zero,  one,    zero], axis=-1),
+                         np.stack([-sin(x), zero,  cos(x)], axis=-1)], axis=-2)
+    theta_az   = pi / 2 - az * pi / 180
+    theta_el   = pi / 2 - el * pi / 180
+    theta_roll = roll * pi / 180
+    D = rot_z(theta_az) @ rot_y(theta_el) @ rot_z(-theta_az) @ rot_z(theta_roll)
+#    D = rot_z(theta_az) * rot_y(theta_el) * rot_z(theta_roll)
+#    print("el, az, roll")
+#    print(el, az, roll)
+#    print("D")
+#    print(D)
+    return D[..., 0], D[..., 1], D[..., 2]
+
+def tautr(gaze_el, gaze_az, att_el, att_az, att_roll, grnd_el, grnd_az):
+#    print("gaze_el, gaze_az, att_el, att_az, att_roll, grnd_el, grnd_az")
+#    print(gaze_el, gaze_az, att_el, att_az, att_roll, grnd_el, grnd_az)
+    dummy0, dummy1, gaze_z = ElAzRoll2D(gaze_el, gaze_az, 0)
+    att_x, att_y, att_z    = ElAzRoll2D(att_el,  att_az,  att_roll)
+    dummy0, dummy1, grnd_z = ElAzRoll2D(grnd_el, grnd_az, 0)
+    idot_x = np.sum(gaze_z * att_x, axis=-1)
+    idot_y = np.sum(gaze_z * att_y, axis=-1)
+    idot_z = np.sum(gaze_z * att_z, axis=-1)
+    att_tau_t = arccos(idot_z) * 180 / pi
+    att_tau_r = arctan2(idot_y, idot_x) * 180 / pi + 180
+
+    idot_z = np.sum(gaze_z * grnd_z, axis=-1)
+    grnd_tau_t = arccos(idot_z) * 180 / pi
+    
+#    print("att_taut_t", att_tau_t)
+#    print("att_taut_r", att_tau_r)
+#    print("grnd_taut_t", grnd_tau_t)
+#    exit()
+    return att_tau_t, att_tau_r, grnd_tau_t
+
+def recv_power(antenna_freq, loss, power, slant_range, gain_vhcl, att_tau_t, att_tau_r, gain_grnd, grnd_tau_t):
+    flag = False
+    S = 0
+    dS =  power
+    if flag: print(dS,end=",")
+    S += dS
+    dS =  gain_vhcl.lookup(att_tau_t, att_tau_r)
+    if flag: print(dS,end=",")
+    S += dS
+    dS =  gain_grnd.lookup(grnd_tau_t, 0)
+    if flag: print(dS,end=",")
+    S += dS
+    dS =  20 * log10(299792458 / antenna_freq)
+    if flag: print(dS,end=",")
+    S += dS
+    dS = -20 * log10(4 * pi * slant_range)
+    if flag: print(dS,end=",")
+    S += dS
+    dS = -loss
+    if flag: print(dS)
+    S += dS
+
+    return S
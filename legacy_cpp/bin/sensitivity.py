@@ -0,0 +1,181 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# Copyright (c) 2017 Interstellar Technologies Inc. All Rights Reserved.
+# ==============================================================================
+# Global sensitivity of the campaign outputs to the dispersed parameters.
+#
+# The dispersed inputs of every case (dispersion manifest) are joined to the
+# outputs (event table values, surrogate.event_targets), and for all the
+# outputs at once
+#   Sobol indices : first order (Saltelli 2010) and total (Jansen) of every
+#                   gosa.json parameter, with bootstrap confidence intervals
+#   rank correlation : Spearman correlation of every manifest column
+# are computed. The Sobol indices need the Saltelli sampling plan: a campaign
+# run with "sampling": "saltelli" in mc.json (monte_carlo.py) is used as it
+# is, otherwise a surrogate model fitted on the campaign is evaluated on a
+# plan of "Nbase" base samples.
+#
+# sensitivity.json (optional):
+# {
+#     "targets": [{"body": "dynamics_1", "event": "impact", "column": "lat(deg)"}, ...],
+#     "model": "gaussian process", "Nbase": 4096,   (campaigns without the plan)
+#     "bootstrap": 200, "seed": 0
+# }
+#
+# output/sobol_indices.csv and output/rank_correlation.csv are written.
+#
+# usage: python sensitivity.py (mission_name) [sensitivity.json]
+import sys
+import os
+import json
+import multiprocessing as mp
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+import campaign_store
+import dispersion
+import surrogate
+from monte_carlo import saltelli_plan
+
+
+def sobol_indices(Y_A, Y_B, Y_AB):
+    """
+    Args:
+        Y_A, Y_B (array) : (..., N, T) outputs of the blocks A and B
+        Y_AB (array) : (..., Ndim, N, T) outputs of the blocks AB_i, nan for failed cases
+    Returns:
+        first order and total indices (..., Ndim, T), the base samples with a nan
+        in any block are left out
+    """
+    valid = np.isfinite(Y_A) & np.isfinite(Y_B) & np.all(np.isfinite(Y_AB), axis=-3)
+    n = np.maximum(np.count_nonzero(valid, axis=-2), 1)
+    mean = (np.sum(np.where(valid, Y_A, 0.0), axis=-2) + np.sum(np.where(valid, Y_B, 0.0), axis=-2)) / (2 * n)
+    # centered outputs, the first order estimator is unstable for outputs with a large mean
+    mean = mean[..., None, :]
+    A, B = np.where(valid, Y_A - mean, 0.0), np.where(valid, Y_B - mean, 0.0)
+    variance = np.sum(A * A + B * B, axis=-2) / np.maximum(2 * n - 1, 1)
+    variance = np.where(variance > 0.0, variance, np.nan)[..., None, :]
+    n = n[..., None, :]
+    valid, A, B = valid[..., None, :, :], A[..., None, :, :], B[..., None, :, :]
+    AB = np.where(valid, Y_AB - mean[..., None, :, :], 0.0)
+    first = np.sum(B * (AB - A), axis=-2) / n / variance
+    total = 0.5 * np.sum((A - AB) ** 2, axis=-2) / n / variance
+    return first, total
+
+
+def bootstrap_sobol(Y_A, Y_B, Y_AB, Nboot=200, seed=0, confidence=0.95, chunk=16):
+    """ half widths (Ndim, T) of the confidence intervals of the first order and total indices """
+    rng = np.random.default_rng(seed)
+    index = rng.integers(0, len(Y_A), (Nboot, len(Y_A)))
+    first, total = [], []
+    for k in range(0, Nboot, chunk):
+        i = index[k:k + chunk]
+        f, t = sobol_indices(Y_A[i], Y_B[i], np.moveaxis(Y_AB[:, i], 0, 1))
+        first.append(f)
+        total.append(t)
+    q = [50.0 * (1.0 - confidence), 50.0 * (1.0 + confidence)]
+    return [0.5 * np.diff(np.nanpercentile(np.concatenate(v), q, axis=0), axis=0)[0] for v in (first, total)]
+
+
+def split_plan(Y, Ndim, Nbase):
+    """ outputs (Nbase * (Ndim + 2), T) of the plan in its blocks A, B and AB (Ndim, Nbase, T) """
+    return Y[:Nbase], Y[Nbase:2 * Nbase], Y[2 * Nbase:].reshape(Ndim, Nbase, -1)
+
+
+def rank_correlation(X, Y):
+    """
+    Spearman rank correlation (p, T) of the inputs X (n, p) and the outputs Y (n, T),
+    over the cases without nan
+    """
+    valid = np.all(np.isfinite(X), axis=1) & np.all(np.isfinite(Y), axis=1)
+    R = pd.DataFrame(np.concatenate([X[valid], Y[valid]], axis=1)).rank().to_numpy()
+    R = R - R.mean(axis=0)
+    norm = np.sqrt(np.sum(R * R, axis=0))
+    R = R / np.where(norm > 0.0, norm, np.nan)
+    p = X.shape[1]
+    return R[:, :p].T @ R[:, p:]
+
+
+if __name__ == "__main__":
+    Nproc = max(mp.cpu_count() - 1, 1)
+
+    print("IST SENSITIVITY ANALYZER")
+    print("libraries load done.")
+
+    argv = sys.argv
+    if len(argv) > 1:
+        otmc_mission_name = argv[1]
+    else:
+        print("PLEASE INPUT mission_name as the command line argument.")
+        exit()
+    missionpath = campaign_store.mission_path(otmc_mission_name)
+
+    if len(argv) > 2:
+        stat_input = argv[2]
+    else:
+        stat_input = "sensitivity.json"
+        campaign_store.fetch(missionpath + "/stat/inp/sensitivity.json", stat_input)
+    stat = {}
+    if os.path.exists(stat_input):
+        with open(stat_input) as fp:
+            stat = json.load(fp)
+    seed = stat.get("seed", 0)
+
+    mc, gosa, nominal = dispersion.load_mission_inputs(missionpath)
+    manifest = dispersion.dispersion_manifest(gosa, dispersion.load_case_settings(missionpath, mc["suffix"]))
+    store = campaign_store.open_store(otmc_mission_name, "store", Nproc)
+    targets = surrogate.event_targets(store, stat.get("targets", surrogate.default_targets))
+    parameters = ["/".join(keys) for rule, argument, keys in dispersion.dispersion_routes(gosa)]
+    Ndim = len(parameters)
+
+    if mc.get("sampling") == "saltelli":
+        Nbase = mc["Nbase"]
+        print("Saltelli plan of the campaign: Nbase = {0:d}, {1:d} parameters".format(Nbase, Ndim))
+        cases = np.arange(1, Nbase * (Ndim + 2) + 1)
+        missing = cases[~np.isin(cases, targets.index)]
+        if len(missing) > 0:
+            # a missing case of the plan would take its whole block out of the indices
+            print("ERROR: {0:d} cases of the Saltelli plan have no result: {1:s}".format(
+                len(missing), " ".join(str(c) for c in missing[:20]) + (" ..." if len(missing) > 20 else "")))
+            exit(1)
+        Y = targets.loc[cases].to_numpy(dtype=np.float64)
+    else:
+        Nbase = stat.get("Nbase", 4096)
+        model = surrogate.models[stat.get("model", "gaussian process")]()
+        fitted = surrogate.Surrogate(model).fit(manifest, targets)
+        print("{0:s} surrogate on a plan of Nbase = {1:d}, {2:d} parameters".format(model.name, Nbase, Ndim))
+        print(fitted.diagnostics().to_string(index=False))
+        U = saltelli_plan(Ndim, Nbase, seed)
+        Y = fitted.predict(dispersion.dispersion_values(gosa, nominal, U)).to_numpy(copy=True)
+        # longitudes back around the campaign center, not across the date line
+        lon = np.isfinite(fitted.lon_center)
+        Y[:, lon] = (Y[:, lon] - fitted.lon_center[lon] + 180.0) % 360.0 - 180.0 + fitted.lon_center[lon]
+    Y_A, Y_B, Y_AB = split_plan(Y, Ndim, Nbase)
+    first, total = sobol_indices(Y_A, Y_B, Y_AB)
+    first_conf, total_conf = bootstrap_sobol(Y_A, Y_B, Y_AB, stat.get("bootstrap", 200), seed)
+
+    rows = []
+    for t, target in enumerate(targets.columns):
+        for i in np.argsort(-np.nan_to_num(total[:, t], nan=-np.inf)):
+            rows.append(OrderedDict([("target", target), ("parameter", parameters[i]),
+                                     ("first order", first[i, t]), ("first order conf", first_conf[i, t]),
+                                     ("total", total[i, t]), ("total conf", total_conf[i, t])]))
+        print(target)
+        for row in rows[-Ndim:]:
+            print("\t{0:.3f} ({1:.3f})\t{2:s}".format(row["total"], row["first order"], row["parameter"]))
+    df_sobol = pd.DataFrame(rows)
+
+    df = manifest.join(targets, how="inner")
+    rho = rank_correlation(df[manifest.columns].to_numpy(dtype=np.float64), df[targets.columns].to_numpy(dtype=np.float64))
+    df_rank = pd.DataFrame(rho, index=pd.Index(manifest.columns, name="parameter"), columns=targets.columns)
+
+    os.makedirs("output", exist_ok=True)
+    outputfiles = ["output/sobol_indices.csv", "output/rank_correlation.csv"]
+    df_sobol.to_csv(outputfiles[0], index=False)
+    df_rank.to_csv(outputfiles[1])
+
+    for outputfile in outputfiles:
+        if missionpath.startswith("s3://"):
+            os.system("aws s3 cp " + outputfile + " " + missionpath + "/stat/output/")
+        else:
+            os.system("cp " + outputfile + " " + missionpath + "/stat/output/")
@@ -0,0 +1,241 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# Copyright (c) 2017 Interstellar Technologies Inc. All Rights Reserved.
+# ==============================================================================
+# Bootstrap confidence intervals of the campaign percentiles.
+#
+# The high/low values of fetch_stat (stat_covariance.py) are order statistics
+# of the cases. Here the case indices are resampled with replacement and the
+# same high/low values are taken from every resample, which gives a
+# confidence interval telling whether the number of cases was enough.
+#
+# Each data set is sorted once. A resample is drawn as the multiplicity of
+# every case (multinomial counts); the order statistics of the resample are
+# then found from the cumulative counts in the sorted order, so a batch of
+# resamples is one vectorized pass over all variables and time steps without
+# sorting again. Batches can be spread over a worker pool.
+#
+# The settings are those of covariance.json ("fetch mode", "probability(%)")
+# with the optional entry
+#     "bootstrap": {"replicates": 200, "confidence(%)": 95, "seed": 0}
+# covariance_<k>_ci.csv is written for the "sample points" of covariance.json
+# and datapoint_<k>_ci.csv for those of datapoint.json (values from stat_query.py).
+#
+# usage: python stat_bootstrap.py (mission_name)
+import sys
+import os
+import json
+import math
+import warnings
+import multiprocessing as mp
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+import campaign_store
+import stat_query
+
+
+def fetch_index(Nvalid, fetch_mode, number_of_sample, Nfetch, probability):
+    """
+    index of the high/low values in the ascending sorted valid data, same rule as fetch_stat
+    Args:
+        Nvalid (int array) : number of the valid (not nan) data
+    Returns:
+        high, low (int array), -1 where fetch_stat returns nan
+    """
+    Nvalid = np.asarray(Nvalid, dtype=np.int64)
+    if fetch_mode == "constant":
+        high = Nvalid - Nfetch
+        low = np.full_like(Nvalid, Nfetch - 1)
+        enough = Nvalid >= Nfetch
+        high = np.where(enough, high, -1)
+        low = np.where(enough, low, -1)
+    elif fetch_mode == "constant high":
+        high = Nvalid - Nfetch
+        low = Nfetch - 1 - (number_of_sample - Nvalid)
+        enough = Nvalid >= Nfetch
+        high = np.where(enough, high, -1)
+        low = np.where(enough & (low >= 0), low, -1)
+    else:  # variable
+        n = np.ceil(Nvalid * probability).astype(np.int64)
+        n = ((Nvalid - n) / 2.0).astype(np.int64)
+        high = np.where(Nvalid > 0, Nvalid - n - 1, -1)
+        low = np.where(Nvalid > 0, n, -1)
+    return high, low
+
+
+def fetch_stat_array(X, fetch_mode, number_of_sample, Nfetch, probability):
+    """
+    fetch_stat of stat_covariance.py for every column at once
+    Args:
+        X (array) : (Ncase, M), nan for the missing data
+    Returns:
+        high, low (array (M,))
+    """
+    Xs = np.sort(X, axis=0)
+    Nvalid = np.sum(~np.isnan(X), axis=0)
+    high, low = fetch_index(Nvalid, fetch_mode, number_of_sample, Nfetch, probability)
+    cols = np.arange(X.shape[1])
+    return (np.where(high >= 0, Xs[np.maximum(high, 0), cols], np.nan),
+            np.where(low >= 0, Xs[np.maximum(low, 0), cols], np.nan))
+
+
+_worker = {}
+
+
+def _init_worker(Xs, order, valid, setting):
+    _worker.update(Xs=Xs, order=order, valid=valid, setting=setting)
+
+
+def _bootstrap_batch(arg):
+    """ high/low of Nb resamples, returns (Nb, M) x 2 """
+    seed, Nb = arg
+    Xs, order, valid = _worker["Xs"], _worker["order"], _worker["valid"]
+    fetch_mode, number_of_sample, Nfetch, probability = _worker["setting"]
+    N, M = Xs.shape
+    rng = np.random.default_rng(seed)
+    counts = rng.multinomial(N, np.full(N, 1.0 / N), size=Nb).astype(np.int32)
+    # multiplicity of each sorted position, (Nb, N, M)
+    cum = np.cumsum(counts[:, order], axis=1, dtype=np.int32)
+    Nvalid = np.take_along_axis(cum, np.broadcast_to(valid.sum(axis=0) - 1, (Nb, 1, M)).clip(0), axis=1)[:, 0, :]
+    Nvalid = np.where(valid.sum(axis=0) > 0, Nvalid, 0)
+    high, low = fetch_index(Nvalid, fetch_mode, number_of_sample, Nfetch, probability)
+    out = []
+    cols = np.arange(M)
+    for r in [high, low]:
+        # position of the r-th (0 origin) value of the resample in the sorted data
+        j = np.sum(cum <= r[:, None, :], axis=1)
+        out.append(np.where(r >= 0, Xs[np.minimum(j, N - 1), cols], np.nan))
+    return out
+
+
+def bootstrap(X, fetch_mode, number_of_sample, Nfetch, probability,
+              replicates=200, confidence=0.95, seed=0, Nproc=1, batch_elements=20000000):
+    """
+    Args:
+        X (array) : (Ncase, M), nan for the missing data
+        replicates (int) : number of bootstrap resamples
+        confidence (float) : confidence level of the interval
+        Nproc (int) : worker processes, 1 for in-process
+        batch_elements (int) : max size of a (resamples x cases x columns) batch
+    Returns:
+        dict of (M,) arrays: high, low, high_ci_lower, high_ci_upper, low_ci_lower, low_ci_upper
+    """
+    X = np.asarray(X, dtype=np.float64)
+    N, M = X.shape
+    high, low = fetch_stat_array(X, fetch_mode, number_of_sample, Nfetch, probability)
+    order = np.argsort(X, axis=0, kind="stable")
+    Xs = np.take_along_axis(X, order, axis=0)
+    valid = ~np.isnan(Xs)
+    setting = (fetch_mode, number_of_sample, Nfetch, probability)
+
+    Nb = max(1, min(replicates, batch_elements // max(N * M, 1)))
+    sizes = [min(Nb, replicates - i) for i in range(0, replicates, Nb)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    args = list(zip(seeds, sizes))
+    if Nproc > 1 and len(args) > 1:
+        pool = mp.Pool(min(Nproc, len(args)), _init_worker, (Xs, order, valid, setting))
+        callback = pool.map(_bootstrap_batch, args)
+        pool.close()
+        pool.join()
+    else:
+        _init_worker(Xs, order, valid, setting)
+        callback = [_bootstrap_batch(a) for a in args]
+    # no interval where the campaign itself has no value
+    high_b = np.where(np.isnan(high), np.nan, np.concatenate([c[0] for c in callback], axis=0))
+    low_b = np.where(np.isnan(low), np.nan, np.concatenate([c[1] for c in callback], axis=0))
+
+    q = [50.0 * (1.0 - confidence), 50.0 * (1.0 + confidence)]
+    out = OrderedDict(high=high, low=low)
+    with warnings.catch_warnings():
+        # all nan columns (no case at the time step) stay nan
+        warnings.simplefilter("ignore", RuntimeWarning)
+        out["high_ci_lower"], out["high_ci_upper"] = np.nanpercentile(high_b, q, axis=0)
+        out["low_ci_lower"], out["low_ci_upper"] = np.nanpercentile(low_b, q, axis=0)
+    return out
+
+
+def rows_matrix(store, body, name):
+    """ (Ncase, Nrow max) matrix of the column by row index as stat_covariance.py, nan padded """
+    offsets = store.offsets(body)
+    lengths = np.diff(offsets)
+    x = np.asarray(store.column(body, name))
+    out = np.full((len(lengths), lengths.max()), np.nan)
+    mask = np.arange(lengths.max())[None, :] < lengths[:, None]
+    out[mask] = x
+    return out
+
+
+def to_frame(stats, index, name):
+    return pd.DataFrame(OrderedDict((name + "_" + k, v) for k, v in stats.items()), index=index)
+
+
+if __name__ == "__main__":
+    Nproc = max(mp.cpu_count() - 1, 1)
+
+    print("IST BOOTSTRAP MAKER")
+    print("libraries load done.")
+
+    argv = sys.argv
+    if len(argv) > 1:
+        otmc_mission_name = argv[1]
+    else:
+        print("PLEASE INPUT mission_name as the command line argument.")
+        exit()
+    missionpath = campaign_store.mission_path(otmc_mission_name)
+
+    campaign_store.fetch(missionpath + "/raw/inp/mc.json", "mc.json")
+    with open("mc.json") as fp:
+        number_of_sample = int(json.load(fp)["Ntask"])
+    campaign_store.fetch(missionpath + "/stat/inp/covariance.json", "covariance.json")
+    with open("covariance.json") as fp:
+        stat = json.load(fp, object_pairs_hook=OrderedDict)
+    fetch_mode = stat["fetch mode"]
+    probability = float(stat["probability(%)"]) * 1e-2
+    Nfetch = math.ceil(number_of_sample * probability)
+    Nfetch = int((number_of_sample - Nfetch) / 2.0) + 1
+    setting = stat.get("bootstrap", {})
+    options = dict(replicates=int(setting.get("replicates", 200)),
+                   confidence=float(setting.get("confidence(%)", 95)) * 1e-2,
+                   seed=int(setting.get("seed", 0)), Nproc=Nproc)
+
+    store = campaign_store.open_store(otmc_mission_name, "store", Nproc)
+    body = "dynamics_1"
+    dispersed = store.cases(body) > 0
+    os.makedirs("output", exist_ok=True)
+
+    # covariance_*.csv
+    for key_sample_point, key_variable_names in stat["sample points"].items():
+        df_out = []
+        for key_variable_name in key_variable_names:
+            X = rows_matrix(store, body, key_variable_name)[dispersed]
+            if key_sample_point == "all":
+                index = np.arange(X.shape[1])
+            elif key_sample_point == "landing_time":
+                lengths = np.diff(store.offsets(body))[dispersed]
+                X = X[np.arange(len(X)), lengths - 1][:, None]
+                index = [key_sample_point]
+            else:
+                X = X[:, [int(key_sample_point)]]
+                index = [int(key_sample_point)]
+            stats = bootstrap(X, fetch_mode, number_of_sample, Nfetch, probability, **options)
+            df_out.append(to_frame(stats, index, key_variable_name))
+        pd.concat(df_out, axis=1).dropna(axis=0, how="all").to_csv(
+            "output/covariance_{}_ci.csv".format(key_sample_point))
+
+    # datapoint_*.csv
+    if campaign_store.fetch(missionpath + "/stat/inp/datapoint.json", "datapoint.json"):
+        with open("datapoint.json") as fp:
+            queries = stat_query.load_queries(json.load(fp, object_pairs_hook=OrderedDict))
+        for k, df in stat_query.evaluate(store, queries).items():
+            columns = [c for c in df.columns if c != "caseNo"]
+            stats = bootstrap(df[columns].to_numpy(dtype=np.float64), fetch_mode,
+                              number_of_sample, Nfetch, probability, **options)
+            df_out = pd.concat([to_frame(OrderedDict((s, v[[j]]) for s, v in stats.items()), [k], c)
+                                for j, c in enumerate(columns)], axis=1)
+            df_out.to_csv("output/datapoint_{}_ci.csv".format(k))
+
+    if missionpath.startswith("s3://"):
+        os.system("aws s3 cp output " + missionpath + "/stat/output/ --exclude '*' --include '*_ci.csv' --recursive")
+    else:
+        os.system("cp output/*_ci.csv " + missionpath + "/stat/output/")
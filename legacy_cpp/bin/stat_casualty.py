@@ -0,0 +1,196 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# Copyright (c) 2017 Interstellar Technologies Inc. All Rights Reserved.
+# ==============================================================================
+# Expected casualties (Ec) of every stage and dump product.
+#
+# The population raster is an ESRI binary grid (.flt float32 + .hdr) in
+# lon/lat [deg], memory mapped and read in blocks of rows, so that only the
+# rows with impact points are loaded. Each dispersed case puts probability
+# 1/N on the raster cell of its impact point (stat_jettison_area.py), and
+#   Ec = sum over cells of P(cell) * density(cell) * sum over fragments of n * A_c
+# with the casualty area A_c [m2] of each fragment of the body. All the
+# fragments of a body are assumed to land at the impact point of the body
+# (the last row of the case): the breakup and the dispersion of the
+# fragments around it are not modeled.
+#
+# casualty.json:
+# {
+#     "population unit": "density(1/km2)",   (or "count" : persons per cell)
+#     "fragments": {
+#         "dynamics_1": [{"name": "1st stage", "casualty area(m2)": 150.0, "number": 1}],
+#         "dynamics_1_dump": [{"name": "fairing", "casualty area(m2)": 30.0, "number": 2}]
+#     },
+#     "default casualty area(m2)": 0.0        (bodies without "fragments")
+# }
+#
+# output/casualty.csv (Ec of every body), output/casualty_<body>.csv (cells
+# with impact probability, their density and contribution) are written.
+#
+# usage: python stat_casualty.py (mission_name) (population.flt) [casualty.json]
+import sys
+import os
+import json
+import multiprocessing as mp
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+import campaign_store
+import stat_jettison_area
+
+R_earth = 6378137.0  # [m], cell area of the "count" raster
+
+
+class PopulationRaster:
+    """
+    ESRI binary grid (.flt + .hdr), memory mapped
+    Args:
+        filename (str) : .flt file, the .hdr is next to it
+        unit (str) : "density(1/km2)" or "count" (persons per cell)
+        block_bytes (int) : max size of a block of rows read at once
+    """
+    def __init__(self, filename, unit="density(1/km2)", block_bytes=64 * 1024 * 1024):
+        header = {}
+        with open(os.path.splitext(filename)[0] + ".hdr") as fp:
+            for line in fp:
+                if len(line.split()) >= 2:
+                    header[line.split()[0].lower()] = line.split()[1]
+        self.ncols, self.nrows = int(header["ncols"]), int(header["nrows"])
+        self.cellsize = float(header["cellsize"])
+        self.xll = float(header.get("xllcorner", float(header.get("xllcenter", 0.0)) - 0.5 * self.cellsize))
+        self.yll = float(header.get("yllcorner", float(header.get("yllcenter", 0.0)) - 0.5 * self.cellsize))
+        self.nodata = float(header.get("nodata_value", -9999))
+        byteorder = ">" if header.get("byteorder", "LSBFIRST").upper() == "MSBFIRST" else "<"
+        self.data = np.memmap(filename, dtype=byteorder + "f4", mode="r", shape=(self.nrows, self.ncols))
+        self.unit = unit
+        self.block_rows = max(1, int(block_bytes // (4 * self.ncols)))
+
+    def cell(self, lon, lat):
+        """ row (from the north), column of the points, -1 outside the raster """
+        lon = (np.asarray(lon, dtype=np.float64) - self.xll) % 360.0
+        lat = np.asarray(lat, dtype=np.float64)
+        with np.errstate(invalid="ignore"):
+            col = np.floor(lon / self.cellsize)
+            row = self.nrows - 1 - np.floor((lat - self.yll) / self.cellsize)
+        outside = ~(np.isfinite(col) & np.isfinite(row)) | (col >= self.ncols) | (row < 0) | (row >= self.nrows)
+        return (np.where(outside, -1, np.nan_to_num(row)).astype(np.int64),
+                np.where(outside, -1, np.nan_to_num(col)).astype(np.int64))
+
+    def cell_area(self, row):
+        """ area [m2] of the cells of the rows """
+        lat_top = np.deg2rad(self.yll + (self.nrows - row) * self.cellsize)
+        lat_bottom = np.deg2rad(self.yll + (self.nrows - row - 1) * self.cellsize)
+        return R_earth ** 2 * np.deg2rad(self.cellsize) * np.abs(np.sin(lat_top) - np.sin(lat_bottom))
+
+    def density(self, row, col):
+        """ population density [1/m2] of the cells, read block by block of rows """
+        row, col = np.asarray(row), np.asarray(col)
+        value = np.zeros(len(row))
+        valid = np.flatnonzero(row >= 0)
+        order = valid[np.argsort(row[valid], kind="stable")]
+        sorted_row = row[order]
+        for r0 in np.unique(sorted_row // self.block_rows) * self.block_rows:
+            a, b = np.searchsorted(sorted_row, [r0, r0 + self.block_rows])
+            block = np.asarray(self.data[r0:r0 + self.block_rows])
+            index = order[a:b]
+            value[index] = block[row[index] - r0, col[index]]
+        value[(value == self.nodata) | ~np.isfinite(value) | (value < 0)] = 0.0
+        if self.unit == "count":
+            return np.where(row >= 0, value / self.cell_area(row), 0.0)
+        return value * 1e-6
+
+
+def casualty_area(fragments, default=0.0):
+    """ sum of number * casualty area [m2] of the fragments of a body """
+    if fragments is None:
+        return default
+    return sum(float(f.get("number", 1)) * float(f["casualty area(m2)"]) for f in fragments)
+
+
+def expected_casualty(raster, lon, lat, area):
+    """
+    Ec of a body, all its fragments at the impact point of every case
+    Args:
+        raster (PopulationRaster)
+        lon, lat (array) : impact points [deg] of the dispersed cases
+        area (float) : total casualty area [m2] of the body
+    Returns:
+        Ec and a DataFrame of the cells with impact probability
+    """
+    N = len(lon)
+    row, col = raster.cell(lon, lat)
+    key = np.where(row >= 0, row * raster.ncols + col, -1)
+    cells, count = np.unique(key[key >= 0], return_counts=True)
+    row, col = np.divmod(cells, raster.ncols)
+    density = raster.density(row, col)
+    probability = count / N
+    ec = probability * density * area
+    df = pd.DataFrame(OrderedDict([
+        ("lon(deg)", raster.xll + (col + 0.5) * raster.cellsize),
+        ("lat(deg)", raster.yll + (raster.nrows - row - 0.5) * raster.cellsize),
+        ("probability", probability),
+        ("density(1/km2)", density * 1e6),
+        ("Ec", ec)]))
+    return float(ec.sum()), df.sort_values("Ec", ascending=False).reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    Nproc = max(mp.cpu_count() - 1, 1)
+
+    print("IST CASUALTY EXPECTATION MAKER")
+    print("libraries load done.")
+
+    argv = sys.argv
+    if len(argv) > 2:
+        otmc_mission_name = argv[1]
+        raster_file = argv[2]
+    else:
+        print("PLEASE INPUT mission_name and population raster (.flt) as the command line arguments.")
+        exit()
+    missionpath = campaign_store.mission_path(otmc_mission_name)
+
+    if len(argv) > 3:
+        stat_input = argv[3]
+    else:
+        stat_input = "casualty.json"
+        campaign_store.fetch(missionpath + "/stat/inp/casualty.json", stat_input)
+    with open(stat_input) as fp:
+        stat = json.load(fp)
+    fragments = stat.get("fragments", {})
+    default_area = float(stat.get("default casualty area(m2)", 0.0))
+
+    raster = PopulationRaster(raster_file, stat.get("population unit", "density(1/km2)"))
+    print("population raster: {0:d} x {1:d}, cell {2:} [deg]".format(raster.nrows, raster.ncols, raster.cellsize))
+
+    os.makedirs("output", exist_ok=True)
+    outputfiles = []
+    summary = []
+    store = campaign_store.open_store(otmc_mission_name, "store", Nproc)
+    for body in store.bodies:
+        if body.endswith("_extend") or "lat(deg)" not in store.columns(body):
+            continue
+        lon, lat, cases = stat_jettison_area.impact_points(store, body)
+        if len(lon) == 0:
+            continue
+        area = casualty_area(fragments.get(body), default_area)
+        ec, df = expected_casualty(raster, lon, lat, area)
+        outputfile = "output/casualty_{0:s}.csv".format(body)
+        df.to_csv(outputfile, index=False)
+        outputfiles.append(outputfile)
+        summary.append(OrderedDict([("body", body), ("cases", len(lon)), ("casualty area(m2)", area),
+                                    ("probability on raster", df["probability"].sum()),
+                                    ("probability on population", df["probability"][df["density(1/km2)"] > 0].sum()),
+                                    ("Ec", ec)]))
+        print("{0:s}: Ec = {1:.3e}".format(body, ec))
+    df = pd.DataFrame(summary)
+    if len(summary) > 0:
+        df["cases"] = df["cases"].astype("Int64")
+        df = pd.concat([df, pd.DataFrame([OrderedDict([("body", "total"), ("Ec", df["Ec"].sum())])])], ignore_index=True)
+    df.to_csv("output/casualty.csv", index=False)
+    outputfiles.append("output/casualty.csv")
+
+    for outputfile in outputfiles:
+        if missionpath.startswith("s3://"):
+            os.system("aws s3 cp " + outputfile + " " + missionpath + "/stat/output/")
+        else:
+            os.system("cp " + outputfile + " " + missionpath + "/stat/output/")
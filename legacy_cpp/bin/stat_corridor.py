@@ -0,0 +1,233 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# Copyright (c) 2017 Interstellar Technologies Inc. All Rights Reserved.
+# ==============================================================================
+# Flight corridor conformance of the trajectory and the IIP.
+#
+# The corridor is either a center line with a half width (left / right of the
+# flight direction) or a polygon. For every output row of every case
+# (nominal run = case 0 included) the signed cross-track distance [m] is
+# computed on the sphere. The rows are sorted into blocks of nearby points,
+# and each block is tested at once against the segments whose bounding caps
+# can hold its nearest point:
+#   center line : positive to the right of the line, the nearest segment
+#   polygon     : distance to the boundary, positive outside
+# and the row violates the corridor if it is out of the width / outside.
+# The spherical model is within 0.5 % of the distance on the ellipsoid.
+#
+# corridor.json:
+# {
+#     "centerline": [[lon, lat], ...], "half width(m)": 20000 (or [left, right]),
+#     "polygon": [[lon, lat], ...]          (instead of the center line)
+#     "file": "corridor.geojson"            (instead, first zone of a GeoJSON/KML/csv file)
+#     "targets": ["trajectory", "IIP"],
+#     "bodies": ["dynamics_1"]              (all the bodies if not given)
+# }
+#
+# output/corridor_<body>_<target>.csv (first violation time and the max
+# exceedance of every case) and output/corridor_probability_<body>_<target>.csv
+# (violation probability vs time of the dispersed cases) are written.
+#
+# usage: python stat_corridor.py (mission_name) [corridor.json]
+import sys
+import os
+import json
+import multiprocessing as mp
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+import campaign_store
+from coordinate_transform import R_mean
+import stat_footprint
+import stat_keepout
+
+targets_columns = {"trajectory": ("lon(deg)", "lat(deg)"), "IIP": ("IIP_lon(deg)", "IIP_lat(deg)")}
+
+
+def unit_vectors(lon, lat):
+    """ (N, 3) unit vectors of the points on the sphere """
+    lon, lat = np.deg2rad(lon), np.deg2rad(lat)
+    return np.stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)], axis=-1)
+
+
+class Corridor:
+    """
+    Args:
+        centerline (array) : (n, 2) lon, lat [deg] of the center line in the flight direction
+        half_width (float or list) : [m], or [left, right]
+        polygon (array) : (n, 2) lon, lat [deg] of the corridor boundary, instead of the center line
+    """
+    def __init__(self, centerline=None, half_width=None, polygon=None):
+        if polygon is not None:
+            self.ring = stat_keepout._close(polygon)
+            self.ring[:, 0] = np.rad2deg(np.unwrap(np.deg2rad(self.ring[:, 0])))
+            vertices = self.ring
+        else:
+            self.ring = None
+            vertices = np.asarray(centerline, dtype=np.float64)
+            w = np.broadcast_to(np.asarray(half_width, dtype=np.float64), (2,))
+            self.left, self.right = w[0], w[1]
+        u = unit_vectors(vertices[:, 0], vertices[:, 1])
+        self.V = u
+        self.A, self.B = u[:-1], u[1:]
+        n = np.cross(self.A, self.B)
+        self.N = n / np.linalg.norm(n, axis=1)[:, None]
+        self.NA = np.cross(self.N, self.A)
+        self.BN = np.cross(self.B, self.N)
+        # bounding cap of each segment
+        c = self.A + self.B
+        self.C = c / np.linalg.norm(c, axis=1)[:, None]
+        self.r = 0.5 * np.arccos(np.clip(np.sum(self.A * self.B, axis=1), -1.0, 1.0))
+
+    def _nearest(self, p, segment):
+        """ signed angle [rad] of the points p (n, 3) to the nearest of the segments """
+        N, NA, BN, A, B = self.N[segment], self.NA[segment], self.BN[segment], self.A[segment], self.B[segment]
+        s = p @ N.T
+        within = (p @ NA.T >= 0.0) & (p @ BN.T >= 0.0)
+        # cosine of the angle to the nearest point of each segment, the largest is the nearest
+        cosine = np.where(within, np.sqrt(np.maximum(1.0 - s * s, 0.0)), np.maximum(p @ A.T, p @ B.T))
+        nearest = np.argmax(cosine, axis=1)
+        rows = np.arange(len(p))
+        # exact angle to the nearest segment only
+        s_n = np.clip(s[rows, nearest], -1.0, 1.0)
+        A, B = A[nearest], B[nearest]
+        V = np.where((np.sum(p * A, axis=1) >= np.sum(p * B, axis=1))[:, None], A, B)
+        chord = np.linalg.norm(p - V, axis=1)
+        angle = np.where(within[rows, nearest], np.abs(np.arcsin(s_n)), 2.0 * np.arcsin(np.minimum(0.5 * chord, 1.0)))
+        # right of the segment direction is positive
+        return np.where(s_n > 0.0, -1.0, 1.0) * angle
+
+    def signed_distance(self, lon, lat, block=2048):
+        """
+        Args:
+            lon, lat (array) : points [deg]
+            block (int) : number of the points tested together
+        Returns:
+            (M,) signed cross-track distance [m], nan for nan points
+        """
+        lon, lat = np.asarray(lon, dtype=np.float64), np.asarray(lat, dtype=np.float64)
+        out = np.full(len(lon), np.nan)
+        valid = np.flatnonzero(np.isfinite(lon) & np.isfinite(lat))
+        # blocks of nearby points (1 deg cells) only test the segments that can be the nearest
+        key = np.floor(lat[valid] + 90.0) * 360.0 + np.floor((lon[valid] + 180.0) % 360.0)
+        valid = valid[np.argsort(key, kind="stable")]
+        P = unit_vectors(lon[valid], lat[valid])
+        for k in range(0, len(valid), block):
+            p = P[k:k + block]
+            c = p.sum(axis=0)
+            c = c / np.linalg.norm(c)
+            r = np.arccos(np.clip(np.min(p @ c), -1.0, 1.0))
+            upper = np.arccos(np.clip(np.max(self.V @ c), -1.0, 1.0)) + r
+            lower = np.arccos(np.clip(self.C @ c, -1.0, 1.0)) - r - self.r
+            segment = np.flatnonzero(lower <= upper + 1e-12)
+            out[valid[k:k + block]] = self._nearest(p, segment) * R_mean
+        out[~(np.isfinite(lon) & np.isfinite(lat))] = np.nan
+        if self.ring is not None:
+            # outside of the polygon is positive
+            center = 0.5 * (self.ring[:, 0].min() + self.ring[:, 0].max())
+            x = (lon - center + 180.0) % 360.0 - 180.0 + center
+            inside = stat_footprint.points_in_ring(x, lat, self.ring)
+            out = np.where(inside, -np.abs(out), np.abs(out))
+        return out
+
+    def exceedance(self, distance):
+        """ distance [m] beyond the corridor, positive where the row violates it """
+        if self.ring is not None:
+            return distance
+        return np.maximum(distance - self.right, -self.left - distance)
+
+
+def load_corridor(stat):
+    if "file" in stat:
+        name, rings = stat_keepout.load_zones([stat["file"]])[0]
+        return Corridor(polygon=rings[0])
+    if "polygon" in stat:
+        return Corridor(polygon=stat["polygon"])
+    return Corridor(centerline=stat["centerline"], half_width=stat["half width(m)"])
+
+
+def conformance(store, body, corridor, target="IIP"):
+    """
+    Returns:
+        DataFrame of caseNo, first violation time(s) (nan if none) and max exceedance(m) of every case,
+        DataFrame of time(s), cumulative and instantaneous violation probability of the dispersed cases
+    """
+    col_lon, col_lat = targets_columns[target]
+    offsets = store.offsets(body)
+    starts = offsets[:-1]
+    cases = store.cases(body)
+    time = np.asarray(store.column(body, "time(s)"))
+    excess = corridor.exceedance(corridor.signed_distance(store.column(body, col_lon), store.column(body, col_lat)))
+    violation = excess > 0.0  # nan rows are not violations
+
+    first = np.minimum.reduceat(np.where(violation, np.arange(len(time)), len(time)), starts)
+    first_time = np.where(first < offsets[1:], time[np.minimum(first, len(time) - 1)], np.nan)
+    df_case = pd.DataFrame(OrderedDict([
+        ("caseNo", cases),
+        ("first violation time(s)", first_time),
+        ("max exceedance(m)", np.fmax.reduceat(excess, starts))]))
+
+    # probability vs time of the dispersed cases
+    lengths = np.diff(offsets)
+    dispersed = np.repeat(cases > 0, lengths)
+    Ncase = np.count_nonzero(cases > 0)
+    grid = np.unique(time[dispersed & np.isfinite(time)])
+    index = np.searchsorted(grid, time[dispersed & np.isfinite(time)])
+    flying = np.bincount(index, minlength=len(grid))
+    outside = np.bincount(index, weights=violation[dispersed & np.isfinite(time)], minlength=len(grid))
+    first_dispersed = np.sort(first_time[cases > 0])
+    df_time = pd.DataFrame(OrderedDict([
+        ("time(s)", grid),
+        ("cumulative probability", np.searchsorted(first_dispersed, grid, side="right") / max(Ncase, 1)),
+        ("instantaneous probability", outside / max(Ncase, 1)),
+        ("flying cases", flying)]))
+    return df_case, df_time
+
+
+if __name__ == "__main__":
+    Nproc = max(mp.cpu_count() - 1, 1)
+
+    print("IST CORRIDOR CHECKER")
+    print("libraries load done.")
+
+    argv = sys.argv
+    if len(argv) > 1:
+        otmc_mission_name = argv[1]
+    else:
+        print("PLEASE INPUT mission_name as the command line argument.")
+        exit()
+    missionpath = campaign_store.mission_path(otmc_mission_name)
+
+    if len(argv) > 2:
+        stat_input = argv[2]
+    else:
+        stat_input = "corridor.json"
+        campaign_store.fetch(missionpath + "/stat/inp/corridor.json", stat_input)
+    with open(stat_input) as fp:
+        stat = json.load(fp)
+    corridor = load_corridor(stat)
+    targets = stat.get("targets", ["trajectory", "IIP"])
+
+    os.makedirs("output", exist_ok=True)
+    outputfiles = []
+    store = campaign_store.open_store(otmc_mission_name, "store", Nproc)
+    for body in stat.get("bodies", store.bodies):
+        for target in targets:
+            if not all(c in store.columns(body) for c in targets_columns[target]):
+                continue
+            df_case, df_time = conformance(store, body, corridor, target)
+            for df, name in [(df_case, "corridor"), (df_time, "corridor_probability")]:
+                outputfile = "output/{0:s}_{1:s}_{2:s}.csv".format(name, body, target)
+                df.to_csv(outputfile, index=False)
+                outputfiles.append(outputfile)
+            nominal = df_case[df_case["caseNo"] == 0]["first violation time(s)"]
+            print("{0:s} {1:s}: violation probability {2:.4f}, nominal {3:s}".format(
+                body, target, df_time["cumulative probability"].iloc[-1] if len(df_time) > 0 else 0.0,
+                "no violation" if len(nominal) == 0 or np.isnan(nominal.iloc[0]) else
+                "violates at T+{0:}[s]".format(nominal.iloc[0])))
+
+    for outputfile in outputfiles:
+        if missionpath.startswith("s3://"):
+            os.system("aws s3 cp " + outputfile + " " + missionpath + "/stat/output/")
+        else:
+            os.system("cp " + outputfile + " " + missionpath + "/stat/output/")
@@ -5,6 +5,78 @@ import os
 import json
 import sys
 import multiprocessing as mp
+import event_table
+
+
+def event_keys_of(sample_points):
+    # MECO, apogee, max_Q, ... are looked up from the event table
+    return [k for k in sample_points.keys() if k != "landing_time" and
+            (k in event_table.EVENTS or k in event_table.EVENT_ALIAS)]
+
+
+def event_file_of(filename):
+    return filename.replace("_dynamics_1.csv", "_events.csv")
+
+
+def read_events(eventfile, df):
+    # event table made by monte_carlo.py, detect the events here for the older campaigns
+    if os.path.exists(eventfile):
+        return pd.read_csv(eventfile, index_col=False)
+    events = event_table.detect_events(df)
+    return pd.DataFrame({"body": "dynamics_1",
+                         "event": [e[0] for e in events],
+                         "occurrence": [e[1] for e in events],
+                         "row": [e[2] for e in events]})
+
+
+def read_case(filename, caseNo, sample_points, tmpfile):
+    """
+    Args:
+        filename (str) : downloaded caseNNNNN_<suffix>_dynamics_1.csv
+        caseNo (int) : case number
+        sample_points (dict) : "sample points" of datapoint.json
+        tmpfile (str) : work file name
+    Returns:
+        list of the datapoint_*.csv lines of the case (one per sample point),
+        None if the file does not exist
+    """
+    # format csv file to proper form
+    try:
+        fp = open(filename)
+    except:
+        return None
+    ft = open(tmpfile, "w")
+    for line in fp:
+        ft.write(line.replace(",\n", "\n"))
+    fp.close()
+    ft.close()
+
+    # fetch data
+    df = pd.read_csv(tmpfile)
+    event_keys = event_keys_of(sample_points)
+    if len(event_keys) > 0:
+        events = read_events(event_file_of(filename), df)
+    lines = []
+    for k in sample_points.keys():
+        line = str(caseNo)
+        if k == "landing_time":
+            for v in sample_points[k]:
+                line += "," + str(df.iloc[-1][v])
+        elif k == "MAX":
+            for v in sample_points[k]:
+                line += "," + str(df[v].max())
+        elif k in event_keys:
+            row = event_table.lookup_event(events, k)
+            for v in sample_points[k]:
+                line += "," + (str(float("nan")) if row is None else str(df.iloc[int(row["row"])][v]))
+        else:
+            for v in sample_points[k]:
+                line += "," + str(df.pipe(lambda df: df[df["time(s)"] == float(k)]).iloc[0][v])
+        lines.append(line + "\n")
+
+    # remove temporary csv
+    os.system("rm "+tmpfile)
+    return lines
 
 
 def read_data_points(arg):
@@ -17,51 +89,27 @@ def read_data_points(arg):
     start_index = shou *  id_proc      + min(amari, id_proc)
     end_index   = shou * (id_proc + 1) + min(amari, id_proc + 1)
 
+    use_events = len(event_keys_of(sample_points)) > 0
+
     for i in range(start_index, end_index):
         caseNo = i + 1
         filename = input_file_template.format(caseNo)
         os.system("aws s3 cp "+input_directory+filename+" . > /dev/null")
+        if use_events:
+            os.system("aws s3 cp "+input_directory+event_file_of(filename)+" . > /dev/null")
         if id_proc == 0: print("{0:}/{1:}".format(caseNo, end_index))
         # os.system("cp data/"+filename+" .") ######## FOR DEBUG########################
 
-        # format csv file to proper form
-        try:
-            fp = open(filename)
-        except:
+        lines = read_case(filename, caseNo, sample_points, "tmp_{}.csv".format(id_proc))
+        if lines is None:
             continue
-        ft = open("tmp_{}.csv".format(id_proc), "w")
-        for line in fp:
-            ft.write(line.replace(",\n", "\n"))
-        fp.close()
-        ft.close()
-
-        # fetch data
-        df = pd.read_csv("tmp_{}.csv".format(id_proc))
-        for i, k in enumerate(sample_points.keys()):
-            if k == "landing_time":
-                fo_buff[i] += str(caseNo)
-                for v in sample_points[k]:
-                    fo_buff[i] += "," + str(df.iloc[-1][v])
-                fo_buff[i] += "\n"
-            elif k == "MAX":
-                fo_buff[i] += str(caseNo)
-                for v in sample_points[k]:
-                    fo_buff[i] += "," + str(df[v].max())
-                fo_buff[i] += "\n"
-            elif k == "MECO":
-                fo_buff[i] += str(caseNo)
-                for v in sample_points[k]:
-                    fo_buff[i] += "," + str(df.pipe(lambda df: df[df["thrust(N)"] == 0.]).iloc[0][v])
-                fo_buff[i] += "\n"
-            else:
-                fo_buff[i] += str(caseNo)
-                for v in sample_points[k]:
-                    fo_buff[i] += "," + str(df.pipe(lambda df: df[df["time(s)"] == float(k)]).iloc[0][v])
-                fo_buff[i] += "\n"
-
-        # remove temporary csv
+        for j, line in enumerate(lines):
+            fo_buff[j] += line
+
+        # remove downloaded csv
         os.system("rm "+filename)
-        os.system("rm tmp_{}.csv".format(id_proc))
+        if os.path.exists(event_file_of(filename)):
+            os.system("rm "+event_file_of(filename))
 
     return fo_buff
 
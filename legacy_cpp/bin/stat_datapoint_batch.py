@@ -0,0 +1,186 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# Copyright (c) 2017 Interstellar Technologies Inc. All Rights Reserved.
+# ==============================================================================
+# datapoint_*.csv of every mission under a prefix in one run.
+#
+# The missions are the sub directories of s3://otmc/<prefix>/ (or of a local
+# directory). The cases of all the missions go through one worker pool, and
+# the downloaded csv files are kept in a cache directory so that a second run
+# (e.g. with another datapoint.json) downloads nothing. For every mission
+#   <mission>/stat/output/datapoint_<k>.csv              (as stat_datapoint.py)
+#   <prefix>/results/datapoint_<k>_<suffix>.csv
+# are written, <suffix> is the mission directory name after "cutoff/".
+#
+# usage: python stat_datapoint_batch.py (prefix) [cache directory]
+import sys
+import os
+import json
+import subprocess
+import multiprocessing as mp
+import campaign_store
+import stat_datapoint
+
+
+def list_missions(prefix):
+    """ mission directories under the prefix, "<prefix>/<dir>" """
+    path = campaign_store.mission_path(prefix)
+    if not path.startswith("s3://"):
+        return sorted(os.path.join(path, d) for d in os.listdir(path)
+                      if os.path.isdir(os.path.join(path, d, "raw")))
+    out = subprocess.run(["aws", "s3api", "list-objects", "--bucket", "otmc",
+                          "--prefix", prefix.rstrip("/") + "/", "--delimiter", "/"],
+                         stdout=subprocess.PIPE, check=True).stdout
+    if len(out.strip()) == 0:
+        return []
+    return [p["Prefix"].rstrip("/") for p in json.loads(out.decode()).get("CommonPrefixes", [])]
+
+
+def result_suffix(mission):
+    # same as suffix=${dir##*cutoff/} of the former stat_datapoint_batch.sh
+    mission = mission.rstrip("/")
+    if "cutoff/" in mission:
+        return mission.split("cutoff/")[-1].replace("/", "_")
+    return os.path.basename(mission)
+
+
+def read_mission_case(arg):
+    """
+    download (if not cached) and read one case, runs on the pool
+    Returns:
+        id_mission, caseNo, the lines of the case (None if it is left out) and the reason it is left out
+    """
+    [id_mission, input_directory, cache_directory, input_file_template, caseNo, sample_points] = arg
+    filename = input_file_template.format(caseNo)
+    files = [filename]
+    if len(stat_datapoint.event_keys_of(sample_points)) > 0:
+        files.append(stat_datapoint.event_file_of(filename))
+    tmpfile = os.path.join(cache_directory, "tmp_{}.csv".format(caseNo))
+    try:
+        for f in files:
+            if not os.path.exists(os.path.join(cache_directory, f)):
+                campaign_store.fetch(input_directory + f, os.path.join(cache_directory, f))
+        lines = stat_datapoint.read_case(os.path.join(cache_directory, filename), caseNo, sample_points, tmpfile)
+    except Exception as e:
+        # a broken case is left out as a missing one, not the whole batch
+        if os.path.exists(tmpfile):
+            os.remove(tmpfile)
+        return id_mission, caseNo, None, "{0:s}: {1:}".format(type(e).__name__, e)
+    return id_mission, caseNo, lines, None if lines is not None else "no file"
+
+
+def setup_mission(mission, cache_dir):
+    """
+    Returns:
+        dict of the mission settings, None if mc.json or datapoint.json is missing
+    """
+    missionpath = campaign_store.mission_path(mission)
+    work_directory = os.path.join(cache_dir, mission.strip("/").replace("/", "_"))
+    cache_directory = os.path.join(work_directory, "raw_output")
+    os.makedirs(cache_directory, exist_ok=True)
+    os.makedirs(os.path.join(work_directory, "output"), exist_ok=True)
+    mc_json = os.path.join(work_directory, "mc.json")
+    stat_json = os.path.join(work_directory, "datapoint.json")
+    if not (campaign_store.fetch(missionpath + "/raw/inp/mc.json", mc_json) and
+            campaign_store.fetch(missionpath + "/stat/inp/datapoint.json", stat_json)):
+        return None
+    with open(mc_json) as fp:
+        data = json.load(fp)
+    with open(stat_json) as fp:
+        stat = json.load(fp)
+    return {"mission": mission,
+            "missionpath": missionpath,
+            "work_directory": work_directory,
+            "cache_directory": cache_directory,
+            "number_of_sample": int(data["Ntask"]),
+            "input_directory": missionpath + "/raw/output/",
+            "input_file_template": "case{0:05d}" + "_{0:s}_dynamics_1.csv".format(data["suffix"]),
+            "sample_points": stat["sample points"]}
+
+
+def write_mission(setting, cases, results_dir):
+    """ write datapoint_*.csv of one mission from {caseNo: lines} """
+    sample_points = setting["sample_points"]
+    suffix = result_suffix(setting["mission"])
+    outputfiles = []
+    for j, k in enumerate(sample_points.keys()):
+        body = "caseNo," + ",".join(sample_points[k]) + "\n"  # title
+        body += "".join(cases[caseNo][j] for caseNo in sorted(cases.keys()))
+        outputfile = os.path.join(setting["work_directory"], "output", "datapoint_" + k + ".csv")
+        for f in [outputfile, os.path.join(results_dir, "datapoint_" + k + "_" + suffix + ".csv")]:
+            with open(f, "w") as fo:
+                fo.write(body)
+        outputfiles.append(outputfile)
+    if setting["missionpath"].startswith("s3://"):
+        os.system("aws s3 cp " + os.path.join(setting["work_directory"], "output") + " " +
+                  setting["missionpath"] + "/stat/output/ --exclude '*' --include 'datapoint_*.csv' --recursive")
+    else:
+        os.system("cp " + " ".join(outputfiles) + " " + setting["missionpath"] + "/stat/output/")
+
+
+def run_batch(prefix, cache_dir, Nproc):
+    """
+    datapoint_*.csv of every mission under the prefix
+    Returns:
+        list of the mission settings, list of {caseNo: lines} of the missions
+    """
+    settings = []
+    for mission in list_missions(prefix):
+        setting = setup_mission(mission, cache_dir)
+        if setting is None:
+            print("skip {0:s} (no mc.json or datapoint.json)".format(mission))
+            continue
+        settings.append(setting)
+    print("{0:d} missions".format(len(settings)))
+
+    tasks = [(i, s["input_directory"], s["cache_directory"], s["input_file_template"], caseNo, s["sample_points"])
+             for i, s in enumerate(settings) for caseNo in range(1, s["number_of_sample"] + 1)]
+    remaining = [s["number_of_sample"] for s in settings]
+    cases = [{} for s in settings]
+
+    results_dir = os.path.join(cache_dir, "results")
+    os.makedirs(results_dir, exist_ok=True)
+
+    for i, s in enumerate(settings):
+        if remaining[i] == 0:
+            write_mission(s, cases[i], results_dir)
+
+    # one pool for the cases of all the missions, a mission is written out as soon as it is complete
+    pool = mp.Pool(Nproc)
+    for id_mission, caseNo, lines, error in pool.imap_unordered(read_mission_case, tasks, chunksize=4):
+        if lines is not None:
+            cases[id_mission][caseNo] = lines
+        else:
+            print("{0:s}: case {1:d} left out ({2:s})".format(settings[id_mission]["mission"], caseNo, error))
+        remaining[id_mission] -= 1
+        if remaining[id_mission] == 0:
+            write_mission(settings[id_mission], cases[id_mission], results_dir)
+            print("{0:s}: {1:d}/{2:d} cases".format(settings[id_mission]["mission"], len(cases[id_mission]),
+                                                    settings[id_mission]["number_of_sample"]))
+    pool.close()
+    pool.join()
+
+    missionpath = campaign_store.mission_path(prefix)
+    if missionpath.startswith("s3://"):
+        os.system("aws s3 cp " + results_dir + " " + missionpath + "/results --recursive --exclude '*' --include 'datapoint_*.csv'")
+    else:
+        os.makedirs(missionpath + "/results", exist_ok=True)
+        os.system("cp " + results_dir + "/datapoint_*.csv " + missionpath + "/results/")
+    return settings, cases
+
+
+if __name__ == "__main__":
+    Nproc = max(mp.cpu_count() - 1, 1)
+
+    print("IST DATAPOINT BATCH MAKER")
+    print("libraries load done.")
+
+    argv = sys.argv
+    if len(argv) > 1:
+        prefix = argv[1].rstrip("/")
+    else:
+        print("PLEASE INPUT mission prefix as the command line argument.")
+        exit()
+    cache_dir = argv[2] if len(argv) > 2 else "datapoint_cache"
+
+    run_batch(prefix, cache_dir, Nproc)
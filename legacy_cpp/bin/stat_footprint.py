@@ -0,0 +1,528 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# Copyright (c) 2017 Interstellar Technologies Inc. All Rights Reserved.
+# ==============================================================================
+# Non-parametric landing footprint of every stage and dump product.
+#
+# The impact points (stat_jettison_area.py) are projected to the local
+# azimuthal equidistant plane [m] and described without assuming a normal
+# distribution:
+#   kde       : highest density regions containing the given probabilities,
+#               the density is a histogram on a regular grid smoothed by a
+#               gaussian kernel (FFT convolution), contoured by marching squares
+#   convex    : convex hull (extreme point filter + monotone chain)
+#   concave   : concave hull, the convex hull dug in (Park & Oh 2012): every
+#               edge longer than the concave length is replaced by the two
+#               edges to the point nearest to it (closer than the edge is
+#               long), as long as the triangle cut off holds no point and the
+#               polygon stays simple. The nearest point is searched in the
+#               cells of a grid around the edge.
+#   outline   : occupancy outline, the outline of the grid cells occupied by
+#               the points dilated by one cell, with its holes (not a concave
+#               hull: its resolution is the cell size)
+#   occupancy : number and fraction of the cases in each grid cell
+# Every step is a vectorized pass over the points or the grid, so 10^6
+# points take about a second.
+#
+# output/footprint_<body>.geojson, output/footprint_occupancy_<body>.csv and
+# output/footprint.kml are written.
+#
+# footprint.json (all keys optional):
+# {
+#     "probability(%)": [50, 90, 99],
+#     "grid size": 256,
+#     "bandwidth(m)": null,     (Scott's rule if null)
+#     "cell size(m)": null,     (occupancy / outline cell, the bandwidth if null)
+#     "concave length(m)": null (longest edge of the concave hull, 4 cells if null)
+# }
+#
+# usage: python stat_footprint.py (mission_name) [footprint.json]
+import sys
+import os
+import json
+import heapq
+import multiprocessing as mp
+import numpy as np
+import pandas as pd
+import simplekml
+import campaign_store
+import stat_jettison_area
+
+default_probability = [50.0, 90.0, 99.0]
+
+# marching squares, corner bits: 1 bottom left, 2 bottom right, 4 top right, 8 top left
+# cell edges: 0 bottom, 1 right, 2 top, 3 left
+_segments = {1: [(3, 0)], 2: [(0, 1)], 3: [(3, 1)], 4: [(1, 2)], 6: [(0, 2)], 7: [(3, 2)],
+             8: [(2, 3)], 9: [(0, 2)], 11: [(1, 2)], 12: [(3, 1)], 13: [(0, 1)], 14: [(3, 0)]}
+# saddles by the value at the cell center: (low center, high center)
+_saddles = {5: ([(3, 0), (1, 2)], [(0, 1), (2, 3)]),
+            10: ([(0, 1), (2, 3)], [(3, 0), (1, 2)])}
+
+
+def contour_rings(v, level):
+    """
+    closed iso lines of a grid by marching squares
+    Args:
+        v (array) : (ny, nx) values at the grid points, v[i, j] at (x=j, y=i)
+        level (float) : iso value, the grid is closed by values below it
+    Returns:
+        list of (n, 2) arrays of (x, y) in grid index units, first point repeated at the end
+    """
+    low = min(np.nanmin(v), level) - abs(level) - 1.0
+    v = np.pad(np.where(np.isnan(v), low, v), 1, constant_values=low)
+    ny, nx = v.shape
+    above = v >= level
+    case = (above[:-1, :-1] * 1 + above[:-1, 1:] * 2 + above[1:, 1:] * 4 + above[1:, :-1] * 8)
+    center = 0.25 * (v[:-1, :-1] + v[:-1, 1:] + v[1:, 1:] + v[1:, :-1]) >= level
+
+    # global edge ids: horizontal (i, j)-(i, j+1) then vertical (i, j)-(i+1, j)
+    H = ny * (nx - 1)
+    ci, cj = np.indices(case.shape)
+    edge_id = [ci * (nx - 1) + cj, H + ci * nx + cj + 1, (ci + 1) * (nx - 1) + cj, H + ci * nx + cj]
+    A, B = [], []
+    def add(mask, pairs):
+        for a, b in pairs:
+            A.append(edge_id[a][mask])
+            B.append(edge_id[b][mask])
+    for c, pairs in _segments.items():
+        add(case == c, pairs)
+    for c, (pairs_low, pairs_high) in _saddles.items():
+        add((case == c) & ~center, pairs_low)
+        add((case == c) & center, pairs_high)
+    A, B = np.concatenate(A), np.concatenate(B)
+    if len(A) == 0:
+        return []
+
+    # crossing point of every edge used
+    edges = np.unique(np.concatenate([A, B]))
+    horizontal = edges < H
+    point = np.empty((len(edges), 2))
+    i, j = np.divmod(edges[horizontal], nx - 1)
+    t = (level - v[i, j]) / (v[i, j + 1] - v[i, j])
+    point[horizontal] = np.stack([j + t, i], axis=1)
+    i, j = np.divmod(edges[~horizontal] - H, nx)
+    t = (level - v[i, j]) / (v[i + 1, j] - v[i, j])
+    point[~horizontal] = np.stack([j, i + t], axis=1)
+    a, b = np.searchsorted(edges, A), np.searchsorted(edges, B)
+
+    # every edge point is shared by two segments, walk them into rings
+    ends = np.concatenate([a, b])
+    segment = np.concatenate([np.arange(len(a)), np.arange(len(a))])
+    order = np.argsort(ends, kind="stable")
+    seg1 = np.empty(len(edges), dtype=np.int64)
+    seg2 = np.empty(len(edges), dtype=np.int64)
+    seg1[ends[order[0::2]]] = segment[order[0::2]]
+    seg2[ends[order[1::2]]] = segment[order[1::2]]
+    used = np.zeros(len(a), dtype=bool)
+    rings = []
+    for s0 in range(len(a)):
+        if used[s0]:
+            continue
+        ring = [a[s0]]
+        s, e = s0, b[s0]
+        while True:
+            used[s] = True
+            ring.append(e)
+            s = seg2[e] if seg1[e] == s else seg1[e]
+            if s == s0:
+                break
+            e = b[s] if a[s] == e else a[s]
+        rings.append(point[ring] - 1.0)  # remove the padding
+    return rings
+
+
+def points_in_ring(px, py, ring, chunk_elements=4000000):
+    """ crossing number test of the points against a closed ring ((n, 2), first point repeated) """
+    px, py = np.asarray(px, dtype=np.float64), np.asarray(py, dtype=np.float64)
+    x0, y0 = ring[:-1, 0], ring[:-1, 1]
+    x1, y1 = ring[1:, 0], ring[1:, 1]
+    inside = np.zeros(px.shape, dtype=bool)
+    step = max(1, chunk_elements // max(len(x0), 1))
+    for k in range(0, len(px), step):
+        x, y = px[k:k + step, None], py[k:k + step, None]
+        cross = (y0 > y) != (y1 > y)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            xc = x0 + (y - y0) * (x1 - x0) / (y1 - y0)
+        inside[k:k + step] = np.sum(cross & (x < xc), axis=1) % 2 == 1
+    return inside
+
+
+def signed_area(ring):
+    return 0.5 * np.sum(ring[:-1, 0] * ring[1:, 1] - ring[1:, 0] * ring[:-1, 1])
+
+
+def rings_to_polygons(rings):
+    """
+    Returns:
+        list of [shell, hole, ...], shells counterclockwise and holes clockwise
+    """
+    if len(rings) == 0:
+        return []
+    lo = np.array([r.min(axis=0) for r in rings])
+    hi = np.array([r.max(axis=0) for r in rings])
+    first = np.array([r[0] for r in rings])
+    area = np.array([abs(signed_area(r)) for r in rings])
+    # contains[k, m] : ring m is inside ring k
+    contains = np.zeros((len(rings), len(rings)), dtype=bool)
+    for k, r in enumerate(rings):
+        candidate = np.flatnonzero(np.all((first >= lo[k]) & (first <= hi[k]), axis=1) & (area < area[k]))
+        if len(candidate) > 0:
+            contains[k, candidate] = points_in_ring(first[candidate, 0], first[candidate, 1], r)
+    depth = contains.sum(axis=0)
+    polygons = {}
+    for m in np.argsort(depth, kind="stable"):
+        ring = rings[m]
+        if depth[m] % 2 == 0:
+            polygons[m] = [ring if signed_area(ring) > 0 else ring[::-1]]
+        else:
+            parents = np.flatnonzero(contains[:, m] & (depth == depth[m] - 1))
+            if len(parents) > 0 and parents[0] in polygons:
+                polygons[parents[0]].append(ring if signed_area(ring) < 0 else ring[::-1])
+    return list(polygons.values())
+
+
+def convex_hull(x, y):
+    """ convex hull (counterclockwise, closed) of the points, (n, 2) """
+    p = np.stack([x, y], axis=1)
+    # points strictly inside the octagon of the extreme points can not be on the hull
+    directions = np.array([[-1, 0], [-1, -1], [0, -1], [1, -1], [1, 0], [1, 1], [0, 1], [-1, 1]], dtype=np.float64)
+    extreme = p[np.argmax(p @ directions.T, axis=0)]
+    extreme = extreme[np.any(extreme != np.roll(extreme, 1, axis=0), axis=1)]
+    if len(extreme) >= 3:
+        inside = np.ones(len(p), dtype=bool)
+        for a, b in zip(extreme, np.roll(extreme, -1, axis=0)):
+            inside &= (b[0] - a[0]) * (p[:, 1] - a[1]) - (b[1] - a[1]) * (p[:, 0] - a[0]) > 0
+        p = p[~inside]
+    p = p[np.lexsort((p[:, 1], p[:, 0]))]
+
+    # Andrew's monotone chain
+    def chain(points):
+        hull = []
+        for q in points:
+            while len(hull) >= 2 and (hull[-1][0] - hull[-2][0]) * (q[1] - hull[-2][1]) - \
+                    (hull[-1][1] - hull[-2][1]) * (q[0] - hull[-2][0]) <= 0:
+                hull.pop()
+            hull.append(q)
+        return hull
+    lower, upper = chain(p), chain(p[::-1])
+    hull = np.array(lower[:-1] + upper[:-1])
+    return np.concatenate([hull, hull[:1]])
+
+
+def concave_hull(x, y, length):
+    """
+    concave hull (counterclockwise, closed) of the points by digging the convex hull
+    Args:
+        x, y (array) : points on the plane [m]
+        length (float) : edges longer than this are dug in [m]
+    Returns:
+        (n, 2) array, every point inside or on the hull
+    """
+    p = np.stack([x, y], axis=1)
+    p = p[np.lexsort((p[:, 1], p[:, 0]))]
+    p = p[np.append(True, np.any(p[1:] != p[:-1], axis=1))]
+    hull = convex_hull(p[:, 0], p[:, 1])[:-1]
+    # rows of the hull vertices, p is sorted by x then y
+    vertex = np.searchsorted(p[:, 0], hull[:, 0])
+    for k in range(len(vertex)):
+        while p[vertex[k], 1] != hull[k, 1]:
+            vertex[k] += 1
+    following = np.full(len(p), -1, dtype=np.int64)
+    following[vertex] = np.roll(vertex, -1)
+
+    # the points sorted by their cell, cells of the concave length
+    lo = p.min(axis=0)
+    cell = np.floor((p - lo) / length).astype(np.int64)
+    nx, ny = cell[:, 0].max() + 1, cell[:, 1].max() + 1
+    key = cell[:, 1] * nx + cell[:, 0]
+    order = np.argsort(key, kind="stable")
+    start = np.searchsorted(key[order], np.arange(nx * ny + 1))
+
+    def nearest(a, b):
+        """ point nearest to the edge a-b, on its left (or on it) and over it, None if none is closer than a-b """
+        ab = p[b] - p[a]
+        L = np.hypot(ab[0], ab[1])
+        w = length
+        while True:
+            (i0, j0), (i1, j1) = [np.clip(np.floor((f(p[a], p[b]) + sign * w - lo) / length).astype(np.int64),
+                                          0, [nx - 1, ny - 1]) for f, sign in [(np.minimum, -1), (np.maximum, 1)]]
+            ci, cj = np.meshgrid(np.arange(i0, i1 + 1), np.arange(j0, j1 + 1))
+            centre = (np.stack([ci.ravel(), cj.ravel()], axis=1) + 0.5) * length + lo - p[a]
+            # cells within w of the line (the half diagonal of a cell more)
+            near = np.abs(ab[0] * centre[:, 1] - ab[1] * centre[:, 0]) / L <= w + 0.75 * length
+            keys = (cj.ravel() * nx + ci.ravel())[near]
+            counts = start[keys + 1] - start[keys]
+            index = order[np.repeat(start[keys] - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())]
+            q = p[index] - p[a]
+            t = (q @ ab) / (L * L)
+            d = (ab[0] * q[:, 1] - ab[1] * q[:, 0]) / L
+            candidate = (t > 0.0) & (t < 1.0) & (d >= 0.0) & (index != a) & (index != b)
+            if np.any(candidate & (d <= w)):
+                return index[candidate][np.argmin(d[candidate])]
+            if w >= L:
+                return None
+            w = min(2.0 * w, L)
+
+    def crosses(a, c):
+        """ the segment a-c crosses an edge of the hull (not at a shared vertex) """
+        s = np.array(members)
+        e = following[s]
+        other = (s != a) & (e != a) & (s != c) & (e != c)
+        s, e = p[s[other]], p[e[other]]
+        def side(u, v, w):
+            return (v[..., 0] - u[..., 0]) * (w[..., 1] - u[..., 1]) - (v[..., 1] - u[..., 1]) * (w[..., 0] - u[..., 0])
+        return np.any((side(p[a], p[c], s) * side(p[a], p[c], e) < 0.0) & (side(s, e, p[a]) * side(s, e, p[c]) < 0.0))
+
+    # the longest edges first
+    def push(a):
+        b = following[a]
+        L = np.hypot(*(p[b] - p[a]))
+        if L > length:
+            heapq.heappush(edges, (-L, a, b))
+    edges, members = [], list(vertex)
+    for a in vertex:
+        push(a)
+    while edges:
+        L, a, b = heapq.heappop(edges)
+        if following[a] != b:
+            continue
+        c = nearest(a, b)
+        if c is None or following[c] >= 0 or crosses(a, c) or crosses(c, b):
+            continue
+        following[a], following[c] = c, b
+        members.append(c)
+        push(a)
+        push(c)
+
+    ring = [vertex[0]]
+    while following[ring[-1]] != vertex[0]:
+        ring.append(following[ring[-1]])
+    return p[ring + [vertex[0]]]
+
+
+def gaussian_smooth(a, sigma, axis):
+    """ convolution with a gaussian of sigma [cells] along the axis by FFT, no wrap around """
+    K = int(np.ceil(4.0 * sigma))
+    n = a.shape[axis]
+    nfft = 1 << int(np.ceil(np.log2(n + 2 * K + 1)))
+    kernel = np.exp(-0.5 * (np.arange(-K, K + 1) / max(sigma, 1e-12)) ** 2)
+    kernel = kernel / kernel.sum()
+    shape = [1] * a.ndim
+    shape[axis] = -1
+    F = np.fft.rfft(a, nfft, axis=axis) * np.fft.rfft(kernel, nfft).reshape(shape)
+    out = np.fft.irfft(F, nfft, axis=axis)
+    return np.take(out, np.arange(K, K + n), axis=axis)
+
+
+class Grid:
+    """ regular grid on the plane, cell centers x0 + j dx, y0 + i dy """
+    def __init__(self, x0, y0, dx, dy, nx, ny):
+        self.x0, self.y0, self.dx, self.dy, self.nx, self.ny = x0, y0, dx, dy, nx, ny
+
+    @classmethod
+    def around(cls, x, y, dx, dy, margin):
+        x0, y0 = np.min(x) - margin[0], np.min(y) - margin[1]
+        nx = int(np.ceil((np.max(x) + margin[0] - x0) / dx)) + 1
+        ny = int(np.ceil((np.max(y) + margin[1] - y0) / dy)) + 1
+        return cls(x0, y0, dx, dy, nx, ny)
+
+    def histogram(self, x, y):
+        j = np.clip(np.rint((x - self.x0) / self.dx).astype(np.int64), 0, self.nx - 1)
+        i = np.clip(np.rint((y - self.y0) / self.dy).astype(np.int64), 0, self.ny - 1)
+        return np.bincount(i * self.nx + j, minlength=self.nx * self.ny).reshape(self.ny, self.nx), i, j
+
+    def to_plane(self, ring):
+        return np.stack([self.x0 + ring[:, 0] * self.dx, self.y0 + ring[:, 1] * self.dy], axis=1)
+
+
+def footprint(lon, lat, probability=default_probability, grid_size=256, bandwidth=None, cell_size=None,
+              concave_length=None):
+    """
+    Args:
+        lon, lat (array) : impact points [deg], nan is ignored
+        probability (list) : probabilities of the density contours [%]
+        grid_size (int) : number of the density grid cells along the longer side
+        bandwidth (float) : kernel bandwidth [m], Scott's rule if None
+        cell_size (float) : occupancy grid cell [m], the bandwidth if None
+        concave_length (float) : longest edge of the concave hull [m], 4 cells if None
+    Returns:
+        dict of "kde" (list of (probability, coverage, polygons)), "convex", "concave", "outline" (polygons),
+        "occupancy" (dict of the occupied cell arrays); polygons are lists of
+        [shell, hole, ...] of (n, 2) lon, lat [deg]
+    """
+    lon, lat = np.asarray(lon, dtype=np.float64), np.asarray(lat, dtype=np.float64)
+    valid = np.isfinite(lon) & np.isfinite(lat)
+    lon, lat = lon[valid], lat[valid]
+    N = len(lon)
+    proj = stat_jettison_area.local_projection(lon, lat)
+    x, y = proj(lon, lat)
+
+    def lonlat(points):
+        lon_out, lat_out = proj(points[:, 0], points[:, 1], inverse=True)
+        return np.stack([lon_out, lat_out], axis=1)
+
+    # kernel density on the grid
+    if bandwidth is None:
+        scale = N ** (-1.0 / 6.0)  # Scott's rule in 2D
+        h = np.array([np.std(x, ddof=1), np.std(y, ddof=1)]) * scale
+    else:
+        h = np.array([bandwidth, bandwidth], dtype=np.float64)
+    h = np.maximum(h, 1.0)
+    extent = np.array([np.ptp(x), np.ptp(y)]) + 6.0 * h
+    d = max(extent.max() / grid_size, 1e-3)
+    grid = Grid.around(x, y, d, d, 3.0 * h)
+    count, i, j = grid.histogram(x, y)
+    density = gaussian_smooth(gaussian_smooth(count.astype(np.float64), h[0] / d, 1), h[1] / d, 0)
+    density = np.maximum(density, 0.0) / N
+    sorted_density = np.sort(density.ravel())[::-1]
+    mass = np.cumsum(sorted_density)
+    kde = []
+    for p in probability:
+        threshold = sorted_density[min(np.searchsorted(mass, p * 1e-2 * mass[-1]), len(mass) - 1)]
+        # nest the rings on the plane, the projection keeps the orientation
+        polygons = rings_to_polygons([grid.to_plane(r) for r in contour_rings(density, threshold)])
+        coverage = 100.0 * np.mean(density[i, j] >= threshold)
+        kde.append((p, coverage, [[lonlat(r) for r in polygon] for polygon in polygons]))
+
+    # convex hull
+    convex = [[lonlat(convex_hull(x, y))]]
+
+    # occupancy and its outline, the grid has one more cell on every side for the dilation
+    c = float(np.mean(h)) if cell_size is None else float(cell_size)
+    length = 4.0 * c if concave_length is None else float(concave_length)
+    concave = [[lonlat(concave_hull(x, y, length))]]
+
+    cells = Grid.around(x, y, c, c, (c, c))
+    count, i, j = cells.histogram(x, y)
+    occupied = count > 0
+    closed = np.pad(occupied, 1)
+    closed = (closed[1:-1, 1:-1] | closed[:-2, 1:-1] | closed[2:, 1:-1] | closed[1:-1, :-2] | closed[1:-1, 2:] |
+              closed[:-2, :-2] | closed[:-2, 2:] | closed[2:, :-2] | closed[2:, 2:])
+    polygons = rings_to_polygons([cells.to_plane(r) for r in contour_rings(closed.astype(np.float64), 0.5)])
+    outline = [[lonlat(r) for r in polygon] for polygon in polygons]
+
+    ci, cj = np.nonzero(occupied)
+    center = lonlat(np.stack([cells.x0 + cj * c, cells.y0 + ci * c], axis=1))
+    corner = np.array([[-0.5, -0.5], [0.5, -0.5], [0.5, 0.5], [-0.5, 0.5], [-0.5, -0.5]]) * c
+    corners = lonlat((np.stack([cells.x0 + cj * c, cells.y0 + ci * c], axis=1)[:, None, :] + corner).reshape(-1, 2))
+    occupancy = {"lon(deg)": center[:, 0], "lat(deg)": center[:, 1], "count": count[occupied],
+                 "probability": count[occupied] / N, "corners": corners.reshape(-1, 5, 2)}
+
+    return {"N": N, "bandwidth(m)": h, "cell size(m)": c, "concave length(m)": length, "kde": kde,
+            "convex": convex, "concave": concave, "outline": outline, "occupancy": occupancy}
+
+
+def _coords(ring):
+    return [[float(p[0]), float(p[1])] for p in ring]
+
+
+def to_geojson(name, fp):
+    features = []
+    def add(geometry, properties):
+        properties.update({"body": name})
+        features.append({"type": "Feature", "geometry": geometry, "properties": properties})
+    for p, coverage, polygons in fp["kde"]:
+        add({"type": "MultiPolygon", "coordinates": [[_coords(r) for r in polygon] for polygon in polygons]},
+            {"kind": "kde", "probability(%)": p, "coverage(%)": coverage, "bandwidth(m)": float(np.mean(fp["bandwidth(m)"]))})
+    add({"type": "Polygon", "coordinates": [_coords(r) for r in fp["convex"][0]]}, {"kind": "convex"})
+    add({"type": "Polygon", "coordinates": [_coords(r) for r in fp["concave"][0]]},
+        {"kind": "concave", "length(m)": fp["concave length(m)"]})
+    add({"type": "MultiPolygon", "coordinates": [[_coords(r) for r in polygon] for polygon in fp["outline"]]},
+        {"kind": "occupancy outline", "cell size(m)": fp["cell size(m)"]})
+    occupancy = fp["occupancy"]
+    for k in range(len(occupancy["count"])):
+        add({"type": "Polygon", "coordinates": [_coords(occupancy["corners"][k])]},
+            {"kind": "occupancy", "count": int(occupancy["count"][k]), "probability": float(occupancy["probability"][k])})
+    return {"type": "FeatureCollection", "features": features}
+
+
+def add_kml(kml, name, fp):
+    folder = kml.newfolder(name=name)
+    for k, (p, coverage, polygons) in enumerate(fp["kde"]):
+        color = stat_jettison_area.level_colors[k % len(stat_jettison_area.level_colors)]
+        for polygon in polygons:
+            for ring in polygon:
+                line = folder.newlinestring(name="LandIn Density Area {0:}%".format(p))
+                line.coords = [tuple(q) for q in ring]
+                line.style.linestyle.color = color
+    line = folder.newlinestring(name="LandIn Convex Hull")
+    line.coords = [tuple(q) for q in fp["convex"][0][0]]
+    line.style.linestyle.color = simplekml.Color.white
+    line = folder.newlinestring(name="LandIn Concave Hull")
+    line.coords = [tuple(q) for q in fp["concave"][0][0]]
+    line.style.linestyle.color = simplekml.Color.yellow
+    for polygon in fp["outline"]:
+        for ring in polygon:
+            line = folder.newlinestring(name="LandIn Occupancy Outline")
+            line.coords = [tuple(q) for q in ring]
+            line.style.linestyle.color = simplekml.Color.cyan
+    cells = folder.newfolder(name="Occupancy")
+    occupancy = fp["occupancy"]
+    pmax = occupancy["probability"].max()
+    for k in range(len(occupancy["count"])):
+        cell = cells.newpolygon(name="{0:d} cases".format(int(occupancy["count"][k])),
+                                outerboundaryis=[tuple(q) for q in occupancy["corners"][k]])
+        cell.style.polystyle.color = simplekml.Color.changealphaint(
+            int(40 + 180 * occupancy["probability"][k] / pmax), simplekml.Color.red)
+        cell.style.linestyle.width = 0
+
+
+if __name__ == "__main__":
+    Nproc = max(mp.cpu_count() - 1, 1)
+
+    print("IST FOOTPRINT MAKER")
+    print("libraries load done.")
+
+    argv = sys.argv
+    if len(argv) > 1:
+        otmc_mission_name = argv[1]
+    else:
+        print("PLEASE INPUT mission_name as the command line argument.")
+        exit()
+    missionpath = campaign_store.mission_path(otmc_mission_name)
+
+    if len(argv) > 2:
+        stat_input = argv[2]
+    else:
+        stat_input = "footprint.json"
+        campaign_store.fetch(missionpath + "/stat/inp/footprint.json", stat_input)
+    stat = {}
+    if os.path.exists(stat_input):
+        with open(stat_input) as fp:
+            stat = json.load(fp)
+    options = dict(probability=stat.get("probability(%)", default_probability),
+                   grid_size=int(stat.get("grid size", 256)),
+                   bandwidth=stat.get("bandwidth(m)"),
+                   cell_size=stat.get("cell size(m)"),
+                   concave_length=stat.get("concave length(m)"))
+
+    os.makedirs("output", exist_ok=True)
+    outputfiles = []
+    store = campaign_store.open_store(otmc_mission_name, "store", Nproc)
+    kml = simplekml.Kml(open=1)
+    for body in store.bodies:
+        if body.endswith("_extend") or "lat(deg)" not in store.columns(body):
+            continue
+        lon, lat, cases = stat_jettison_area.impact_points(store, body)
+        if len(lon) < 3:
+            continue
+        fp = footprint(lon, lat, **options)
+        outputfile = "output/footprint_{0:s}.geojson".format(body)
+        with open(outputfile, "w") as fo:
+            json.dump(to_geojson(body, fp), fo)
+        occupancyfile = "output/footprint_occupancy_{0:s}.csv".format(body)
+        occupancy = fp["occupancy"]
+        pd.DataFrame({k: occupancy[k] for k in ["lon(deg)", "lat(deg)", "count", "probability"]}).to_csv(
+            occupancyfile, index=False)
+        add_kml(kml, body, fp)
+        outputfiles.extend([outputfile, occupancyfile])
+        print("{0:s}: {1:d} points, bandwidth {2:.1f} [m], {3:d} occupied cells".format(
+            body, fp["N"], float(np.mean(fp["bandwidth(m)"])), len(occupancy["count"])))
+    kml.save("output/footprint.kml")
+    outputfiles.append("output/footprint.kml")
+
+    for outputfile in outputfiles:
+        if missionpath.startswith("s3://"):
+            os.system("aws s3 cp " + outputfile + " " + missionpath + "/stat/output/")
+        else:
+            os.system("cp " + outputfile + " " + missionpath + "/stat/output/")
@@ -0,0 +1,319 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# Copyright (c) 2017 Interstellar Technologies Inc. All Rights Reserved.
+# ==============================================================================
+# Impact probability raster of every stage and dump product.
+#
+# The impact points (last row of each dispersed case) or the IIP at the
+# cutoff are streamed from the campaign store, batch by batch of cases, into
+# a histogram on a fixed lon/lat grid (rows from the north, the layout of an
+# ESRI binary grid). The accumulators hold the counts of the occupied cells
+# only and the ones of the workers are merged, so the memory depends on the
+# number of the occupied cells, not on the grid size (a fine grid of a wide
+# area has billions of cells). The probability of each cell is count / N,
+# optionally smoothed by a gaussian kernel of the bandwidth [m] (cell width at
+# the center latitude of the grid), made one tile at a time with the halo of
+# the kernel, and the density [1/km2] uses the cell area on the sphere.
+#
+# heatmap.json (all keys optional):
+# {
+#     "points": "impact",                        (or "IIP at cutoff")
+#     "cell size(deg)": 0.01,
+#     "bounds(deg)": [lon_min, lat_min, lon_max, lat_max],   (streamed min / max of the points if not given)
+#     "bandwidth(m)": null,                      (no smoothing if null)
+#     "tile size": 1024                          (rows and columns of a tile)
+# }
+#
+# output/heatmap_<body>/r<i>_c<j>.flt + .hdr (float32 probability of the
+# cells, empty tiles are not written; stat_casualty.py can read them) and
+# output/heatmap_<body>.csv (tile list) are written.
+#
+# usage: python stat_heatmap.py (mission_name) [heatmap.json]
+import sys
+import os
+import json
+import multiprocessing as mp
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+import campaign_store
+from coordinate_transform import R_mean
+import stat_footprint
+
+point_columns = {"impact": ("lon(deg)", "lat(deg)"), "IIP at cutoff": ("IIP_lon(deg)", "IIP_lat(deg)")}
+
+
+class ImpactHeatmap:
+    """
+    histogram of the points on a lon/lat grid, mergeable; only the occupied
+    cells are held (flat index row * ncols + col and count), the grid itself is
+    made tile by tile
+    Args:
+        xll, yll (float) : lon, lat [deg] of the lower left corner
+        cellsize (float) : [deg]
+        ncols, nrows (int) : grid size, row 0 is the north
+    """
+    def __init__(self, xll, yll, cellsize, ncols, nrows):
+        self.xll, self.yll, self.cellsize, self.ncols, self.nrows = xll, yll, cellsize, ncols, nrows
+        self.index = np.zeros(0, dtype=np.int64)  # sorted flat index of the occupied cells
+        self.count = np.zeros(0)
+        self.N = 0          # points streamed, nan and outside of the grid included
+        self.outside = 0
+
+    @classmethod
+    def around(cls, bounds, cellsize, margin=0.0):
+        """ grid covering bounds [lon_min, lat_min, lon_max, lat_max] + margin [deg] """
+        xll = np.floor((bounds[0] - margin) / cellsize) * cellsize
+        yll = np.floor((bounds[1] - margin) / cellsize) * cellsize
+        ncols = int(np.ceil((bounds[2] + margin - xll) / cellsize)) + 1
+        nrows = int(np.ceil((bounds[3] + margin - yll) / cellsize)) + 1
+        return cls(xll, yll, cellsize, ncols, nrows)
+
+    def cell(self, lon, lat):
+        """ row, column of the points, -1 outside of the grid """
+        lon = (np.asarray(lon, dtype=np.float64) - self.xll) % 360.0
+        lat = np.asarray(lat, dtype=np.float64)
+        with np.errstate(invalid="ignore"):
+            col = np.floor(lon / self.cellsize)
+            row = self.nrows - 1 - np.floor((lat - self.yll) / self.cellsize)
+        outside = ~(np.isfinite(col) & np.isfinite(row)) | (col >= self.ncols) | (row < 0) | (row >= self.nrows)
+        return (np.where(outside, -1, np.nan_to_num(row)).astype(np.int64),
+                np.where(outside, -1, np.nan_to_num(col)).astype(np.int64))
+
+    def _add(self, index, weight):
+        index, inverse = np.unique(np.concatenate([self.index, index]), return_inverse=True)
+        self.count = np.bincount(inverse, weights=np.concatenate([self.count, weight]), minlength=len(index))
+        self.index = index
+
+    def update(self, lon, lat, weight=None):
+        """ add the points (one per case), weight 1 if None """
+        row, col = self.cell(lon, lat)
+        inside = row >= 0
+        w = np.ones(len(row)) if weight is None else np.asarray(weight, dtype=np.float64)
+        self._add(row[inside] * self.ncols + col[inside], w[inside])
+        self.N += len(row)
+        self.outside += int(np.count_nonzero(~inside))
+
+    def merge(self, other):
+        """ add the points of another accumulator on the same grid (e.g. of another worker) """
+        if (self.xll, self.yll, self.cellsize, self.ncols, self.nrows) != \
+                (other.xll, other.yll, other.cellsize, other.ncols, other.nrows):
+            raise ValueError("grids of the heatmaps do not match")
+        self._add(other.index, other.count)
+        self.N += other.N
+        self.outside += other.outside
+
+    def cell_area(self, r0=0, r1=None):
+        """ (r1 - r0,) area [m2] of the cells of the rows r0 ... r1 - 1 """
+        row = np.arange(r0, self.nrows if r1 is None else r1)
+        lat_top = np.deg2rad(self.yll + (self.nrows - row) * self.cellsize)
+        lat_bottom = np.deg2rad(self.yll + (self.nrows - row - 1) * self.cellsize)
+        return R_mean ** 2 * np.deg2rad(self.cellsize) * np.abs(np.sin(lat_top) - np.sin(lat_bottom))
+
+    def _sigma(self, bandwidth):
+        """ kernel sigma [cells] along the columns and the rows """
+        lat_center = np.deg2rad(self.yll + 0.5 * self.nrows * self.cellsize)
+        dy = R_mean * np.deg2rad(self.cellsize)
+        dx = dy * max(np.cos(lat_center), 1e-6)
+        return bandwidth / dx, bandwidth / dy
+
+    def halo(self, bandwidth=None):
+        """ cells around a window that reach into it by the kernel (gaussian_smooth cuts at 4 sigma) """
+        if not bandwidth:
+            return 0
+        return int(np.ceil(4.0 * max(self._sigma(bandwidth))))
+
+    def counts(self, r0, r1, c0, c1):
+        """ (r1 - r0, c1 - c0) counts of the window, zero out of the grid """
+        a, b = np.searchsorted(self.index, [max(r0, 0) * self.ncols, max(r1, 0) * self.ncols])
+        row, col = np.divmod(self.index[a:b], self.ncols)
+        count = self.count[a:b]
+        keep = (col >= c0) & (col < c1)
+        block = np.bincount((row[keep] - r0) * (c1 - c0) + col[keep] - c0, weights=count[keep],
+                            minlength=(r1 - r0) * (c1 - c0))
+        return block.reshape(r1 - r0, c1 - c0)
+
+    def probability(self, bandwidth=None, r0=0, r1=None, c0=0, c1=None):
+        """
+        impact probability of the cells of the window (the whole grid by default),
+        smoothed by a gaussian of bandwidth [m]; the window is made with the halo
+        of the kernel, so a tile has the values of the smoothed whole grid
+        """
+        r1 = self.nrows if r1 is None else r1
+        c1 = self.ncols if c1 is None else c1
+        H = self.halo(bandwidth)
+        p = self.counts(r0 - H, r1 + H, c0 - H, c1 + H) / max(self.N, 1)
+        if bandwidth:
+            sx, sy = self._sigma(bandwidth)
+            p = stat_footprint.gaussian_smooth(stat_footprint.gaussian_smooth(p, sx, 1), sy, 0)
+            p = np.maximum(p, 0.0)
+        return p[H:H + r1 - r0, H:H + c1 - c0]
+
+    def density(self, bandwidth=None, r0=0, r1=None, c0=0, c1=None):
+        """ impact probability density [1/km2] of the cells of the window """
+        p = self.probability(bandwidth, r0, r1, c0, c1)
+        return p / (self.cell_area(r0, r0 + p.shape[0])[:, None] * 1e-6)
+
+    def tiles(self, bandwidth=None, tile=1024):
+        """ (row, column) of the tiles which the occupied cells reach with the kernel """
+        H = self.halo(bandwidth)
+        row, col = np.divmod(self.index, self.ncols)
+        found = set()
+        for dr in [-H, H]:
+            for dc in [-H, H]:
+                found.update(zip(np.clip(row + dr, 0, self.nrows - 1) // tile,
+                                 np.clip(col + dc, 0, self.ncols - 1) // tile))
+        if H > tile:
+            # a kernel wider than a tile reaches the tiles between too
+            rows = range(int(min(r for r, c in found)), int(max(r for r, c in found)) + 1)
+            cols = range(int(min(c for r, c in found)), int(max(c for r, c in found)) + 1)
+            found = set((r, c) for r in rows for c in cols)
+        return sorted((int(r), int(c)) for r, c in found)
+
+    def save_tiles(self, directory, bandwidth=None, tile=1024):
+        """
+        write the non-empty tiles as ESRI binary grids (float32, .flt + .hdr),
+        one tile in memory at a time
+        Returns:
+            DataFrame of the tiles
+        """
+        os.makedirs(directory, exist_ok=True)
+        rows = []
+        for tr, tc in self.tiles(bandwidth, tile):
+            r0, c0 = tr * tile, tc * tile
+            block = self.probability(bandwidth, r0, min(r0 + tile, self.nrows), c0, min(c0 + tile, self.ncols))
+            if not np.any(block > 0.0):
+                continue
+            nrows, ncols = block.shape
+            name = os.path.join(directory, "r{0:03d}_c{1:03d}".format(tr, tc))
+            xll = self.xll + c0 * self.cellsize
+            yll = self.yll + (self.nrows - r0 - nrows) * self.cellsize
+            block.astype("<f4").tofile(name + ".flt")
+            with open(name + ".hdr", "w") as fo:
+                fo.write("ncols {0:d}\nnrows {1:d}\nxllcorner {2:.12g}\nyllcorner {3:.12g}\n"
+                         "cellsize {4:.12g}\nNODATA_value -9999\nbyteorder LSBFIRST\n".format(
+                             ncols, nrows, xll, yll, self.cellsize))
+            rows.append(OrderedDict([("file", name + ".flt"), ("xllcorner", xll), ("yllcorner", yll),
+                                     ("ncols", ncols), ("nrows", nrows), ("probability", float(block.sum())),
+                                     ("max probability", float(block.max()))]))
+        return pd.DataFrame(rows, columns=["file", "xllcorner", "yllcorner", "ncols", "nrows", "probability",
+                                           "max probability"])
+
+
+def batch_points(store, body, points, start, stop):
+    """ lon, lat [deg] of the dispersed cases [start, stop) (case index), nan if the case has no point """
+    col_lon, col_lat = point_columns[points]
+    cases = store.cases(body)[start:stop]
+    if points == "impact":
+        rows = store.offsets(body)[start + 1:stop + 1] - 1
+    else:
+        rows = store.event_rows(body, "cutoff")[start:stop]
+    rows = rows[cases > 0]
+    lon = np.asarray(store.column(body, col_lon)[np.maximum(rows, 0)], dtype=np.float64)
+    lat = np.asarray(store.column(body, col_lat)[np.maximum(rows, 0)], dtype=np.float64)
+    return np.where(rows >= 0, lon, np.nan), np.where(rows >= 0, lat, np.nan)
+
+
+def _batches(store, body, batch):
+    Ncase = len(store.cases(body))
+    return [(k, min(k + batch, Ncase)) for k in range(0, Ncase, batch)]
+
+
+def point_bounds(store, body, points, batch=65536):
+    """ streamed [lon_min, lat_min, lon_max, lat_max] of the points, longitudes around the first point """
+    lon_ref, bounds = None, [np.inf, np.inf, -np.inf, -np.inf]
+    for start, stop in _batches(store, body, batch):
+        lon, lat = batch_points(store, body, points, start, stop)
+        valid = np.isfinite(lon) & np.isfinite(lat)
+        if not np.any(valid):
+            continue
+        if lon_ref is None:
+            lon_ref = lon[valid][0]
+        lon = (lon[valid] - lon_ref + 180.0) % 360.0 - 180.0 + lon_ref
+        bounds = [min(bounds[0], lon.min()), min(bounds[1], lat[valid].min()),
+                  max(bounds[2], lon.max()), max(bounds[3], lat[valid].max())]
+    return None if lon_ref is None else bounds
+
+
+def _accumulate(arg):
+    store_dir, body, points, grid, ranges = arg
+    store = campaign_store.CampaignStore(store_dir)
+    heatmap = ImpactHeatmap(*grid)
+    for start, stop in ranges:
+        heatmap.update(*batch_points(store, body, points, start, stop))
+    return heatmap
+
+
+def accumulate(store, body, points, heatmap, Nproc=1, batch=65536):
+    """ stream the points of all the dispersed cases into the heatmap, the workers are merged """
+    ranges = _batches(store, body, batch)
+    grid = (heatmap.xll, heatmap.yll, heatmap.cellsize, heatmap.ncols, heatmap.nrows)
+    args = [(store.store_dir, body, points, grid, ranges[k::Nproc]) for k in range(min(Nproc, len(ranges)))]
+    if len(args) > 1:
+        pool = mp.Pool(len(args))
+        results = pool.map(_accumulate, args)
+        pool.close()
+        pool.join()
+    else:
+        results = [_accumulate(arg) for arg in args]
+    for result in results:
+        heatmap.merge(result)
+    return heatmap
+
+
+if __name__ == "__main__":
+    Nproc = max(mp.cpu_count() - 1, 1)
+
+    print("IST HEATMAP MAKER")
+    print("libraries load done.")
+
+    argv = sys.argv
+    if len(argv) > 1:
+        otmc_mission_name = argv[1]
+    else:
+        print("PLEASE INPUT mission_name as the command line argument.")
+        exit()
+    missionpath = campaign_store.mission_path(otmc_mission_name)
+
+    if len(argv) > 2:
+        stat_input = argv[2]
+    else:
+        stat_input = "heatmap.json"
+        campaign_store.fetch(missionpath + "/stat/inp/heatmap.json", stat_input)
+    stat = {}
+    if os.path.exists(stat_input):
+        with open(stat_input) as fp:
+            stat = json.load(fp)
+    points = stat.get("points", "impact")
+    cellsize = float(stat.get("cell size(deg)", 0.01))
+    bandwidth = stat.get("bandwidth(m)")
+    tile = int(stat.get("tile size", 1024))
+
+    os.makedirs("output", exist_ok=True)
+    outputfiles = []
+    store = campaign_store.open_store(otmc_mission_name, "store", Nproc)
+    for body in store.bodies:
+        if body.endswith("_extend") or not all(c in store.columns(body) for c in point_columns[points]):
+            continue
+        bounds = stat.get("bounds(deg)") or point_bounds(store, body, points)
+        if bounds is None:
+            continue
+        # room for the kernel around the points
+        margin = 3.0 * np.rad2deg(bandwidth / R_mean) / max(np.cos(np.deg2rad(np.max(np.abs(bounds[1::2])))), 1e-6) \
+            if bandwidth else 0.0
+        heatmap = accumulate(store, body, points, ImpactHeatmap.around(bounds, cellsize, margin), Nproc)
+        df = heatmap.save_tiles("output/heatmap_{0:s}".format(body), bandwidth, tile)
+        outputfile = "output/heatmap_{0:s}.csv".format(body)
+        df.to_csv(outputfile, index=False)
+        outputfiles.append(outputfile)
+        outputfiles.extend(sum([[f, f.replace(".flt", ".hdr")] for f in df["file"]], []))
+        print("{0:s}: {1:d} points, {2:d} x {3:d} cells, {4:d} tiles, probability on the grid {5:.4f}".format(
+            body, heatmap.N, heatmap.nrows, heatmap.ncols, len(df), float(df["probability"].sum())))
+
+    for outputfile in outputfiles:
+        destination = missionpath + "/stat/" + os.path.dirname(outputfile) + "/"
+        if missionpath.startswith("s3://"):
+            os.system("aws s3 cp " + outputfile + " " + destination)
+        else:
+            os.makedirs(destination, exist_ok=True)
+            os.system("cp " + outputfile + " " + destination)
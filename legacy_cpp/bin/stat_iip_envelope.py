@@ -0,0 +1,309 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# Copyright (c) 2017 Interstellar Technologies Inc. All Rights Reserved.
+# ==============================================================================
+# Time resolved dispersion envelope of the IIP during the powered flight.
+#
+# The IIP columns of every dispersed case are interpolated on a common time
+# grid (CampaignStore.resample). At every time step the points are projected
+# to the azimuthal equidistant plane [m] (WGS84) centered at their mean
+# direction, stat_jettison_area.local_projection of the step, and for every
+# probability level
+#   ellipse    : normal theory ellipse, k * sigma with k = sqrt(-2 ln(1 - p))
+#   percentile : the same ellipse scaled to the empirical p quantile of the
+#                Mahalanobis radius of the points, no normal assumption
+# are computed. The outlines of consecutive steps are joined by their convex
+# hull, and the sequence of these polygons is the envelope swept by the
+# ellipse during the flight. The longitudes of the outlines and the hulls are
+# kept continuous (beyond +-180 deg) so that they do not jump across the date
+# line.
+#
+# iip_envelope.json (all keys optional):
+# {
+#     "bodies": ["dynamics_1"],             (all the bodies with IIP if not given)
+#     "probability(%)": [50, 90, 99],
+#     "time grid[s]": [0, 200, 1],          (ignition to the last cutoff, 1 s if not given)
+#     "kml step[s]": 10                     (interval of the ellipses in the kml)
+# }
+#
+# output/iip_envelope_<body>.csv (ellipse of every step), output/iip_envelope_<body>.geojson
+# (ellipses, percentile contours and swept envelopes) and output/iip_envelope.kml are written.
+#
+# usage: python stat_iip_envelope.py (mission_name) [iip_envelope.json]
+import sys
+import os
+import json
+import multiprocessing as mp
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+import simplekml
+import campaign_store
+import stat_footprint
+import stat_jettison_area
+
+default_probability = [50.0, 90.0, 99.0]
+iip_columns = ["IIP_lon(deg)", "IIP_lat(deg)"]
+
+
+def step_projections(lon, lat, valid):
+    """ stat_jettison_area.local_projection of the points of every step, None if no point """
+    return [stat_jettison_area.local_projection(lon[t, valid[t]], lat[t, valid[t]]) if np.any(valid[t]) else None
+            for t in range(len(lon))]
+
+
+def to_plane(projections, lon, lat, valid):
+    """ (T, N) lon, lat [deg] to x (east), y (north) [m] on the plane of every step, nan if not valid """
+    x, y = np.full(lon.shape, np.nan), np.full(lat.shape, np.nan)
+    for t, proj in enumerate(projections):
+        if proj is not None:
+            x[t, valid[t]], y[t, valid[t]] = proj(lon[t, valid[t]], lat[t, valid[t]])
+    return x, y
+
+
+def from_plane(projections, x, y):
+    """ inverse of to_plane, (T, M) [m] to lon, lat [deg] """
+    lon, lat = np.full(x.shape, np.nan), np.full(y.shape, np.nan)
+    for t, proj in enumerate(projections):
+        finite = np.isfinite(x[t]) & np.isfinite(y[t])
+        if proj is not None and np.any(finite):
+            lon[t, finite], lat[t, finite] = proj(x[t, finite], y[t, finite], inverse=True)
+    return lon, lat
+
+
+def iip_envelope(lon, lat, probability=default_probability, Nellipse=37):
+    """
+    Args:
+        lon, lat (array) : (T, N) IIP [deg] of N cases at T time steps, nan if the case is not flying
+        probability (list) : probability levels [%]
+        Nellipse (int) : number of the points of the outlines (closed)
+    Returns:
+        dict of the per step arrays: "cases" (T,), "center" (T, 2) lon, lat, "covariance" (T, 2, 2) [m^2],
+        "sigma(m)" (T, 2) major, minor, "azimuth(deg)" (T,) of the major axis, and for the levels
+        "scale" (L, T) of the percentile contours [sigma], "coverage(%)" (L, T) of the normal ellipses,
+        "ellipse" and "percentile" (L, T, Nellipse, 2) outlines in lon, lat [deg], the longitudes
+        continuous around the center (out of [-180, 180) across the date line)
+    """
+    lon, lat = np.asarray(lon, dtype=np.float64), np.asarray(lat, dtype=np.float64)
+    valid = np.isfinite(lon) & np.isfinite(lat)
+    lon, lat = np.where(valid, lon, np.nan), np.where(valid, lat, np.nan)
+    n = valid.sum(axis=1)
+    projections = step_projections(lon, lat, valid)
+    x, y = to_plane(projections, lon, lat, valid)
+
+    # centered moments of every step
+    with np.errstate(invalid="ignore"):
+        mx, my = np.nanmean(x, axis=1), np.nanmean(y, axis=1)
+    dx, dy = np.where(valid, x - mx[:, None], 0.0), np.where(valid, y - my[:, None], 0.0)
+    dof = np.maximum(n - 1, 1)
+    sxx, syy, sxy = np.sum(dx * dx, axis=1) / dof, np.sum(dy * dy, axis=1) / dof, np.sum(dx * dy, axis=1) / dof
+    cov = np.stack([np.stack([sxx, sxy], axis=1), np.stack([sxy, syy], axis=1)], axis=1)
+    cov[n < 2] = np.nan
+
+    # principal axes of the 2x2 matrices in closed form
+    half_trace = 0.5 * (sxx + syy)
+    radius = np.hypot(0.5 * (sxx - syy), sxy)
+    sigma = np.sqrt(np.maximum(np.stack([half_trace + radius, half_trace - radius], axis=1), 0.0))
+    theta = 0.5 * np.arctan2(2.0 * sxy, sxx - syy)  # major axis from the east
+    major = np.stack([np.cos(theta), np.sin(theta)], axis=1)
+    minor = np.stack([-np.sin(theta), np.cos(theta)], axis=1)
+
+    # points in the principal axes [sigma]
+    u = (dx * major[:, None, 0] + dy * major[:, None, 1]) / np.where(sigma[:, :1] > 0, sigma[:, :1], 1.0)
+    v = (dx * minor[:, None, 0] + dy * minor[:, None, 1]) / np.where(sigma[:, 1:] > 0, sigma[:, 1:], 1.0)
+    r2 = np.where(valid, u * u + v * v, np.nan)
+
+    angle = np.linspace(0.0, 2.0 * np.pi, Nellipse)
+    ex = sigma[:, :1] * np.cos(angle) * major[:, :1] + sigma[:, 1:] * np.sin(angle) * minor[:, :1]
+    ey = sigma[:, :1] * np.cos(angle) * major[:, 1:] + sigma[:, 1:] * np.sin(angle) * minor[:, 1:]
+    p = np.asarray(probability, dtype=np.float64) * 1e-2
+    k_normal = stat_jettison_area.ellipse_scale(p)
+    with np.errstate(invalid="ignore"):
+        k_percentile = np.sqrt(np.nanpercentile(r2, 100.0 * p, axis=1)) if len(r2) > 0 else np.zeros((len(p), 0))
+    k_percentile[:, n < 3] = np.nan
+    coverage = 100.0 * np.sum(r2[None] <= k_normal[:, None, None] ** 2, axis=2) / np.maximum(n, 1)
+
+    center = np.stack(from_plane(projections, mx[:, None], my[:, None]), axis=-1)[:, 0]
+
+    def outlines(k):
+        """ (L, T, Nellipse, 2) lon, lat of the ellipses scaled by k (L, T) """
+        X = mx[None, :, None] + k[:, :, None] * ex[None]
+        Y = my[None, :, None] + k[:, :, None] * ey[None]
+        L, T, M = X.shape
+        lon_out, lat_out = from_plane(projections, np.moveaxis(X, 1, 0).reshape(T, L * M),
+                                      np.moveaxis(Y, 1, 0).reshape(T, L * M))
+        # longitudes continuous around the center, not cut at the date line
+        lon_out = (lon_out - center[:, :1] + 180.0) % 360.0 - 180.0 + center[:, :1]
+        out = np.stack([lon_out, lat_out], axis=-1).reshape(T, L, M, 2)
+        return np.moveaxis(out, 0, 1)
+
+    return {"cases": n,
+            "center": center,
+            "covariance": cov,
+            "sigma(m)": np.where((n >= 2)[:, None], sigma, np.nan),
+            "azimuth(deg)": np.where(n >= 2, np.rad2deg(0.5 * np.pi - theta) % 180.0, np.nan),
+            "probability(%)": list(probability),
+            "scale": k_percentile,
+            "coverage(%)": np.where(n >= 2, coverage, np.nan),
+            "ellipse": outlines(np.broadcast_to(k_normal[:, None], k_percentile.shape)),
+            "percentile": outlines(k_percentile)}
+
+
+def swept_envelope(outlines):
+    """
+    Args:
+        outlines (array) : (T, M, 2) closed outlines in lon, lat [deg] of consecutive steps
+    Returns:
+        list of (time index, (n, 2) closed convex hull of the outlines of the step and the next one),
+        the longitudes continuous around the first point of the step
+    """
+    finite = np.all(np.isfinite(outlines), axis=(1, 2))
+    swept = []
+    for t in np.flatnonzero(finite[:-1] & finite[1:]):
+        points = outlines[t:t + 2].reshape(-1, 2)
+        # longitudes continuous around the first point, the hull is taken on the lon, lat plane
+        lon = (points[:, 0] - points[0, 0] + 180.0) % 360.0 - 180.0 + points[0, 0]
+        if np.ptp(lon) == 0.0 and np.ptp(points[:, 1]) == 0.0:
+            continue
+        # not wrapped back to [-180, 180): a hull across the date line would jump around the earth
+        swept.append((t, stat_footprint.convex_hull(lon, points[:, 1])))
+    return swept
+
+
+def powered_flight_grid(store, body, dt=1.0):
+    """ time grid from the first ignition to the last cutoff of the dispersed cases """
+    cases = store.cases(body)
+    time = np.asarray(store.column(body, "time(s)"))
+    t0, t1 = np.nanmin(time), np.nanmax(time)
+    rows = {e: store.event_rows(body, e)[cases > 0] for e in ["ignition", "cutoff"]}
+    if np.any(rows["ignition"] >= 0):
+        t0 = time[rows["ignition"][rows["ignition"] >= 0]].min()
+    if np.any(rows["cutoff"] >= 0):
+        t1 = time[rows["cutoff"][rows["cutoff"] >= 0]].max()
+    return np.arange(t0, t1 + 0.5 * dt, dt)
+
+
+def load_iip(store, body, time_grid, batch=256):
+    """ (T, N) IIP lon, lat [deg] of the dispersed cases on the time grid """
+    cases = store.cases(body)
+    blocks = []
+    for start in range(0, len(cases), batch):
+        X = store.resample(body, iip_columns, time_grid, start, start + batch)
+        blocks.append(X[cases[start:start + batch] > 0])
+    X = np.concatenate(blocks) if blocks else np.zeros((0, len(time_grid), 2))
+    return X[:, :, 0].T, X[:, :, 1].T
+
+
+def to_dataframe(time_grid, env):
+    columns = OrderedDict([
+        ("time(s)", time_grid), ("cases", env["cases"]),
+        ("center lon(deg)", env["center"][:, 0]), ("center lat(deg)", env["center"][:, 1]),
+        ("sigma major(m)", env["sigma(m)"][:, 0]), ("sigma minor(m)", env["sigma(m)"][:, 1]),
+        ("azimuth(deg)", env["azimuth(deg)"])])
+    for k, p in enumerate(env["probability(%)"]):
+        columns["ellipse {0:g}% coverage(%)".format(p)] = env["coverage(%)"][k]
+        columns["percentile {0:g}% scale(sigma)".format(p)] = env["scale"][k]
+    return pd.DataFrame(columns)
+
+
+def _coords(ring):
+    return [[float(q[0]), float(q[1])] for q in ring]
+
+
+def to_geojson(name, time_grid, env, swept):
+    features = []
+    for k, p in enumerate(env["probability(%)"]):
+        for kind in ["ellipse", "percentile"]:
+            for t in np.flatnonzero(np.all(np.isfinite(env[kind][k]), axis=(1, 2))):
+                features.append({"type": "Feature",
+                                 "geometry": {"type": "Polygon", "coordinates": [_coords(env[kind][k, t])]},
+                                 "properties": {"body": name, "kind": kind, "probability(%)": p,
+                                                "time(s)": float(time_grid[t])}})
+            features.append({"type": "Feature",
+                             "geometry": {"type": "MultiPolygon",
+                                          "coordinates": [[_coords(hull)] for t, hull in swept[kind][k]]},
+                             "properties": {"body": name, "kind": "swept " + kind, "probability(%)": p,
+                                            "time(s)": [float(time_grid[t]) for t, hull in swept[kind][k]]}})
+    return {"type": "FeatureCollection", "features": features}
+
+
+def add_kml(kml, name, time_grid, env, swept, kml_step=10.0):
+    folder = kml.newfolder(name=name)
+    folder.newlinestring(name="IIP Center", coords=[tuple(q) for q in env["center"] if np.all(np.isfinite(q))])
+    shown = np.flatnonzero(np.isclose((time_grid - time_grid[0]) % kml_step, 0.0) |
+                           np.isclose((time_grid - time_grid[0]) % kml_step, kml_step))
+    for k, p in enumerate(env["probability(%)"]):
+        color = stat_jettison_area.level_colors[k % len(stat_jettison_area.level_colors)]
+        level = folder.newfolder(name="IIP Dispersion {0:g}%".format(p))
+        for t, hull in swept["percentile"][k]:
+            polygon = level.newpolygon(name="IIP Envelope {0:g}% T+{1:g}".format(p, time_grid[t]),
+                                       outerboundaryis=[tuple(q) for q in hull])
+            polygon.style.polystyle.color = simplekml.Color.changealphaint(40, color)
+            polygon.style.linestyle.width = 0
+        for t in shown:
+            if not np.all(np.isfinite(env["percentile"][k, t])):
+                continue
+            line = level.newlinestring(name="IIP Percentile Area {0:g}% T+{1:g}".format(p, time_grid[t]))
+            line.coords = [tuple(q) for q in env["percentile"][k, t]]
+            line.style.linestyle.color = color
+
+
+if __name__ == "__main__":
+    Nproc = max(mp.cpu_count() - 1, 1)
+
+    print("IST IIP ENVELOPE MAKER")
+    print("libraries load done.")
+
+    argv = sys.argv
+    if len(argv) > 1:
+        otmc_mission_name = argv[1]
+    else:
+        print("PLEASE INPUT mission_name as the command line argument.")
+        exit()
+    missionpath = campaign_store.mission_path(otmc_mission_name)
+
+    if len(argv) > 2:
+        stat_input = argv[2]
+    else:
+        stat_input = "iip_envelope.json"
+        campaign_store.fetch(missionpath + "/stat/inp/iip_envelope.json", stat_input)
+    stat = {}
+    if os.path.exists(stat_input):
+        with open(stat_input) as fp:
+            stat = json.load(fp)
+    probability = stat.get("probability(%)", default_probability)
+
+    os.makedirs("output", exist_ok=True)
+    outputfiles = []
+    store = campaign_store.open_store(otmc_mission_name, "store", Nproc)
+    kml = simplekml.Kml(open=1)
+    for body in stat.get("bodies", store.bodies):
+        if not all(c in store.columns(body) for c in iip_columns):
+            continue
+        if "time grid[s]" in stat:
+            t0, t1, dt = stat["time grid[s]"]
+            time_grid = np.arange(t0, t1 + 0.5 * dt, dt)
+        else:
+            time_grid = powered_flight_grid(store, body)
+        lon, lat = load_iip(store, body, time_grid)
+        env = iip_envelope(lon, lat, probability)
+        swept = {kind: [swept_envelope(env[kind][k]) for k in range(len(probability))]
+                 for kind in ["ellipse", "percentile"]}
+
+        outputfile = "output/iip_envelope_{0:s}.csv".format(body)
+        to_dataframe(time_grid, env).to_csv(outputfile, index=False)
+        geojsonfile = "output/iip_envelope_{0:s}.geojson".format(body)
+        with open(geojsonfile, "w") as fo:
+            json.dump(to_geojson(body, time_grid, env, swept), fo)
+        add_kml(kml, body, time_grid, env, swept, stat.get("kml step[s]", 10.0))
+        outputfiles.extend([outputfile, geojsonfile])
+        print("{0:s}: {1:d} steps from T+{2:g} to T+{3:g}[s], max sigma {4:.1f} [m]".format(
+            body, len(time_grid), time_grid[0], time_grid[-1], np.nanmax(env["sigma(m)"][:, 0])))
+    kml.save("output/iip_envelope.kml")
+    outputfiles.append("output/iip_envelope.kml")
+
+    for outputfile in outputfiles:
+        if missionpath.startswith("s3://"):
+            os.system("aws s3 cp " + outputfile + " " + missionpath + "/stat/output/")
+        else:
+            os.system("cp " + outputfile + " " + missionpath + "/stat/output/")
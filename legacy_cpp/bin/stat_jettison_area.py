@@ -1,125 +1,239 @@
-#!/usr/bin/python
-import math
-import numpy as np
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# Copyright (c) 2017 Interstellar Technologies Inc. All Rights Reserved.
+# ==============================================================================
+# Jettison (impact) area of every stage and dump product.
+#
+# The impact point of a body is the last row of each dispersed case in the
+# campaign store (dynamics_1, dynamics_1_dump, dynamics_2, ...). The points
+# are projected to an azimuthal equidistant plane [m] centered at their mean
+# direction, where the mean and covariance are taken with centered (two pass)
+# moments. For every probability level
+#   ellipse : semi axes k * sigma on the principal axes, k = sqrt(-2 ln(1 - p))
+#   box     : rectangle on the principal axes, each side with probability sqrt(p)
+# and the fraction of the points inside is reported next to the level.
+# The outlines are projected back to lon/lat [deg].
+#
+# output/jettison_area_<body>.dat, output/jettison_area.kml and, if
+# stat/output/datapoint_landing_time.csv exists, the former
+# output/datapoint_landing_time.dat/.kml are written.
+#
+# jettison_area.json (optional): {"probability(%)": [50, 90, 99, 99.9]}
+#
+# usage: python stat_jettison_area.py (mission_name) [jettison_area.json]
 import sys
 import os
+import json
+import multiprocessing as mp
+from statistics import NormalDist
+import numpy as np
 import simplekml
+from pyproj import Proj
+import campaign_store
+
+default_probability = [50.0, 90.0, 99.0, 99.9]
+level_colors = [simplekml.Color.yellow, simplekml.Color.orange, simplekml.Color.red, simplekml.Color.magenta]
+
+
+def read_lonlat(inputfile):
+    """ lon, lat [deg] of a datapoint_*.csv, only the two columns are loaded """
+    with open(inputfile) as fp:
+        header = [v.strip() for v in fp.readline().split(",")]
+    if "lat(deg)" not in header or "lon(deg)" not in header:
+        raise ValueError("THERE IS NO LAT-LON DATA in " + inputfile)
+    data = np.loadtxt(inputfile, delimiter=",", skiprows=1, ndmin=2,
+                      usecols=(header.index("lon(deg)"), header.index("lat(deg)")))
+    return data[:, 0], data[:, 1]
+
+
+def impact_points(store, body):
+    """ lon, lat [deg] and caseNo of the last row of every dispersed case of the body """
+    last = store.offsets(body)[1:] - 1
+    cases = store.cases(body)
+    lon = np.asarray(store.column(body, "lon(deg)"))[last]
+    lat = np.asarray(store.column(body, "lat(deg)"))[last]
+    dispersed = cases > 0
+    return lon[dispersed], lat[dispersed], cases[dispersed]
+
+
+def local_projection(lon, lat):
+    """ azimuthal equidistant projection centered at the mean direction of the points """
+    lon_r, lat_r = np.deg2rad(lon), np.deg2rad(lat)
+    c = np.cos(lat_r)
+    x, y, z = np.mean(c * np.cos(lon_r)), np.mean(c * np.sin(lon_r)), np.mean(np.sin(lat_r))
+    lon_0 = np.rad2deg(np.arctan2(y, x))
+    lat_0 = np.rad2deg(np.arctan2(z, np.hypot(x, y)))
+    return Proj(proj="aeqd", lat_0=lat_0, lon_0=lon_0, ellps="WGS84")
+
+
+def plane_moments(x, y):
+    """ mean (2,) and covariance (2, 2) [m] with centered moments """
+    mean = np.array([np.mean(x), np.mean(y)])
+    dx, dy = x - mean[0], y - mean[1]
+    cov = np.array([[dx @ dx, dx @ dy], [dx @ dy, dy @ dy]]) / max(len(x) - 1, 1)
+    return mean, cov
+
+
+def ellipse_scale(p):
+    """ Mahalanobis radius of the 2D normal distribution containing probability p """
+    return np.sqrt(-2.0 * np.log(1.0 - p))
+
+
+def box_scale(p):
+    """ half width [sigma] of the principal axis box containing probability p """
+    return NormalDist().inv_cdf(0.5 + 0.5 * np.sqrt(p))
+
+
+def jettison_area(lon, lat, probability=default_probability, Nellipse=37, Nedge=10):
+    """
+    Args:
+        lon, lat (array) : impact points [deg], nan is ignored
+        probability (list) : probability levels [%]
+        Nellipse (int) : number of the points of the ellipse outline (closed)
+        Nedge (int) : number of the segments of a box side
+    Returns:
+        dict of the center, sigma and a list of the levels
+        (ellipse / box outlines in lon, lat [deg] and the coverage of the points)
+    """
+    lon, lat = np.asarray(lon, dtype=np.float64), np.asarray(lat, dtype=np.float64)
+    valid = np.isfinite(lon) & np.isfinite(lat)
+    lon, lat = lon[valid], lat[valid]
+    proj = local_projection(lon, lat)
+    x, y = proj(lon, lat)
+    mean, cov = plane_moments(x, y)
+    eigval, eigvec = np.linalg.eigh(cov)
+    sigma = np.sqrt(np.maximum(eigval[::-1], 0.0))  # major, minor
+    axes = eigvec[:, ::-1] * sigma                   # columns: major, minor axis vectors [m]
+
+    # points in the principal axes [sigma]
+    u = np.stack([x - mean[0], y - mean[1]], axis=1) @ eigvec[:, ::-1]
+    u = u / np.where(sigma > 0, sigma, 1.0)
+    r2 = np.sum(u ** 2, axis=1)
+    umax = np.max(np.abs(u), axis=1)
+
+    angle = np.linspace(0.0, 2.0 * np.pi, Nellipse)
+    circle = np.stack([np.cos(angle), np.sin(angle)])
+    corner = np.array([[1, 1], [-1, 1], [-1, -1], [1, -1], [1, 1]], dtype=np.float64)
+    s = np.linspace(0.0, 1.0, Nedge + 1)[:-1, None]
+    square = np.concatenate([corner[i] + s * (corner[i + 1] - corner[i]) for i in range(4)] + [corner[:1]]).T
+
+    def lonlat(points):
+        lon_out, lat_out = proj(mean[0] + points[0], mean[1] + points[1], inverse=True)
+        return np.stack([lon_out, lat_out], axis=1)
+
+    levels = []
+    for p in probability:
+        k_e, k_b = ellipse_scale(p * 1e-2), box_scale(p * 1e-2)
+        levels.append({"probability(%)": p,
+                       "ellipse semi axes(m)": k_e * sigma,
+                       "ellipse coverage(%)": 100.0 * np.mean(r2 <= k_e ** 2),
+                       "ellipse": lonlat(k_e * axes @ circle),
+                       "box half widths(m)": k_b * sigma,
+                       "box coverage(%)": 100.0 * np.mean(umax <= k_b),
+                       "box": lonlat(k_b * axes @ corner.T),
+                       "box outline": lonlat(k_b * axes @ square)})
+    center = lonlat(np.zeros((2, 1)))[0]
+    return {"N": len(lon),
+            "center": center,
+            "sigma(m)": sigma,
+            "azimuth(deg)": np.rad2deg(np.arctan2(axes[0, 0], axes[1, 0])) % 180.0,
+            "levels": levels}
+
+
+def write_dat(outputfile, inputname, area):
+    fp = open(outputfile, "w")
+    fp.write("IST JETTISON AREA MAKER\n\n")
+    fp.write("INPUTFIE: {0:}\n".format(inputname))
+    fp.write("NUMBER OF POINTS: {0:d}\n".format(area["N"]))
+    fp.write("AVERAGE POINT (lon, lat)[deg]:\n")
+    fp.write("\t{0:}, {1:}\n".format(area["center"][0], area["center"][1]))
+    fp.write("SIGMA (major, minor)[m], AZIMUTH OF MAJOR AXIS[deg]:\n")
+    fp.write("\t{0:}, {1:}, {2:}\n".format(area["sigma(m)"][0], area["sigma(m)"][1], area["azimuth(deg)"]))
+    for level in area["levels"]:
+        fp.write("\nPROBABILITY {0:}%\n".format(level["probability(%)"]))
+        fp.write("JETTISON AREA (lon, lat)[deg]: half widths {0:} x {1:} [m], coverage {2:.2f}%\n".format(
+            level["box half widths(m)"][0], level["box half widths(m)"][1], level["box coverage(%)"]))
+        for p in level["box"]:
+            fp.write("\t{0:}, {1:}\n".format(p[0], p[1]))
+        fp.write("JETTISON ELLIPSE (lon, lat)[deg]: semi axes {0:} x {1:} [m], coverage {2:.2f}%\n".format(
+            level["ellipse semi axes(m)"][0], level["ellipse semi axes(m)"][1], level["ellipse coverage(%)"]))
+        for p in level["ellipse"]:
+            fp.write("\t{0:}, {1:}\n".format(p[0], p[1]))
+    fp.close()
+
+
+def add_kml(kml, name, area):
+    folder = kml.newfolder(name=name)
+    folder.newpoint(name="Average LandIn Point", coords=[tuple(area["center"])])
+    for i, level in enumerate(area["levels"]):
+        color = level_colors[i % len(level_colors)]
+        box = folder.newlinestring(name="LandIn Inclusion Area {0:}%".format(level["probability(%)"]))
+        box.coords = [tuple(p) for p in level["box outline"]]
+        box.style.linestyle.color = color
+        ellipse = folder.newlinestring(name="LandIn Elliposoid Area {0:}%".format(level["probability(%)"]))
+        ellipse.coords = [tuple(p) for p in level["ellipse"]]
+        ellipse.style.linestyle.color = color
+
+
+if __name__ == "__main__":
+    Nproc = max(mp.cpu_count() - 1, 1)
+
+    print("IST JETTISON AREA MAKER")
+    print("libraries load done.")
+
+    argv = sys.argv
+    if len(argv) > 1:
+        otmc_mission_name = argv[1]
+    else:
+        print("PLEASE INPUT mission_name as the command line argument.")
+        exit()
+    missionpath = campaign_store.mission_path(otmc_mission_name)
+
+    if len(argv) > 2:
+        stat_input = argv[2]
+    else:
+        stat_input = "jettison_area.json"
+        campaign_store.fetch(missionpath + "/stat/inp/jettison_area.json", stat_input)
+    stat = {}
+    if os.path.exists(stat_input):
+        with open(stat_input) as fp:
+            stat = json.load(fp)
+    probability = stat.get("probability(%)", default_probability)
+
+    os.makedirs("output", exist_ok=True)
+    outputfiles = []
+
+    # impact points of every stage and dump product
+    store = campaign_store.open_store(otmc_mission_name, "store", Nproc)
+    kml = simplekml.Kml(open=1)
+    for body in store.bodies:
+        if body.endswith("_extend") or "lat(deg)" not in store.columns(body):
+            continue
+        lon, lat, cases = impact_points(store, body)
+        if len(lon) < 2:
+            continue
+        area = jettison_area(lon, lat, probability)
+        outputfile = "output/jettison_area_{0:s}.dat".format(body)
+        write_dat(outputfile, body, area)
+        add_kml(kml, body, area)
+        outputfiles.append(outputfile)
+        print("{0:s}: {1:d} points, sigma {2:.1f} x {3:.1f} [m]".format(body, area["N"], *area["sigma(m)"]))
+    kml.save("output/jettison_area.kml")
+    outputfiles.append("output/jettison_area.kml")
+
+    # datapoint_landing_time.csv of stat_datapoint.py
+    inputfile = "output/datapoint_landing_time.csv"
+    if campaign_store.fetch(missionpath + "/stat/" + inputfile, inputfile):
+        lon, lat = read_lonlat(inputfile)
+        area = jettison_area(lon, lat, probability)
+        write_dat(inputfile.replace(".csv", ".dat"), inputfile, area)
+        kml = simplekml.Kml(open=1)
+        add_kml(kml, "landing_time", area)
+        kml.save(inputfile.replace(".csv", ".kml"))
+        outputfiles.extend([inputfile.replace(".csv", ".dat"), inputfile.replace(".csv", ".kml")])
 
-inputfile  = "output/datapoint_landing_time.csv" # default file name
-outputfile = inputfile.replace(".csv", ".dat")
-outputkml = inputfile.replace(".csv", ".kml")
-
-argv = sys.argv
-if len(argv) > 1:
-    otmc_mission_name = argv[1]
-else:
-    print "PLEASE INPUT mission_name as the command line argument."
-    exit()
-
-os.system("aws s3 cp s3://otmc/{0:s}/stat/{1:s} .".format(otmc_mission_name,inputfile))
-
-# initialize
-N  = 0
-x  = 0
-y  = 0
-x2 = 0
-y2 = 0
-xy = 0
-
-# inputfile load
-###### CAUTION ###################
-# WE DO NOT USE PANDAS           #
-# 'CAUSE IT REQUIRES             #
-# TOO HUGE MEMORIES !!!!!!       #
-##################################
-index_lat = None
-index_lon = None
-fp = open(inputfile)
-for line_number,line in enumerate(fp):
-    if line_number == 0:
-        arr = line.split(",")
-        for i, v in enumerate(arr):
-            if "lat(deg)" == v.strip():
-                index_lat = i
-            elif "lon(deg)" == v.strip():
-                index_lon = i
-        if index_lat == None or index_lon == None:
-                print("ERROR: THERE IS NO LAT-LON DATA!!")
-                exit(1)
-        continue
-
-    arr = line.split(",")
-    lat = float(arr[index_lat])
-    lon = float(arr[index_lon])
-
-    N  += 1
-    x  += lon
-    y  += lat
-    x2 += lon ** 2
-    y2 += lat ** 2
-    xy += lon * lat
-fp.close()
-
-# statistical parameters
-x_ave = x / N
-y_ave = y / N
-ave = np.array([x_ave, y_ave])
-sigma_x2 = x2/N - x_ave**2
-sigma_y2 = y2/N - y_ave**2
-sigma_xy = xy/N - x_ave * y_ave
-sign = (sigma_x2-sigma_y2)/abs(sigma_x2-sigma_y2)
-
-# long-axis and short-axis of ellipse
-alpha = math.sqrt((sigma_x2 + sigma_y2 + sign * math.sqrt(4 * sigma_xy ** 2 + (sigma_x2 - sigma_y2) ** 2)) / 2)
-beta  = math.sqrt((sigma_x2 + sigma_y2 - sign * math.sqrt(4 * sigma_xy ** 2 + (sigma_x2 - sigma_y2) ** 2)) / 2)
-theta = 0.5 * math.atan(2 * sigma_xy / (sigma_x2 - sigma_y2))
-v1 = np.array([  alpha * math.cos(theta), alpha * math.sin(theta)])
-v2 = np.array([- beta  * math.sin(theta), beta  * math.cos(theta)])
-
-# boundary points
-p1 =  3 * v1 + 3 * v2 + ave
-p2 = -3 * v1 + 3 * v2 + ave
-p3 = -3 * v1 - 3 * v2 + ave
-p4 =  3 * v1 - 3 * v2 + ave
-
-# output
-fp = open(outputfile,"w")
-fp.write("IST JETTISON AREA MAKER\n\n")
-fp.write("INPUTFIE: {0:}\n".format(inputfile))
-fp.write("AVERAGE POINT (lon, lat)[deg]:\n")
-fp.write("\t{0:}, {1:}\n".format(ave[0],ave[1]))
-fp.write("JETTISON AREA (lon, lat)[deg]:\n")
-fp.write("\t{0:}, {1:}\n".format(p1[0],p1[1]))
-fp.write("\t{0:}, {1:}\n".format(p2[0],p2[1]))
-fp.write("\t{0:}, {1:}\n".format(p3[0],p3[1]))
-fp.write("\t{0:}, {1:}\n".format(p4[0],p4[1]))
-fp.write("\t{0:}, {1:}\n".format(p1[0],p1[1]))
-fp.write("JETTISON ELLIPSE (3 SIGMA) (lon, lat)[deg]:\n")
-for i in range(37):
-    angle = np.pi / 180 * i * 10
-    p_tmp = 3 * v1 * math.cos(angle) + 3 * v2 * math.sin(angle) + ave
-    fp.write("\t{0:}, {1:}\n".format(p_tmp[0],p_tmp[1]))
-fp.close()
-os.system("aws s3 cp {1:s} s3://otmc/{0:s}/stat/output/ ".format(otmc_mission_name, outputfile))
-
-kml = simplekml.Kml(open=1)
-
-kml.newpoint(name="Average LandIn Point", coords = [(ave[0], ave[1])])
-
-inc_area = kml.newlinestring(name="LandIn Inclusion Area")
-inc_area.coords = [(p1[0],p1[1]),\
-                     (p2[0],p2[1]),\
-                     (p3[0],p3[1]),\
-                     (p4[0],p4[1]),\
-                     (p1[0],p1[1])]
-inc_area.style.linestyle.color = simplekml.Color.red
-
-linestring = kml.newlinestring(name="LandIn Elliposoid Area")
-arr_coords = []
-for i in range(37):
-    angle = np.pi / 180 * i * 10
-    p_tmp = 3 * v1 * math.cos(angle) + 3 * v2 * math.sin(angle) + ave
-    arr_coords.append((p_tmp[0], p_tmp[1]))
-linestring.coords = arr_coords
-kml.save(outputkml)
-os.system("aws s3 cp {1:s} s3://otmc/{0:s}/stat/output/ ".format(otmc_mission_name, outputkml))
+    for outputfile in outputfiles:
+        if missionpath.startswith("s3://"):
+            os.system("aws s3 cp " + outputfile + " " + missionpath + "/stat/output/")
+        else:
+            os.system("cp " + outputfile + " " + missionpath + "/stat/output/")
@@ -0,0 +1,322 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# Copyright (c) 2017 Interstellar Technologies Inc. All Rights Reserved.
+# ==============================================================================
+# Impact probability of keep-out zones (land, restricted areas, ...).
+#
+# The zones are read from local GeoJSON (Polygon / MultiPolygon features),
+# KML (Placemark polygons) or csv (name,lon(deg),lat(deg) vertex rows) files.
+# Each zone gets a uniform grid over its bounding box in which every cell is
+# classified once as outside, inside or on the boundary: the cell centers by
+# a row-wise crossing count, the boundary by the cells each edge crosses. The
+# impact points are bucketed on another uniform grid, so a zone only looks at
+# the points near its bounding box, decides them by a cell lookup, and only
+# the few in boundary cells get the exact crossing number test.
+#
+# For the impact points of every stage and dump product in the campaign store
+# (and datapoint_landing_time.csv if it exists) output/keepout_<body>.csv
+# lists the number of cases, the probability and the caseNo of the cases in
+# every zone.
+#
+# usage: python stat_keepout.py (mission_name) (zone file) [zone file ...]
+import sys
+import os
+import json
+import multiprocessing as mp
+import xml.etree.ElementTree as ET
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+import campaign_store
+import stat_footprint
+import stat_jettison_area
+
+
+def _close(ring):
+    ring = np.asarray(ring, dtype=np.float64)[:, :2]
+    if np.any(ring[0] != ring[-1]):
+        ring = np.concatenate([ring, ring[:1]])
+    return ring
+
+
+def load_geojson(filename):
+    with open(filename) as fp:
+        data = json.load(fp)
+    features = data["features"] if data.get("type") == "FeatureCollection" else [data]
+    zones = []
+    for k, feature in enumerate(features):
+        geometry = feature.get("geometry", feature)
+        name = (feature.get("properties") or {}).get("name", "{0:s}_{1:d}".format(os.path.basename(filename), k))
+        if geometry["type"] == "Polygon":
+            rings = geometry["coordinates"]
+        elif geometry["type"] == "MultiPolygon":
+            rings = sum(geometry["coordinates"], [])
+        else:
+            continue
+        zones.append((name, [_close(r) for r in rings]))
+    return zones
+
+
+def load_kml(filename):
+    def local(tag):
+        return tag.rsplit("}", 1)[-1]
+
+    def coordinates(element):
+        text = [e.text for e in element.iter() if local(e.tag) == "coordinates"][0]
+        return _close([[float(v) for v in p.split(",")[:2]] for p in text.split()])
+
+    zones = []
+    for k, placemark in enumerate(e for e in ET.parse(filename).getroot().iter() if local(e.tag) == "Placemark"):
+        names = [e.text for e in placemark if local(e.tag) == "name"]
+        name = names[0] if len(names) > 0 else "{0:s}_{1:d}".format(os.path.basename(filename), k)
+        rings = [coordinates(boundary) for boundary in placemark.iter()
+                 if local(boundary.tag) in ["outerBoundaryIs", "innerBoundaryIs"]]
+        if len(rings) > 0:
+            zones.append((name, rings))
+    return zones
+
+
+def load_csv(filename):
+    df = pd.read_csv(filename, index_col=False)
+    return [(name, [_close(g[["lon(deg)", "lat(deg)"]].to_numpy())])
+            for name, g in df.groupby("name", sort=False)]
+
+
+def load_zones(filenames):
+    """
+    Returns:
+        list of (name, rings), rings are closed (n, 2) arrays of lon, lat [deg];
+        a point is inside the zone if it is inside an odd number of the rings
+    """
+    zones = []
+    for filename in filenames:
+        ext = os.path.splitext(filename)[1].lower()
+        if ext in [".geojson", ".json"]:
+            zones.extend(load_geojson(filename))
+        elif ext == ".kml":
+            zones.extend(load_kml(filename))
+        else:
+            zones.extend(load_csv(filename))
+    return zones
+
+
+class KeepoutZone:
+    """
+    one zone with its uniform grid index
+    Args:
+        name (str)
+        rings (list) : closed (n, 2) arrays of lon, lat [deg]
+        Ncell (int) : max number of the grid cells along a side
+    """
+    OUTSIDE, INSIDE, BOUNDARY = 0, 1, 2
+
+    def __init__(self, name, rings, Ncell=256):
+        self.name = name
+        # continuous longitude across the date line, the holes and the other
+        # shells on the same side as the first ring
+        self.rings = []
+        for r in rings:
+            r = r.copy()
+            r[:, 0] = np.rad2deg(np.unwrap(np.deg2rad(r[:, 0])))
+            if len(self.rings) > 0:
+                r[:, 0] -= 360.0 * np.round((r[0, 0] - self.rings[0][0, 0]) / 360.0)
+            self.rings.append(r)
+        points = np.concatenate(self.rings)
+        self.lo, self.hi = points.min(axis=0), points.max(axis=0)
+        self.lon_center = 0.5 * (self.lo[0] + self.hi[0])
+        edges = np.concatenate([np.concatenate([r[:-1], r[1:]], axis=1) for r in self.rings])
+        self.edges = edges  # (E, 4) x0, y0, x1, y1
+
+        n = int(min(Ncell, max(32, 16 * np.sqrt(len(edges)))))
+        self.d = np.maximum((self.hi - self.lo) / n, 1e-9)
+        self.shape = (n, n)  # (rows along lat, columns along lon)
+        self.cell = self._classify()
+
+    def _classify(self):
+        ny, nx = self.shape
+        x0, y0, x1, y1 = self.edges.T
+        cell = np.zeros(self.shape, dtype=np.int8)
+
+        # cell centers: crossings of each row center line left of each column center
+        yc = self.lo[1] + (np.arange(ny) + 0.5) * self.d[1]
+        r0 = np.ceil((np.minimum(y0, y1) - self.lo[1]) / self.d[1] - 0.5).astype(np.int64)
+        r1 = np.ceil((np.maximum(y0, y1) - self.lo[1]) / self.d[1] - 0.5).astype(np.int64)
+        r0, r1 = np.clip(r0, 0, ny), np.clip(r1, 0, ny)
+        span = r1 - r0
+        edge = np.repeat(np.arange(len(x0)), span)
+        row = np.repeat(r0 - np.cumsum(span) + span, span) + np.arange(span.sum())
+        y = yc[row]
+        cross = (y0[edge] > y) != (y1[edge] > y)
+        edge, row, y = edge[cross], row[cross], y[cross]
+        xc = x0[edge] + (y - y0[edge]) * (x1[edge] - x0[edge]) / (y1[edge] - y0[edge])
+        # a crossing at xc is left of the centers of the columns with index > (xc - lo) / d - 0.5
+        col = np.clip(np.floor((xc - self.lo[0]) / self.d[0] - 0.5).astype(np.int64) + 1, 0, nx)
+        count = np.bincount(row * (nx + 1) + col, minlength=ny * (nx + 1)).reshape(ny, nx + 1)
+        cell[np.cumsum(count, axis=1)[:, :nx] % 2 == 1] = self.INSIDE
+
+        # cells crossed by an edge: split every edge at the grid lines, the middle
+        # of each piece is in one crossed cell
+        kx0, kx1 = np.floor((np.minimum(x0, x1) - self.lo[0]) / self.d[0]), np.floor((np.maximum(x0, x1) - self.lo[0]) / self.d[0])
+        ky0, ky1 = np.floor((np.minimum(y0, y1) - self.lo[1]) / self.d[1]), np.floor((np.maximum(y0, y1) - self.lo[1]) / self.d[1])
+        nline = [(kx1 - kx0).astype(np.int64), (ky1 - ky0).astype(np.int64)]
+        t = [np.zeros(len(x0)), np.ones(len(x0))]
+        edge = [np.arange(len(x0)), np.arange(len(x0))]
+        for axis, (k0, a0, a1) in enumerate([(kx0, x0, x1), (ky0, y0, y1)]):
+            n_e = nline[axis]
+            e = np.repeat(np.arange(len(x0)), n_e)
+            k = np.repeat(k0 + 1 - np.cumsum(n_e) + n_e, n_e) + np.arange(n_e.sum())
+            line = self.lo[axis] + k * self.d[axis]
+            t.append((line - a0[e]) / (a1[e] - a0[e]))
+            edge.append(e)
+        t, edge = np.concatenate(t), np.concatenate(edge)
+        order = np.lexsort((t, edge))
+        t, edge = t[order], edge[order]
+        same = edge[1:] == edge[:-1]
+        tm, em = 0.5 * (t[1:] + t[:-1])[same], edge[1:][same]
+        i = np.floor((y0[em] + tm * (y1[em] - y0[em]) - self.lo[1]) / self.d[1]).astype(np.int64)
+        j = np.floor((x0[em] + tm * (x1[em] - x0[em]) - self.lo[0]) / self.d[0]).astype(np.int64)
+        cell[np.clip(i, 0, ny - 1), np.clip(j, 0, nx - 1)] = self.BOUNDARY
+        return cell
+
+    def contains(self, lon, lat, candidate=None):
+        """
+        Args:
+            lon, lat (array) : points [deg]
+            candidate (array) : indices of the points to test, all if None
+        Returns:
+            boolean array, the points inside the zone
+        """
+        lon = np.asarray(lon, dtype=np.float64)
+        lat = np.asarray(lat, dtype=np.float64)
+        inside = np.zeros(lon.shape, dtype=bool)
+        if candidate is None:
+            candidate = np.arange(len(lon))
+        x = (lon[candidate] - self.lon_center + 180.0) % 360.0 - 180.0 + self.lon_center
+        y = lat[candidate]
+        box = (x >= self.lo[0]) & (x <= self.hi[0]) & (y >= self.lo[1]) & (y <= self.hi[1])
+        candidate, x, y = candidate[box], x[box], y[box]
+        if len(candidate) == 0:
+            return inside
+        i = np.clip(((y - self.lo[1]) / self.d[1]).astype(np.int64), 0, self.shape[0] - 1)
+        j = np.clip(((x - self.lo[0]) / self.d[0]).astype(np.int64), 0, self.shape[1] - 1)
+        state = self.cell[i, j]
+        inside[candidate[state == self.INSIDE]] = True
+        exact = state == self.BOUNDARY
+        if np.any(exact):
+            parity = np.zeros(np.count_nonzero(exact), dtype=bool)
+            for r in self.rings:
+                parity ^= stat_footprint.points_in_ring(x[exact], y[exact], r)
+            inside[candidate[exact]] = parity
+        return inside
+
+
+class KeepoutIndex:
+    """
+    Args:
+        zones (list) : (name, rings) of load_zones
+    """
+    def __init__(self, zones, Ncell=256):
+        self.zones = [KeepoutZone(name, rings, Ncell) for name, rings in zones]
+
+    def query(self, lon, lat, Ngrid=256):
+        """
+        Args:
+            lon, lat (array) : points [deg]
+            Ngrid (int) : number of the cells of the point buckets along a side
+        Returns:
+            OrderedDict of zone name -> indices of the points inside
+        """
+        lon = (np.asarray(lon, dtype=np.float64) + 180.0) % 360.0 - 180.0
+        lat = np.asarray(lat, dtype=np.float64)
+        valid = np.flatnonzero(np.isfinite(lon) & np.isfinite(lat))
+        hits = OrderedDict()
+        if len(valid) == 0:
+            return OrderedDict((zone.name, np.zeros(0, dtype=np.int64)) for zone in self.zones)
+        # points bucketed on a uniform grid, the cells of a row are contiguous
+        lo = np.array([lon[valid].min(), lat[valid].min()])
+        d = np.maximum((np.array([lon[valid].max(), lat[valid].max()]) - lo) / Ngrid, 1e-9)
+        i = np.minimum(((lat[valid] - lo[1]) / d[1]).astype(np.int64), Ngrid - 1)
+        j = np.minimum(((lon[valid] - lo[0]) / d[0]).astype(np.int64), Ngrid - 1)
+        key = i * Ngrid + j
+        order = np.argsort(key, kind="stable")
+        points = valid[order]
+        start = np.searchsorted(key[order], np.arange(Ngrid * Ngrid + 1))
+
+        for zone in self.zones:
+            pieces = []
+            for shift in [-360.0, 0.0, 360.0]:
+                j0, i0 = np.floor((zone.lo + [shift, 0.0] - lo) / d).astype(np.int64)
+                j1, i1 = np.floor((zone.hi + [shift, 0.0] - lo) / d).astype(np.int64)
+                if j1 < 0 or i1 < 0 or j0 >= Ngrid or i0 >= Ngrid:
+                    continue
+                j0, i0, j1, i1 = max(j0, 0), max(i0, 0), min(j1, Ngrid - 1), min(i1, Ngrid - 1)
+                rows = np.arange(i0, i1 + 1) * Ngrid
+                pieces.extend(points[a:b] for a, b in zip(start[rows + j0], start[rows + j1 + 1]))
+            candidate = np.concatenate(pieces) if len(pieces) > 0 else np.zeros(0, dtype=np.int64)
+            index = np.flatnonzero(zone.contains(lon, lat, candidate))
+            hits[zone.name] = np.union1d(hits[zone.name], index) if zone.name in hits else index
+        return hits
+
+
+def exceedance(index, lon, lat, cases):
+    """
+    Returns:
+        DataFrame of zone name, number of the cases, probability and caseNo inside,
+        the last line "any" is the union of all the zones
+    """
+    lon, lat, cases = np.asarray(lon), np.asarray(lat), np.asarray(cases)
+    hits = index.query(lon, lat)
+    hits["any"] = np.unique(np.concatenate([np.zeros(0, dtype=np.int64)] + list(hits.values())))
+    N = len(lon)
+    return pd.DataFrame(OrderedDict([
+        ("name", list(hits.keys())),
+        ("count", [len(h) for h in hits.values()]),
+        ("probability", [len(h) / N if N > 0 else np.nan for h in hits.values()]),
+        ("caseNo", [" ".join(str(c) for c in np.sort(cases[h])) for h in hits.values()])]))
+
+
+if __name__ == "__main__":
+    Nproc = max(mp.cpu_count() - 1, 1)
+
+    print("IST KEEP-OUT ZONE CHECKER")
+    print("libraries load done.")
+
+    argv = sys.argv
+    if len(argv) > 2:
+        otmc_mission_name = argv[1]
+        zone_files = argv[2:]
+    else:
+        print("PLEASE INPUT mission_name and keep-out zone files as the command line arguments.")
+        exit()
+    missionpath = campaign_store.mission_path(otmc_mission_name)
+
+    index = KeepoutIndex(load_zones(zone_files))
+    print("{0:d} keep-out zones".format(len(index.zones)))
+
+    os.makedirs("output", exist_ok=True)
+    outputfiles = []
+    sources = []
+    store = campaign_store.open_store(otmc_mission_name, "store", Nproc)
+    for body in store.bodies:
+        if body.endswith("_extend") or "lat(deg)" not in store.columns(body):
+            continue
+        sources.append((body,) + stat_jettison_area.impact_points(store, body))
+
+    # datapoint_landing_time.csv of stat_datapoint.py
+    inputfile = "output/datapoint_landing_time.csv"
+    if campaign_store.fetch(missionpath + "/stat/" + inputfile, inputfile):
+        df = pd.read_csv(inputfile, usecols=["caseNo", "lon(deg)", "lat(deg)"])
+        sources.append(("landing_time", df["lon(deg)"].to_numpy(), df["lat(deg)"].to_numpy(), df["caseNo"].to_numpy()))
+
+    for name, lon, lat, cases in sources:
+        df = exceedance(index, lon, lat, cases)
+        outputfile = "output/keepout_{0:s}.csv".format(name)
+        df.to_csv(outputfile, index=False)
+        outputfiles.append(outputfile)
+        print("{0:s}: {1:d} cases, {2:d} in the keep-out zones".format(name, len(lon), int(df["count"].iloc[-1])))
+
+    for outputfile in outputfiles:
+        if missionpath.startswith("s3://"):
+            os.system("aws s3 cp " + outputfile + " " + missionpath + "/stat/output/")
+        else:
+            os.system("cp " + outputfile + " " + missionpath + "/stat/output/")
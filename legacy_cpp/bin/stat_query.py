@@ -0,0 +1,292 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# Copyright (c) 2017 Interstellar Technologies Inc. All Rights Reserved.
+# ==============================================================================
+# Declarative campaign query engine.
+#
+# query.json lists the output files and the value of every column as an
+# expression over the columns of one body of the campaign store:
+#
+# {
+#     "queries": {
+#         "apogee": {"body": "dynamics_1",
+#                    "columns": {"altitude(m)": "max([altitude(m)])",
+#                                "time(s)": "argmax([altitude(m)])",
+#                                "velocity(m/s)": "at_event(sqrt([vel_NED_X(m/s)]**2 + [vel_NED_Y(m/s)]**2), apogee)"}},
+#         "SECO": {"body": "dynamics_2", "columns": ["at_event([altitude(m)], cutoff)"]}
+#     },
+#     "sample points": {"MECO": ["time(s)", "altitude(m)"]}
+# }
+#
+# [column name] refers to a column, numpy functions (sqrt, hypot, arctan2, ...)
+# make derived columns, and the outermost call reduces every case to a value:
+#   max, min, mean, first, last   : over the rows of the case
+#   argmax, argmin                : time(s) of the maximum / minimum
+#   at_time(expr, t)              : value at time t [s] (linear interpolation)
+#   at_event(expr, event[, n])    : value at the n-th event of the event table
+# "sample points" of datapoint.json are accepted as they are (body dynamics_1).
+#
+# Every query of a body is compiled first, the columns are read once from the
+# store and each distinct expression is evaluated once over the rows of all
+# cases, so a query costs one vectorized pass instead of one csv per case.
+#
+# usage: python stat_query.py (mission_name) [query.json]
+import sys
+import os
+import re
+import ast
+import json
+import multiprocessing as mp
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+import campaign_store
+import event_table
+
+FUNCTIONS = {f: getattr(np, f) for f in ["sqrt", "abs", "hypot", "arctan2", "sin", "cos", "tan",
+                                         "arcsin", "arccos", "arctan", "deg2rad", "rad2deg",
+                                         "exp", "log", "log10", "minimum", "maximum", "where"]}
+REDUCTIONS = ["max", "min", "mean", "first", "last", "argmax", "argmin", "at_time", "at_event"]
+
+_column_ref = re.compile(r"\[([^\[\]]+)\]")
+_allowed_nodes = (ast.Expression, ast.BinOp, ast.UnaryOp, ast.Call, ast.Name, ast.Load, ast.Constant,
+                  ast.Compare, ast.operator, ast.unaryop, ast.cmpop)
+
+
+def split_args(text):
+    """ split the arguments at the top level commas """
+    args, depth, start = [], 0, 0
+    for i, c in enumerate(text):
+        if c in "([":
+            depth += 1
+        elif c in ")]":
+            depth -= 1
+        elif c == "," and depth == 0:
+            args.append(text[start:i].strip())
+            start = i + 1
+    args.append(text[start:].strip())
+    return args
+
+
+class Query:
+    """
+    one compiled query expression
+    Args:
+        text (str) : e.g. "at_event(hypot([vel_NED_X(m/s)], [vel_NED_Y(m/s)]), cutoff)"
+    """
+    def __init__(self, text):
+        self.text = text
+        m = re.match(r"^\s*(\w+)\s*\((.*)\)\s*$", text, re.S)
+        if m is None or m.group(1) not in REDUCTIONS:
+            raise ValueError("query must be one of {0:} : {1:s}".format(REDUCTIONS, text))
+        self.reduction = m.group(1)
+        args = split_args(m.group(2))
+        self.expr = args[0]
+        self.args = args[1:]
+        if self.reduction == "at_time" and len(self.args) != 1:
+            raise ValueError("at_time(expr, time) : " + text)
+        if self.reduction == "at_event" and len(self.args) not in [1, 2]:
+            raise ValueError("at_event(expr, event[, occurrence]) : " + text)
+        if self.reduction == "at_event":
+            event = self.args[0].strip("'\"")
+            if event not in event_table.EVENTS and event not in event_table.EVENT_ALIAS:
+                raise ValueError("unknown event {0:s} : {1:s}".format(event, text))
+
+        # [column] -> variable name, then check that only the numpy functions are used
+        self.columns = []
+        def replace(m):
+            if m.group(1) not in self.columns:
+                self.columns.append(m.group(1))
+            return "c{0:d}".format(self.columns.index(m.group(1)))
+        source = _column_ref.sub(replace, self.expr)
+        tree = ast.parse(source, mode="eval")
+        for node in ast.walk(tree):
+            if not isinstance(node, _allowed_nodes):
+                raise ValueError("{0:s} is not allowed in a query : {1:s}".format(type(node).__name__, text))
+            if isinstance(node, ast.Name) and node.id not in FUNCTIONS and \
+                    not re.match(r"^c\d+$", node.id):
+                raise ValueError("unknown name {0:s} : {1:s}".format(node.id, text))
+        self.code = compile(tree, "<query>", "eval")
+
+    def evaluate(self, column, Nrow):
+        """ derived column over all rows, column(name) returns the stored column """
+        namespace = dict(FUNCTIONS)
+        namespace.update({"c{0:d}".format(j): np.asarray(column(c)) for j, c in enumerate(self.columns)})
+        value = np.asarray(eval(self.code, {"__builtins__": {}}, namespace), dtype=np.float64)
+        return np.broadcast_to(value, (Nrow,))
+
+
+def _segment_arg(x, offsets, fn):
+    """ global row index of the maximum (fn=np.fmax) / minimum of every case, -1 if all nan """
+    starts = offsets[:-1]
+    lengths = np.diff(offsets)
+    extreme = fn.reduceat(x, starts)
+    hit = np.flatnonzero(x == np.repeat(extreme, lengths))
+    case = np.searchsorted(offsets, hit, side="right") - 1
+    case, first = np.unique(case, return_index=True)
+    rows = np.full(len(starts), -1, dtype=np.int64)
+    rows[case] = hit[first]
+    return rows
+
+
+def _take(x, rows):
+    value = np.full(len(rows), np.nan)
+    value[rows >= 0] = x[rows[rows >= 0]]
+    return value
+
+
+def _at_time(x, time, offsets, t):
+    """ value at time t of every case with linear interpolation, nan out of the case time range """
+    starts = offsets[:-1]
+    ends = offsets[1:] - 1
+    index = np.where(time <= t, np.arange(len(time)), -1)
+    i0 = np.maximum.reduceat(index, starts)
+    i0 = np.where(i0 >= starts, i0, -1)
+    i1 = np.minimum(i0 + 1, ends)
+    valid = i0 >= 0
+    value = np.full(len(starts), np.nan)
+    a, b = i0[valid], i1[valid]
+    t0, t1 = time[a], time[b]
+    w = np.where(t1 > t0, (t - t0) / np.where(t1 > t0, t1 - t0, 1.0), 0.0)
+    v = np.where(w == 0.0, x[a], x[a] + w * (x[b] - x[a]))
+    v[(w < 0.0) | (w > 1.0) | ((a == b) & (time[a] != t))] = np.nan
+    value[valid] = v
+    return value
+
+
+def run_queries(store, body, queries):
+    """
+    Args:
+        store (CampaignStore)
+        body (str) : e.g. "dynamics_1", "dynamics_1_dump", "dynamics_1_extend"
+        queries (list of Query)
+    Returns:
+        caseNo array and a list of the values of every query (one per case)
+    """
+    cache = {}
+    def column(name):
+        if name not in cache:
+            cache[name] = np.asarray(store.column(body, name))
+        return cache[name]
+
+    offsets = store.offsets(body)
+    starts = offsets[:-1]
+    time = column("time(s)")
+    derived = {}
+    results = []
+    for q in queries:
+        if q.expr not in derived:
+            derived[q.expr] = q.evaluate(column, len(time))
+        x = derived[q.expr]
+        if q.reduction == "max":
+            v = np.fmax.reduceat(x, starts)
+        elif q.reduction == "min":
+            v = np.fmin.reduceat(x, starts)
+        elif q.reduction == "mean":
+            finite = ~np.isnan(x)
+            v = np.add.reduceat(np.where(finite, x, 0.0), starts) / np.add.reduceat(finite, starts)
+        elif q.reduction == "first":
+            v = x[starts]
+        elif q.reduction == "last":
+            v = x[offsets[1:] - 1]
+        elif q.reduction == "argmax":
+            v = _take(time, _segment_arg(x, offsets, np.fmax))
+        elif q.reduction == "argmin":
+            v = _take(time, _segment_arg(x, offsets, np.fmin))
+        elif q.reduction == "at_time":
+            v = _at_time(x, time, offsets, float(q.args[0]))
+        else:  # at_event
+            occurrence = int(q.args[1]) if len(q.args) > 1 else 1
+            v = _take(x, store.event_rows(body, q.args[0].strip("'\""), occurrence))
+        results.append(v)
+    return store.cases(body), results
+
+
+def sample_points_to_queries(sample_points):
+    """ datapoint.json "sample points" -> query.json "queries" """
+    queries = OrderedDict()
+    for k, variables in sample_points.items():
+        if k == "landing_time":
+            fmt = "last([{0:s}])"
+        elif k == "MAX":
+            fmt = "max([{0:s}])"
+        elif k in event_table.EVENTS or k in event_table.EVENT_ALIAS:
+            fmt = "at_event([{0:s}], " + k + ")"
+        else:
+            fmt = "at_time([{0:s}], " + k + ")"
+        queries[k] = {"body": "dynamics_1", "columns": OrderedDict((v, fmt.format(v)) for v in variables)}
+    return queries
+
+
+def load_queries(stat):
+    queries = OrderedDict()
+    if "sample points" in stat:
+        queries.update(sample_points_to_queries(stat["sample points"]))
+    queries.update(stat.get("queries", {}))
+    for k, q in queries.items():
+        if isinstance(q["columns"], list):
+            q["columns"] = OrderedDict((c, c) for c in q["columns"])
+    return queries
+
+
+def evaluate(store, queries):
+    """
+    Returns:
+        OrderedDict of output name -> DataFrame (caseNo + one column per query)
+    """
+    compiled = OrderedDict((k, [Query(text) for text in q["columns"].values()]) for k, q in queries.items())
+    # one pass per body for all the queries on it
+    values = {}
+    for body in sorted(set(q.get("body", "dynamics_1") for q in queries.values())):
+        keys = [k for k, q in queries.items() if q.get("body", "dynamics_1") == body]
+        cases, results = run_queries(store, body, sum([compiled[k] for k in keys], []))
+        for k in keys:
+            n = len(compiled[k])
+            values[k] = (cases, results[:n])
+            results = results[n:]
+
+    out = OrderedDict()
+    for k, q in queries.items():
+        cases, results = values[k]
+        df = pd.DataFrame(OrderedDict([("caseNo", cases)] + list(zip(q["columns"].keys(), results))))
+        # case 0 is the nominal run, the dispersed cases are 1 ... Ntask as in stat_datapoint.py
+        out[k] = df[df["caseNo"] > 0].reset_index(drop=True)
+    return out
+
+
+if __name__ == "__main__":
+    Nproc = max(mp.cpu_count() - 1, 1)
+
+    print("IST QUERY ENGINE")
+    print("libraries load done.")
+
+    argv = sys.argv
+    if len(argv) > 1:
+        otmc_mission_name = argv[1]
+    else:
+        print("PLEASE INPUT mission_name as the command line argument.")
+        exit()
+    missionpath = campaign_store.mission_path(otmc_mission_name)
+
+    if len(argv) > 2:
+        stat_input = argv[2]
+    else:
+        stat_input = "query.json"
+        campaign_store.fetch(missionpath + "/stat/inp/query.json", stat_input)
+
+    with open(stat_input) as fp:
+        stat = json.load(fp, object_pairs_hook=OrderedDict)
+    queries = load_queries(stat)
+
+    store = campaign_store.open_store(otmc_mission_name, "store", Nproc)
+    results = evaluate(store, queries)
+
+    # write out datapoint_*.csv
+    os.makedirs("output", exist_ok=True)
+    for k, df in results.items():
+        df.to_csv("output/datapoint_" + k + ".csv", index=False)
+
+    if missionpath.startswith("s3://"):
+        os.system("aws s3 cp output " + missionpath + "/stat/output/ --exclude '*' --include 'datapoint_*.csv' --recursive")
+    else:
+        os.system("cp output/datapoint_*.csv " + missionpath + "/stat/output/")
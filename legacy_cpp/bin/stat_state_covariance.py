@@ -0,0 +1,146 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# Copyright (c) 2017 Interstellar Technologies Inc. All Rights Reserved.
+# ==============================================================================
+# Mean vector and covariance matrix of the state vector at every time step.
+#
+# stat_covariance.py reports only the high/low percentiles of each variable.
+# This script streams the cases of the campaign store through single pass
+# (Welford / Chan) accumulators and writes the full covariance of the selected
+# state variables at each grid time to output/state_covariance_<body>.npz:
+#
+#   time (T,), variables (k,), count (T,), mean (T, k), covariance (T, k, k)
+#
+# state_covariance.json (all keys optional):
+# {
+#     "body": "dynamics_1",
+#     "variables": ["pos_ECI_X(m)", "pos_ECI_Y(m)", "pos_ECI_Z(m)",
+#                   "vel_ECI_X(m/s)", "vel_ECI_Y(m/s)", "vel_ECI_Z(m/s)"],
+#     "time grid[s]": [0, 1000, 1]
+# }
+#
+# usage: python stat_state_covariance.py (mission_name) [state_covariance.json]
+import sys
+import os
+import json
+import multiprocessing as mp
+import numpy as np
+import campaign_store
+
+default_variables = ["pos_ECI_X(m)", "pos_ECI_Y(m)", "pos_ECI_Z(m)",
+                     "vel_ECI_X(m/s)", "vel_ECI_Y(m/s)", "vel_ECI_Z(m/s)"]
+
+
+class StateCovariance:
+    """
+    single pass accumulator of the mean and covariance at every time step
+    Args:
+        time (array) : time grid (T,)
+        variables (list) : names of the k state variables
+    """
+    def __init__(self, time, variables):
+        self.time = np.asarray(time, dtype=np.float64)
+        self.variables = list(variables)
+        T, k = len(self.time), len(self.variables)
+        self.count = np.zeros(T)
+        self.mean = np.zeros((T, k))
+        self.M2 = np.zeros((T, k, k))
+
+    def update(self, X):
+        """
+        Args:
+            X (array) : (T, k) of one case or (B, T, k) of a batch of cases on the time grid,
+                        rows with nan (out of the flight time) are skipped
+        """
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 2:
+            X = X[None]
+        valid = np.all(np.isfinite(X), axis=2)
+        n_b = valid.sum(axis=0).astype(np.float64)
+        X0 = np.where(valid[:, :, None], X, 0.0)
+        mean_b = X0.sum(axis=0) / np.maximum(n_b, 1.0)[:, None]
+        D = np.where(valid[:, :, None], X - mean_b[None], 0.0)
+        M2_b = np.einsum("btk,btl->tkl", D, D)
+        self._combine(n_b, mean_b, M2_b)
+
+    def merge(self, other):
+        """ add the cases of another accumulator on the same grid (e.g. of another worker) """
+        self._combine(other.count, other.mean, other.M2)
+
+    def _combine(self, n_b, mean_b, M2_b):
+        # Chan et al. pairwise update
+        n = self.count + n_b
+        delta = mean_b - self.mean
+        ratio = np.where(n > 0, n_b / np.maximum(n, 1.0), 0.0)
+        self.mean = self.mean + delta * ratio[:, None]
+        self.M2 = self.M2 + M2_b + np.einsum("tk,tl->tkl", delta, delta) * (self.count * ratio)[:, None, None]
+        self.count = n
+
+    def covariance(self, ddof=1):
+        """ (T, k, k), nan where less than ddof + 1 cases """
+        dof = self.count - ddof
+        return np.where((dof > 0)[:, None, None], self.M2 / np.maximum(dof, 1.0)[:, None, None], np.nan)
+
+    def save(self, filename):
+        mean = np.where((self.count > 0)[:, None], self.mean, np.nan)
+        np.savez_compressed(filename, time=self.time, variables=np.array(self.variables),
+                            count=self.count, mean=mean, covariance=self.covariance())
+
+
+def accumulate(store, body, variables, time_grid, batch=64):
+    """ stream the dispersed cases (caseNo > 0) of the store into a StateCovariance """
+    acc = StateCovariance(time_grid, variables)
+    cases = store.cases(body)
+    for start in range(0, len(cases), batch):
+        X = store.resample(body, variables, time_grid, start, start + batch)
+        X = X[cases[start:start + batch] > 0]
+        acc.update(X)
+    return acc
+
+
+if __name__ == "__main__":
+    Nproc = max(mp.cpu_count() - 1, 1)
+
+    print("IST STATE COVARIANCE MAKER")
+    print("libraries load done.")
+
+    argv = sys.argv
+    if len(argv) > 1:
+        otmc_mission_name = argv[1]
+    else:
+        print("PLEASE INPUT mission_name as the command line argument.")
+        exit()
+    missionpath = campaign_store.mission_path(otmc_mission_name)
+
+    if len(argv) > 2:
+        stat_input = argv[2]
+    else:
+        stat_input = "state_covariance.json"
+        campaign_store.fetch(missionpath + "/stat/inp/state_covariance.json", stat_input)
+    stat = {}
+    if os.path.exists(stat_input):
+        with open(stat_input) as fp:
+            stat = json.load(fp)
+
+    store = campaign_store.open_store(otmc_mission_name, "store", Nproc)
+    body = stat.get("body", "dynamics_1")
+    variables = stat.get("variables", default_variables)
+    if "time grid[s]" in stat:
+        t0, t1, dt = stat["time grid[s]"]
+    else:
+        time = store.column(body, "time(s)")
+        t0, t1, dt = np.nanmin(time), np.nanmax(time), 1.0
+    time_grid = np.arange(t0, t1 + 0.5 * dt, dt)
+
+    acc = accumulate(store, body, variables, time_grid)
+
+    os.makedirs("output", exist_ok=True)
+    outputfile = "output/state_covariance_{0:s}.npz".format(body)
+    acc.save(outputfile)
+    print("{0:d} time steps x {1:d} variables, max cases per step: {2:d}".format(
+        len(time_grid), len(variables), int(acc.count.max())))
+
+    if missionpath.startswith("s3://"):
+        os.system("aws s3 cp " + outputfile + " " + missionpath + "/stat/output/")
+    else:
+        os.system("cp " + outputfile + " " + missionpath + "/stat/output/")
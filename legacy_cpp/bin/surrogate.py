@@ -0,0 +1,361 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# Copyright (c) 2017 Interstellar Technologies Inc. All Rights Reserved.
+# ==============================================================================
+# Surrogate model of the campaign outputs.
+#
+# The dispersion manifest (dispersion.py) of the cases is the input and the
+# event table values (impact lat/lon, apogee altitude, MECO time, ...) of the
+# campaign store are the outputs. The inputs are standardized, the file
+# choices one-hot encoded, and one of
+#   polynomial       : ridge regression on the monomials up to "degree"
+#   gaussian process : squared exponential kernel, the length scale and the
+#                      noise chosen by the leave-one-out error
+# is fitted to all the outputs together. Both have the leave-one-out residuals
+# in closed form (hat matrix / inverse kernel), which give the fit quality
+# without refitting. Longitudes are unwrapped around their circular mean.
+#
+# surrogate.json (optional):
+# {
+#     "model": "polynomial",                  (or "gaussian process")
+#     "degree": 2,
+#     "targets": [{"body": "dynamics_1", "event": "impact", "column": "lat(deg)"}, ...],
+#     "samples": 1000000,                     (new dispersion sets from gosa.json, or a csv
+#                                              file with the columns of the manifest)
+#     "seed": 0
+# }
+#
+# output/surrogate_diagnostics.csv, output/surrogate_model.npz and, with
+# "samples", output/surrogate_prediction.csv and
+# output/surrogate_prediction_summary.csv are written.
+#
+# usage: python surrogate.py (mission_name) [surrogate.json]
+import sys
+import os
+import json
+import itertools
+import multiprocessing as mp
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+import campaign_store
+import dispersion
+
+default_targets = [{"body": "dynamics_1", "event": "impact", "column": "lat(deg)"},
+                   {"body": "dynamics_1", "event": "impact", "column": "lon(deg)"},
+                   {"body": "dynamics_1", "event": "apogee", "column": "altitude(m)"},
+                   {"body": "dynamics_1", "event": "MECO", "column": "time(s)"}]
+percentiles = [0.1, 1.0, 5.0, 50.0, 95.0, 99.0, 99.9]
+
+
+def encode(df, categories=None):
+    """
+    Args:
+        df (DataFrame) : manifest columns, the file choices ("#") are one-hot encoded
+        categories (dict) : column -> codes of the training data
+    Returns:
+        (n, d) array, names of the features, categories
+    """
+    if categories is None:
+        categories = {c: np.unique(df[c].to_numpy()) for c in df.columns if c.endswith("#")}
+    blocks, names = [], []
+    for c in df.columns:
+        v = df[c].to_numpy(dtype=np.float64)
+        if c in categories:
+            for code in categories[c][1:]:
+                blocks.append((v == code).astype(np.float64))
+                names.append("{0:s}={1:g}".format(c, code))
+        else:
+            blocks.append(v)
+            names.append(c)
+    return np.stack(blocks, axis=1), names, categories
+
+
+def _standardize(X):
+    mean = X.mean(axis=0)
+    scale = X.std(axis=0)
+    return mean, np.where(scale > 0.0, scale, 1.0)
+
+
+class PolynomialSurrogate:
+    """
+    Args:
+        degree (int) : max degree of the monomials, lowered until the terms are not more than the cases
+        ridge (float) : ridge parameter on the standardized monomials, chosen by the leave-one-out error if None
+    """
+    name = "polynomial"
+
+    def __init__(self, degree=2, ridge=None):
+        self.degree = degree
+        self.ridge = ridge
+
+    def _features(self, Z):
+        P = np.ones((len(Z), len(self.terms)))
+        for j, term in enumerate(self.terms):
+            for i in term:
+                P[:, j] *= Z[:, i]
+        return P
+
+    def fit(self, X, Y):
+        N, d = X.shape
+        self.mean, self.scale = _standardize(X)
+        Z = (X - self.mean) / self.scale
+        for degree in range(self.degree, -1, -1):
+            self.terms = [t for k in range(degree + 1) for t in itertools.combinations_with_replacement(range(d), k)]
+            if len(self.terms) <= N:
+                break
+        self.degree = degree
+        P = self._features(Z)
+        U, s, Vt = np.linalg.svd(P, full_matrices=False)
+        UY = U.T @ Y
+        y_scale = np.where(Y.std(axis=0) > 0.0, Y.std(axis=0), 1.0)
+        best = None
+        for ridge in (np.logspace(-8.0, 2.0, 21) if self.ridge is None else [self.ridge]):
+            shrink = s * s / (s * s + ridge * N)
+            coef = Vt.T @ ((shrink / np.where(s > 0.0, s, 1.0))[:, None] * UY)
+            hat = np.sum(U * U * shrink, axis=1)
+            loo = (Y - P @ coef) / np.maximum(1.0 - hat, 1e-12)[:, None]
+            score = np.mean((loo / y_scale) ** 2)
+            if best is None or score < best[0]:
+                best = (score, ridge, coef, loo)
+        score, self.ridge, self.coef, self.loo_residual = best
+        return self
+
+    def predict(self, X, chunk=200000):
+        out = np.empty((len(X), self.coef.shape[1]))
+        for k in range(0, len(X), chunk):
+            out[k:k + chunk] = self._features((X[k:k + chunk] - self.mean) / self.scale) @ self.coef
+        return out
+
+    def state(self):
+        terms = np.full((len(self.terms), max(self.degree, 1)), -1, dtype=np.int64)
+        for j, term in enumerate(self.terms):
+            terms[j, :len(term)] = term
+        return {"degree": self.degree, "ridge": self.ridge, "mean": self.mean, "scale": self.scale,
+                "terms": terms, "coef": self.coef}
+
+    def load_state(self, state):
+        self.degree, self.ridge = int(state["degree"]), float(state["ridge"])
+        self.mean, self.scale, self.coef = state["mean"], state["scale"], state["coef"]
+        self.terms = [tuple(int(i) for i in t if i >= 0) for t in state["terms"]]
+        return self
+
+
+class GaussianProcessSurrogate:
+    """
+    Args:
+        length_scales (list) : candidates of the length scale [standard deviation of the inputs]
+        noises (list) : candidates of the noise variance [variance of the outputs]
+    """
+    name = "gaussian process"
+
+    def __init__(self, length_scales=None, noises=None):
+        self.length_scales = length_scales
+        self.noises = noises if noises is not None else [1e-8, 1e-6, 1e-4, 1e-2, 1e-1]
+
+    def fit(self, X, Y):
+        N, d = X.shape
+        self.mean, self.scale = _standardize(X)
+        self.y_mean, self.y_scale = _standardize(Y)
+        self.Z = (X - self.mean) / self.scale
+        W = (Y - self.y_mean) / self.y_scale
+        sq = np.sum(self.Z ** 2, axis=1)
+        D2 = np.maximum(sq[:, None] + sq[None, :] - 2.0 * self.Z @ self.Z.T, 0.0)
+        lengths = self.length_scales if self.length_scales is not None else np.sqrt(d) * np.logspace(-1.0, 1.0, 9)
+        best = None
+        for length in lengths:
+            K0 = np.exp(-0.5 * D2 / length ** 2)
+            for noise in self.noises:
+                try:
+                    L = np.linalg.cholesky(K0 + noise * np.eye(N))
+                except np.linalg.LinAlgError:
+                    continue
+                L_inv = np.linalg.solve(L, np.eye(N))
+                K_inv = L_inv.T @ L_inv
+                alpha = K_inv @ W
+                loo = alpha / np.diag(K_inv)[:, None]
+                score = np.mean(loo ** 2)
+                if best is None or score < best[0]:
+                    best = (score, length, noise, alpha, loo)
+        score, self.length, self.noise, self.alpha, loo = best
+        self.loo_residual = loo * self.y_scale
+        return self
+
+    def predict(self, X, chunk=10000):
+        out = np.empty((len(X), self.alpha.shape[1]))
+        sq = np.sum(self.Z ** 2, axis=1)
+        for k in range(0, len(X), chunk):
+            z = (X[k:k + chunk] - self.mean) / self.scale
+            d2 = np.maximum(np.sum(z ** 2, axis=1)[:, None] + sq[None, :] - 2.0 * z @ self.Z.T, 0.0)
+            out[k:k + chunk] = np.exp(-0.5 * d2 / self.length ** 2) @ self.alpha
+        return out * self.y_scale + self.y_mean
+
+    def state(self):
+        return {"length": self.length, "noise": self.noise, "mean": self.mean, "scale": self.scale,
+                "y_mean": self.y_mean, "y_scale": self.y_scale, "Z": self.Z, "alpha": self.alpha}
+
+    def load_state(self, state):
+        for k in ["mean", "scale", "y_mean", "y_scale", "Z", "alpha"]:
+            setattr(self, k, state[k])
+        self.length, self.noise = float(state["length"]), float(state["noise"])
+        return self
+
+
+models = {PolynomialSurrogate.name: PolynomialSurrogate, GaussianProcessSurrogate.name: GaussianProcessSurrogate}
+
+
+class Surrogate:
+    """
+    Batched prediction of the targets from dispersion sets
+    Args:
+        model : PolynomialSurrogate or GaussianProcessSurrogate
+    """
+    def __init__(self, model):
+        self.model = model
+
+    def fit(self, manifest, targets):
+        """
+        Args:
+            manifest (DataFrame) : dispersion manifest, index caseNo
+            targets (DataFrame) : target values, index caseNo (nan cases are dropped)
+        """
+        df = manifest.join(targets, how="inner").dropna()
+        self.inputs = list(manifest.columns)
+        self.targets = list(targets.columns)
+        self.cases = df.index.to_numpy()
+        X, self.features, self.categories = encode(df[self.inputs])
+        Y = df[self.targets].to_numpy(dtype=np.float64, copy=True)
+        # longitudes are unwrapped around their circular mean
+        self.lon_center = np.full(len(self.targets), np.nan)
+        for j, name in enumerate(self.targets):
+            if "lon" in name:
+                rad = np.deg2rad(Y[:, j])
+                self.lon_center[j] = np.rad2deg(np.arctan2(np.mean(np.sin(rad)), np.mean(np.cos(rad))))
+                Y[:, j] = (Y[:, j] - self.lon_center[j] + 180.0) % 360.0 - 180.0 + self.lon_center[j]
+        self.Y = Y
+        self.model.fit(X, Y)
+        return self
+
+    def predict(self, samples):
+        """
+        Args:
+            samples (DataFrame) : dispersion sets with the columns of the manifest
+        Returns:
+            DataFrame of the predicted targets
+        """
+        X, names, categories = encode(samples[self.inputs], self.categories)
+        Y = self.model.predict(X)
+        lon = np.isfinite(self.lon_center)
+        Y[:, lon] = (Y[:, lon] + 180.0) % 360.0 - 180.0
+        return pd.DataFrame(Y, columns=self.targets, index=samples.index)
+
+    def diagnostics(self):
+        """ fit quality of every target by the leave-one-out residuals """
+        loo = self.model.loo_residual
+        rows = []
+        for j, name in enumerate(self.targets):
+            y = self.Y[:, j]
+            variance = np.var(y)
+            rows.append(OrderedDict([
+                ("target", name), ("cases", len(y)), ("std", np.sqrt(variance)),
+                ("LOO RMSE", np.sqrt(np.mean(loo[:, j] ** 2))),
+                ("LOO max error", np.max(np.abs(loo[:, j]))),
+                ("LOO R2", 1.0 - np.mean(loo[:, j] ** 2) / variance if variance > 0 else np.nan)]))
+        return pd.DataFrame(rows)
+
+    def save(self, filename):
+        state = {"model_" + k: v for k, v in self.model.state().items()}
+        np.savez(filename, model=self.model.name, inputs=np.array(self.inputs), targets=np.array(self.targets),
+                 lon_center=self.lon_center, categories=json.dumps({k: list(v) for k, v in self.categories.items()}),
+                 **state)
+
+
+def load_surrogate(filename):
+    data = np.load(filename, allow_pickle=False)
+    model = models[str(data["model"])]()
+    model.load_state({k[len("model_"):]: data[k] for k in data.files if k.startswith("model_")})
+    surrogate = Surrogate(model)
+    surrogate.inputs, surrogate.targets = list(data["inputs"]), list(data["targets"])
+    surrogate.lon_center = data["lon_center"]
+    surrogate.categories = {k: np.array(v) for k, v in json.loads(str(data["categories"])).items()}
+    return surrogate
+
+
+def event_targets(store, targets):
+    """ DataFrame of the target values of every case (index caseNo), nan if the case has no such event """
+    columns = OrderedDict()
+    index = None
+    for t in targets:
+        body, event, column = t["body"], t["event"], t["column"]
+        occurrence = t.get("occurrence", 1)
+        cases = store.cases(body)
+        rows = store.event_rows(body, event, occurrence)
+        values = np.asarray(store.column(body, column))[np.maximum(rows, 0)]
+        s = pd.Series(np.where(rows >= 0, values, np.nan), index=cases)
+        columns["{0:s}/{1:s}/{2:s}".format(body, event, column)] = s
+    return pd.DataFrame(columns).rename_axis("caseNo")
+
+
+if __name__ == "__main__":
+    Nproc = max(mp.cpu_count() - 1, 1)
+
+    print("IST SURROGATE MODEL MAKER")
+    print("libraries load done.")
+
+    argv = sys.argv
+    if len(argv) > 1:
+        otmc_mission_name = argv[1]
+    else:
+        print("PLEASE INPUT mission_name as the command line argument.")
+        exit()
+    missionpath = campaign_store.mission_path(otmc_mission_name)
+
+    if len(argv) > 2:
+        stat_input = argv[2]
+    else:
+        stat_input = "surrogate.json"
+        campaign_store.fetch(missionpath + "/stat/inp/surrogate.json", stat_input)
+    stat = {}
+    if os.path.exists(stat_input):
+        with open(stat_input) as fp:
+            stat = json.load(fp)
+
+    mc, gosa, nominal = dispersion.load_mission_inputs(missionpath)
+    manifest = dispersion.dispersion_manifest(gosa, dispersion.load_case_settings(missionpath, mc["suffix"]))
+    store = campaign_store.open_store(otmc_mission_name, "store", Nproc)
+    targets = event_targets(store, stat.get("targets", default_targets))
+
+    model_name = stat.get("model", "polynomial")
+    if model_name == "polynomial":
+        model = PolynomialSurrogate(stat.get("degree", 2))
+    else:
+        model = GaussianProcessSurrogate()
+    surrogate = Surrogate(model).fit(manifest, targets)
+    print("{0:s} surrogate: {1:d} cases, {2:d} features".format(model_name, len(surrogate.cases),
+                                                                len(surrogate.features)))
+
+    os.makedirs("output", exist_ok=True)
+    outputfiles = ["output/surrogate_diagnostics.csv", "output/surrogate_model.npz"]
+    df = surrogate.diagnostics()
+    df.to_csv(outputfiles[0], index=False)
+    print(df.to_string(index=False))
+    surrogate.save(outputfiles[1])
+
+    if "samples" in stat:
+        if isinstance(stat["samples"], str):
+            campaign_store.fetch(missionpath + "/stat/inp/" + stat["samples"], stat["samples"])
+            samples = pd.read_csv(stat["samples"], index_col=False)
+        else:
+            samples = dispersion.sample_dispersions(gosa, nominal, int(stat["samples"]), stat.get("seed"))
+        prediction = surrogate.predict(samples)
+        prediction.to_csv("output/surrogate_prediction.csv", index=False)
+        summary = prediction.describe(percentiles=[p * 1e-2 for p in percentiles]).T
+        summary.to_csv("output/surrogate_prediction_summary.csv", index_label="target")
+        outputfiles += ["output/surrogate_prediction.csv", "output/surrogate_prediction_summary.csv"]
+        print("{0:d} samples predicted".format(len(prediction)))
+
+    for outputfile in outputfiles:
+        if missionpath.startswith("s3://"):
+            os.system("aws s3 cp " + outputfile + " " + missionpath + "/stat/output/")
+        else:
+            os.system("cp " + outputfile + " " + missionpath + "/stat/output/")
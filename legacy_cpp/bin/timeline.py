@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2017 Interstellar Technologies Inc. All Rights Reserved.
+# ==============================================================================
+# Stitched timeline of one flight.
+#
+# OpenTsiolkovsky writes one csv per stage (output/<name>_dynamics_<k>.csv) and
+# one per dumping product (output/<name>_dynamics_<k>_dump.csv). The timeline
+# loads all of them into one float array of the rows of all bodies
+# concatenated in body order (stage 1, its dumping product, stage 2, ...), with
+# the body tag of each row, so the row-wise post processing
+# (make_extend_output.py) runs over the whole flight in one vectorized pass and
+# its results are split back per body with the offsets.
+#
+# Columns missing in some files are filled with NaN; the csv layout of the
+# stages and of the dumping products is the same.
+#
+# usage: python timeline.py (input_json_file)
+import sys
+import os
+import json
+import numpy as np
+import pandas as pd
+
+
+def stage_count(data):
+    """ number of the stages flown in the input json (following stage exist?(bool) chain) """
+    count = 1
+    while "stage" + str(count + 1) in data and data["stage" + str(count)]["stage"]["following stage exist?(bool)"]:
+        count += 1
+    return count
+
+
+def timeline_files(rocket_name, stages, directory="output"):
+    """
+    Args:
+        rocket_name (str) : name(str) of the input json
+        stages (int) : number of the stages
+        directory (str) : output directory of OpenTsiolkovsky
+    Returns:
+        list of (body, csv file) in body order, dumping products only if the file exists
+    """
+    files = []
+    for k in range(1, stages + 1):
+        body = "dynamics_" + str(k)
+        files.append((body, os.path.join(directory, rocket_name + "_" + body + ".csv")))
+        dump = os.path.join(directory, rocket_name + "_" + body + "_dump.csv")
+        if os.path.exists(dump):
+            files.append((body + "_dump", dump))
+    return files
+
+
+class Timeline:
+    """
+    Rows of all bodies of a flight.
+
+    Attributes:
+        bodies (list) : body names ("dynamics_1", "dynamics_1_dump", ...)
+        frames (list) : DataFrame of each body as read from its csv
+        columns (list) : union of the columns, in the order of the first file
+        values (array) : (N, Ncolumn) float64 rows of all bodies, NaN where a body lacks a column
+        body (array) : (N,) index of the body of each row
+        offsets (array) : first row of each body (len = Nbody + 1)
+    """
+    def __init__(self, bodies, frames):
+        self.bodies = list(bodies)
+        self.frames = list(frames)
+        self.columns = []
+        for df in self.frames:
+            self.columns.extend(c for c in df.columns if c not in self.columns)
+        self.offsets = np.cumsum([0] + [len(df) for df in self.frames])
+        self.values = np.full((self.offsets[-1], len(self.columns)), np.nan)
+        index = {c: j for j, c in enumerate(self.columns)}
+        for df, start, stop in zip(self.frames, self.offsets[:-1], self.offsets[1:]):
+            numeric = df.apply(pd.to_numeric, errors="coerce").to_numpy(dtype=np.float64)
+            self.values[start:stop, [index[c] for c in df.columns]] = numeric
+        self.body = np.repeat(np.arange(len(self.bodies)), np.diff(self.offsets))
+
+    def __len__(self):
+        return len(self.body)
+
+    def column(self, name):
+        """ (N,) values of a column over all bodies """
+        return self.values[:, self.columns.index(name)]
+
+    def split(self, array):
+        """ list of the slices of a (N, ...) array per body """
+        return [array[start:stop] for start, stop in zip(self.offsets[:-1], self.offsets[1:])]
+
+    def time_order(self):
+        """ row indices sorting the timeline by time(s), stages before dumping products at equal times """
+        return np.lexsort((self.body, self.column("time(s)")))
+
+
+def load_timeline(rocket_name, stages, directory="output"):
+    """ Timeline of the stage and dumping product csv files (timeline_files) """
+    bodies, frames = [], []
+    for body, filename in timeline_files(rocket_name, stages, directory):
+        bodies.append(body)
+        frames.append(pd.read_csv(filename, index_col=False))
+    return Timeline(bodies, frames)
+
+
+if __name__ == "__main__":
+    argv = sys.argv
+    if len(argv) > 1:
+        file_name = argv[1]
+    else:
+        file_name = "param_sample_01.json"
+    with open(file_name) as fp:
+        data = json.load(fp)
+
+    timeline = load_timeline(data["name(str)"], stage_count(data))
+    time = timeline.column("time(s)")
+    for k, body in enumerate(timeline.bodies):
+        rows = timeline.body == k
+        print("{0:s}\t{1:d} rows\t{2:.1f} - {3:.1f} [s]".format(body, int(rows.sum()), time[rows].min(), time[rows].max()))
@@ -0,0 +1,272 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# Copyright (c) 2017 Interstellar Technologies Inc. All Rights Reserved.
+# ==============================================================================
+# Trajectory with lazily computed, cached derived columns.
+#
+# make_extend_output.py and make_rfprop.py compute every derived column of a
+# dynamics csv whether a report uses it or not. Trajectory reads the csv on
+# first access and computes a derived column only when it is asked for:
+#   traj = Trajectory("output/rocket_dynamics_1.csv", antenna_LLH=[...], cutoff_time=2.0)
+#   traj["IIP radius(m)"]          # computes the IIP radius group only
+# The derived columns are registered in groups (register) that are computed
+# together, e.g. distance, azimuth and elevation of the antenna share one
+# geodesic call. A group is cached in <cache directory>/<csv name>_<key>.npz,
+# the key is the hash of the csv file, the group, its version and the
+# parameters it uses (and of the files it reads, the gain tables), so a
+# repeated report run loads the groups it needs and computes nothing else.
+# Raise the version of a group (register) when its function changes, so that
+# the columns cached by the former code are not loaded. Delete the cache
+# directory (default .derived next to the csv) to drop the cache.
+#
+# parameters:
+#   antenna_LLH : antenna lat, lon, alt [deg, deg, m] (antenna columns of make_extend_output.py)
+#   cutoff_time : engine cut-off time for the IIP radius [s]
+#   stations    : names and LLH (S, 3) of the ground stations (ground_station.py)
+#   rf          : one RF setting of the make_rfprop.py json (received power)
+#
+# settings json of the command line:
+# {
+#     "antenna LLH[deg,deg,m]": [42.5039248, 143.44954216, 25.0],
+#     "IIP cut-off time[s]": 2.0,
+#     "stations": [{"name": "Taiki", "LLH[deg,deg,m]": [42.5039248, 143.44954216, 25.0]}],
+#     "rf": {"name(str)": "S-band", "antenna_lat(deg)": 42.5, ...}
+# }
+# output/<trajectory>_derived.csv (time and the requested columns) is written.
+#
+# usage: python trajectory.py (dynamics csv file) (settings json) (column name) [column name ...]
+import sys
+import os
+import json
+import hashlib
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from coordinate_transform import antenna_param, radius_IIP
+from ground_station import quantities, parse_stations, station_geometry, station_columns
+from iip import kepler_IIP
+from rf_link import DATA_2D, tautr, recv_power
+
+registry = OrderedDict()  # group -> (function, columns, parameters, files, version)
+
+
+def register(group, columns, params=(), files=None, version=1):
+    """
+    decorator registering a group of derived columns
+    Args:
+        group (str) : name of the group
+        columns (list or function) : names of the columns, or function(params) -> names
+        params (tuple) : names of the parameters of Trajectory the group uses
+        files (function) : function(params) -> files whose content is part of the cache key
+        version (int) : version of the function, part of the cache key
+    The function is called as function(trajectory, **params) and returns an
+    OrderedDict of the columns, arrays (N,).
+    """
+    def wrap(function):
+        registry[group] = (function, columns, tuple(params), files, version)
+        return function
+    return wrap
+
+
+def file_hash(filename):
+    h = hashlib.sha1()
+    with open(filename, "rb") as fp:
+        for chunk in iter(lambda: fp.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _jsonable(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, (tuple, list)):
+        return [_jsonable(v) for v in value]
+    if isinstance(value, dict):
+        return {str(k): _jsonable(v) for k, v in value.items()}
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+class Trajectory:
+    """
+    Columns of a dynamics csv, and the registered derived columns computed on first access.
+
+    Attributes:
+        filename (str) : dynamics csv
+        params (dict) : parameters of the derived columns (see the header)
+        cache_dir (str) : directory of the cached groups, None for no disk cache
+        computed (list) : groups computed by this object
+        loaded (list) : groups loaded from the cache by this object
+    """
+    def __init__(self, filename, cache_dir="", **params):
+        self.filename = filename
+        self.params = {k: v for k, v in params.items() if v is not None}
+        if cache_dir == "":
+            cache_dir = os.path.join(os.path.dirname(filename) or ".", ".derived")
+        self.cache_dir = cache_dir
+        self.computed = []
+        self.loaded = []
+        self._frame = None
+        self._hash = None
+        self._derived = {}
+
+    @property
+    def frame(self):
+        if self._frame is None:
+            self._frame = pd.read_csv(self.filename, index_col=False)
+        return self._frame
+
+    def source_hash(self):
+        if self._hash is None:
+            self._hash = file_hash(self.filename)
+        return self._hash
+
+    def _columns_of(self, group):
+        function, columns, params, files, version = registry[group]
+        if any(p not in self.params for p in params):
+            return []
+        return list(columns(self.params) if callable(columns) else columns)
+
+    def derived_columns(self):
+        """ names of the derived columns available with the parameters """
+        return [name for group in registry for name in self._columns_of(group)]
+
+    def __contains__(self, name):
+        return name in self.frame.columns or name in self.derived_columns()
+
+    def __getitem__(self, name):
+        if name in self._derived:
+            return self._derived[name]
+        if name in self.frame.columns:
+            return self.frame[name].to_numpy(dtype=np.float64)
+        for group in registry:
+            if name in self._columns_of(group):
+                self._derived.update(self.group(group))
+                return self._derived[name]
+        raise KeyError(name + " is neither a column of " + self.filename +
+                       " nor a derived column with the parameters " + ", ".join(sorted(self.params)))
+
+    def cache_key(self, group):
+        function, columns, params, files, version = registry[group]
+        used = {p: _jsonable(self.params[p]) for p in params}
+        contents = [file_hash(f) for f in files(self.params)] if files is not None else []
+        text = json.dumps([self.source_hash(), group, version, used, contents], sort_keys=True)
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    def group(self, group):
+        """ OrderedDict of the columns of a group, from the cache or computed """
+        function, columns, params, files, version = registry[group]
+        path = None
+        if self.cache_dir is not None:
+            stem = os.path.splitext(os.path.basename(self.filename))[0]
+            path = os.path.join(self.cache_dir, stem + "_" + self.cache_key(group)[:16] + ".npz")
+            if os.path.exists(path):
+                with np.load(path) as cached:
+                    self.loaded.append(group)
+                    return OrderedDict(zip(cached["names"].tolist(), cached["values"]))
+        result = function(self, **{p: self.params[p] for p in params})
+        self.computed.append(group)
+        if path is not None:
+            # 並列に走るレポートと書き込みが重ならないよう一時ファイルから置き換え
+            os.makedirs(self.cache_dir, exist_ok=True)
+            temporary = path + "." + str(os.getpid()) + ".tmp"
+            with open(temporary, "wb") as fp:
+                np.savez(fp, names=np.array(list(result.keys())),
+                         values=np.stack([np.asarray(v, dtype=np.float64) for v in result.values()]))
+            os.replace(temporary, path)
+        return result
+
+    def table(self, names):
+        """ DataFrame of time(s) and the columns """
+        return pd.DataFrame(OrderedDict([("time(s)", self["time(s)"])] + [(name, self[name]) for name in names]))
+
+
+@register("antenna", ["distance 2d(m)", "distance 3d(m)", "antenna lat(deg)", "antenna lon(deg)",
+                      "antenna azimuth(deg)", "antenna elevation(deg)", "antenna body difference(deg)"],
+          ["antenna_LLH"])
+def antenna(trajectory, antenna_LLH):
+    antenna_LLH = np.asarray(antenna_LLH, dtype=np.float64)
+    rocket_LLH = np.stack([trajectory["lat(deg)"], trajectory["lon(deg)"], trajectory["altitude(m)"]], axis=1)
+    dis2_a, dis3_a, az_a, el_a = antenna_param(antenna_LLH, rocket_LLH)
+    return OrderedDict([("distance 2d(m)", dis2_a),
+                        ("distance 3d(m)", dis3_a),
+                        ("antenna lat(deg)", np.full(len(dis2_a), antenna_LLH[0])),
+                        ("antenna lon(deg)", np.full(len(dis2_a), antenna_LLH[1])),
+                        ("antenna azimuth(deg)", az_a),
+                        ("antenna elevation(deg)", el_a),
+                        ("antenna body difference(deg)", trajectory["attitude_elevation(deg)"] - el_a)])
+
+
+def _ECI(trajectory, kind):
+    return np.stack([trajectory[kind + "_ECI_" + axis + ("(m)" if kind == "pos" else "(m/s)")]
+                     for axis in "XYZ"], axis=1)
+
+
+@register("IIP radius", ["IIP radius(m)"], ["cutoff_time"])
+def IIP_radius(trajectory, cutoff_time):
+    vel_NED = np.stack([trajectory["vel_NED_" + axis + "(m/s)"] for axis in "XYZ"], axis=1)
+    return OrderedDict([("IIP radius(m)", radius_IIP(trajectory["time(s)"], _ECI(trajectory, "pos"), vel_NED,
+                                                     cutoff_time, trajectory["thrust(N)"], trajectory["mass(kg)"]))])
+
+
+@register("kepler IIP", ["IIP kepler lat(deg)", "IIP kepler lon(deg)", "IIP kepler impact time(s)"])
+def IIP_kepler(trajectory):
+    llh, t_impact = kepler_IIP(trajectory["time(s)"], _ECI(trajectory, "pos"), _ECI(trajectory, "vel"))
+    return OrderedDict([("IIP kepler lat(deg)", llh[:, 0]),
+                        ("IIP kepler lon(deg)", llh[:, 1]),
+                        ("IIP kepler impact time(s)", t_impact)])
+
+
+@register("stations", lambda params: [name + " " + q for name in params["stations"][0] for q in quantities],
+          ["stations"])
+def stations(trajectory, stations):
+    names, stations_LLH = stations
+    rocket_LLH = np.stack([trajectory["lat(deg)"], trajectory["lon(deg)"], trajectory["altitude(m)"]], axis=1)
+    return station_columns(names, station_geometry(stations_LLH, rocket_LLH, trajectory["attitude_elevation(deg)"]))
+
+
+@register("received power", ["vehicle tau_t(deg)", "vehicle tau_r(deg)", "ground tau_t(deg)", "received power(dB)"],
+          ["rf"], files=lambda params: [params["rf"]["gain_vhcl(str)"], params["rf"]["gain_grnd(str)"]])
+def received_power(trajectory, rf):
+    antenna_LLH = np.array([rf["antenna_lat(deg)"], rf["antenna_lon(deg)"], rf["antenna_alt(m)"]])
+    rocket_LLH = np.stack([trajectory["lat(deg)"], trajectory["lon(deg)"], trajectory["altitude(m)"]], axis=1)
+    dis2_a, dis3_a, az_a, el_a = antenna_param(antenna_LLH, rocket_LLH)
+    att_tau_t, att_tau_r, grnd_tau_t = tautr(el_a, az_a, trajectory["attitude_elevation(deg)"],
+                                             trajectory["attitude_azimuth(deg)"], 0,
+                                             rf["antenna_elv(deg)"], rf["antenna_azi(deg)"])
+    power = recv_power(rf["freq(Hz)"], rf["loss(dB)"], rf["power(dBm)"], dis3_a, DATA_2D(rf["gain_vhcl(str)"]),
+                       att_tau_t, att_tau_r, DATA_2D(rf["gain_grnd(str)"]), grnd_tau_t)
+    return OrderedDict([("vehicle tau_t(deg)", att_tau_t),
+                        ("vehicle tau_r(deg)", att_tau_r),
+                        ("ground tau_t(deg)", grnd_tau_t),
+                        ("received power(dB)", power)])
+
+
+if __name__ == "__main__":
+    print("IST DERIVED COLUMN MAKER")
+    print("libraries load done.")
+
+    argv = sys.argv
+    if len(argv) > 3:
+        file_name = argv[1]
+        names = argv[3:]
+    else:
+        print("PLEASE INPUT the dynamics csv file, the settings json and the column names as the command line arguments.")
+        exit()
+    with open(argv[2]) as fp:
+        settings = json.load(fp)
+
+    traj = Trajectory(file_name,
+                      antenna_LLH=settings.get("antenna LLH[deg,deg,m]"),
+                      cutoff_time=settings.get("IIP cut-off time[s]"),
+                      stations=parse_stations(settings["stations"]) if "stations" in settings else None,
+                      rf=settings.get("rf"))
+    table = traj.table(names)
+
+    os.makedirs("output", exist_ok=True)
+    outputfile = "output/" + os.path.splitext(os.path.basename(file_name))[0] + "_derived.csv"
+    table.to_csv(outputfile, index=False)
+    print("computed : " + (", ".join(traj.computed) or "-"))
+    print("cached   : " + (", ".join(traj.loaded) or "-"))
+    print("{0:d} columns : {1:s}".format(len(names), outputfile))
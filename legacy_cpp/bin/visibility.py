@@ -0,0 +1,271 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+# Copyright (c) 2017 Interstellar Technologies Inc. All Rights Reserved.
+# ==============================================================================
+# AOS/LOS windows of the ground stations over the campaign.
+#
+# The elevation of the rocket seen from every station (topocentric, with the
+# curvature of the earth) is computed for the rows of many cases at once and
+# compared with the mask of the station: the larger of a constant mask
+# elevation and a terrain mask table (elevation vs azimuth, linear and
+# periodic in azimuth). The crossings of the mask are the sign changes of
+# (elevation - mask) between consecutive rows of a case; every crossing is
+# refined within the step by regula falsi (Illinois) on the chord between the
+# two rows. A case visible at its first (last) row opens (closes) a window
+# there, and so does a visible row after (before) a non-finite one, a gap in
+# the output of the case. The AOS and LOS of every [station x case] alternate, so the passes
+# are the consecutive AOS/LOS pairs without any loop over the rows.
+#
+# visibility.json:
+# {
+#     "mask elevation(deg)": 3.0,
+#     "stations": [
+#         {"name": "Taiki", "LLH[deg,deg,m]": [42.5039248, 143.44954216, 25.0],
+#          "terrain mask[deg,deg]": [[0.0, 2.0], [90.0, 5.0], [180.0, 1.0], [270.0, 2.0]]},
+#         {"name": "Hiroo", "LLH[deg,deg,m]": [42.2920, 143.3240, 40.0], "mask elevation(deg)": 5.0,
+#          "terrain mask file(str)": "hiroo_mask.csv"}
+#     ]
+# }
+# a terrain mask file (stat/inp) has the columns azimuth(deg), elevation(deg).
+#
+# For every dynamics_<k> body of the campaign store
+#   output/visibility_windows_<body>.csv : station, caseNo, pass, AOS(s), LOS(s), ...
+#   output/visibility_<body>.csv         : campaign distribution of the first AOS,
+#                                          last LOS, visible time and passes of every station
+# are written.
+#
+# usage: python visibility.py (mission_name) [visibility.json]
+import sys
+import os
+import json
+import multiprocessing as mp
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+import campaign_store
+from ballistic import Profile
+from coordinate_transform import posECEF_from_LLH, topocentric
+from ground_station import parse_stations
+
+percentiles = [0.0, 5.0, 25.0, 50.0, 75.0, 95.0, 100.0]
+
+
+def station_masks(stations, mask_elevation=0.0, directory="."):
+    """
+    Args:
+        stations (list) : station dicts of visibility.json
+        mask_elevation (float) : mask elevation [deg] of the stations without their own
+        directory (str) : directory of the terrain mask files
+    Returns:
+        mask elevation [deg] (S,) and the terrain masks, Profile of the
+        elevation [deg] vs azimuth [deg] of every station
+    """
+    mask = np.array([s.get("mask elevation(deg)", mask_elevation) for s in stations], dtype=np.float64)
+    tables = []
+    for s in stations:
+        if "terrain mask[deg,deg]" in s:
+            table = np.asarray(s["terrain mask[deg,deg]"], dtype=np.float64).reshape(-1, 2)
+        elif "terrain mask file(str)" in s:
+            df = pd.read_csv(os.path.join(directory, s["terrain mask file(str)"]), index_col=False,
+                             skipinitialspace=True)
+            table = df[["azimuth(deg)", "elevation(deg)"]].to_numpy(dtype=np.float64)
+        else:
+            table = np.array([[0.0, -90.0]])
+        azimuth = table[:, 0] % 360.0
+        order = np.argsort(azimuth, kind="stable")
+        azimuth, elevation = azimuth[order], table[order, 1]
+        # one period on each side, so that the interpolation wraps around north
+        tables.append((np.concatenate([azimuth - 360.0, azimuth, azimuth + 360.0]), np.tile(elevation, 3)))
+    return mask, Profile(tables)
+
+
+def mask_margin(stations_LLH, mask, terrain, station, target_ECEF):
+    """
+    Args:
+        stations_LLH (array) : (S, 1, 3) or (K, 3) lat, lon, alt of the stations [deg, deg, m]
+        mask, terrain : of station_masks
+        station (array) : index of the station of every element, the shape of the result
+        target_ECEF (array) : (N, 3) or (K, 3) ECEF position of the rocket [m]
+    Returns:
+        elevation - mask [deg], azimuth [deg], elevation [deg]
+    """
+    azimuth, elevation, distance = topocentric(stations_LLH, target_ECEF)
+    floor = np.maximum(mask[station], terrain(azimuth, station))
+    return elevation - floor, azimuth, elevation
+
+
+def pass_windows(time, offsets, rocket_ECEF, stations_LLH, mask, terrain, iterations=6):
+    """
+    Args:
+        time (array) : (Nrow,) time [s] of the rows of all the cases
+        offsets (array) : first row of each case (len = Ncase + 1)
+        rocket_ECEF (array) : (Nrow, 3) ECEF position of the rocket [m]
+        stations_LLH (array) : (S, 3) lat, lon, alt of the stations [deg, deg, m]
+        mask, terrain : of station_masks
+        iterations (int) : regula falsi iterations of the crossings
+    Returns:
+        OrderedDict of the arrays of the windows ordered by station, case and time
+    """
+    time = np.asarray(time, dtype=np.float64)
+    stations_LLH = np.asarray(stations_LLH, dtype=np.float64).reshape(-1, 3)
+    S, Nrow = len(stations_LLH), len(time)
+    station = np.broadcast_to(np.arange(S)[:, None], (S, Nrow))
+    margin, azimuth, elevation = mask_margin(stations_LLH[:, None, :], mask, terrain, station, rocket_ECEF)
+    finite = np.isfinite(margin)
+    visible = finite & (margin >= 0.0)
+    case = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+
+    # crossings between the rows i and i + 1 of a case
+    change = (visible[:, 1:] != visible[:, :-1]) & finite[:, 1:] & finite[:, :-1] & (case[1:] == case[:-1])[None, :]
+    cs, row = np.nonzero(change)
+    rising = visible[cs, row + 1]
+    lo, hi = np.zeros(len(row)), np.ones(len(row))
+    m_lo, m_hi = margin[cs, row], margin[cs, row + 1]
+    chord = rocket_ECEF[row + 1] - rocket_ECEF[row]
+    kept = np.zeros(len(row), dtype=np.int64)
+    for k in range(iterations):
+        x = lo + (hi - lo) * m_lo / (m_lo - m_hi)
+        m_x = mask_margin(stations_LLH[cs], mask, terrain, cs, rocket_ECEF[row] + x[:, None] * chord)[0]
+        low_side = (m_x >= 0.0) == (m_lo >= 0.0)
+        # Illinois: an end kept twice in a row has its value halved
+        m_hi = np.where(low_side & (kept == 1), 0.5 * m_hi, m_hi)
+        m_lo = np.where(~low_side & (kept == -1), 0.5 * m_lo, m_lo)
+        m_lo, m_hi = np.where(low_side, m_x, m_lo), np.where(low_side, m_hi, m_x)
+        lo, hi = np.where(low_side, x, lo), np.where(low_side, hi, x)
+        kept = np.where(low_side, 1, -1)
+    x = lo + (hi - lo) * m_lo / (m_lo - m_hi)
+    t_cross = time[row] + x * (time[row + 1] - time[row])
+    az_cross = mask_margin(stations_LLH[cs], mask, terrain, cs, rocket_ECEF[row] + x[:, None] * chord)[1]
+
+    # the visible rows at the first / last row of a case or next to a non-finite row
+    after_break = np.ones((S, Nrow), dtype=bool)
+    after_break[:, 1:] = ~finite[:, :-1] | (case[1:] != case[:-1])[None, :]
+    before_break = np.ones((S, Nrow), dtype=bool)
+    before_break[:, :-1] = ~finite[:, 1:] | (case[1:] != case[:-1])[None, :]
+    s_first, first = np.nonzero(visible & after_break)
+    s_last, last = np.nonzero(visible & before_break)
+
+    # AOS = +1, LOS = -1, row = first / last visible row of the window
+    ev_station = np.concatenate([cs, s_first, s_last])
+    ev_row = np.concatenate([np.where(rising, row + 1, row), first, last])
+    ev_time = np.concatenate([t_cross, time[first], time[last]])
+    ev_azimuth = np.concatenate([az_cross, azimuth[s_first, first], azimuth[s_last, last]])
+    ev_kind = np.concatenate([np.where(rising, 1, -1), np.ones(len(first), dtype=np.int64),
+                              -np.ones(len(last), dtype=np.int64)])
+    ev_case = case[ev_row]
+    order = np.lexsort((-ev_kind, ev_time, ev_case, ev_station))
+    aos, los = order[ev_kind[order] == 1], order[ev_kind[order] == -1]
+
+    # max elevation over the rows of every window
+    flat = np.append(elevation.reshape(-1), -np.inf)
+    bounds = np.empty(2 * len(aos), dtype=np.int64)
+    bounds[0::2] = ev_station[aos] * Nrow + ev_row[aos]
+    bounds[1::2] = ev_station[los] * Nrow + ev_row[los] + 1
+    max_elevation = np.maximum.reduceat(flat, bounds)[0::2] if len(aos) > 0 else np.zeros(0)
+
+    group = np.ones(len(aos), dtype=bool)
+    group[1:] = (ev_station[aos][1:] != ev_station[aos][:-1]) | (ev_case[aos][1:] != ev_case[aos][:-1])
+    n = np.arange(len(aos))
+    number = n - np.maximum.accumulate(np.where(group, n, 0)) + 1
+    return OrderedDict([("station", ev_station[aos]),
+                        ("case index", ev_case[aos]),
+                        ("pass", number),
+                        ("AOS(s)", ev_time[aos]),
+                        ("LOS(s)", ev_time[los]),
+                        ("duration(s)", ev_time[los] - ev_time[aos]),
+                        ("AOS azimuth(deg)", ev_azimuth[aos]),
+                        ("LOS azimuth(deg)", ev_azimuth[los]),
+                        ("max elevation(deg)", max_elevation)])
+
+
+def body_windows(store, body, names, stations_LLH, mask, terrain, batch=1024):
+    """ pass windows (DataFrame) of all the cases of the body, batch cases at a time """
+    cases = store.cases(body)
+    offsets = store.offsets(body)
+    tables = []
+    for start in range(0, len(cases), batch):
+        stop = min(start + batch, len(cases))
+        r0, r1 = offsets[start], offsets[stop]
+        time = np.asarray(store.column(body, "time(s)")[r0:r1])
+        llh = np.stack([np.asarray(store.column(body, c)[r0:r1]) for c in ["lat(deg)", "lon(deg)", "altitude(m)"]],
+                       axis=1)
+        windows = pass_windows(time, offsets[start:stop + 1] - r0, posECEF_from_LLH(llh), stations_LLH, mask, terrain)
+        table = pd.DataFrame(windows)
+        table.insert(1, "caseNo", cases[start + windows["case index"]])
+        tables.append(table.drop(columns="case index"))
+    table = pd.concat(tables, ignore_index=True)
+    table["station"] = np.array(names, dtype=object)[table["station"].to_numpy(dtype=np.int64)]
+    return table
+
+
+def pass_statistics(windows, names, cases):
+    """
+    campaign distribution of the first AOS, last LOS, visible time and number of
+    passes of the cases for every station (nan AOS / LOS if the case has no pass)
+    """
+    per_case = windows.groupby(["station", "caseNo"]).agg(**{
+        "first AOS(s)": ("AOS(s)", "min"), "last LOS(s)": ("LOS(s)", "max"),
+        "visible time(s)": ("duration(s)", "sum"), "passes": ("pass", "count")})
+    index = pd.MultiIndex.from_product([names, cases], names=["station", "caseNo"])
+    per_case = per_case.reindex(index)
+    per_case[["visible time(s)", "passes"]] = per_case[["visible time(s)", "passes"]].fillna(0.0)
+    rows = []
+    for name in names:
+        for quantity in per_case.columns:
+            value = per_case.loc[name, quantity].to_numpy(dtype=np.float64)
+            valid = value[np.isfinite(value)]
+            row = OrderedDict([("station", name), ("quantity", quantity), ("cases", len(valid)),
+                               ("mean", valid.mean() if len(valid) > 0 else np.nan),
+                               ("std", valid.std(ddof=1) if len(valid) > 1 else np.nan)])
+            for p, v in zip(percentiles, np.percentile(valid, percentiles) if len(valid) > 0 else [np.nan] * len(percentiles)):
+                row["{0:g}%".format(p)] = v
+            rows.append(row)
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    Nproc = max(mp.cpu_count() - 1, 1)
+
+    print("IST VISIBILITY MAKER")
+    print("libraries load done.")
+
+    argv = sys.argv
+    if len(argv) > 1:
+        otmc_mission_name = argv[1]
+    else:
+        print("PLEASE INPUT mission_name as the command line argument.")
+        exit()
+    missionpath = campaign_store.mission_path(otmc_mission_name)
+
+    if len(argv) > 2:
+        stat_input = argv[2]
+    else:
+        stat_input = "visibility.json"
+        campaign_store.fetch(missionpath + "/stat/inp/visibility.json", stat_input)
+    with open(stat_input) as fp:
+        stat = json.load(fp)
+    stations = stat["stations"]
+    names, stations_LLH = parse_stations(stations)
+    for s in stations:
+        if "terrain mask file(str)" in s and not os.path.exists(s["terrain mask file(str)"]):
+            campaign_store.fetch(missionpath + "/stat/inp/" + s["terrain mask file(str)"], s["terrain mask file(str)"])
+    mask, terrain = station_masks(stations, stat.get("mask elevation(deg)", 0.0))
+
+    os.makedirs("output", exist_ok=True)
+    outputfiles = []
+    store = campaign_store.open_store(otmc_mission_name, "store", Nproc)
+    for body in store.bodies:
+        if not body.startswith("dynamics_") or body.count("_") != 1:
+            continue
+        windows = body_windows(store, body, names, stations_LLH, mask, terrain)
+        outputfiles.append("output/visibility_windows_" + body + ".csv")
+        windows.to_csv(outputfiles[-1], index=False)
+        outputfiles.append("output/visibility_" + body + ".csv")
+        pass_statistics(windows, names, store.cases(body)).to_csv(outputfiles[-1], index=False)
+        print("{0:s}: {1:d} passes of {2:d} stations".format(body, len(windows), len(names)))
+
+    for outputfile in outputfiles:
+        if missionpath.startswith("s3://"):
+            os.system("aws s3 cp " + outputfile + " " + missionpath + "/stat/output/")
+        else:
+            os.system("cp " + outputfile + " " + missionpath + "/stat/output/")
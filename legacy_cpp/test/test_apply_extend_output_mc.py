@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+apply_extend_output_mc test
+
+The body dynamics_1_extend written back to a small campaign store, in
+batches of a few cases in this process and over a pool, is compared with
+extend_columns of make_extend_output_mc.py on every case by itself: the
+batches must not mix the rows of the cases at their boundaries. The csv
+files of write_csv are the rows of the extended body.
+
+Copyright (c) 2018 Interstellar Technologies Inc. All Rights Reserved.
+"""
+
+import os
+import sys
+import tempfile
+import multiprocessing as mp
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bin"))
+import apply_extend_output_mc
+import campaign_store
+from ground_station import parse_stations
+from make_extend_output_mc import extend_columns
+from test_timeline import body_frame
+
+suffix = "test"
+antenna_LLH = [42.5039248, 143.44954216, 25.0]
+stations = parse_stations([{"name": "Taiki", "LLH[deg,deg,m]": antenna_LLH},
+                           {"name": "Sea", "LLH[deg,deg,m]": [41.0, 146.0, 0.0]}])
+
+
+def test_extend_body_matches_each_case():
+    lengths = [20, 35, 0, 12, 28, 9, 16]
+    with tempfile.TemporaryDirectory() as directory:
+        raw = os.path.join(directory, "raw")
+        os.makedirs(raw)
+        for caseNo, N in enumerate(lengths):
+            # a length 0 writes the header only
+            body_frame(max(N, 2), caseNo).iloc[:N].to_csv(
+                os.path.join(raw, "case{0:05d}_{1:s}_dynamics_1.csv".format(caseNo, suffix)), index=False)
+        # an event table as monte_carlo.py, not detected from the bodies
+        pd.DataFrame(columns=["body", "event", "occurrence", "row"]).to_csv(
+            os.path.join(raw, "case00000_{0:s}_events.csv".format(suffix)), index=False)
+        store = campaign_store.build_store(raw, suffix, os.path.join(directory, "store"))
+        cases, offsets = store.cases("dynamics_1"), store.offsets("dynamics_1")
+        columns = store.columns("dynamics_1")
+        values = np.stack([np.asarray(store.column("dynamics_1", c)) for c in columns], axis=1)
+        # every case by itself
+        expected = [extend_columns(values[offsets[k]:offsets[k + 1]],
+                                   values[offsets[k]:offsets[k + 1], columns.index("attitude_elevation(deg)")],
+                                   np.asarray(antenna_LLH), 2.0, stations, True) for k in range(len(cases))]
+
+        pool = mp.Pool(2, initializer=apply_extend_output_mc._init_worker)
+        try:
+            # batches of 1, 2 (one boundary inside every batch) and 4 cases, the last batch shorter
+            for batch, runner in [(1, None), (2, None), (4, pool)]:
+                name = apply_extend_output_mc.extend_body(store, "dynamics_1", antenna_LLH, 2.0, stations, True,
+                                                          runner, batch)
+                assert name == "dynamics_1_extend"
+                store = campaign_store.CampaignStore(store.store_dir)
+                assert np.array_equal(store.cases(name), cases) and np.array_equal(store.offsets(name), offsets)
+                assert store.columns(name)[:len(columns)] == columns
+                for c in columns:
+                    assert np.array_equal(store.column(name, c), store.column("dynamics_1", c), equal_nan=True)
+                for k in range(len(cases)):
+                    assert list(expected[k]) == store.columns(name)[len(columns):]
+                    for c, value in expected[k].items():
+                        assert np.array_equal(store.column(name, c)[offsets[k]:offsets[k + 1]], value,
+                                              equal_nan=True), (batch, k, c)
+        finally:
+            pool.close()
+            pool.join()
+
+        out = os.path.join(directory, "extend_csv")
+        apply_extend_output_mc.write_csv(store, "dynamics_1_extend", suffix, out)
+        assert sorted(os.listdir(out)) == ["case{0:05d}_{1:s}_dynamics_1_extend.csv".format(int(c), suffix)
+                                           for c in cases]
+        df = pd.read_csv(os.path.join(out, "case00003_test_dynamics_1_extend.csv"))
+        assert np.allclose(df["IIP radius(m)"], expected[2]["IIP radius(m)"], rtol=1e-15, equal_nan=True)
+
+
+if __name__ == '__main__':
+    test_extend_body_matches_each_case()
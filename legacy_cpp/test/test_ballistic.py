@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+"""
+ballistic test
+
+propagate is compared with an independent point mass integration (J2 gravity,
+no air, no wind), parent_state with the analytic state at the rows it was not
+given, and the wind / air density lookups of Environment with the scalar
+interpolations of the C++ engine (interp_matrix, linear_interp1_from_y).
+
+Copyright (c) 2018 Interstellar Technologies Inc. All Rights Reserved.
+"""
+
+import os
+import sys
+import tempfile
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bin"))
+import coordinate_transform as ct
+import ballistic
+import campaign_store
+
+no_wind = {"wind": {"wind file exist?(bool)": False, "const wind[m/s,deg]": [0.0, 0.0]},
+           "calculate condition": {}}
+
+
+def interp_matrix(x, table, col):
+    """ fileio.cpp interp_matrix: linear, the outermost value outside """
+    y = 0.0
+    for i in range(len(table) - 1):
+        if table[i][0] <= x < table[i + 1][0]:
+            alpha = (x - table[i][0]) / (table[i + 1][0] - table[i][0])
+            y = table[i][col] + alpha * (table[i + 1][col] - table[i][col])
+    if x < table[0][0]:
+        y = table[0][col]
+    elif x >= table[-1][0]:
+        y = table[-1][col]
+    return y
+
+
+def linear_interp1_from_y(y, x_array, y_array):
+    """ air.cpp linear_interp1_from_y """
+    x = 0.0
+    for i in range(len(y_array) - 1):
+        if y_array[i] <= y < y_array[i + 1]:
+            alpha = (y - y_array[i]) / (y_array[i + 1] - y_array[i])
+            x = x_array[i] + alpha * (x_array[i + 1] - x_array[i])
+    if y < y_array[0]:
+        x = x_array[0]
+    elif y >= y_array[-1]:
+        x = x_array[-1]
+    return x
+
+
+def gravity_J2(r):
+    """ point mass + J2 in the usual (unnormalized) form """
+    J2 = -np.sqrt(5.0) * ballistic.barC20
+    rn = np.linalg.norm(r)
+    k = 1.5 * J2 * (ballistic.re_a / rn) ** 2
+    zz = (r[2] / rn) ** 2
+    return -ballistic.mu / rn ** 3 * r * np.array([1.0 + k * (1.0 - 5.0 * zz), 1.0 + k * (1.0 - 5.0 * zz),
+                                                    1.0 + k * (3.0 - 5.0 * zz)])
+
+
+def altitude(t, r):
+    return ct.posLLH(ct.posECEF(ct.dcmECI2ECEF(t, ct.omega_engine), r), bitwise=False)[2]
+
+
+def point_mass_impact(t, r, v, step=0.01):
+    """ RK4 in vacuum until the ground, the crossing linear between the steps """
+    def f(y):
+        return np.concatenate([y[3:], gravity_J2(y[:3])])
+    y = np.concatenate([r, v])
+    h0 = altitude(t, r)
+    while True:
+        k1 = f(y)
+        k2 = f(y + 0.5 * step * k1)
+        k3 = f(y + 0.5 * step * k2)
+        k4 = f(y + step * k3)
+        new = y + step / 6.0 * (k1 + 2.0 * k2 + 2.0 * k3 + k4)
+        h1 = altitude(t + step, new[:3])
+        if h1 < 0.0:
+            w = h0 / (h0 - h1)
+            return t + w * step, y + w * (new - y)
+        t, y, h0 = t + step, new, h1
+
+
+def launch_states(N, seed=0):
+    """ ECI states of bodies coasting at 20 - 80 km """
+    rng = np.random.default_rng(seed)
+    t = rng.uniform(0.0, 300.0, N)
+    llh = np.column_stack([rng.uniform(-60.0, 60.0, N), rng.uniform(-180.0, 180.0, N), rng.uniform(2e4, 8e4, N)])
+    dcm = np.swapaxes(ct.dcmECI2ECEF(t, ct.omega_engine), -1, -2)
+    pos = ct.posECEF(dcm, ct.posECEF_from_LLH(llh))
+    vel = rng.normal(0.0, 800.0, (N, 3))
+    return t, pos, vel
+
+
+def test_vacuum_matches_point_mass():
+    N = 6
+    t0, pos, vel = launch_states(N)
+    env = ballistic.Environment([no_wind] * N)
+    beta = np.full(N, 1.0e30)  # 空気抵抗なし
+    result = ballistic.propagate(t0, pos, vel, beta, env, t0 + 1000.0, step=0.5, output_step=5.0)
+    assert not np.any(np.isnan(result["impact"]))
+    for k in range(N):
+        t_impact, y = point_mass_impact(t0[k], pos[k], vel[k])
+        rows = result["body"] == k
+        assert np.isclose(result["impact"][k], t_impact, rtol=0.0, atol=2e-3)
+        assert np.isclose(result["time(s)"][rows][-1], result["impact"][k])
+        assert np.allclose(result["state"][:3, rows][:, -1], y[:3], rtol=0.0, atol=2.0)
+        assert np.allclose(result["state"][3:, rows][:, -1], y[3:], rtol=0.0, atol=1e-2)
+
+    # output columns with coordinate_transform and the gravity model
+    columns = ballistic.output_columns(result, beta, env, mass=np.arange(N) + 1.0,
+                                       launch_llh=np.tile([35.0, 139.0, 0.0], (N, 1)))
+    pos = result["state"][:3].T
+    llh = ct.posLLH(ct.posECEF(ct.dcmECI2ECEF(result["time(s)"], ct.omega_engine), pos), bitwise=False)
+    for j, name in enumerate(["lat(deg)", "lon(deg)", "altitude(m)"]):
+        assert np.allclose(columns[name], llh[:, j], rtol=0.0, atol=1e-6)
+    assert np.array_equal(columns["mass(kg)"], result["body"] + 1.0)
+    acc = np.array([gravity_J2(r) for r in pos])
+    for j, name in enumerate(["acc_ECI_X(m/s2)", "acc_ECI_Y(m/s2)", "acc_ECI_Z(m/s2)"]):
+        assert np.allclose(columns[name], acc[:, j], rtol=1e-12, atol=1e-12)
+    # the air is still there, only the drag is negligible
+    assert np.all(columns["dynamic pressure(Pa)"] > 0.0)
+    assert np.all(columns["downrange(m)"] >= 0.0)
+
+
+def test_parent_state_hermite():
+    # 解析的な軌道 (円運動 + 一定加速度) を1行おきに渡し、渡していない行で比べる
+    r, w, az = 6.9e6, 2.0 * np.pi / 5400.0, 3.0
+
+    def state(t, phase):
+        c, s = np.cos(w * t + phase), np.sin(w * t + phase)
+        pos = np.stack([r * c, r * s, 0.5 * az * t ** 2], axis=1)
+        vel = np.stack([-r * w * s, r * w * c, az * t], axis=1)
+        acc = np.stack([-r * w * w * c, -r * w * w * s, np.full(len(t), az)], axis=1)
+        return pos, vel, acc
+
+    times = [np.arange(0.0, 201.0, 1.0), np.arange(50.0, 151.0, 1.0)]
+    phases = [0.0, 1.0]
+    with tempfile.TemporaryDirectory() as directory:
+        store = campaign_store.CampaignStore(directory)
+        data = {"time(s)": np.concatenate([t[::2] for t in times])}
+        parts = [state(t[::2], phase) for t, phase in zip(times, phases)]
+        for n, (a, u) in enumerate([("pos", "(m)"), ("vel", "(m/s)"), ("acc", "(m/s2)")]):
+            for j, x in enumerate("XYZ"):
+                data[a + "_ECI_" + x + u] = np.concatenate([p[n][:, j] for p in parts])
+        lengths = [len(t[::2]) for t in times]
+        store.add_columns("dynamics_1", [1, 2], np.concatenate([[0], np.cumsum(lengths)]), data)
+
+        case_index = np.concatenate([np.zeros(100, dtype=np.int64), np.ones(50, dtype=np.int64)])
+        t = np.concatenate([times[0][1::2], times[1][1::2]])
+        p, v = ballistic.parent_state(store, "dynamics_1", case_index, t)
+        expected = [np.concatenate(x) for x in zip(state(times[0][1::2], phases[0]), state(times[1][1::2], phases[1]))]
+        # 3次Hermiteの誤差 r w^4 h^4 / 384 ~ 5e-7 m (線形補間なら数m)
+        assert np.allclose(p, expected[0], rtol=0.0, atol=1e-5)
+        assert np.allclose(v, expected[1], rtol=0.0, atol=1e-7)
+
+        # the rows themselves and outside of the case
+        p, v = ballistic.parent_state(store, "dynamics_1", np.array([0, 1, 1, 1]), np.array([200.0, 50.0, 40.0, 160.0]))
+        assert np.allclose(p[:2], [state(np.array([200.0]), 0.0)[0][0], state(np.array([50.0]), 1.0)[0][0]],
+                           rtol=0.0, atol=1e-9)
+        assert np.all(np.isnan(p[2:])) and np.all(np.isnan(v[2:]))
+
+
+def test_environment_matches_engine():
+    wind_table = [[0.0, 2.0, 10.0], [1000.0, 8.0, 45.0], [5000.0, 20.0, 270.0], [12000.0, 35.0, 300.0]]
+    density_table = [[0.0, 5.0], [10000.0, -12.0], [30000.0, 20.0]]
+    with tempfile.TemporaryDirectory() as directory:
+        pd.DataFrame(wind_table, columns=["altitude[m]", "wind_speed[m/s]", "direction[deg]"]).to_csv(
+            os.path.join(directory, "wind.csv"), index=False)
+        pd.DataFrame(density_table, columns=["altitude[m]", "air density variation[percent]"]).to_csv(
+            os.path.join(directory, "density.csv"), index=False)
+        file_wind = {"wind file exist?(bool)": True, "wind file name(str)": "wind.csv"}
+        settings = [{"wind": file_wind,
+                     "calculate condition": {"air density variation file exist?(bool)": True,
+                                             "air density variation file name(str)": "density.csv"}},
+                    {"wind": {"wind file exist?(bool)": False, "const wind[m/s,deg]": [7.0, 120.0]},
+                     "calculate condition": {"variation ratio of air density[%](-100to100, default=0)": -30.0}},
+                    {"wind": file_wind,
+                     "calculate condition": {"variation ratio of air density[%](-100to100, default=0)": 50.0}},
+                    no_wind]
+        env = ballistic.Environment(settings, directory)
+
+    # 風のファイルは行ごとに u, v にしてから高度で補間 (エンジンと同じ)
+    uv = [[h, -s * np.sin(np.deg2rad(d)), -s * np.cos(np.deg2rad(d))] for h, s, d in wind_table]
+    rng = np.random.default_rng(0)
+    heights = np.concatenate([rng.uniform(-500.0, 100000.0, 200),
+                              [0.0, 1000.0, 5000.0, 12000.0, 30000.0, 1010.0, 90220.0, 90880.0, 95000.0]])
+    for body, s in enumerate(settings):
+        index = np.full(len(heights), body)
+        north, east = env.wind_ned(heights, index)
+        airspeed, density = env.air(heights, index)
+        rho = ballistic.standard_atmosphere(heights)[3]
+        for h, n, e, d, r0 in zip(heights, north, east, density, rho):
+            if s["wind"]["wind file exist?(bool)"]:
+                expected_ne = interp_matrix(h, uv, 2), interp_matrix(h, uv, 1)
+            else:
+                speed, direction = s["wind"]["const wind[m/s,deg]"]
+                expected_ne = -speed * np.cos(np.deg2rad(direction)), -speed * np.sin(np.deg2rad(direction))
+            assert np.allclose([n, e], expected_ne, rtol=0.0, atol=1e-12)
+
+            calc = s["calculate condition"]
+            percent = calc.get("variation ratio of air density[%](-100to100, default=0)", 0.0)
+            if calc.get("air density variation file exist?(bool)", False):
+                coef = linear_interp1_from_y(h, [v for a, v in density_table], [a for a, v in density_table]) / 100
+            elif percent == 0.0:
+                coef = 0.0
+            else:
+                altitude_ref, variation_ref = ballistic.variation_minus if percent < 0 else ballistic.variation_plus
+                coef = linear_interp1_from_y(h, variation_ref, altitude_ref) / 100 * abs(percent) / 100
+            assert np.isclose(d, r0 * (1.0 + coef), rtol=1e-12, atol=0.0)
+
+    # take keeps the profiles of the bodies taken
+    part = env.take(np.array([2, 1]))
+    assert np.allclose(part.wind_ned(heights[:5], np.zeros(5, dtype=np.int64)),
+                       env.wind_ned(heights[:5], np.full(5, 2)))
+    assert np.allclose(part.air(heights[:5], np.ones(5, dtype=np.int64)), env.air(heights[:5], np.ones(5, dtype=np.int64)))
+
+
+if __name__ == '__main__':
+    test_vacuum_matches_point_mass()
+    test_parent_state_hermite()
+    test_environment_matches_engine()
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""
+campaign store test
+
+The store built in two passes (row count, then the columns) from the case
+csv files is compared with the csv files themselves: offsets, caseNo,
+columns, the event table of monte_carlo.py or detected from dynamics_1, and
+resample against np.interp of every case. open_store rebuilds a store made
+from another mission or suffix.
+
+Copyright (c) 2018 Interstellar Technologies Inc. All Rights Reserved.
+"""
+
+import os
+import sys
+import json
+import tempfile
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bin"))
+import campaign_store
+import event_table
+
+suffix = "test"
+
+
+def case_frame(N, seed, step=0.5):
+    """ dynamics_1 of one case: a climb, the cut-off at 40 % and some nan """
+    rng = np.random.default_rng(seed)
+    t = np.arange(N) * step
+    altitude = 1000.0 * t * (N * step - t) + rng.normal(0.0, 10.0, N)
+    df = pd.DataFrame({"time(s)": t, "altitude(m)": altitude,
+                       "vel_NED_X(m/s)": rng.normal(0.0, 100.0, N), "vel_NED_Y(m/s)": rng.normal(0.0, 100.0, N),
+                       "dynamic pressure(Pa)": rng.uniform(0.0, 5e4, N),
+                       "acc_Body_X(m/s2)": rng.normal(0.0, 10.0, N), "acc_Body_Y(m/s2)": rng.normal(0.0, 1.0, N),
+                       "acc_Body_Z(m/s2)": rng.normal(0.0, 1.0, N),
+                       event_table.col_powered: (np.arange(N) < 0.4 * N).astype(int),
+                       event_table.col_separated: (np.arange(N) >= 0.6 * N).astype(int)})
+    df.loc[rng.random(N) < 0.05, "vel_NED_Y(m/s)"] = np.nan
+    return df
+
+
+def write_campaign(directory, lengths, events=False):
+    """
+    caseNNNNN_<suffix>_dynamics_1.csv of the cases 0 ... (a length 0 writes the header only),
+    and their event tables if events
+    Returns:
+        dict of caseNo -> DataFrame as read from the csv
+    """
+    frames = {}
+    for caseNo, N in enumerate(lengths):
+        df = case_frame(N, caseNo)
+        filename = os.path.join(directory, "case{0:05d}_{1:s}_dynamics_1.csv".format(caseNo, suffix))
+        df.to_csv(filename, index=False)
+        # the csv round trip may change the last bit
+        frames[caseNo] = pd.read_csv(filename, index_col=False)
+        if events and N > 0:
+            found = event_table.detect_events(df)
+            pd.DataFrame({"body": "dynamics_1", "event": [e[0] for e in found],
+                          "occurrence": [e[1] for e in found], "row": [e[2] for e in found]}).to_csv(
+                os.path.join(directory, "case{0:05d}_{1:s}_events.csv".format(caseNo, suffix)), index=False)
+    return frames
+
+
+def test_two_pass_build():
+    lengths = [30, 45, 0, 17, 60]
+    for events, Nproc in [(True, 1), (False, 2)]:
+        with tempfile.TemporaryDirectory() as directory:
+            raw = os.path.join(directory, "raw")
+            os.makedirs(raw)
+            frames = write_campaign(raw, lengths, events)
+            # a file of another body and suffix is not taken
+            frames[0].to_csv(os.path.join(raw, "case00001_other_dynamics_1.csv"), index=False)
+            store = campaign_store.build_store(raw, suffix, os.path.join(directory, "store"), Nproc)
+
+            assert store.bodies == ["dynamics_1"]
+            assert np.array_equal(store.cases("dynamics_1"), [0, 1, 3, 4])
+            assert np.array_equal(store.offsets("dynamics_1"), [0, 30, 75, 92, 152])
+            assert np.array_equal(store.case_index("dynamics_1"), np.repeat(np.arange(4), [30, 45, 17, 60]))
+            assert store.columns("dynamics_1") == list(frames[0].columns)
+            for name in store.columns("dynamics_1"):
+                expected = np.concatenate([frames[c][name].to_numpy(dtype=np.float64) for c in [0, 1, 3, 4]])
+                assert np.array_equal(store.column("dynamics_1", name), expected, equal_nan=True)
+
+            # the same events from the csv files of monte_carlo.py and detected from dynamics_1
+            for k, caseNo in enumerate([0, 1, 3, 4]):
+                for event, occurrence, row in event_table.detect_events(frames[caseNo]):
+                    rows = store.event_rows("dynamics_1", event, occurrence)
+                    assert rows[k] == store.offsets("dynamics_1")[k] + row
+            assert np.array_equal(store.event_rows("dynamics_1", "MECO"), store.event_rows("dynamics_1", "cutoff"))
+            assert np.all(store.event_rows("dynamics_1", "cutoff", 2) == -1)
+            assert set(store.events["caseNo"]) == {0, 1, 3, 4}
+
+
+def test_resample_and_add_columns():
+    with tempfile.TemporaryDirectory() as directory:
+        frames = write_campaign(directory, [20, 35, 8])
+        store = campaign_store.build_store(directory, suffix, os.path.join(directory, "store"))
+        grid = np.array([-1.0, 0.0, 0.25, 3.7, 9.5, 12.0, 17.0])
+        out = store.resample("dynamics_1", ["altitude(m)", "vel_NED_X(m/s)"], grid)
+        assert out.shape == (3, len(grid), 2)
+        for k, df in frames.items():
+            t = df["time(s)"].to_numpy()
+            inside = (grid >= t[0]) & (grid <= t[-1])
+            for j, name in enumerate(["altitude(m)", "vel_NED_X(m/s)"]):
+                expected = np.where(inside, np.interp(grid, t, df[name].to_numpy()), np.nan)
+                assert np.allclose(out[k, :, j], expected, rtol=1e-12, atol=1e-9, equal_nan=True)
+        part = store.resample("dynamics_1", ["altitude(m)"], grid, start=1, stop=3)
+        assert np.array_equal(part, out[1:, :, :1], equal_nan=True)
+
+        # columns written back on the same rows, another row layout is refused
+        offsets = store.offsets("dynamics_1")
+        store.add_columns("dynamics_1_extend", store.cases("dynamics_1"), offsets, {"x": np.arange(offsets[-1])})
+        store.add_columns("dynamics_1_extend", store.cases("dynamics_1"), offsets, {"y": -np.arange(offsets[-1])})
+        assert store.columns("dynamics_1_extend") == ["x", "y"]
+        assert np.array_equal(store.column("dynamics_1_extend", "y"), -np.arange(offsets[-1]))
+        try:
+            store.add_columns("dynamics_1_extend", [0, 1], offsets[:3], {"z": np.zeros(offsets[2])})
+            assert False
+        except ValueError:
+            pass
+
+
+
+def write_mission(directory, lengths, mission_suffix=suffix):
+    """ <directory>/raw/inp/mc.json and raw/output of a local mission """
+    os.makedirs(os.path.join(directory, "raw", "inp"))
+    os.makedirs(os.path.join(directory, "raw", "output"))
+    with open(os.path.join(directory, "raw", "inp", "mc.json"), "w") as fo:
+        json.dump({"suffix": mission_suffix, "Ntask": len(lengths) - 1}, fo)
+    for caseNo, N in enumerate(lengths):
+        case_frame(N, caseNo).to_csv(os.path.join(directory, "raw", "output", "case{0:05d}_{1:s}_dynamics_1.csv".format(
+            caseNo, mission_suffix)), index=False)
+
+
+def test_open_store_of_another_mission():
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        missions = {"A": [30, 45, 17], "B": [20, 10, 12, 8]}
+        for name, lengths in missions.items():
+            write_mission(os.path.join(directory, name), lengths)
+        write_mission(os.path.join(directory, "C"), [5, 6], "other")
+        work = os.path.join(directory, "work")
+        os.makedirs(work)
+        try:
+            os.chdir(work)
+            for name in ["A", "B", "A"]:
+                store = campaign_store.open_store(os.path.join(directory, name))
+                assert np.array_equal(np.diff(store.offsets("dynamics_1")), missions[name]), name
+                assert store.meta == {"mission": os.path.join(directory, name), "suffix": suffix}
+            # the same mission is not ingested again
+            marker = os.path.join("store", "dynamics_1", "marker")
+            open(marker, "w").close()
+            campaign_store.open_store(os.path.join(directory, "A") + "/")
+            assert os.path.exists(marker)
+            # the same mission directory with another suffix, and a store without meta.json
+            with open(os.path.join(directory, "A", "raw", "inp", "mc.json"), "w") as fo:
+                json.dump({"suffix": "other"}, fo)
+            os.rename(os.path.join(directory, "C", "raw", "output", "case00001_other_dynamics_1.csv"),
+                      os.path.join(directory, "A", "raw", "output", "case00001_other_dynamics_1.csv"))
+            store = campaign_store.open_store(os.path.join(directory, "A"))
+            assert np.array_equal(np.diff(store.offsets("dynamics_1")), [6]) and not os.path.exists(marker)
+            os.remove(os.path.join("store", "meta.json"))
+            store = campaign_store.open_store(os.path.join(directory, "A"))
+            assert store.meta["suffix"] == "other"
+        finally:
+            os.chdir(cwd)
+
+
+if __name__ == '__main__':
+    test_two_pass_build()
+    test_resample_and_add_columns()
+    test_open_store_of_another_mission()
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""
+coordinate_transform test
+
+The batched transforms are compared with the single vector implementations
+they replaced (row by row, bit for bit), and python test_coordinate_transform.py
+runs a micro benchmark of the two.
+
+Copyright (c) 2018 Interstellar Technologies Inc. All Rights Reserved.
+"""
+
+import os
+import sys
+import time
+import numpy as np
+from numpy import sin, cos, sqrt, arctan2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bin"))
+import coordinate_transform as ct
+
+wgs84 = ct.wgs84
+earth = ct.earth
+deg2rad = ct.deg2rad
+rad2deg = ct.rad2deg
+
+
+# ==== scalar reference (single 3-vector implementation of make_extend_output.py) ====
+def ref_dcmECI2ECEF(second):
+    theta = earth.omega * second
+    return np.array([[cos(theta),  sin(theta), 0.0],
+                     [-sin(theta), cos(theta), 0.0],
+                     [0.0,         0.0,        1.0]])
+
+def ref_n_posECEF2LLH(phi_n_deg):
+    return wgs84.re_a / sqrt(1.0 - wgs84.e2 * sin(deg2rad(phi_n_deg)) * sin(deg2rad(phi_n_deg)))
+
+def ref_posLLH(posECEF_):
+    p = sqrt(posECEF_[0] **2 + posECEF_[1] **2)
+    theta = arctan2(posECEF_[2] * wgs84.re_a, p * wgs84.re_b)
+    lat = rad2deg(arctan2(posECEF_[2] + wgs84.ed2 * wgs84.re_b * pow(sin(theta), 3), p - wgs84.e2 * wgs84.re_a * pow(cos(theta),3)))
+    lon = rad2deg(arctan2(posECEF_[1], posECEF_[0]))
+    alt = p / cos(deg2rad(lat)) - ref_n_posECEF2LLH(lat)
+    return np.array([lat, lon, alt])
+
+def ref_dcmECEF2NED(posLLH_):
+    lat = deg2rad(posLLH_[0])
+    lon = deg2rad(posLLH_[1])
+    return np.array([[-sin(lat)*cos(lon), -sin(lat)*sin(lon), cos(lat)],
+                     [-sin(lon),           cos(lon),          0],
+                     [-cos(lat)*cos(lon), -cos(lat)*sin(lon), -sin(lat)]])
+
+def ref_posECEF_from_LLH(posLLH_):
+    lat = deg2rad(posLLH_[0])
+    lon = deg2rad(posLLH_[1])
+    alt = posLLH_[2]
+    W = sqrt(1.0 - wgs84.e2 * sin(lat) * sin(lat))
+    N = wgs84.re_a / W
+    return np.array([(N + alt) * cos(lat) * cos(lon), (N + alt) * cos(lat) * sin(lon), (N * (1 - wgs84.e2) + alt) * sin(lat)])
+
+def ref_posLLH_IIP(t, posECI_, vel_ECEF_NEDframe_):
+    g0 = 9.80665
+    dcmECI2ECEF_ = ref_dcmECI2ECEF(t)
+    posLLH_ = ref_posLLH(dcmECI2ECEF_.dot(posECI_))
+    dcmNED2ECI_ = ref_dcmECEF2NED(posLLH_).dot(dcmECI2ECEF_).T
+    vel_north_ = vel_ECEF_NEDframe_[0]
+    vel_east_ = vel_ECEF_NEDframe_[1]
+    vel_up_ = - vel_ECEF_NEDframe_[2]
+    h = posLLH_[2]
+    tau = 1.0/g0 * (vel_up_ + sqrt(vel_up_**2 + 2 * h * g0))
+    dist_IIP_from_now_NED = np.array([vel_north_ * tau, vel_east_ * tau, -h])
+    posECI_IIP_ = posECI_ + dcmNED2ECI_.dot(dist_IIP_from_now_NED)
+    return ref_posLLH(ref_dcmECI2ECEF(t).dot(posECI_IIP_))
+
+def ref_distance_surface(pos0_LLH_, pos1_LLH_):
+    pos0_ECEF_ = ref_posECEF_from_LLH(pos0_LLH_)
+    pos1_ECEF_ = ref_posECEF_from_LLH(pos1_LLH_)
+    theta = np.arccos(np.dot(pos0_ECEF_, pos1_ECEF_) / np.linalg.norm(pos0_ECEF_) / np.linalg.norm(pos1_ECEF_))
+    return 6378137 * theta
+
+def ref_radius_IIP(t, posECI_, vel_ECEF_NEDframe_, cutoff_time, thrust, weight):
+    delta_vel = thrust / weight * cutoff_time
+    point_IIP = ref_posLLH_IIP(t, posECI_, vel_ECEF_NEDframe_)
+    delta_IIP = ref_posLLH_IIP(t, posECI_, vel_ECEF_NEDframe_ + delta_vel * np.array([1,1,0]))
+    _a, _b, distance_2d = ct.g.inv(point_IIP[1], point_IIP[0], delta_IIP[1], delta_IIP[0])
+    return distance_2d
+
+def ref_antenna_param(antenna_LLH_, rocket_LLH_):
+    azimuth, back_azimuth, distance_2d = ct.g.inv(antenna_LLH_[1], antenna_LLH_[0], rocket_LLH_[1], rocket_LLH_[0])
+    elevation = np.rad2deg(np.arctan2(rocket_LLH_[2], distance_2d))
+    distance_3d = np.hypot(distance_2d, rocket_LLH_[2])
+    return distance_2d, distance_3d, azimuth, elevation
+
+
+def flight_states(N=500, seed=0):
+    """ random states along a sub orbital flight: time, LLH, ECI position, NED velocity, thrust, mass """
+    rng = np.random.default_rng(seed)
+    t = rng.uniform(0.0, 600.0, N)
+    llh = np.stack([rng.uniform(-80.0, 80.0, N), rng.uniform(-180.0, 180.0, N), rng.uniform(0.0, 4e5, N)], axis=1)
+    ecef = np.array([ref_posECEF_from_LLH(p) for p in llh])
+    eci = np.array([ref_dcmECI2ECEF(ti).T.dot(p) for ti, p in zip(t, ecef)])
+    vel = rng.normal(0.0, 1000.0, (N, 3))
+    thrust = rng.uniform(0.0, 2e5, N)
+    mass = rng.uniform(500.0, 2e4, N)
+    return t, llh, ecef, eci, vel, thrust, mass
+
+
+def test_frames_match_scalar_reference():
+    t, llh, ecef, eci, vel, thrust, mass = flight_states()
+    assert np.array_equal(ct.dcmECI2ECEF(t), np.array([ref_dcmECI2ECEF(ti) for ti in t]))
+    assert np.array_equal(ct.dcmECEF2NED(llh), np.array([ref_dcmECEF2NED(p) for p in llh]))
+    assert np.array_equal(ct.posLLH(ecef), np.array([ref_posLLH(p) for p in ecef]))
+    assert np.array_equal(ct.posECEF_from_LLH(llh), ecef)
+    dcm = ct.dcmECI2NED(ct.dcmECEF2NED(llh), ct.dcmECI2ECEF(t))
+    assert np.array_equal(dcm, np.array([ref_dcmECEF2NED(p).dot(ref_dcmECI2ECEF(ti)) for p, ti in zip(llh, t)]))
+    assert np.array_equal(ct.posECEF(ct.dcmECI2ECEF(t), eci), np.array([ref_dcmECI2ECEF(ti).dot(p) for ti, p in zip(t, eci)]))
+
+
+def test_iip_and_antenna_match_scalar_reference():
+    t, llh, ecef, eci, vel, thrust, mass = flight_states()
+    vel[:, 2] = -np.abs(vel[:, 2])  # climbing, tau is real
+    assert np.array_equal(ct.posLLH_IIP(t, eci, vel), np.array([ref_posLLH_IIP(*args) for args in zip(t, eci, vel)]))
+    radius = ct.radius_IIP(t, eci, vel, 2.0, thrust, mass)
+    assert np.array_equal(radius, np.array([ref_radius_IIP(ti, p, v, 2.0, f, m)
+                                            for ti, p, v, f, m in zip(t, eci, vel, thrust, mass)]))
+    antenna = np.array([42.5039248, 143.44954216, 25.0])
+    batched = ct.antenna_param(antenna, llh)
+    scalar = np.array([ref_antenna_param(antenna, p) for p in llh]).T
+    for b, s in zip(batched, scalar):
+        assert np.array_equal(b, s)
+    other = llh[::-1]
+    assert np.allclose(ct.distance_surface(llh, other),
+                       [ref_distance_surface(a, b) for a, b in zip(llh, other)], rtol=1e-12, atol=1e-6)
+
+
+def test_single_vector():
+    t, llh, ecef, eci, vel, thrust, mass = flight_states(1)
+    assert np.array_equal(ct.posLLH(ecef[0]), ref_posLLH(ecef[0]))
+    assert np.array_equal(ct.dcmECI2ECEF(t[0]), ref_dcmECI2ECEF(t[0]))
+    assert np.array_equal(ct.posECEF_from_LLH(llh[0]), ecef[0])
+    assert ct.posLLH(ecef[0]).shape == (3,)
+    assert ct.dcmECEF2NED(llh[0]).shape == (3, 3)
+
+
+def test_antenna_param_of_stations():
+    t, llh, ecef, eci, vel, thrust, mass = flight_states()
+    stations = np.array([[42.5039248, 143.44954216, 25.0], [30.4, 130.97, 10.0], [-10.0, 20.0, 0.0]])
+    batched = ct.antenna_param(stations[:, None, :], llh)
+    for k, station in enumerate(stations):
+        for b, s in zip(batched, ct.antenna_param(station, llh)):
+            assert b.shape == (len(stations), len(llh))
+            assert np.array_equal(b[k], s)
+
+
+def test_topocentric():
+    t, llh, ecef, eci, vel, thrust, mass = flight_states()
+    stations = np.array([[42.5039248, 143.44954216, 25.0], [30.4, 130.97, 10.0]])
+    azimuth, elevation, distance = ct.topocentric(stations[:, None, :], ecef)
+    assert azimuth.shape == (2, len(llh))
+    for k, station in enumerate(stations):
+        rel = ecef - ref_posECEF_from_LLH(station)
+        ned = np.array([ref_dcmECEF2NED(station).dot(r) for r in rel])
+        assert np.allclose(distance[k], np.linalg.norm(rel, axis=1))
+        assert np.allclose(np.sin(np.deg2rad(elevation[k])), -ned[:, 2] / np.linalg.norm(rel, axis=1))
+        assert np.allclose(np.deg2rad(azimuth[k]) % (2 * np.pi), np.arctan2(ned[:, 1], ned[:, 0]) % (2 * np.pi))
+    # straight up and on the horizon
+    above = ct.posECEF_from_LLH(np.array([42.5039248, 143.44954216, 1e5]))
+    assert np.isclose(ct.topocentric(stations[0], above)[1], 90.0)
+    assert np.isclose(ct.topocentric(stations[0], above)[2], 1e5 - 25.0)
+
+
+def test_round_trip_and_orthonormal():
+    t, llh, ecef, eci, vel, thrust, mass = flight_states()
+    back = ct.posLLH(ct.posECEF_from_LLH(llh))
+    # Bowring's closed form is within a few mm up to 400 km altitude
+    assert np.allclose(back[:, :2], llh[:, :2], rtol=0.0, atol=1e-7)
+    assert np.allclose(back[:, 2], llh[:, 2], rtol=0.0, atol=5e-3)
+    for dcm in [ct.dcmECI2ECEF(t), ct.dcmECEF2NED(llh)]:
+        assert np.allclose(np.matmul(dcm, np.swapaxes(dcm, -1, -2)), np.eye(3), rtol=0.0, atol=1e-12)
+    assert np.allclose(ct.posLLH(ecef, bitwise=False), ct.posLLH(ecef), rtol=1e-14, atol=1e-9)
+    # the engine rotation rate is passed explicitly
+    angle = np.arctan2(ct.dcmECI2ECEF(t, ct.omega_engine)[:, 0, 1], ct.dcmECI2ECEF(t, ct.omega_engine)[:, 0, 0])
+    assert np.allclose(angle, np.arctan2(np.sin(ct.omega_engine * t), np.cos(ct.omega_engine * t)), rtol=0.0, atol=1e-15)
+
+
+def benchmark(N=20000):
+    t, llh, ecef, eci, vel, thrust, mass = flight_states(N)
+    vel[:, 2] = -np.abs(vel[:, 2])
+    antenna = np.array([42.5039248, 143.44954216, 25.0])
+    cases = [
+        ("posLLH", lambda: [ref_posLLH(p) for p in ecef], lambda: ct.posLLH(ecef)),
+        ("dcmECEF2NED", lambda: [ref_dcmECEF2NED(p) for p in llh], lambda: ct.dcmECEF2NED(llh)),
+        ("posECEF_from_LLH", lambda: [ref_posECEF_from_LLH(p) for p in llh], lambda: ct.posECEF_from_LLH(llh)),
+        ("radius_IIP", lambda: [ref_radius_IIP(ti, p, v, 2.0, f, m) for ti, p, v, f, m in zip(t, eci, vel, thrust, mass)],
+         lambda: ct.radius_IIP(t, eci, vel, 2.0, thrust, mass)),
+        ("antenna_param", lambda: [ref_antenna_param(antenna, p) for p in llh], lambda: ct.antenna_param(antenna, llh)),
+    ]
+    print("{0:d} rows".format(N))
+    for name, scalar, batched in cases:
+        t0 = time.perf_counter()
+        scalar()
+        t1 = time.perf_counter()
+        batched()
+        t2 = time.perf_counter()
+        print("{0:18s} scalar {1:8.1f} [us/row]  batched {2:6.3f} [us/row]  x{3:.0f}".format(
+            name, (t1 - t0) / N * 1e6, (t2 - t1) / N * 1e6, (t1 - t0) / (t2 - t1)))
+
+
+if __name__ == '__main__':
+    test_frames_match_scalar_reference()
+    test_iip_and_antenna_match_scalar_reference()
+    test_single_vector()
+    test_antenna_param_of_stations()
+    test_topocentric()
+    test_round_trip_and_orthonormal()
+    benchmark()
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+iip test
+
+The IIP shifts of the Jacobian are compared with the IIP solves they replace,
+and python test_iip.py runs a micro benchmark of an azimuth sweep.
+
+Copyright (c) 2018 Interstellar Technologies Inc. All Rights Reserved.
+"""
+
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bin"))
+import coordinate_transform as ct
+import iip
+from test_coordinate_transform import flight_states
+
+
+def climbing_states(N=300, seed=0):
+    t, llh, ecef, eci, vel, thrust, mass = flight_states(N, seed)
+    vel[:, 2] = -np.abs(vel[:, 2])
+    return t, eci, vel, thrust, mass
+
+
+def solved_shift(t, eci, vel, center, direction, delta_v):
+    """ distance and azimuth from the IIP to the IIP of the perturbed velocity, one IIP solve """
+    moved = ct.posLLH_IIP(t, eci, vel + delta_v * np.asarray(direction))
+    azimuth, back_azimuth, distance = ct.g.inv(center[:, 1], center[:, 0], moved[:, 1], moved[:, 0])
+    return distance, azimuth
+
+
+def test_shift_matches_iip_solve():
+    t, eci, vel, thrust, mass = climbing_states()
+    center, jacobian = iip.iip_jacobian(t, eci, vel)
+    assert np.array_equal(center, ct.posLLH_IIP(t, eci, vel))
+    directions = iip.azimuth_directions([0.0, 45.0, 130.0, 270.0])
+    shift = iip.iip_shift(jacobian, directions, 10.0)
+    for m, direction in enumerate(directions):
+        distance, azimuth = solved_shift(t, eci, vel, center, direction, 10.0)
+        assert np.allclose(np.hypot(shift[:, m, 0], shift[:, m, 1]), distance, rtol=1e-3)
+        difference = (np.rad2deg(np.arctan2(shift[:, m, 1], shift[:, m, 0])) - azimuth + 180.0) % 360.0 - 180.0
+        assert np.all(np.abs(difference) < 1e-3)
+
+
+def test_linear_radius_matches_radius_IIP():
+    t, eci, vel, thrust, mass = climbing_states()
+    sweep = iip.iip_sweep(t, eci, vel, 2.0, thrust, mass, Nazimuth=8)
+    assert np.allclose(sweep["IIP linear radius(m)"], ct.radius_IIP(t, eci, vel, 2.0, thrust, mass), rtol=1e-2)
+    # the sweep has the magnitude of [1,1,0] and covers its azimuth (45 deg)
+    assert np.all(sweep["IIP sweep radius(m)"] >= sweep["IIP linear radius(m)"] * (1.0 - 1e-9))
+
+
+def coast_states(N=20, seed=1):
+    """ ECI states of suborbital coasts: 50-300 km altitude, 1-5 km/s climbing or falling """
+    rng = np.random.default_rng(seed)
+    llh = np.stack([rng.uniform(-60.0, 60.0, N), rng.uniform(-180.0, 180.0, N), rng.uniform(5e4, 3e5, N)], axis=1)
+    t = rng.uniform(0.0, 600.0, N)
+    eci = np.matmul(np.swapaxes(ct.dcmECI2ECEF(t), 1, 2), ct.posECEF_from_LLH(llh)[:, :, None])[:, :, 0]
+    up = eci / np.linalg.norm(eci, axis=1)[:, None]
+    horizontal = np.cross(up, rng.normal(size=(N, 3)))
+    horizontal /= np.linalg.norm(horizontal, axis=1)[:, None]
+    speed = rng.uniform(1000.0, 5000.0, N)
+    flight_path = np.deg2rad(rng.uniform(-40.0, 60.0, N))
+    vel = speed[:, None] * (np.cos(flight_path)[:, None] * horizontal + np.sin(flight_path)[:, None] * up)
+    return t, eci, vel
+
+
+def integrated_IIP(t, eci, vel, step=0.05):
+    """ point mass RK4 down to the WGS84 ellipsoid, the impact interpolated between the steps """
+    def acc(r):
+        return -iip.mu * r / np.linalg.norm(r, axis=1)[:, None] ** 3
+    r, v, now = eci.copy(), vel.copy(), t.copy()
+    altitude = ct.posLLH(ct.posECEF(ct.dcmECI2ECEF(now, ct.omega_engine), r))[:, 2]
+    impact = np.full(eci.shape, np.nan)
+    t_impact = np.full(t.shape, np.nan)
+    active = np.ones(len(t), dtype=bool)
+    while np.any(active):
+        k1r, k1v = v, acc(r)
+        k2r, k2v = v + 0.5 * step * k1v, acc(r + 0.5 * step * k1r)
+        k3r, k3v = v + 0.5 * step * k2v, acc(r + 0.5 * step * k2r)
+        k4r, k4v = v + step * k3v, acc(r + step * k3r)
+        r_new = r + step / 6.0 * (k1r + 2 * k2r + 2 * k3r + k4r)
+        v_new = v + step / 6.0 * (k1v + 2 * k2v + 2 * k3v + k4v)
+        altitude_new = ct.posLLH(ct.posECEF(ct.dcmECI2ECEF(now + step, ct.omega_engine), r_new))[:, 2]
+        landed = active & (altitude_new < 0.0)
+        w = altitude[landed] / (altitude[landed] - altitude_new[landed])
+        t_impact[landed] = now[landed] + w * step
+        impact[landed] = r[landed] + w[:, None] * (r_new[landed] - r[landed])
+        active &= ~landed
+        r, v, now, altitude = r_new, v_new, now + step, altitude_new
+    return ct.posLLH(ct.posECEF(ct.dcmECI2ECEF(t_impact, ct.omega_engine), impact)), t_impact
+
+
+def test_kepler_IIP_matches_integration():
+    t, eci, vel = coast_states()
+    llh, t_impact = iip.kepler_IIP(t, eci, vel)
+    reference, t_reference = integrated_IIP(t, eci, vel)
+    assert np.all(np.isfinite(t_impact))
+    assert np.allclose(t_impact, t_reference, rtol=0.0, atol=1e-2)
+    assert np.allclose(llh[:, :2], reference[:, :2], rtol=0.0, atol=1e-5)
+    assert np.allclose(llh[:, 2], 0.0, atol=1e-3)
+
+
+def test_kepler_IIP_no_impact_and_drag():
+    t, eci, vel = coast_states()
+    # escape, circular orbit above the ground
+    vel[0] = 12000.0 * eci[0] / np.linalg.norm(eci[0])
+    horizontal = np.cross(eci[1], [0.0, 0.0, 1.0])
+    vel[1] = np.sqrt(iip.mu / np.linalg.norm(eci[1])) * horizontal / np.linalg.norm(horizontal)
+    llh, t_impact = iip.kepler_IIP(t, eci, vel)
+    assert np.all(np.isnan(t_impact[:2])) and np.all(np.isnan(llh[:2]))
+    vacuum, t_vacuum = llh[2:], t_impact[2:]
+    dragged, t_dragged = iip.kepler_IIP(t[2:], eci[2:], vel[2:], ballistic_coef=100.0)
+    assert np.all(np.isfinite(t_dragged))
+    # the drag slows the fall down and shortens the range
+    assert np.all(t_dragged > t_vacuum)
+    start = ct.posLLH(ct.posECEF(ct.dcmECI2ECEF(t[2:]), eci[2:]))
+    assert np.all(ct.distance_surface(start, dragged) < ct.distance_surface(start, vacuum))
+
+
+def benchmark(N=2000, Nazimuth=36):
+    t, eci, vel, thrust, mass = climbing_states(N)
+    delta_v = thrust / mass * 2.0
+    directions = iip.azimuth_directions(np.arange(Nazimuth) * 360.0 / Nazimuth)
+    t0 = time.perf_counter()
+    center = ct.posLLH_IIP(t, eci, vel)
+    for direction in directions:
+        solved_shift(t, eci, vel, center, direction, delta_v[:, None])
+    t1 = time.perf_counter()
+    center, jacobian = iip.iip_jacobian(t, eci, vel)
+    iip.iip_shift(jacobian, directions, delta_v)
+    t2 = time.perf_counter()
+    t3 = time.perf_counter()
+    iip.kepler_IIP(*coast_states(N * 10))
+    t4 = time.perf_counter()
+    print("{0:d} rows: Keplerian IIP {1:.3f} [s]".format(N * 10, t4 - t3))
+    print("{0:d} rows x {1:d} azimuths: IIP solves {2:.3f} [s]  Jacobian {3:.3f} [s]  x{4:.0f}".format(
+        N, Nazimuth, t1 - t0, t2 - t1, (t1 - t0) / (t2 - t1)))
+
+
+if __name__ == '__main__':
+    test_shift_matches_iip_solve()
+    test_linear_radius_matches_radius_IIP()
+    test_kepler_IIP_matches_integration()
+    test_kepler_IIP_no_impact_and_drag()
+    benchmark()
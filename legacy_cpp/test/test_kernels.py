@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+kernels test
+
+The row loops of kernels.py (run as Python when Numba is not installed) are
+compared with the batched NumPy code they replace, and python test_kernels.py
+runs a benchmark on campaign size inputs.
+
+Copyright (c) 2018 Interstellar Technologies Inc. All Rights Reserved.
+"""
+
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bin"))
+import coordinate_transform as ct
+import iip
+import kernels
+from test_coordinate_transform import flight_states
+from test_iip import coast_states
+
+
+def python_loop(kernel):
+    """ the kernel as Python, compiled or not """
+    return getattr(kernel, "py_func", kernel)
+
+
+def table_walk(x_grid, y_grid, data, x, y):
+    """ DATA_2D.func of rf_link.py """
+    ind_x = next(i for i, val in enumerate(x_grid) if x < val)
+    ratio_x = (x - x_grid[ind_x - 1]) / (x_grid[ind_x] - x_grid[ind_x - 1])
+    ind_y = next(i for i, val in enumerate(y_grid) if y < val)
+    ratio_y = (y - y_grid[ind_y - 1]) / (y_grid[ind_y] - y_grid[ind_y - 1])
+    y1 = data[ind_y - 1][ind_x - 1] * (1 - ratio_x) + data[ind_y - 1][ind_x] * ratio_x
+    y2 = data[ind_y][ind_x - 1] * (1 - ratio_x) + data[ind_y][ind_x] * ratio_x
+    return y1 * (1 - ratio_y) + y2 * ratio_y
+
+
+def gain_table(seed=0):
+    rng = np.random.default_rng(seed)
+    x_grid = np.arange(0.0, 181.0, 5.0)
+    y_grid = np.arange(0.0, 361.0, 10.0)
+    return x_grid, y_grid, rng.normal(0.0, 5.0, (len(y_grid), len(x_grid)))
+
+
+def test_posLLH_loop_matches_numpy():
+    t, llh, ecef, eci, vel, thrust, mass = flight_states(200)
+    assert np.allclose(python_loop(kernels._posLLH_rows)(ecef), ct.posLLH(ecef), rtol=0.0, atol=1e-8)
+    assert np.allclose(kernels.posLLH(ecef), ct.posLLH(ecef), rtol=0.0, atol=1e-8)
+
+
+def test_kepler_loop_matches_numpy():
+    t, eci, vel = coast_states(50)
+    # escape and circular orbit above the ground have no crossing
+    vel[0] = 12000.0 * eci[0] / np.linalg.norm(eci[0])
+    horizontal = np.cross(eci[1], [0.0, 0.0, 1.0])
+    vel[1] = np.sqrt(iip.mu / np.linalg.norm(eci[1])) * horizontal / np.linalg.norm(horizontal)
+    enabled, kernels.enabled = kernels.enabled, False
+    try:
+        expected = iip.kepler_crossing(t, eci, vel, 1.0e5)
+    finally:
+        kernels.enabled = enabled
+    altitude = np.full(len(t), 1.0e5)
+    result = python_loop(kernels._kepler_crossing_rows)(t, eci, vel, altitude, 4)
+    assert np.array_equal(np.isnan(result[0]), np.isnan(expected[0]))
+    assert np.all(np.isnan(result[0][:2]))
+    for value, reference in zip(result, expected):
+        assert np.allclose(value, reference, rtol=1e-12, atol=1e-6, equal_nan=True)
+
+
+def test_table_lookup_matches_walk():
+    x_grid, y_grid, data = gain_table()
+    rng = np.random.default_rng(1)
+    x = rng.uniform(0.0, 179.9, 500)
+    y = rng.uniform(0.0, 359.9, 500)
+    expected = [table_walk(x_grid, y_grid, data, a, b) for a, b in zip(x, y)]
+    assert np.allclose(kernels.table_lookup(x_grid, y_grid, data, x, y), expected, rtol=0.0, atol=1e-12)
+    assert np.allclose(python_loop(kernels._table_lookup_rows)(x_grid, y_grid, data, x, y), expected,
+                       rtol=0.0, atol=1e-12)
+    # the last grid point and beyond: the last cell is extended
+    edge = kernels.table_lookup(x_grid, y_grid, data, [180.0, 185.0], 0.0)
+    assert np.isclose(edge[0], data[0, -1])
+    assert np.isclose(edge[1], data[0, -1] + (data[0, -1] - data[0, -2]))
+
+
+def benchmark(N=1000000, Nkepler=200000, Nwalk=20000):
+    print("numba : " + ("enabled" if kernels.enabled else "not used (NumPy)"))
+    t, llh, ecef, eci, vel, thrust, mass = flight_states(N)
+    x_grid, y_grid, data = gain_table()
+    rng = np.random.default_rng(2)
+    x = rng.uniform(0.0, 179.9, N)
+    y = rng.uniform(0.0, 359.9, N)
+    t_kepler, eci_kepler, vel_kepler = coast_states(Nkepler)
+    if kernels.enabled:
+        # コンパイル時間を除く
+        kernels.posLLH(ecef[:10])
+        kernels.kepler_crossing(t_kepler[:10], eci_kepler[:10], vel_kepler[:10], 0.0, 4)
+        kernels.table_lookup(x_grid, y_grid, data, x[:10], y[:10])
+    enabled = kernels.enabled
+    timing = {}
+    for backend in [False, True] if enabled else [False]:
+        kernels.enabled = backend
+        t0 = time.perf_counter()
+        kernels.posLLH(ecef)
+        t1 = time.perf_counter()
+        iip.kepler_crossing(t_kepler, eci_kepler, vel_kepler)
+        t2 = time.perf_counter()
+        kernels.table_lookup(x_grid, y_grid, data, x, y)
+        t3 = time.perf_counter()
+        timing[backend] = [t1 - t0, t2 - t1, t3 - t2]
+    kernels.enabled = enabled
+    t0 = time.perf_counter()
+    for a, b in zip(x[:Nwalk], y[:Nwalk]):
+        table_walk(x_grid, y_grid, data, a, b)
+    walk = (time.perf_counter() - t0) * N / Nwalk
+    for k, name in enumerate(["posLLH {0:d} rows".format(N), "kepler_crossing {0:d} rows".format(Nkepler),
+                              "table_lookup {0:d} points".format(N)]):
+        line = "{0:s}: NumPy {1:.3f} [s]".format(name, timing[False][k])
+        if enabled:
+            line += "  Numba {0:.3f} [s]  x{1:.1f}".format(timing[True][k], timing[False][k] / timing[True][k])
+        print(line)
+    print("DATA_2D.func walk {0:d} points (extrapolated): {1:.1f} [s]  x{2:.0f} of table_lookup".format(
+        N, walk, walk / timing[enabled][2]))
+
+
+if __name__ == '__main__':
+    test_posLLH_loop_matches_numpy()
+    test_kepler_loop_matches_numpy()
+    test_table_lookup_matches_walk()
+    benchmark()
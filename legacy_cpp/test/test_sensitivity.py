@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+sensitivity test
+
+The Sobol indices of the Ishigami function (a = 7, b = 0.1) on the Saltelli
+plan of monte_carlo.py are compared with the analytic indices, the plan with
+its definition (AB_i is A with the column i of B), the bootstrap intervals
+with the indices of every resample computed one at a time, the base samples
+with a nan with the indices without them, and normal_ppf with
+statistics.NormalDist in the central, tail and far tail branches.
+
+Copyright (c) 2018 Interstellar Technologies Inc. All Rights Reserved.
+"""
+
+import os
+import sys
+from statistics import NormalDist
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bin"))
+import sensitivity
+from monte_carlo import saltelli_plan, normal_ppf
+
+a, b = 7.0, 0.1
+
+
+def ishigami(X):
+    return np.sin(X[:, 0]) + a * np.sin(X[:, 1]) ** 2 + b * X[:, 2] ** 4 * np.sin(X[:, 0])
+
+
+def ishigami_indices():
+    """ analytic first order and total indices """
+    V1 = 0.5 * (1.0 + b * np.pi ** 4 / 5.0) ** 2
+    V2 = a ** 2 / 8.0
+    V13 = b ** 2 * np.pi ** 8 * (1.0 / 18.0 - 1.0 / 50.0)
+    V = V1 + V2 + V13
+    return np.array([V1, V2, 0.0]) / V, np.array([V1 + V13, V2, V13]) / V
+
+
+def test_saltelli_plan_blocks():
+    Ndim, Nbase = 4, 50
+    U = saltelli_plan(Ndim, Nbase, seed=3)
+    assert U.shape == (Nbase * (Ndim + 2), Ndim) and np.all((U >= 0.0) & (U < 1.0))
+    A, B, AB = sensitivity.split_plan(U, Ndim, Nbase)
+    assert AB.shape == (Ndim, Nbase, Ndim)
+    assert not np.any(A == B)
+    for i in range(Ndim):
+        assert np.array_equal(AB[i], U[(2 + i) * Nbase:(3 + i) * Nbase])
+        expected = A.copy()
+        expected[:, i] = B[:, i]
+        assert np.array_equal(AB[i], expected), i
+    assert np.array_equal(saltelli_plan(Ndim, Nbase, seed=3), U)
+
+
+def test_ishigami_indices():
+    Ndim, Nbase = 3, 1 << 14
+    U = saltelli_plan(Ndim, Nbase, seed=0)
+    f = ishigami(np.pi * (2.0 * U - 1.0))
+    # the same function with a large mean: the centered estimators do not lose it
+    Y = np.stack([f, f + 1.0e4], axis=1)
+    Y_A, Y_B, Y_AB = sensitivity.split_plan(Y, Ndim, Nbase)
+    first, total = sensitivity.sobol_indices(Y_A, Y_B, Y_AB)
+    assert first.shape == (Ndim, 2) and total.shape == (Ndim, 2)
+    S, ST = ishigami_indices()
+    assert np.allclose(S, [0.3139, 0.4424, 0.0], atol=1e-4) and np.allclose(ST, [0.5576, 0.4424, 0.2437], atol=1e-4)
+    first_conf, total_conf = sensitivity.bootstrap_sobol(Y_A, Y_B, Y_AB, Nboot=100, seed=1)
+    for t in range(2):
+        assert np.all(np.abs(first[:, t] - S) < 0.03), first[:, t]
+        assert np.all(np.abs(total[:, t] - ST) < 0.03), total[:, t]
+        # within the intervals (widened for the 6 indices tested together)
+        assert np.all(np.abs(first[:, t] - S) < 2.0 * first_conf[:, t])
+        assert np.all(np.abs(total[:, t] - ST) < 2.0 * total_conf[:, t])
+    assert np.allclose(first[:, 0], first[:, 1], rtol=0.0, atol=1e-9)
+    assert np.all(first_conf > 0.0) and np.all(first_conf < 0.05) and np.all(total_conf < 0.05)
+
+
+def test_bootstrap_matches_single_resamples():
+    Ndim, Nbase, Nboot = 3, 64, 37
+    U = saltelli_plan(Ndim, Nbase, seed=2)
+    Y = ishigami(np.pi * (2.0 * U - 1.0))[:, None]
+    Y_A, Y_B, Y_AB = sensitivity.split_plan(Y, Ndim, Nbase)
+    first_conf, total_conf = sensitivity.bootstrap_sobol(Y_A, Y_B, Y_AB, Nboot, seed=5, confidence=0.9, chunk=8)
+    index = np.random.default_rng(5).integers(0, Nbase, (Nboot, Nbase))
+    replicates = [sensitivity.sobol_indices(Y_A[i], Y_B[i], Y_AB[:, i]) for i in index]
+    for k, conf in enumerate([first_conf, total_conf]):
+        values = np.array([r[k] for r in replicates])
+        expected = 0.5 * (np.percentile(values, 95.0, axis=0) - np.percentile(values, 5.0, axis=0))
+        assert np.allclose(conf, expected, rtol=1e-12, atol=1e-15), k
+
+
+def test_nan_cases_are_left_out():
+    Ndim, Nbase = 3, 200
+    U = saltelli_plan(Ndim, Nbase, seed=4)
+    f = ishigami(np.pi * (2.0 * U - 1.0))
+    Y = np.stack([f, f ** 2, np.full(len(f), 2.0)], axis=1)
+    Y_A, Y_B, Y_AB = sensitivity.split_plan(Y, Ndim, Nbase)
+    first, total = sensitivity.sobol_indices(Y_A, Y_B, Y_AB)
+    # failed cases in every block: the base samples 3, 10, 57 and 120
+    Y_A[3, 0], Y_B[10, 1], Y_AB[2, 57, 0], Y_AB[0, 120, :] = np.nan, np.nan, np.nan, np.nan
+    with_nan = sensitivity.sobol_indices(Y_A, Y_B, Y_AB)
+    for t, bad in enumerate([[3, 57, 120], [10, 120], [120]]):
+        keep = ~np.isin(np.arange(Nbase), bad)
+        expected = sensitivity.sobol_indices(Y_A[keep][:, t:t + 1], Y_B[keep][:, t:t + 1], Y_AB[:, keep][:, :, t:t + 1])
+        for k in range(2):
+            assert np.allclose(with_nan[k][:, t:t + 1], expected[k], rtol=1e-12, atol=0.0, equal_nan=True), t
+    # a constant output has no variance to share
+    assert np.all(np.isnan(first[:, 2])) and np.all(np.isnan(total[:, 2]))
+    assert np.all(np.isfinite(first[:, :2]))
+    # no valid base sample at all
+    Y_A[:, 0] = np.nan
+    assert np.all(np.isnan(np.stack(sensitivity.sobol_indices(Y_A, Y_B, Y_AB))[:, :, 0]))
+
+
+def test_rank_correlation():
+    rng = np.random.default_rng(6)
+    X = rng.normal(0.0, 1.0, (300, 3))
+    Y = np.stack([np.exp(X[:, 0]) + 0.1 * rng.normal(0.0, 1.0, 300), X[:, 1] ** 3 - X[:, 2],
+                  np.round(X[:, 2])], axis=1)
+    X[5, 1], Y[17, 0] = np.nan, np.nan
+    rho = sensitivity.rank_correlation(X, Y)
+    valid = np.all(np.isfinite(X), axis=1) & np.all(np.isfinite(Y), axis=1)
+    expected = pd.DataFrame(np.concatenate([X, Y], axis=1)[valid]).corr(method="spearman").to_numpy()[:3, 3:]
+    assert np.allclose(rho, expected, rtol=1e-12, atol=1e-14)
+    # a monotone transform of an input is a correlation of 1
+    assert np.isclose(sensitivity.rank_correlation(X[:, :1], np.exp(X[:, :1]))[0, 0], 1.0)
+
+
+def test_normal_ppf_matches_normal_dist():
+    u = np.concatenate([np.linspace(0.075, 0.925, 101),  # central branch (|u - 0.5| <= 0.425)
+                        np.logspace(-10.5, np.log10(0.07), 60),  # tail
+                        1.0 - np.logspace(-10.5, np.log10(0.07), 60),
+                        [1e-12, 5e-12, 1.2e-11]])  # far tail (r > 5)
+    expected = np.array([NormalDist().inv_cdf(p) for p in u])
+    assert np.allclose(normal_ppf(u), expected, rtol=1e-14, atol=1e-14)
+    # scalar, and kept off the infinite tails
+    assert isinstance(normal_ppf(0.3), float) and normal_ppf(0.3) == NormalDist().inv_cdf(0.3)
+    assert normal_ppf(0.0) == NormalDist().inv_cdf(1e-12) and normal_ppf(1.0) == NormalDist().inv_cdf(1.0 - 1e-12)
+
+
+if __name__ == '__main__':
+    test_saltelli_plan_blocks()
+    test_ishigami_indices()
+    test_bootstrap_matches_single_resamples()
+    test_nan_cases_are_left_out()
+    test_rank_correlation()
+    test_normal_ppf_matches_normal_dist()
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+stat_bootstrap test
+
+The high/low values of fetch_stat_array are compared with fetch_stat of
+stat_covariance.py column by column, and the order statistics found from the
+multinomial counts (cumulative counts in the sorted order) with the same
+resamples drawn directly: the cases repeated by their counts and sorted again.
+Small N with ties and nan, for the three fetch modes.
+
+Copyright (c) 2018 Interstellar Technologies Inc. All Rights Reserved.
+"""
+
+import os
+import sys
+import math
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bin"))
+import stat_bootstrap
+import stat_covariance
+
+modes = ["constant", "constant high", "variable"]
+
+
+def campaign(seed, N=15, M=6):
+    """ (N, M) values with ties, nan in some cases and one column without any value """
+    rng = np.random.default_rng(seed)
+    X = np.round(rng.normal(0.0, 1.0, (N, M)), 1)
+    X[rng.random((N, M)) < 0.2] = np.nan
+    X[:, 0] = np.nan
+    X[:, 1] = rng.integers(0, 3, N)
+    return X
+
+
+def settings(N, p=0.8):
+    """ (fetch mode, number of sample, Nfetch, probability) as stat_covariance.py """
+    Nfetch = int((N - math.ceil(N * p)) / 2.0) + 1
+    return [(mode, N, Nfetch, p) for mode in modes]
+
+
+def direct(X, counts, setting):
+    """ high/low of the resamples, the cases repeated by their counts """
+    high, low = [], []
+    for c in counts:
+        h, l = stat_bootstrap.fetch_stat_array(X[np.repeat(np.arange(len(X)), c)], *setting)
+        high.append(h)
+        low.append(l)
+    return np.array(high), np.array(low)
+
+
+def test_fetch_stat_array_matches_fetch_stat():
+    X = campaign(0)
+    for setting in settings(len(X)):
+        high, low = stat_bootstrap.fetch_stat_array(X, *setting)
+        assert np.isnan(high[0]) and np.isnan(low[0])
+        for j in range(1, X.shape[1]):
+            expected = stat_covariance.fetch_stat(pd.Series(X[:, j]), *setting)
+            assert np.array_equal([high[j], low[j]], expected, equal_nan=True), (setting[0], j)
+
+
+def test_multinomial_matches_direct_resampling():
+    X = campaign(1)
+    N = len(X)
+    order = np.argsort(X, axis=0, kind="stable")
+    Xs = np.take_along_axis(X, order, axis=0)
+    for setting in settings(N):
+        stat_bootstrap._init_worker(Xs, order, ~np.isnan(Xs), setting)
+        high, low = stat_bootstrap._bootstrap_batch((7, 50))
+        # the same counts as the batch
+        counts = np.random.default_rng(7).multinomial(N, np.full(N, 1.0 / N), size=50)
+        expected_high, expected_low = direct(X, counts, setting)
+        assert np.array_equal(high, expected_high, equal_nan=True), setting[0]
+        assert np.array_equal(low, expected_low, equal_nan=True), setting[0]
+
+
+def test_confidence_interval():
+    X = campaign(2)
+    N, M = X.shape
+    replicates, confidence = 30, 0.9
+    for setting in settings(N):
+        # batches of 7 resamples, in process and over a pool
+        out = stat_bootstrap.bootstrap(X, *setting, replicates=replicates, confidence=confidence, seed=3,
+                                       batch_elements=7 * N * M)
+        pooled = stat_bootstrap.bootstrap(X, *setting, replicates=replicates, confidence=confidence, seed=3,
+                                          Nproc=2, batch_elements=7 * N * M)
+        for k in out:
+            assert np.array_equal(out[k], pooled[k], equal_nan=True), k
+
+        seeds = np.random.SeedSequence(3).spawn(5)
+        counts = np.concatenate([np.random.default_rng(s).multinomial(N, np.full(N, 1.0 / N), size=n)
+                                 for s, n in zip(seeds, [7, 7, 7, 7, 2])])
+        high_b, low_b = direct(X, counts, setting)
+        high, low = stat_bootstrap.fetch_stat_array(X, *setting)
+        assert np.array_equal(out["high"], high, equal_nan=True) and np.array_equal(out["low"], low, equal_nan=True)
+        for name, values, reference in [("high", high_b, high), ("low", low_b, low)]:
+            for j in np.flatnonzero(~np.isnan(reference)):
+                finite = values[:, j][~np.isnan(values[:, j])]
+                lower, upper = np.percentile(finite, [5.0, 95.0])
+                assert np.allclose([out[name + "_ci_lower"][j], out[name + "_ci_upper"][j]], [lower, upper],
+                                   rtol=1e-12, atol=1e-15), (name, j)
+            # no interval where the campaign has no value
+            assert np.all(np.isnan(out[name + "_ci_lower"][np.isnan(reference)]))
+
+
+if __name__ == '__main__':
+    test_fetch_stat_array_matches_fetch_stat()
+    test_multinomial_matches_direct_resampling()
+    test_confidence_interval()
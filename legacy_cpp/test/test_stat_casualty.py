@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+stat_casualty test
+
+A synthetic ESRI binary grid (both byte orders, corner and center headers,
+read in blocks of a few rows) is compared with the array written to it, the
+cells of the points with the floor of their offsets, the cell areas with the
+integral of cos(lat) over the cells, and Ec of impact points put in known
+cells with the sum of probability * density * casualty area.
+
+Copyright (c) 2018 Interstellar Technologies Inc. All Rights Reserved.
+"""
+
+import os
+import sys
+import tempfile
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bin"))
+import stat_casualty
+
+nrows, ncols, cellsize, xll, yll = 40, 60, 0.25, 130.0, 30.0
+
+
+def population(seed=0):
+    """ density [1/km2] with nodata, a negative and a nan cell """
+    rng = np.random.default_rng(seed)
+    data = rng.uniform(0.0, 5000.0, (nrows, ncols)).astype(np.float32)
+    data[rng.random((nrows, ncols)) < 0.1] = -9999.0
+    data[3, 7], data[5, 9] = -1.0, np.nan
+    return data
+
+
+def write_raster(directory, data, byteorder="LSBFIRST", center=False):
+    """ population.flt + .hdr, the corner or the center of the lower left cell in the header """
+    filename = os.path.join(directory, "population.flt")
+    data.astype(">f4" if byteorder == "MSBFIRST" else "<f4").tofile(filename)
+    x, y = ("xllcenter", "yllcenter") if center else ("xllcorner", "yllcorner")
+    offset = 0.5 * cellsize if center else 0.0
+    with open(os.path.join(directory, "population.hdr"), "w") as fo:
+        fo.write("ncols {0:d}\nnrows {1:d}\n{2:s} {3:.17g}\n{4:s} {5:.17g}\ncellsize {6:.17g}\n"
+                 "NODATA_value -9999\nbyteorder {7:s}\n".format(ncols, nrows, x, xll + offset, y, yll + offset,
+                                                                cellsize, byteorder))
+    return filename
+
+
+def expected_density(data):
+    """ [1/m2], nodata, nan and negative cells are empty """
+    value = data.astype(np.float64)
+    value[~np.isfinite(value) | (value < 0)] = 0.0
+    return value * 1e-6
+
+
+def test_raster_reader():
+    data = population()
+    rows, cols = np.divmod(np.arange(nrows * ncols), ncols)
+    for byteorder, center in [("LSBFIRST", False), ("MSBFIRST", True)]:
+        with tempfile.TemporaryDirectory() as directory:
+            # 3行ずつのブロックで読む
+            raster = stat_casualty.PopulationRaster(write_raster(directory, data, byteorder, center),
+                                                    block_bytes=4 * ncols * 3)
+            assert (raster.nrows, raster.ncols, raster.block_rows) == (nrows, ncols, 3)
+            assert np.isclose(raster.xll, xll, rtol=0.0, atol=1e-12) and np.isclose(raster.yll, yll, rtol=0.0, atol=1e-12)
+            # the cells in a random order, some outside
+            order = np.random.default_rng(1).permutation(len(rows))
+            row, col = np.append(rows[order], -1), np.append(cols[order], -1)
+            value = raster.density(row, col)
+            assert np.array_equal(value[:-1], expected_density(data)[rows[order], cols[order]]) and value[-1] == 0.0
+
+    with tempfile.TemporaryDirectory() as directory:
+        raster = stat_casualty.PopulationRaster(write_raster(directory, data))
+        rng = np.random.default_rng(2)
+        i, j = rng.integers(0, nrows, 500), rng.integers(0, ncols, 500)
+        lon = xll + (j + rng.uniform(0.01, 0.99, 500)) * cellsize
+        lat = yll + (nrows - 1 - i + rng.uniform(0.01, 0.99, 500)) * cellsize
+        row, col = raster.cell(lon, lat)
+        assert np.array_equal(row, i) and np.array_equal(col, j)
+        # the longitudes are taken modulo 360
+        assert np.array_equal(raster.cell(lon - 360.0, lat)[1], j)
+        row, col = raster.cell([xll - 0.1, xll + 1.0, xll + 1.0, xll + ncols * cellsize + 0.1, np.nan, xll + 1.0],
+                               [yll + 1.0, yll - 0.1, yll + nrows * cellsize + 0.1, yll + 1.0, yll + 1.0, np.nan])
+        assert np.all(row == -1) and np.all(col == -1)
+
+        # cell area: R^2 * integral of cos(lat) over the cell
+        area = raster.cell_area(np.arange(nrows))
+        for r in [0, 17, nrows - 1]:
+            phi = np.deg2rad(np.linspace(yll + (nrows - 1 - r) * cellsize, yll + (nrows - r) * cellsize, 2001))
+            f = np.cos(phi)
+            expected = stat_casualty.R_earth ** 2 * np.deg2rad(cellsize) * np.sum(0.5 * (f[1:] + f[:-1]) * np.diff(phi))
+            assert np.isclose(area[r], expected, rtol=1e-9)
+        band = 2.0 * np.pi * stat_casualty.R_earth ** 2 * (np.sin(np.deg2rad(yll + nrows * cellsize)) -
+                                                            np.sin(np.deg2rad(yll)))
+        assert np.isclose(area.sum() * ncols, band * ncols * cellsize / 360.0, rtol=1e-12)
+
+        # persons per cell
+        raster = stat_casualty.PopulationRaster(raster.data.filename, unit="count")
+        assert np.allclose(raster.density(rows, cols), expected_density(data)[rows, cols] * 1e6 / area[rows],
+                           rtol=1e-12, atol=0.0)
+
+
+def test_expected_casualty():
+    data = population(3)
+    rng = np.random.default_rng(4)
+    # N = 1000 cases: 300 + 200 + 150 in three cells, 100 in a nodata cell, 250 outside
+    cells = [(4, 10, 300), (25, 33, 200), (39, 0, 150)]
+    data[12, 50] = -9999.0
+    lon, lat = [], []
+    for i, j, n in cells + [(12, 50, 100)]:
+        lon.append(xll + (j + rng.uniform(0.01, 0.99, n)) * cellsize)
+        lat.append(yll + (nrows - 1 - i + rng.uniform(0.01, 0.99, n)) * cellsize)
+    lon.append(rng.uniform(100.0, 120.0, 250))
+    lat.append(rng.uniform(-10.0, 10.0, 250))
+    lon, lat = np.concatenate(lon), np.concatenate(lat)
+    fragments = [{"name": "1st stage", "casualty area(m2)": 150.0}, {"name": "fairing", "casualty area(m2)": 30.0, "number": 2}]
+    area = stat_casualty.casualty_area(fragments)
+    assert area == 210.0 and stat_casualty.casualty_area(None, 5.0) == 5.0
+
+    with tempfile.TemporaryDirectory() as directory:
+        raster = stat_casualty.PopulationRaster(write_raster(directory, data), block_bytes=4 * ncols)
+        ec, df = stat_casualty.expected_casualty(raster, lon, lat, area)
+    expected = sum(n / 1000.0 * float(data[i, j]) * 1e-6 * area for i, j, n in cells)
+    assert np.isclose(ec, expected, rtol=1e-12)
+    assert np.isclose(df["Ec"].sum(), ec, rtol=1e-12) and np.all(np.diff(df["Ec"]) <= 0.0)
+    assert len(df) == 4 and np.isclose(df["probability"].sum(), 0.75)
+    # the cells are reported at their centers
+    for i, j, n in cells:
+        k = np.flatnonzero(np.isclose(df["lon(deg)"], xll + (j + 0.5) * cellsize) &
+                           np.isclose(df["lat(deg)"], yll + (nrows - i - 0.5) * cellsize))
+        assert len(k) == 1 and np.isclose(df["probability"][k[0]], n / 1000.0)
+        assert np.isclose(df["density(1/km2)"][k[0]], data[i, j], rtol=1e-12)
+
+
+if __name__ == '__main__':
+    test_raster_reader()
+    test_expected_casualty()
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+stat_corridor test
+
+Corridor.signed_distance is compared with the geodesic distance (pyproj) of
+every point to the densely sampled center line or polygon boundary: on a
+sphere of R_mean it is the cross-track distance itself (down to the sampling),
+on WGS84 within the 0.5 % of the header. The blocks with the segments pruned
+by their bounding caps give the same values as all the segments at once, the
+right of the flight direction and the outside of the polygon are positive.
+
+Copyright (c) 2018 Interstellar Technologies Inc. All Rights Reserved.
+"""
+
+import os
+import sys
+import numpy as np
+from pyproj import Geod
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bin"))
+import stat_corridor
+from stat_corridor import R_mean
+from stat_footprint import points_in_ring
+from stat_jettison_area import local_projection
+
+sphere = Geod(a=R_mean, b=R_mean)
+wgs84 = Geod(ellps="WGS84")
+spacing = 200.0  # [m]
+
+
+def densify(geod, vertices):
+    """ lon, lat [deg] of the points every spacing [m] along the geodesics of the vertices, and their azimuth """
+    lon, lat, azimuth = [], [], []
+    for (lon1, lat1), (lon2, lat2) in zip(vertices[:-1], vertices[1:]):
+        a12, a21, d = geod.inv(lon1, lat1, lon2, lat2)
+        points = np.array(geod.npts(lon1, lat1, lon2, lat2, int(d // spacing)) + [(lon2, lat2)])
+        lon.extend([lon1] + list(points[:, 0]))
+        lat.extend([lat1] + list(points[:, 1]))
+        # azimuth of the line at the points (the last one is the start of the next segment)
+        azimuth.extend(geod.inv(np.append(lon1, points[:-1, 0]), np.append(lat1, points[:-1, 1]),
+                                points[:, 0], points[:, 1])[0].tolist() + [np.nan])
+    return np.array(lon), np.array(lat), np.array(azimuth)
+
+
+def nearest_sample(geod, samples, lon, lat):
+    """ distance [m] of the points to the nearest sample, its index and the azimuth to the point """
+    s_lon, s_lat = samples[0], samples[1]
+    distance = np.empty(len(lon))
+    index = np.empty(len(lon), dtype=np.int64)
+    for k in range(len(lon)):
+        az, back, d = geod.inv(s_lon, s_lat, np.full(len(s_lon), lon[k]), np.full(len(s_lon), lat[k]))
+        index[k] = np.argmin(d)
+        distance[k] = d[index[k]]
+    azimuth = geod.inv(s_lon[index], s_lat[index], lon, lat)[0]
+    return distance, index, azimuth
+
+
+def check_distance(distance, samples, lon, lat):
+    """ |distance| against the sampled geodesic distances on the sphere and on WGS84 """
+    reference, index, azimuth = nearest_sample(sphere, samples, lon, lat)
+    # the nearest sample is at most half a spacing along the line from the nearest point
+    d = np.abs(distance)
+    assert np.all(reference >= d - 1e-6 * d - 1e-3)
+    assert np.all(reference - d <= np.minimum(0.5 * spacing, spacing ** 2 / (8.0 * np.maximum(d, 1.0))) + 1e-3)
+    ellipsoid = nearest_sample(wgs84, samples, lon, lat)[0]
+    assert np.all(np.abs(ellipsoid - d) <= 0.005 * d + spacing)
+    return index, azimuth
+
+
+def centerline():
+    """ a zigzag of 40 vertices over ~2000 km to the east north east """
+    rng = np.random.default_rng(0)
+    lon = 130.0 + np.arange(40) * 0.5
+    lat = 30.0 + np.arange(40) * 0.15 + rng.uniform(-0.2, 0.2, 40)
+    return np.stack([lon, lat], axis=1)
+
+
+def test_centerline_distance():
+    vertices = centerline()
+    corridor = stat_corridor.Corridor(centerline=vertices, half_width=[10e3, 30e3])
+    rng = np.random.default_rng(1)
+    # along the line up to 300 km off it, beyond the ends, and far from it
+    k = rng.integers(0, len(vertices) - 1, 300)
+    t = rng.uniform(0.0, 1.0, 300)
+    lon = vertices[k, 0] + t * (vertices[k + 1, 0] - vertices[k, 0]) + rng.normal(0.0, 0.3, 300)
+    lat = vertices[k, 1] + t * (vertices[k + 1, 1] - vertices[k, 1]) + rng.normal(0.0, 1.0, 300) ** 3
+    lon = np.concatenate([lon, rng.uniform(120.0, 160.0, 60), [np.nan, 140.0]])
+    lat = np.concatenate([lat, rng.uniform(20.0, 45.0, 60), [30.0, np.nan]])
+
+    distance = corridor.signed_distance(lon, lat, block=32)
+    assert np.all(np.isnan(distance[-2:])) and np.all(np.isfinite(distance[:-2]))
+    # the blocks test only the segments whose caps can hold the nearest point
+    for block in [1, 2048]:
+        assert np.allclose(corridor.signed_distance(lon, lat, block), distance, rtol=1e-12, atol=1e-6, equal_nan=True)
+    everything = corridor._nearest(stat_corridor.unit_vectors(lon[:-2], lat[:-2]), np.arange(len(corridor.A))) * R_mean
+    assert np.allclose(everything, distance[:-2], rtol=1e-12, atol=1e-6)
+
+    samples = densify(sphere, vertices)
+    index, azimuth = check_distance(distance[:-2], samples, lon[:-2], lat[:-2])
+    # right of the flight direction is positive (beside the line, off the ends the side is of the last segment)
+    line = samples[2][index]
+    beside = np.isfinite(line) & (index > 0) & (index < len(samples[0]) - 1) & (np.abs(distance[:-2]) > 1e3)
+    right = (azimuth - line) % 360.0 < 180.0
+    assert np.count_nonzero(beside) > 150
+    assert np.array_equal(distance[:-2][beside] > 0.0, right[beside])
+
+    # exceedance: left half width 10 km, right 30 km
+    excess = corridor.exceedance(distance)
+    assert np.allclose(excess, np.maximum(distance - 30e3, -10e3 - distance), equal_nan=True)
+    assert np.all(excess[(distance > -10e3) & (distance < 30e3)] < 0.0)
+
+
+def test_polygon_distance():
+    rng = np.random.default_rng(2)
+    # a convex polygon of ~150 km around the date line, lon given in [-180, 180)
+    angle = np.sort(rng.uniform(0.0, 2.0 * np.pi, 12))
+    center = (179.5, -20.0)
+    lon, lat = wgs84.fwd(np.full(12, center[0]), np.full(12, center[1]), np.rad2deg(angle), np.full(12, 150e3))[:2]
+    vertices = np.stack([lon, lat], axis=1)
+    corridor = stat_corridor.Corridor(polygon=vertices)
+
+    lon, lat = wgs84.fwd(np.full(400, center[0]), np.full(400, center[1]), rng.uniform(0.0, 360.0, 400),
+                         rng.uniform(0.0, 400e3, 400))[:2]
+    distance = corridor.signed_distance(lon, lat, block=16)
+    assert np.allclose(corridor.signed_distance(lon, lat), distance, rtol=1e-12, atol=1e-6)
+    ring = np.concatenate([vertices, vertices[:1]])
+    check_distance(distance, densify(sphere, ring), lon, lat)
+
+    # outside of the polygon is positive, the in-ring test on the local plane (edges close to straight)
+    proj = local_projection(ring[:, 0], ring[:, 1])
+    x, y = proj(lon, lat)
+    inside = points_in_ring(x, y, np.stack(proj(ring[:, 0], ring[:, 1]), axis=1))
+    clear = np.abs(distance) > 2e3
+    assert np.count_nonzero(inside & clear) > 50 and np.count_nonzero(~inside & clear) > 50
+    assert np.array_equal(distance[clear] > 0.0, ~inside[clear])
+    assert np.array_equal(corridor.exceedance(distance), distance)
+
+
+if __name__ == '__main__':
+    test_centerline_distance()
+    test_polygon_distance()
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+stat_datapoint_batch test
+
+Two local missions under a prefix are run through the pool: the datapoint
+files of every mission and of the results directory are the lines of
+stat_datapoint.read_case of every case, in caseNo order. A missing case file
+and a broken one (a column of datapoint.json missing) are both left out of
+their mission without stopping the batch, and a mission without
+datapoint.json is skipped.
+
+Copyright (c) 2018 Interstellar Technologies Inc. All Rights Reserved.
+"""
+
+import os
+import sys
+import json
+import tempfile
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bin"))
+import stat_datapoint
+import stat_datapoint_batch
+
+sample_points = OrderedDict([("landing_time", ["time(s)", "altitude(m)"]), ("MAX", ["altitude(m)"]),
+                             ("1.5", ["altitude(m)", "mass(kg)"])])
+
+
+def case_frame(seed, N=12):
+    rng = np.random.default_rng(seed)
+    t = np.arange(N) * 0.5
+    return pd.DataFrame({"time(s)": t, "mass(kg)": 100.0 - t, "altitude(m)": rng.uniform(0.0, 1e4, N)})
+
+
+def write_mission(directory, Ntask, datapoint=True):
+    for d in ["raw/inp", "raw/output", "stat/inp", "stat/output"]:
+        os.makedirs(os.path.join(directory, d))
+    with open(os.path.join(directory, "raw", "inp", "mc.json"), "w") as fo:
+        json.dump({"Ntask": Ntask, "suffix": "test"}, fo)
+    if datapoint:
+        with open(os.path.join(directory, "stat", "inp", "datapoint.json"), "w") as fo:
+            json.dump({"sample points": sample_points}, fo)
+    for caseNo in range(1, Ntask + 1):
+        case_frame(caseNo).to_csv(os.path.join(directory, "raw", "output", "case{0:05d}_test_dynamics_1.csv".format(
+            caseNo)), index=False)
+
+
+def expected_lines(directory, caseNo, tmpfile):
+    return stat_datapoint.read_case(os.path.join(directory, "raw", "output", "case{0:05d}_test_dynamics_1.csv".format(
+        caseNo)), caseNo, sample_points, tmpfile)
+
+
+def test_result_suffix():
+    assert stat_datapoint_batch.result_suffix("2019/cutoff/MOMO3/10s") == "MOMO3_10s"
+    assert stat_datapoint_batch.result_suffix("2019/cutoff/MOMO3/") == "MOMO3"
+    assert stat_datapoint_batch.result_suffix("/tmp/missions/MOMO3") == "MOMO3"
+
+
+def test_write_mission():
+    with tempfile.TemporaryDirectory() as directory:
+        mission = os.path.join(directory, "cutoff", "m1")
+        os.makedirs(os.path.join(mission, "stat", "output"))
+        work = os.path.join(directory, "work")
+        os.makedirs(os.path.join(work, "output"))
+        results = os.path.join(directory, "results")
+        os.makedirs(results)
+        setting = {"mission": mission, "missionpath": mission, "work_directory": work, "sample_points": sample_points}
+        cases = {3: ["3,a,b\n", "3,c\n", "3,d,e\n"], 1: ["1,f,g\n", "1,h\n", "1,i,j\n"]}
+        stat_datapoint_batch.write_mission(setting, cases, results)
+        for j, k in enumerate(sample_points):
+            body = "caseNo," + ",".join(sample_points[k]) + "\n" + cases[1][j] + cases[3][j]
+            for f in [os.path.join(work, "output", "datapoint_" + k + ".csv"),
+                      os.path.join(results, "datapoint_" + k + "_m1.csv"),
+                      os.path.join(mission, "stat", "output", "datapoint_" + k + ".csv")]:
+                with open(f) as fp:
+                    assert fp.read() == body, f
+
+
+def test_local_missions():
+    with tempfile.TemporaryDirectory() as directory:
+        prefix = os.path.join(directory, "prefix")
+        write_mission(os.path.join(prefix, "A"), 5)
+        write_mission(os.path.join(prefix, "B"), 4)
+        write_mission(os.path.join(prefix, "C"), 2, datapoint=False)
+        # B: case 2 missing, case 3 without the altitude
+        os.remove(os.path.join(prefix, "B", "raw", "output", "case00002_test_dynamics_1.csv"))
+        case_frame(3).drop(columns="altitude(m)").to_csv(
+            os.path.join(prefix, "B", "raw", "output", "case00003_test_dynamics_1.csv"), index=False)
+
+        cache = os.path.join(directory, "cache")
+        settings, cases = stat_datapoint_batch.run_batch(prefix, cache, 2)
+        assert [s["mission"] for s in settings] == [os.path.join(prefix, "A"), os.path.join(prefix, "B")]
+        assert sorted(cases[0]) == [1, 2, 3, 4, 5] and sorted(cases[1]) == [1, 4]
+        tmpfile = os.path.join(directory, "tmp.csv")
+        for name, case_list in [("A", [1, 2, 3, 4, 5]), ("B", [1, 4])]:
+            lines = [expected_lines(os.path.join(prefix, name), caseNo, tmpfile) for caseNo in case_list]
+            for j, k in enumerate(sample_points):
+                body = "caseNo," + ",".join(sample_points[k]) + "\n" + "".join(line[j] for line in lines)
+                for f in [os.path.join(prefix, name, "stat", "output", "datapoint_" + k + ".csv"),
+                          os.path.join(prefix, "results", "datapoint_" + k + "_" + name + ".csv")]:
+                    with open(f) as fp:
+                        assert fp.read() == body, f
+        assert not os.path.exists(os.path.join(prefix, "results", "datapoint_MAX_C.csv"))
+        # the broken case leaves no work file in the cache
+        work = [s["cache_directory"] for s in settings][1]
+        assert not any(f.startswith("tmp_") for f in os.listdir(work))
+
+
+if __name__ == '__main__':
+    test_result_suffix()
+    test_write_mission()
+    test_local_missions()
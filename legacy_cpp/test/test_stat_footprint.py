@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""
+stat_footprint test
+
+The kde contours of gaussian impact points are compared with the ellipses of
+the normal distribution (widened by the kernel), the convex hull with the
+definition (every point left of every edge), and the occupancy cells and
+their outline with the points: all points counted once, the outline keeps
+one cell around every point and the hole of a ring of points. The concave
+hull of a C-shaped cloud is a simple polygon of the points holding all of
+them, with the area of the C and the gap of the C outside.
+
+Copyright (c) 2018 Interstellar Technologies Inc. All Rights Reserved.
+"""
+
+import os
+import sys
+import numpy as np
+from pyproj import Proj
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bin"))
+import stat_footprint
+from stat_footprint import points_in_ring, signed_area
+from stat_jettison_area import local_projection
+
+center = (141.5, 40.0)
+
+
+def impact_points(x, y):
+    """ lon, lat [deg] of the points x, y [m] of the plane around the center """
+    return Proj(proj="aeqd", lat_0=center[1], lon_0=center[0], ellps="WGS84")(x, y, inverse=True)
+
+
+def inside_polygons(polygons, x, y):
+    inside = np.zeros(len(x), dtype=bool)
+    for polygon in polygons:
+        for ring in polygon:
+            inside ^= points_in_ring(x, y, ring)
+    return inside
+
+
+def distance_to_rings(rings, x, y):
+    """ distance [m] of the points to the nearest edge of the rings """
+    d = np.full(len(x), np.inf)
+    for ring in rings:
+        a, b = ring[:-1], ring[1:]
+        ab = b - a
+        t = ((x[:, None] - a[:, 0]) * ab[:, 0] + (y[:, None] - a[:, 1]) * ab[:, 1]) / np.sum(ab * ab, axis=1)
+        t = np.clip(t, 0.0, 1.0)
+        d = np.minimum(d, np.min(np.hypot(a[:, 0] + t * ab[:, 0] - x[:, None],
+                                          a[:, 1] + t * ab[:, 1] - y[:, None]), axis=1))
+    return d
+
+
+def test_kde_matches_normal_distribution():
+    rng = np.random.default_rng(0)
+    sx, sy, N = 8000.0, 3000.0, 40000
+    lon, lat = impact_points(rng.normal(0.0, sx, N), rng.normal(0.0, sy, N))
+    fp = stat_footprint.footprint(lon, lat, probability=[50.0, 90.0, 99.0])
+    proj = local_projection(lon, lat)
+    x, y = proj(lon, lat)
+    hx, hy = fp["bandwidth(m)"]
+    for p, coverage, polygons in fp["kde"]:
+        rings = [[np.stack(proj(r[:, 0], r[:, 1]), axis=1) for r in polygon] for polygon in polygons]
+        inside = inside_polygons(rings, x, y)
+        # 点の割合も格子上の coverage も確率に近い
+        assert abs(100.0 * np.mean(inside) - p) < 1.5, p
+        assert abs(coverage - p) < 1.5, p
+        # the normal distribution convolved with the kernel: sx^2 + hx^2
+        area = sum(signed_area(r) for polygon in rings for r in polygon)
+        expected = np.pi * np.sqrt((sx ** 2 + hx ** 2) * (sy ** 2 + hy ** 2)) * -2.0 * np.log(1.0 - p * 1e-2)
+        assert abs(area / expected - 1.0) < 0.08, (p, area / expected)
+    assert len(fp["kde"][0][2]) == 1
+
+
+def test_convex_hull():
+    rng = np.random.default_rng(1)
+    x = np.concatenate([rng.normal(0.0, 1.0, 5000), np.linspace(-4.0, 4.0, 9), [0.0, 0.0]])
+    y = np.concatenate([rng.normal(0.0, 1.0, 5000), np.full(9, -4.0), [5.0, 5.0]])
+    hull = stat_footprint.convex_hull(x, y)
+    assert np.array_equal(hull[0], hull[-1]) and signed_area(hull) > 0.0
+    a, b = hull[:-1], np.roll(hull[:-1], -1, axis=0)
+    cross = (b[:, 0] - a[:, 0]) * (y[:, None] - a[:, 1]) - (b[:, 1] - a[:, 1]) * (x[:, None] - a[:, 0])
+    assert np.all(cross >= -1e-9)
+    # the vertices are the points and strictly convex (no collinear vertex, no duplicate)
+    points = set(zip(x, y))
+    assert all((p[0], p[1]) in points for p in hull)
+    c = np.roll(b, -1, axis=0)
+    assert np.all((b[:, 0] - a[:, 0]) * (c[:, 1] - a[:, 1]) - (b[:, 1] - a[:, 1]) * (c[:, 0] - a[:, 0]) > 0.0)
+    assert [-4.0, -4.0] in hull.tolist() and [4.0, -4.0] in hull.tolist() and [0.0, 5.0] in hull.tolist()
+
+    # the hull of the footprint contains all the impact points
+    lon, lat = impact_points(rng.normal(0.0, 5000.0, 2000), rng.normal(0.0, 5000.0, 2000))
+    fp = stat_footprint.footprint(lon, lat, probability=[50.0])
+    assert np.all(inside_polygons(fp["convex"], lon, lat) |
+                  (distance_to_rings(fp["convex"][0], lon, lat) < 1e-9))
+
+
+def test_occupancy_and_outline():
+    rng = np.random.default_rng(2)
+    # 円環状の点: 外形線は穴を持つ
+    N, c = 12000, 1000.0
+    r, theta = rng.uniform(20e3, 40e3, N), rng.uniform(0.0, 2.0 * np.pi, N)
+    lon, lat = impact_points(r * np.cos(theta), r * np.sin(theta))
+    lon, lat = np.append(lon, np.nan), np.append(lat, 40.0)
+    fp = stat_footprint.footprint(lon, lat, probability=[50.0], cell_size=c)
+    assert fp["N"] == N and fp["cell size(m)"] == c
+    occupancy = fp["occupancy"]
+    assert occupancy["count"].sum() == N and np.isclose(occupancy["probability"].sum(), 1.0)
+
+    proj = local_projection(lon[:-1], lat[:-1])
+    x, y = proj(lon[:-1], lat[:-1])
+    cx, cy = proj(occupancy["lon(deg)"], occupancy["lat(deg)"])
+    # every point is in the cell of one center, the counts are the points of the cells
+    nearest = np.argmin(np.maximum(np.abs(x[:, None] - cx), np.abs(y[:, None] - cy)), axis=1)
+    assert np.all(np.maximum(np.abs(x - cx[nearest]), np.abs(y - cy[nearest])) <= 0.5 * c + 1e-6)
+    assert np.array_equal(np.bincount(nearest, minlength=len(cx)), occupancy["count"])
+    corners = np.stack(proj(occupancy["corners"][:, :, 0], occupancy["corners"][:, :, 1]), axis=2)
+    assert np.allclose(corners[:, 2] - corners[:, 0], c, rtol=0.0, atol=1e-3)
+
+    # outline: one polygon with the hole, one cell of margin around every point (the grid is padded)
+    assert len(fp["outline"]) == 1 and len(fp["outline"][0]) == 2
+    rings = [np.stack(proj(r[:, 0], r[:, 1]), axis=1) for r in fp["outline"][0]]
+    assert signed_area(rings[0]) > 0.0 and signed_area(rings[1]) < 0.0
+    assert np.all(inside_polygons([rings], x, y))
+    assert np.min(distance_to_rings(rings, x, y)) > 0.99 * c
+    assert not inside_polygons([rings], np.array([0.0, 5e3]), np.array([0.0, -8e3])).any()
+    geojson = stat_footprint.to_geojson("dynamics_1", fp)
+    kinds = [f["properties"]["kind"] for f in geojson["features"]]
+    assert kinds.count("occupancy outline") == 1 and kinds.count("occupancy") == len(cx)
+
+
+def test_concave_hull():
+    rng = np.random.default_rng(3)
+    N = 20000
+    r, theta = rng.uniform(20e3, 40e3, N), rng.uniform(0.0, 1.5 * np.pi, N)
+    x, y = r * np.cos(theta), r * np.sin(theta)
+    for length in [1e3, 4e3]:
+        hull = stat_footprint.concave_hull(x, y, length)
+        assert np.array_equal(hull[0], hull[-1]) and signed_area(hull) > 0.0
+        points = set(zip(x, y))
+        assert all((q[0], q[1]) in points for q in hull) and len(set(map(tuple, hull[:-1]))) == len(hull) - 1
+        # simple: no two edges cross
+        a, b = hull[:-1], hull[1:]
+        def side(u, v, w):
+            return (v[..., 0] - u[..., 0]) * (w[..., 1] - u[..., 1]) - (v[..., 1] - u[..., 1]) * (w[..., 0] - u[..., 0])
+        cross = (side(a[:, None], b[:, None], a[None, :]) * side(a[:, None], b[:, None], b[None, :]) < 0.0) & \
+                (side(a[None, :], b[None, :], a[:, None]) * side(a[None, :], b[None, :], b[:, None]) < 0.0)
+        assert not cross.any()
+        assert np.all(points_in_ring(x, y, hull) | (distance_to_rings([hull], x, y) < 1e-6))
+        # the C and not its gap: a quarter of the annulus and the center outside
+        assert abs(signed_area(hull) / (0.75 * np.pi * (40e3 ** 2 - 20e3 ** 2)) - 1.0) < 0.05, length
+        gap = np.array([0.0, 30e3 * np.cos(1.75 * np.pi), 12e3]), np.array([0.0, 30e3 * np.sin(1.75 * np.pi), -12e3])
+        assert not points_in_ring(gap[0], gap[1], hull).any()
+        assert np.max(np.hypot(*np.diff(hull, axis=0).T)) < 1.2 * length
+    # longer than the cloud: the convex hull
+    assert np.array_equal(stat_footprint.concave_hull(x, y, 200e3), stat_footprint.convex_hull(x, y))
+
+    lon, lat = impact_points(x, y)
+    fp = stat_footprint.footprint(lon, lat, probability=[50.0], cell_size=1000.0)
+    assert fp["concave length(m)"] == 4000.0
+    proj = local_projection(lon, lat)
+    ring = np.stack(proj(fp["concave"][0][0][:, 0], fp["concave"][0][0][:, 1]), axis=1)
+    px, py = proj(lon, lat)
+    assert np.all(points_in_ring(px, py, ring) | (distance_to_rings([ring], px, py) < 1e-3))
+    kinds = [f["properties"]["kind"] for f in stat_footprint.to_geojson("dynamics_1", fp)["features"]]
+    assert kinds.count("concave") == 1
+
+
+if __name__ == '__main__':
+    test_kde_matches_normal_distribution()
+    test_convex_hull()
+    test_occupancy_and_outline()
+    test_concave_hull()
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+stat_heatmap test
+
+The tiles made from the counts of the occupied cells (with the halo of the
+kernel) are compared with the histogram and the smoothing of the whole
+grid, and a grid of 6 x 10^11 cells is accumulated and written without
+allocating it.
+
+Copyright (c) 2018 Interstellar Technologies Inc. All Rights Reserved.
+"""
+
+import os
+import sys
+import tempfile
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bin"))
+import stat_heatmap
+import stat_footprint
+
+
+def read_tiles(df, heatmap):
+    """ the written tiles put back on the whole grid """
+    grid = np.zeros((heatmap.nrows, heatmap.ncols))
+    for _, t in df.iterrows():
+        block = np.fromfile(t["file"], dtype="<f4").reshape(int(t["nrows"]), int(t["ncols"]))
+        c0 = int(round((t["xllcorner"] - heatmap.xll) / heatmap.cellsize))
+        r0 = heatmap.nrows - int(round((t["yllcorner"] - heatmap.yll) / heatmap.cellsize)) - block.shape[0]
+        grid[r0:r0 + block.shape[0], c0:c0 + block.shape[1]] = block
+    return grid
+
+
+def test_tiles_match_whole_grid():
+    rng = np.random.default_rng(0)
+    lon = np.concatenate([rng.normal(140.0, 0.3, 3000), rng.normal(141.2, 0.05, 1000), [np.nan, 150.0]])
+    lat = np.concatenate([rng.normal(35.0, 0.2, 3000), rng.normal(35.5, 0.05, 1000), [35.0, np.nan]])
+    heatmap = stat_heatmap.ImpactHeatmap.around([138.5, 34.0, 142.0, 36.0], 0.01, 0.05)
+    # two workers merged
+    other = stat_heatmap.ImpactHeatmap(heatmap.xll, heatmap.yll, heatmap.cellsize, heatmap.ncols, heatmap.nrows)
+    heatmap.update(lon[:2500], lat[:2500])
+    other.update(lon[2500:], lat[2500:])
+    heatmap.merge(other)
+    assert heatmap.N == len(lon) and heatmap.outside == 2
+
+    row, col = heatmap.cell(lon, lat)
+    dense = np.zeros((heatmap.nrows, heatmap.ncols))
+    np.add.at(dense, (row[row >= 0], col[row >= 0]), 1.0)
+    assert len(heatmap.index) == np.count_nonzero(dense)
+    assert np.array_equal(heatmap.counts(0, heatmap.nrows, 0, heatmap.ncols), dense)
+
+    dy = stat_heatmap.R_mean * np.deg2rad(heatmap.cellsize)
+    dx = dy * np.cos(np.deg2rad(heatmap.yll + 0.5 * heatmap.nrows * heatmap.cellsize))
+    for bandwidth in [None, 5000.0]:
+        expected = dense / len(lon)
+        if bandwidth:
+            expected = stat_footprint.gaussian_smooth(stat_footprint.gaussian_smooth(expected, bandwidth / dx, 1),
+                                                      bandwidth / dy, 0)
+            expected = np.maximum(expected, 0.0)
+        assert np.allclose(heatmap.probability(bandwidth), expected, rtol=0.0, atol=1e-15)
+        area = heatmap.cell_area()
+        # (the FFT of the whole grid leaves ~1e-21 far from the points)
+        assert np.allclose(heatmap.density(bandwidth, 40, 90, 10, 20), expected[40:90, 10:20] / (area[40:90, None] * 1e-6),
+                           rtol=1e-9, atol=1e-12)
+        with tempfile.TemporaryDirectory() as directory:
+            df = heatmap.save_tiles(directory, bandwidth, tile=64)
+            grid = read_tiles(df, heatmap)
+            assert np.allclose(grid, expected.astype("<f4"), rtol=0.0, atol=1e-9)
+            # every tile with some probability is written (not the FFT noise of the whole grid)
+            written = set(zip(df["yllcorner"], df["xllcorner"]))
+            assert len(written) == len(df)
+            for r0 in range(0, heatmap.nrows, 64):
+                for c0 in range(0, heatmap.ncols, 64):
+                    if np.any(expected[r0:r0 + 64, c0:c0 + 64] > 1e-12):
+                        assert os.path.exists(os.path.join(directory, "r{0:03d}_c{1:03d}.flt".format(r0 // 64, c0 // 64)))
+            assert np.isclose(df["probability"].sum(), expected.sum(), rtol=1e-5)
+
+
+def test_large_grid_is_not_allocated():
+    # 0.0001 [deg] の格子で経度100度 x 緯度60度: 6e11 セル
+    heatmap = stat_heatmap.ImpactHeatmap.around([100.0, 0.0, 200.0, 60.0], 1e-4)
+    assert heatmap.ncols * heatmap.nrows > 5e11
+    rng = np.random.default_rng(1)
+    lon, lat = rng.uniform(100.0, 200.0, 2000), rng.uniform(0.0, 60.0, 2000)
+    for k in range(4):
+        heatmap.update(lon[k::4], lat[k::4])
+    assert heatmap.count.sum() == 2000 and len(heatmap.index) == 2000
+    row, col = heatmap.cell(lon, lat)
+    with tempfile.TemporaryDirectory() as directory:
+        df = heatmap.save_tiles(directory, None, tile=256)
+        assert len(df) == len(set(zip(row // 256, col // 256))) and np.isclose(df["probability"].sum(), 1.0)
+        assert pd.read_csv(os.path.join(directory, os.path.basename(df["file"][0]).replace(".flt", ".hdr")),
+                           sep=" ", header=None).shape == (7, 2)
+
+
+if __name__ == '__main__':
+    test_tiles_match_whole_grid()
+    test_large_grid_is_not_allocated()
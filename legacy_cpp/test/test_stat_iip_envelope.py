@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+stat_iip_envelope test
+
+IIP points of two steps are sampled from a rotated 2D normal distribution on
+the plane around a center moving to the east. The ellipse of every step
+holds the probability of the points (within the binomial error), the
+percentile scale of the normal points is the normal theory scale, and the
+swept hull of the two steps holds both ellipses. The same clouds moved
+across the date line give the same outlines and hulls shifted in longitude,
+continuous over +-180 deg.
+
+Copyright (c) 2018 Interstellar Technologies Inc. All Rights Reserved.
+"""
+
+import os
+import sys
+import numpy as np
+from pyproj import Proj
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bin"))
+import stat_iip_envelope
+import stat_jettison_area
+from stat_footprint import points_in_ring
+
+sigma = (12000.0, 4000.0)  # [m] major, minor
+azimuth = 60.0  # [deg] of the major axis from north
+probability = [50.0, 90.0, 99.0]
+
+
+def gaussian_steps(rng, center, N, step=30e3):
+    """ (2, N) lon, lat [deg] of the two steps, the second one step [m] to the east, wrapped to [-180, 180) """
+    proj = Proj(proj="aeqd", lat_0=center[1], lon_0=center[0], ellps="WGS84")
+    t = np.deg2rad(azimuth)
+    lon, lat = [], []
+    for shift in [0.0, step]:
+        a, b = rng.normal(0.0, sigma[0], N), rng.normal(0.0, sigma[1], N)
+        x, y = proj(a * np.sin(t) - b * np.cos(t) + shift, a * np.cos(t) + b * np.sin(t), inverse=True)
+        lon.append((x + 180.0) % 360.0 - 180.0)
+        lat.append(y)
+    return np.array(lon), np.array(lat), proj
+
+
+def inside(proj, ring, lon, lat):
+    """ points in the ring on the plane of proj, or on it (1 mm) """
+    x, y = proj(lon, lat)
+    rx, ry = proj(ring[:, 0], ring[:, 1])
+    a, b = np.stack([rx[:-1], ry[:-1]], axis=1), np.stack([rx[1:], ry[1:]], axis=1)
+    ab = b - a
+    s = np.clip(((x[:, None] - a[:, 0]) * ab[:, 0] + (y[:, None] - a[:, 1]) * ab[:, 1]) / np.sum(ab * ab, axis=1),
+                0.0, 1.0)
+    d = np.min(np.hypot(a[:, 0] + s * ab[:, 0] - x[:, None], a[:, 1] + s * ab[:, 1] - y[:, None]), axis=1)
+    return points_in_ring(x, y, np.stack([rx, ry], axis=1)) | (d < 1e-3)
+
+
+def on_hull(hull, points):
+    """ points inside or on the convex hull (counterclockwise) on the lon, lat plane """
+    a, b = hull[:-1], hull[1:]
+    cross = (b[:, 0] - a[:, 0]) * (points[:, 1:] - a[:, 1]) - (b[:, 1] - a[:, 1]) * (points[:, :1] - a[:, 0])
+    return np.all(cross >= -1e-12, axis=1)
+
+
+def test_coverage_of_gaussian_steps():
+    rng = np.random.default_rng(0)
+    N = 20000
+    lon, lat, proj = gaussian_steps(rng, (139.0, 31.0), N)
+    env = stat_iip_envelope.iip_envelope(lon, lat, probability, Nellipse=721)
+    assert np.array_equal(env["cases"], [N, N])
+    assert np.allclose(env["sigma(m)"], sigma, rtol=4.0 / np.sqrt(2.0 * N))
+    assert np.all(np.abs((env["azimuth(deg)"] - azimuth + 90.0) % 180.0 - 90.0) < 0.5)
+
+    new_lon, new_lat = gaussian_steps(rng, (139.0, 31.0), N)[:2]
+    k_normal = stat_jettison_area.ellipse_scale(np.array(probability) * 1e-2)
+    for k, p in enumerate(np.array(probability) * 1e-2):
+        # 4 sigma of the binomial, and the error of the fitted sigma on the outline
+        tolerance = 100.0 * (4.0 * np.sqrt(p * (1.0 - p) / N) + 0.005 * (1.0 - p))
+        for t in range(2):
+            ellipse = env["ellipse"][k, t]
+            assert np.allclose(ellipse[0], ellipse[-1])
+            assert abs(env["coverage(%)"][k, t] - 100.0 * p) < tolerance, (p, t)
+            assert abs(100.0 * np.mean(inside(proj, ellipse, new_lon[t], new_lat[t])) - 100.0 * p) < tolerance, (p, t)
+            # the empirical quantile of the normal points: the normal theory scale (error of the quantile)
+            dk = 4.0 * np.sqrt(p * (1.0 - p) / N) / (k_normal[k] * np.exp(-0.5 * k_normal[k] ** 2))
+            assert abs(env["scale"][k, t] - k_normal[k]) < dk + 0.005 * k_normal[k], (p, t)
+            # the percentile contour is the ellipse scaled to it
+            center = np.array(proj(*env["center"][t]))
+            e = np.stack(proj(ellipse[:, 0], ellipse[:, 1]), axis=1) - center
+            c = env["percentile"][k, t]
+            c = np.stack(proj(c[:, 0], c[:, 1]), axis=1) - center
+            assert np.allclose(c, e * env["scale"][k, t] / k_normal[k], rtol=0.0, atol=1.0)
+
+    # the swept hull of the two steps holds both ellipses
+    for kind in ["ellipse", "percentile"]:
+        for k in range(len(probability)):
+            swept = stat_iip_envelope.swept_envelope(env[kind][k])
+            assert [t for t, hull in swept] == [0]
+            hull = swept[0][1]
+            assert np.allclose(hull[0], hull[-1])
+            assert np.all(on_hull(hull, env[kind][k].reshape(-1, 2))), (kind, k)
+
+
+def test_date_line():
+    N = 4000
+    # the same clouds around 0 deg and across the date line
+    reference = gaussian_steps(np.random.default_rng(1), (-0.1, -20.0), N, step=40e3)
+    lon, lat, proj = gaussian_steps(np.random.default_rng(1), (179.9, -20.0), N, step=40e3)
+    assert np.any(lon < 0.0) and np.any(lon > 0.0)
+    env_reference = stat_iip_envelope.iip_envelope(reference[0], reference[1], probability)
+    env = stat_iip_envelope.iip_envelope(lon, lat, probability)
+    assert np.allclose(env["sigma(m)"], env_reference["sigma(m)"], rtol=1e-6)
+    assert np.allclose(env["scale"], env_reference["scale"], rtol=1e-6)
+    for kind in ["ellipse", "percentile"]:
+        # continuous longitudes around the center of the step, the outline of the reference shifted by 180 deg
+        assert np.all(np.ptp(env[kind][..., 0], axis=-1) < 2.0)
+        assert np.allclose((env[kind][..., 0] - env_reference[kind][..., 0]) % 360.0, 180.0, rtol=0.0, atol=1e-6)
+        assert np.allclose(env[kind][..., 1], env_reference[kind][..., 1], rtol=0.0, atol=1e-6)
+        for k in range(len(probability)):
+            swept = stat_iip_envelope.swept_envelope(env[kind][k])
+            swept_reference = stat_iip_envelope.swept_envelope(env_reference[kind][k])
+            hull = swept[0][1]
+            assert np.ptp(hull[:, 0]) < 2.0 and np.any(hull[:, 0] > 180.0)
+            assert np.allclose(hull - [180.0, 0.0], swept_reference[0][1], rtol=0.0, atol=1e-6)
+            # both outlines of the step in the hull, taken around the first point as the hull
+            outlines = env[kind][k].reshape(-1, 2)
+            outlines[:, 0] = (outlines[:, 0] - outlines[0, 0] + 180.0) % 360.0 - 180.0 + outlines[0, 0]
+            assert np.all(on_hull(hull, outlines)), (kind, k)
+
+
+if __name__ == '__main__':
+    test_coverage_of_gaussian_steps()
+    test_date_line()
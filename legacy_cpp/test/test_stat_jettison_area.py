@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+stat_jettison_area test
+
+Impact points are sampled from a rotated 2D normal distribution on the plane
+around a center. The sigma, azimuth and center of jettison_area are compared
+with the distribution, and at every configured probability the ellipse and
+the box hold the probability: the coverage of the points and the fraction
+of new samples inside the outlines, within the binomial error.
+
+Copyright (c) 2018 Interstellar Technologies Inc. All Rights Reserved.
+"""
+
+import os
+import sys
+from statistics import NormalDist
+import numpy as np
+from pyproj import Proj
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bin"))
+import stat_jettison_area
+from stat_footprint import points_in_ring
+
+center = (139.0, 31.0)
+sigma = (12000.0, 4000.0)  # [m] major, minor
+azimuth = 60.0  # [deg] of the major axis from north
+
+
+def gaussian_points(rng, N):
+    """ lon, lat [deg] of N points of the normal distribution, and the plane of the center """
+    proj = Proj(proj="aeqd", lat_0=center[1], lon_0=center[0], ellps="WGS84")
+    a, b = rng.normal(0.0, sigma[0], N), rng.normal(0.0, sigma[1], N)
+    t = np.deg2rad(azimuth)
+    lon, lat = proj(a * np.sin(t) - b * np.cos(t), a * np.cos(t) + b * np.sin(t), inverse=True)
+    return lon, lat, proj
+
+
+def fraction_inside(proj, outline, lon, lat):
+    x, y = proj(lon, lat)
+    return np.mean(points_in_ring(x, y, np.stack(proj(outline[:, 0], outline[:, 1]), axis=1)))
+
+
+def test_coverage_of_gaussian_samples():
+    rng = np.random.default_rng(0)
+    N = 20000
+    lon, lat, proj = gaussian_points(rng, N)
+    area = stat_jettison_area.jettison_area(np.append(lon, np.nan), np.append(lat, 30.0), Nellipse=721, Nedge=50)
+    assert area["N"] == N
+    # 分布のパラメータ: sigma は標本誤差 (1 / sqrt(2N)) の4倍以内
+    assert np.allclose(area["sigma(m)"], sigma, rtol=4.0 / np.sqrt(2.0 * N))
+    assert abs((area["azimuth(deg)"] - azimuth + 90.0) % 180.0 - 90.0) < 0.5
+    x, y = proj(*area["center"])
+    assert np.hypot(x, y) < 4.0 * sigma[0] / np.sqrt(N)
+
+    new_lon, new_lat = gaussian_points(rng, N)[:2]
+    assert [level["probability(%)"] for level in area["levels"]] == stat_jettison_area.default_probability
+    for level in area["levels"]:
+        p = level["probability(%)"] * 1e-2
+        # 4 sigma of the binomial, and the error of the fitted sigma on the outline
+        tolerance = 100.0 * (4.0 * np.sqrt(p * (1.0 - p) / N) + 0.005 * (1.0 - p))
+        for kind in ["ellipse", "box"]:
+            assert abs(level[kind + " coverage(%)"] - 100.0 * p) < tolerance, (kind, p)
+            outline = level["box outline" if kind == "box" else "ellipse"]
+            assert np.allclose(outline[0], outline[-1])
+            assert abs(100.0 * fraction_inside(proj, outline, new_lon, new_lat) - 100.0 * p) < tolerance, (kind, p)
+        # the box is the rectangle of the principal axes: the corners of the box outline
+        assert np.allclose(level["box"], level["box outline"][::50], rtol=0.0, atol=1e-9)
+        assert np.allclose(level["ellipse semi axes(m)"], stat_jettison_area.ellipse_scale(p) * area["sigma(m)"])
+        assert np.allclose(level["box half widths(m)"], stat_jettison_area.box_scale(p) * area["sigma(m)"])
+
+
+def test_scales():
+    # chi-square with 2 degrees of freedom, and the square of the normal interval
+    for p in [0.5, 0.9, 0.99, 0.999]:
+        k = stat_jettison_area.ellipse_scale(p)
+        assert np.isclose(1.0 - np.exp(-0.5 * k * k), p, rtol=1e-12)
+        b = stat_jettison_area.box_scale(p)
+        assert np.isclose((NormalDist().cdf(b) - NormalDist().cdf(-b)) ** 2, p, rtol=1e-12)
+
+
+if __name__ == '__main__':
+    test_coverage_of_gaussian_samples()
+    test_scales()
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+stat_keepout test
+
+The cell classification and the bucketed query are compared with the brute
+force crossing number test (stat_footprint.points_in_ring over all the points
+and rings) on random polygons with holes and zones across the date line.
+
+Copyright (c) 2018 Interstellar Technologies Inc. All Rights Reserved.
+"""
+
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bin"))
+import stat_keepout
+from stat_footprint import points_in_ring
+
+
+def star(rng, center, r_min, r_max, n):
+    """ random simple (star shaped) closed ring of lon, lat [deg] around the center """
+    angle = np.sort(rng.uniform(0.0, 2.0 * np.pi, n))
+    radius = rng.uniform(r_min, r_max, n)
+    ring = np.column_stack([center[0] + radius * np.cos(angle), center[1] + radius * np.sin(angle)])
+    return np.concatenate([ring, ring[:1]])
+
+
+def random_zones(seed):
+    """
+    Returns:
+        list of (name, rings as in the files, rings with continuous longitudes)
+    """
+    rng = np.random.default_rng(seed)
+    zones = []
+    for k in range(6):
+        center = [rng.uniform(-170.0, 170.0), rng.uniform(-60.0, 60.0)]
+        rings = [star(rng, center, 4.0, 10.0, rng.integers(5, 80))]
+        for h in range(rng.integers(0, 3)):
+            # holes within the inner radius of the shell
+            hole = [center[0] + rng.uniform(-1.5, 1.5), center[1] + rng.uniform(-1.5, 1.5)]
+            rings.append(star(rng, hole, 0.3, 1.5, rng.integers(3, 20))[::-1])
+        zones.append(("zone{0:d}".format(k), rings, rings))
+    # across the date line, the longitudes wrapped to [-180, 180) as in the files
+    # (the hole starts on the other side of the date line than the shell)
+    for k, center in enumerate([[179.0, 10.0], [-179.5, -30.0]]):
+        rings = [star(rng, center, 1.0, 3.0, 40), star(rng, [center[0] + 0.2, center[1]], 0.2, 0.6, 8)[::-1]]
+        wrapped = [r.copy() for r in rings]
+        for r in wrapped:
+            r[:, 0] = (r[:, 0] + 180.0) % 360.0 - 180.0
+        zones.append(("dateline{0:d}".format(k), wrapped, rings))
+    # two shells of one zone (MultiPolygon)
+    rings = [star(rng, [30.0, 40.0], 1.0, 2.0, 12), star(rng, [36.0, 41.0], 1.0, 2.0, 12)]
+    zones.append(("multi", rings, rings))
+    return zones
+
+
+def brute_force(rings, lon, lat):
+    """ points inside an odd number of the rings (continuous longitudes), all points against all rings """
+    center = np.mean(rings[0][:, 0])
+    x = (lon - center + 180.0) % 360.0 - 180.0 + center
+    parity = np.zeros(len(lon), dtype=bool)
+    for r in rings:
+        parity ^= points_in_ring(x, lat, r)
+    return parity
+
+
+def test_classify_cells():
+    rng = np.random.default_rng(1)
+    for name, rings, truth in random_zones(0):
+        zone = stat_keepout.KeepoutZone(name, rings, Ncell=64)
+        ny, nx = zone.shape
+        # 各セルに4点、境界セル以外はセル全体が同じ判定
+        i = np.repeat(np.arange(ny), nx * 4)
+        j = np.tile(np.repeat(np.arange(nx), 4), ny)
+        x = zone.lo[0] + (j + rng.uniform(0.01, 0.99, len(j))) * zone.d[0]
+        y = zone.lo[1] + (i + rng.uniform(0.01, 0.99, len(i))) * zone.d[1]
+        parity = np.zeros(len(x), dtype=bool)
+        for r in zone.rings:
+            parity ^= points_in_ring(x, y, r)
+        state = zone.cell[i, j]
+        assert np.all(parity[state == zone.INSIDE]), name
+        assert not np.any(parity[state == zone.OUTSIDE]), name
+        assert np.count_nonzero(state == zone.INSIDE) > 0, name
+
+
+def test_query_matches_brute_force():
+    zones = random_zones(2)
+    index = stat_keepout.KeepoutIndex([(name, rings) for name, rings, truth in zones])
+    rng = np.random.default_rng(3)
+    lon = np.concatenate([rng.uniform(-180.0, 180.0, 40000), rng.uniform(176.0, 184.0, 5000) % 360.0,
+                          rng.uniform(-184.0, -176.0, 5000), [np.nan, 10.0]])
+    lat = np.concatenate([rng.uniform(-75.0, 75.0, 40000), rng.uniform(5.0, 15.0, 5000),
+                          rng.uniform(-35.0, -25.0, 5000), [0.0, np.nan]])
+    for Ngrid in [256, 17]:
+        hits = index.query(lon, lat, Ngrid)
+        assert list(hits.keys()) == [name for name, rings, truth in zones]
+        finite = np.isfinite(lon) & np.isfinite(lat)
+        for name, rings, truth in zones:
+            expected = np.flatnonzero(brute_force(truth, lon, lat) & finite)
+            assert np.array_equal(hits[name], expected), (name, Ngrid)
+            assert len(expected) > 0, name
+    # the same points given with the longitudes shifted by 360 [deg]
+    hits = index.query(lon + 360.0, lat)
+    for name, rings, truth in zones:
+        assert np.array_equal(hits[name], np.flatnonzero(brute_force(truth, lon, lat) & finite)), name
+
+
+if __name__ == '__main__':
+    test_classify_cells()
+    test_query_matches_brute_force()
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+stat_query test
+
+The reductions over the campaign store (reduceat over the rows of every case)
+are compared with pandas on each case csv, the "sample points" of
+datapoint.json with the legacy reader stat_datapoint.read_case (exact time
+match), and the expressions outside of the allowed nodes are refused.
+
+Copyright (c) 2018 Interstellar Technologies Inc. All Rights Reserved.
+"""
+
+import os
+import sys
+import tempfile
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bin"))
+import campaign_store
+import stat_query
+import stat_datapoint
+from test_campaign_store import suffix, write_campaign
+
+lengths = [30, 45, 17, 60, 1]
+
+
+def test_reductions_match_pandas():
+    with tempfile.TemporaryDirectory() as directory:
+        frames = write_campaign(directory, lengths, events=True)
+        store = campaign_store.build_store(directory, suffix, os.path.join(directory, "store"))
+        # 1行だけのケース、nanを含む列、2回目の無いイベントも含む
+        texts = ["max([vel_NED_Y(m/s)])", "min([vel_NED_Y(m/s)])", "mean([vel_NED_Y(m/s)])",
+                 "first([altitude(m)])", "last([altitude(m)])",
+                 "argmax(hypot([vel_NED_X(m/s)], [vel_NED_Y(m/s)]))", "argmin([vel_NED_Y(m/s)])",
+                 "at_event(sqrt([vel_NED_X(m/s)]**2 + [vel_NED_Y(m/s)]**2), cutoff)",
+                 "at_event([altitude(m)], 'ignition', 2)", "max(where([altitude(m)] > 5e4, 1.0, 0.0))"]
+        cases, results = stat_query.run_queries(store, "dynamics_1", [stat_query.Query(t) for t in texts])
+        assert np.array_equal(cases, np.arange(len(lengths)))
+        for k, df in frames.items():
+            y = df["vel_NED_Y(m/s)"]
+            speed = np.hypot(df["vel_NED_X(m/s)"], y)
+            cutoff = int(np.argmin(df["is_powered(1=powered 0=free)"].to_numpy())) if len(df) > 1 else None
+            expected = [y.max(), y.min(), y.mean(), df["altitude(m)"].iloc[0], df["altitude(m)"].iloc[-1],
+                        df["time(s)"][speed.idxmax()] if speed.notna().any() else np.nan,
+                        df["time(s)"][y.idxmin()] if y.notna().any() else np.nan,
+                        speed.iloc[cutoff] if cutoff else np.nan, np.nan,
+                        float((df["altitude(m)"] > 5e4).any())]
+            for text, value, reference in zip(texts, results, expected):
+                assert np.isclose(value[k], reference, rtol=1e-12, atol=0.0, equal_nan=True), (text, k)
+
+
+def test_sample_points_match_legacy_reader():
+    sample_points = {"5.0": ["altitude(m)", "vel_NED_X(m/s)"], "MECO": ["altitude(m)"], "apogee": ["time(s)"],
+                     "MAX": ["altitude(m)", "dynamic pressure(Pa)"], "landing_time": ["time(s)", "altitude(m)"]}
+    with tempfile.TemporaryDirectory() as directory:
+        write_campaign(directory, [0] + lengths[:4], events=True)
+        store = campaign_store.build_store(directory, suffix, os.path.join(directory, "store"))
+        results = stat_query.evaluate(store, stat_query.load_queries({"sample points": sample_points}))
+        for k, variables in sample_points.items():
+            # case 0 (the nominal run) is not in the results
+            assert np.array_equal(results[k]["caseNo"], [1, 2, 3, 4])
+        for caseNo in [1, 2, 3, 4]:
+            filename = os.path.join(directory, "case{0:05d}_{1:s}_dynamics_1.csv".format(caseNo, suffix))
+            lines = stat_datapoint.read_case(filename, caseNo, sample_points, os.path.join(directory, "tmp.csv"))
+            for line, (k, variables) in zip(lines, sample_points.items()):
+                legacy = [float(v) for v in line.strip().split(",")[1:]]
+                df = results[k]
+                row = df[df["caseNo"] == caseNo][variables].to_numpy()[0]
+                assert np.allclose(row, legacy, rtol=1e-15, atol=0.0, equal_nan=True), (k, caseNo)
+
+
+def test_at_time_interpolation():
+    # 行の時刻と一致しない時刻は線形補間、範囲外はnan
+    time = np.array([0.0, 1.0, 2.5, 4.0, 0.5, 1.5, 10.0, 3.0])
+    x = np.array([1.0, 3.0, 0.0, 6.0, -1.0, 1.0, 5.0, 7.0])
+    offsets = np.array([0, 4, 7, 8])
+    for t in [0.0, 0.4, 1.0, 1.7, 2.5, 4.0, 4.5, 3.0, 10.0, -1.0]:
+        value = stat_query._at_time(x, time, offsets, t)
+        for k in range(3):
+            tk, xk = time[offsets[k]:offsets[k + 1]], x[offsets[k]:offsets[k + 1]]
+            expected = np.interp(t, tk, xk) if tk[0] <= t <= tk[-1] else np.nan
+            assert np.isclose(value[k], expected, rtol=1e-15, atol=0.0, equal_nan=True), (t, k)
+
+
+def test_rejected_expressions():
+    for text in ["max([a].__class__)", "max(__import__('os'))", "max((lambda v: v)([a]))", "max([a][0])",
+                 "max(eval('1'))", "max([v for v in [a]])", "max(np.sqrt([a]))", "sum([a])",
+                 "at_time([a])", "at_event([a], launch)", "max([a] if [b] else [c])"]:
+        try:
+            stat_query.Query(text)
+            assert False, text
+        except (ValueError, SyntaxError):
+            pass
+    q = stat_query.Query("max(arctan2([vel_NED_Y(m/s)], [a]) * 2 + -[a] ** 2)")
+    assert q.columns == ["vel_NED_Y(m/s)", "a"]
+    data = {"vel_NED_Y(m/s)": np.array([1.0, 2.0]), "a": np.array([3.0, -1.0])}
+    assert np.allclose(q.evaluate(data.get, 2), np.arctan2(data["vel_NED_Y(m/s)"], data["a"]) * 2 - data["a"] ** 2)
+    # a constant expression is broadcast to the rows
+    assert np.array_equal(stat_query.Query("first(1.5)").evaluate(data.get, 3), [1.5, 1.5, 1.5])
+
+
+if __name__ == '__main__':
+    test_reductions_match_pandas()
+    test_sample_points_match_legacy_reader()
+    test_at_time_interpolation()
+    test_rejected_expressions()
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+stat_state_covariance test
+
+The Welford / Chan accumulator fed with batches of cases of various sizes
+(one case, empty batches, nan rows), and merged from several accumulators,
+is compared with np.mean and np.cov over the valid rows of all the batches
+concatenated, also for ECI positions of 7000 km with a spread of meters
+where the sum of squares about zero would lose most of the digits.
+
+Copyright (c) 2018 Interstellar Technologies Inc. All Rights Reserved.
+"""
+
+import os
+import sys
+import tempfile
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bin"))
+import campaign_store
+import stat_state_covariance
+from test_campaign_store import suffix, write_campaign
+
+
+def batches(seed, T=12, k=3, offset=0.0, scale=1.0):
+    """ list of (B, T, k) batches, nan where the case is not flying """
+    rng = np.random.default_rng(seed)
+    A = rng.normal(0.0, 1.0, (k, k))
+    out = []
+    for B in [5, 1, 0, 17, 2, 40]:
+        X = offset + scale * rng.normal(0.0, 1.0, (B, T, k)) @ A.T
+        # the first steps before the ignition of some cases, the last after the impact
+        X[rng.random((B, T)) < 0.15] = np.nan
+        X[:, -1, :] = np.nan
+        X[:, -2, :] = np.where(np.arange(B)[:, None] == 0, X[:, -2, :], np.nan)
+        out.append(X)
+    return out
+
+
+def reference(X):
+    """ count, mean and covariance (ddof=1) of the valid rows at every step """
+    T, k = X.shape[1], X.shape[2]
+    count, mean, cov = np.zeros(T), np.full((T, k), np.nan), np.full((T, k, k), np.nan)
+    for t in range(T):
+        rows = X[:, t][np.all(np.isfinite(X[:, t]), axis=1)]
+        count[t] = len(rows)
+        if len(rows) > 0:
+            mean[t] = rows.mean(axis=0)
+        if len(rows) > 1:
+            cov[t] = np.cov(rows, rowvar=False)
+    return count, mean, cov
+
+
+def test_batches_and_merge_match_np_cov():
+    for offset, scale, rtol in [(0.0, 1.0, 1e-12), (7.0e6, 3.0, 1e-8)]:
+        data = batches(0, offset=offset, scale=scale)
+        T, k = data[0].shape[1], data[0].shape[2]
+        count, mean, cov = reference(np.concatenate(data))
+
+        acc = stat_state_covariance.StateCovariance(np.arange(T), ["x", "y", "z"])
+        for X in data:
+            acc.update(X[0] if len(X) == 1 else X)
+        # 3 workers, one of them without any case
+        workers = [stat_state_covariance.StateCovariance(np.arange(T), ["x", "y", "z"]) for w in range(3)]
+        for i, X in enumerate(data):
+            workers[0 if i < 3 else 2].update(X)
+        merged = stat_state_covariance.StateCovariance(np.arange(T), ["x", "y", "z"])
+        for w in workers:
+            merged.merge(w)
+
+        for a in [acc, merged]:
+            assert np.array_equal(a.count, count)
+            assert np.allclose(a.mean[count > 0], mean[count > 0], rtol=1e-14, atol=0.0)
+            assert np.allclose(a.covariance(), cov, rtol=rtol, atol=0.0, equal_nan=True), offset
+            assert np.all(np.isnan(a.covariance()[count < 2]))
+            many = count > 1
+            assert np.allclose(a.covariance(ddof=0)[many], cov[many] * ((count[many] - 1) / count[many])[:, None, None],
+                               rtol=rtol, atol=0.0)
+        # one case of each non empty batch at the step before the last
+        assert count[-1] == 0 and count[-2] == 5
+
+
+def test_accumulate_and_save():
+    with tempfile.TemporaryDirectory() as directory:
+        write_campaign(directory, [30, 45, 17, 60, 25])
+        store = campaign_store.build_store(directory, suffix, os.path.join(directory, "store"))
+        variables = ["altitude(m)", "vel_NED_X(m/s)"]
+        grid = np.arange(-1.0, 32.0, 0.5)
+        acc = stat_state_covariance.accumulate(store, "dynamics_1", variables, grid, batch=2)
+        # the nominal run (case 0) is not taken
+        X = store.resample("dynamics_1", variables, grid)[store.cases("dynamics_1") > 0]
+        count, mean, cov = reference(X)
+        assert np.array_equal(acc.count, count) and count[0] == 0 and count.max() == 4
+        assert np.allclose(acc.covariance(), cov, rtol=1e-10, atol=0.0, equal_nan=True)
+
+        filename = os.path.join(directory, "state_covariance.npz")
+        acc.save(filename)
+        saved = np.load(filename)
+        assert list(saved["variables"]) == variables and np.array_equal(saved["time"], grid)
+        assert np.array_equal(saved["mean"], np.where((count > 0)[:, None], acc.mean, np.nan), equal_nan=True)
+        assert np.array_equal(saved["covariance"], acc.covariance(), equal_nan=True)
+
+
+if __name__ == '__main__':
+    test_batches_and_merge_match_np_cov()
+    test_accumulate_and_save()
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+surrogate test
+
+The leave-one-out residuals in closed form (hat matrix of the ridge
+regression, inverse kernel of the gaussian process) are compared with the
+residuals of the models fitted again without each case, on the features
+standardized once with all the cases as in the closed form.
+
+Copyright (c) 2018 Interstellar Technologies Inc. All Rights Reserved.
+"""
+
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bin"))
+import surrogate
+
+
+def campaign(seed, N=40, d=3):
+    """ inputs (N, d) and two outputs, smooth with some noise """
+    rng = np.random.default_rng(seed)
+    X = rng.normal(0.0, 1.0, (N, d)) * [1.0, 10.0, 0.1] + [0.0, 100.0, -3.0]
+    Y = np.stack([X[:, 0] ** 2 + 0.1 * X[:, 1] - 5.0 * X[:, 0] * X[:, 2],
+                  np.sin(X[:, 0]) + 30.0 * X[:, 2]], axis=1) + rng.normal(0.0, 0.05, (N, 2))
+    return X, Y
+
+
+def test_polynomial_loo_matches_refit():
+    X, Y = campaign(0)
+    N = len(X)
+    for ridge in [1e-6, 1e-2, None]:
+        model = surrogate.PolynomialSurrogate(degree=2, ridge=ridge).fit(X, Y)
+        assert model.degree == 2 and len(model.terms) == 10
+        P = model._features((X - model.mean) / model.scale)
+        for i in range(N):
+            keep = np.arange(N) != i
+            # the same penalty ridge * N on the coefficients
+            A = P[keep].T @ P[keep] + model.ridge * N * np.eye(P.shape[1])
+            coef = np.linalg.solve(A, P[keep].T @ Y[keep])
+            assert np.allclose(model.loo_residual[i], Y[i] - P[i] @ coef, rtol=1e-7, atol=1e-9), (ridge, i)
+    # the chosen ridge has the smallest leave-one-out error of the candidates
+    y_scale = Y.std(axis=0)
+    best = np.mean((model.loo_residual / y_scale) ** 2)
+    for ridge in np.logspace(-8.0, 2.0, 21):
+        other = surrogate.PolynomialSurrogate(degree=2, ridge=ridge).fit(X, Y)
+        assert best <= np.mean((other.loo_residual / y_scale) ** 2) * (1.0 + 1e-12)
+
+    # more terms than the cases: the degree is lowered
+    model = surrogate.PolynomialSurrogate(degree=3).fit(X[:12], Y[:12])
+    assert model.degree == 2
+
+
+def test_gaussian_process_loo_matches_refit():
+    X, Y = campaign(1)
+    N = len(X)
+    model = surrogate.GaussianProcessSurrogate(length_scales=[1.5], noises=[1e-3]).fit(X, Y)
+    Z = (X - model.mean) / model.scale
+    W = (Y - model.y_mean) / model.y_scale
+    K0 = np.exp(-0.5 * np.sum((Z[:, None, :] - Z[None, :, :]) ** 2, axis=2) / 1.5 ** 2)
+    K = K0 + 1e-3 * np.eye(N)
+    for i in range(N):
+        keep = np.arange(N) != i
+        mean = K0[i, keep] @ np.linalg.solve(K[np.ix_(keep, keep)], W[keep])
+        assert np.allclose(model.loo_residual[i], (W[i] - mean) * model.y_scale, rtol=1e-6, atol=1e-9), i
+    # the prediction at the cases is the posterior mean with all the cases
+    assert np.allclose(model.predict(X), (K0 @ np.linalg.solve(K, W)) * model.y_scale + model.y_mean,
+                       rtol=1e-8, atol=1e-8)
+
+
+def test_diagnostics():
+    X, Y = campaign(2)
+    manifest = pd.DataFrame(X, columns=["a", "b", "c"], index=pd.Index(np.arange(1, len(X) + 1), name="caseNo"))
+    targets = pd.DataFrame(Y, columns=["y0", "y1"], index=manifest.index)
+    targets.iloc[3, 0] = np.nan
+    fitted = surrogate.Surrogate(surrogate.PolynomialSurrogate(degree=2)).fit(manifest, targets)
+    assert len(fitted.cases) == len(X) - 1
+    df = fitted.diagnostics()
+    loo = fitted.model.loo_residual
+    for j, name in enumerate(["y0", "y1"]):
+        row = df[df["target"] == name].iloc[0]
+        assert np.isclose(row["LOO RMSE"], np.sqrt(np.mean(loo[:, j] ** 2)))
+        assert np.isclose(row["LOO R2"], 1.0 - np.mean(loo[:, j] ** 2) / np.var(fitted.Y[:, j]))
+        assert row["LOO R2"] > 0.9, name
+
+
+if __name__ == '__main__':
+    test_polynomial_loo_matches_refit()
+    test_gaussian_process_loo_matches_refit()
+    test_diagnostics()
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+timeline test
+
+The extend columns of the stitched stages and dumping products are compared
+with the columns of each body computed on its own.
+
+Copyright (c) 2018 Interstellar Technologies Inc. All Rights Reserved.
+"""
+
+import os
+import sys
+import tempfile
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bin"))
+import timeline
+from make_extend_output_mc import extend_columns, extend_timeline
+from test_coordinate_transform import flight_states
+
+columns = ["time(s)", "mass(kg)", "thrust(N)", "lat(deg)", "lon(deg)", "altitude(m)",
+           "pos_ECI_X(m)", "pos_ECI_Y(m)", "pos_ECI_Z(m)", "vel_ECI_X(m/s)", "vel_ECI_Y(m/s)", "vel_ECI_Z(m/s)",
+           "vel_NED_X(m/s)", "vel_NED_Y(m/s)", "vel_NED_Z(m/s)", "attitude_elevation(deg)", "is_powered(1=powered 0=free)"]
+
+
+def body_frame(N, seed, powered=True):
+    t, llh, ecef, eci, vel, thrust, mass = flight_states(N, seed)
+    values = np.column_stack([t, mass, thrust if powered else 0.0 * thrust, llh, eci, vel, vel,
+                              np.linspace(80.0, 20.0, N), np.full(N, int(powered))])
+    df = pd.DataFrame(values, columns=columns)
+    df["is_powered(1=powered 0=free)"] = df["is_powered(1=powered 0=free)"].astype(int)
+    return df
+
+
+def write_flight(directory):
+    frames = {"dynamics_1": body_frame(50, 0), "dynamics_1_dump": body_frame(30, 1, False),
+              "dynamics_2": body_frame(40, 2)}
+    for body, df in frames.items():
+        df.to_csv(os.path.join(directory, "rocket_" + body + ".csv"), index=False)
+    # the dumping product of the last stage of a previous run is not part of a two stage flight
+    frames["dynamics_2"].to_csv(os.path.join(directory, "rocket_dynamics_3.csv"), index=False)
+    return frames
+
+
+def test_stage_count():
+    data = {"stage1": {"stage": {"following stage exist?(bool)": True}},
+            "stage2": {"stage": {"following stage exist?(bool)": False}},
+            "stage3": {"stage": {"following stage exist?(bool)": False}}}
+    assert timeline.stage_count(data) == 2
+    data["stage2"]["stage"]["following stage exist?(bool)"] = True
+    assert timeline.stage_count(data) == 3
+    assert timeline.stage_count({"stage1": {"stage": {"following stage exist?(bool)": True}}}) == 1
+
+
+def test_stitched_extend_matches_bodies():
+    posLLH_antenna = np.array([42.5039248, 143.44954216, 25.0])
+    with tempfile.TemporaryDirectory() as directory:
+        frames = write_flight(directory)
+        stitched = timeline.load_timeline("rocket", 2, directory)
+    assert stitched.bodies == ["dynamics_1", "dynamics_1_dump", "dynamics_2"]
+    assert np.array_equal(stitched.offsets, [0, 50, 80, 120])
+    assert np.array_equal(stitched.split(stitched.body)[1], np.ones(30))
+    order = stitched.time_order()
+    assert np.all(np.diff(stitched.column("time(s)")[order]) >= 0.0)
+    extended = extend_timeline(stitched, posLLH_antenna, 2.0)
+    for body, read, df in zip(stitched.bodies, stitched.frames, extended):
+        assert np.allclose(read.to_numpy(dtype=np.float64), frames[body].to_numpy(dtype=np.float64), rtol=1e-15)
+        values = read.to_numpy(dtype=np.float64)
+        expected = extend_columns(values, values[:, 15], posLLH_antenna, 2.0)
+        assert list(df.columns) == columns + list(expected.keys())
+        assert df["is_powered(1=powered 0=free)"].dtype == np.int64
+        for name, value in expected.items():
+            assert np.array_equal(df[name].to_numpy(), value)
+
+
+if __name__ == '__main__':
+    test_stage_count()
+    test_stitched_extend_matches_bodies()
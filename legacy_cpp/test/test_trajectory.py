@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+trajectory test
+
+The derived columns are compared with make_extend_output_mc.extend_columns,
+and only the groups asked for are computed, once per csv, parameters and
+version of the group.
+
+Copyright (c) 2018 Interstellar Technologies Inc. All Rights Reserved.
+"""
+
+import os
+import sys
+import tempfile
+from collections import OrderedDict
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bin"))
+import trajectory
+from make_extend_output_mc import extend_columns
+from rf_link import DATA_2D, tautr, recv_power
+from test_timeline import body_frame
+
+antenna_LLH = np.array([42.5039248, 143.44954216, 25.0])
+stations = (["Taiki", "Sea"], np.array([[42.5039248, 143.44954216, 25.0], [41.0, 146.0, 0.0]]))
+
+
+def write_csv(directory, seed=0):
+    df = body_frame(60, seed)
+    df["attitude_azimuth(deg)"] = np.linspace(90.0, 120.0, len(df))
+    filename = os.path.join(directory, "rocket_dynamics_1.csv")
+    df.to_csv(filename, index=False)
+    return filename
+
+
+def write_gain(filename, x_grid, y_grid, seed):
+    data = np.random.default_rng(seed).normal(0.0, 5.0, (len(y_grid), len(x_grid)))
+    with open(filename, "w") as fp:
+        fp.write("gain\n")
+        fp.write("deg," + ",".join(str(x) for x in x_grid) + "\n")
+        for y, row in zip(y_grid, data):
+            fp.write(str(y) + "," + ",".join(str(v) for v in row) + "\n")
+
+
+def test_columns_match_extend_and_are_cached():
+    with tempfile.TemporaryDirectory() as directory:
+        filename = write_csv(directory)
+        traj = trajectory.Trajectory(filename, antenna_LLH=antenna_LLH, cutoff_time=2.0, stations=stations)
+        values = traj.frame.to_numpy(dtype=np.float64)
+        expected = extend_columns(values, traj["attitude_elevation(deg)"], antenna_LLH, 2.0, stations, kepler=True)
+        assert np.array_equal(traj["IIP radius(m)"], expected["IIP radius(m)"])
+        assert traj.computed == ["IIP radius"]
+        for name, value in expected.items():
+            assert np.array_equal(traj[name], value, equal_nan=True)
+        assert traj.computed == ["IIP radius", "antenna", "stations", "kepler IIP"]
+
+        again = trajectory.Trajectory(filename, antenna_LLH=antenna_LLH, cutoff_time=2.0, stations=stations)
+        assert np.array_equal(again["Sea elevation(deg)"], expected["Sea elevation(deg)"])
+        assert again.computed == [] and again.loaded == ["stations"]
+
+        # other parameters or another csv are computed again
+        other = trajectory.Trajectory(filename, antenna_LLH=antenna_LLH, cutoff_time=3.0, stations=stations)
+        other["IIP radius(m)"]
+        other["distance 2d(m)"]
+        assert other.computed == ["IIP radius"] and other.loaded == ["antenna"]
+        filename = write_csv(directory, seed=1)
+        changed = trajectory.Trajectory(filename, antenna_LLH=antenna_LLH, cutoff_time=2.0)
+        changed["distance 2d(m)"]
+        assert changed.computed == ["antenna"]
+
+
+def test_received_power_and_unknown_columns():
+    with tempfile.TemporaryDirectory() as directory:
+        filename = write_csv(directory)
+        write_gain(os.path.join(directory, "vhcl.csv"), np.arange(-10.0, 200.0, 10.0), np.arange(-30.0, 400.0, 30.0), 0)
+        write_gain(os.path.join(directory, "grnd.csv"), np.arange(-10.0, 200.0, 5.0), [-1.0, 1.0], 1)
+        rf = {"name(str)": "S", "antenna_lat(deg)": 42.5, "antenna_lon(deg)": 143.45, "antenna_alt(m)": 25.0,
+              "antenna_elv(deg)": 40.0, "antenna_azi(deg)": 120.0, "freq(Hz)": 2.2e9, "loss(dB)": 3.0,
+              "power(dBm)": 30.0, "gain_vhcl(str)": os.path.join(directory, "vhcl.csv"),
+              "gain_grnd(str)": os.path.join(directory, "grnd.csv")}
+        traj = trajectory.Trajectory(filename, rf=rf)
+        power = traj["received power(dB)"]
+        assert traj.computed == ["received power"]
+        # row by row as make_rfprop.py did
+        for k in [0, 17, 59]:
+            rocket_LLH = np.array([traj["lat(deg)"][k], traj["lon(deg)"][k], traj["altitude(m)"][k]])
+            dis2, dis3, az, el = trajectory.antenna_param(np.array([42.5, 143.45, 25.0]), rocket_LLH)
+            tau = tautr(el, az, traj["attitude_elevation(deg)"][k], traj["attitude_azimuth(deg)"][k], 0, 40.0, 120.0)
+            row = recv_power(2.2e9, 3.0, 30.0, dis3, DATA_2D(rf["gain_vhcl(str)"]), tau[0], tau[1],
+                             DATA_2D(rf["gain_grnd(str)"]), tau[2])
+            assert np.isclose(power[k], row, rtol=0.0, atol=1e-9)
+        # a changed gain table is not taken from the cache
+        write_gain(rf["gain_grnd(str)"], np.arange(-10.0, 200.0, 5.0), [-1.0, 1.0], 2)
+        changed = trajectory.Trajectory(filename, rf=rf)
+        assert not np.array_equal(changed["received power(dB)"], power)
+        assert changed.computed == ["received power"]
+        assert "IIP radius(m)" not in traj and "received power(dB)" in traj
+        try:
+            traj["IIP radius(m)"]
+            assert False
+        except KeyError:
+            pass
+
+
+
+def test_group_version_in_cache_key():
+    with tempfile.TemporaryDirectory() as directory:
+        filename = write_csv(directory)
+
+        def doubled(traj, cutoff_time):
+            return OrderedDict([("doubled time(s)", 2.0 * traj["time(s)"] + cutoff_time)])
+        try:
+            trajectory.register("test doubled", ["doubled time(s)"], ["cutoff_time"])(doubled)
+            first = trajectory.Trajectory(filename, cutoff_time=1.0)
+            key = first.cache_key("test doubled")
+            first["doubled time(s)"]
+            assert first.computed == ["test doubled"]
+
+            # the same version is loaded, a new version of the function is computed again
+            again = trajectory.Trajectory(filename, cutoff_time=1.0)
+            again["doubled time(s)"]
+            assert again.loaded == ["test doubled"]
+            trajectory.register("test doubled", ["doubled time(s)"], ["cutoff_time"], version=2)(
+                lambda traj, cutoff_time: OrderedDict([("doubled time(s)", 2.0 * traj["time(s)"] - cutoff_time)]))
+            changed = trajectory.Trajectory(filename, cutoff_time=1.0)
+            assert changed.cache_key("test doubled") != key
+            assert np.array_equal(changed["doubled time(s)"], 2.0 * changed["time(s)"] - 1.0)
+            assert changed.computed == ["test doubled"] and changed.loaded == []
+        finally:
+            del trajectory.registry["test doubled"]
+
+
+if __name__ == '__main__':
+    test_columns_match_extend_and_are_cached()
+    test_received_power_and_unknown_columns()
+    test_group_version_in_cache_key()
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+visibility test
+
+The AOS/LOS refined within coarse output steps are compared with the mask
+crossings of the same chords sampled finely. Non-finite rows inside a
+visible run close the window at the last finite row and open another at the
+first finite row after them.
+
+Copyright (c) 2018 Interstellar Technologies Inc. All Rights Reserved.
+"""
+
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bin"))
+import coordinate_transform as ct
+import visibility
+
+stations_LLH = np.array([[42.5039248, 143.44954216, 25.0], [41.0, 146.0, 0.0]])
+stations = [{"name": "Taiki", "LLH[deg,deg,m]": list(stations_LLH[0]),
+             "terrain mask[deg,deg]": [[350.0, 10.0], [10.0, 0.0], [120.0, 6.0]]},
+            {"name": "Sea", "LLH[deg,deg,m]": list(stations_LLH[1]), "mask elevation(deg)": 5.0,
+             "terrain mask[deg,deg]": [[0.0, 0.0], [318.0, 0.0], [322.0, 60.0], [326.0, 0.0]]}]
+
+
+def trajectories(step):
+    """ three cases of lofted flights from near the first station, rows every step [s] """
+    time, llh, offsets = [], [], [0]
+    for duration, lat_rate, lon_rate in [(600.0, -1.5e-3, 3.5e-3), (420.0, -0.5e-3, 5.0e-3), (500.0, 1.0e-3, 2.0e-3)]:
+        t = np.arange(0.0, duration + 1e-9, step)
+        altitude = 4.0 * 300e3 * t / duration * (1.0 - t / duration)
+        llh.append(np.stack([42.51 + lat_rate * t, 143.46 + lon_rate * t, altitude + 10.0], axis=1))
+        time.append(t)
+        offsets.append(offsets[-1] + len(t))
+    return np.concatenate(time), np.array(offsets), ct.posECEF_from_LLH(np.concatenate(llh))
+
+
+def densify(time, offsets, ecef, n):
+    """ n points on every chord between the rows of the cases """
+    x = np.arange(n) / n
+    dense_time, dense_ecef, dense_offsets = [], [], [0]
+    for k in range(len(offsets) - 1):
+        t, p = time[offsets[k]:offsets[k + 1]], ecef[offsets[k]:offsets[k + 1]]
+        dense_time.append(np.append((t[:-1, None] + x * np.diff(t)[:, None]).reshape(-1), t[-1]))
+        dense_ecef.append(np.append((p[:-1, None, :] + x[:, None] * np.diff(p, axis=0)[:, None, :]).reshape(-1, 3),
+                                    p[-1:], axis=0))
+        dense_offsets.append(dense_offsets[-1] + len(dense_time[-1]))
+    return np.concatenate(dense_time), np.array(dense_offsets), np.concatenate(dense_ecef)
+
+
+def test_terrain_mask_wraps_around_north():
+    mask, terrain = visibility.station_masks(stations, 3.0)
+    assert np.array_equal(mask, [3.0, 5.0])
+    value = terrain(np.array([0.0, 5.0, 355.0, 180.0, 65.0]), np.zeros(5, dtype=np.int64))
+    assert np.allclose(value, [5.0, 2.5, 7.5, 6.0 + 4.0 * 60.0 / 230.0, 3.0])
+    value = terrain(np.array([0.0, 320.0, 322.0, 330.0]), np.ones(4, dtype=np.int64))
+    assert np.allclose(value, [0.0, 30.0, 60.0, 0.0])
+
+
+def test_windows_match_fine_sampling():
+    mask, terrain = visibility.station_masks(stations, 3.0)
+    time, offsets, ecef = trajectories(10.0)
+    coarse = visibility.pass_windows(time, offsets, ecef, stations_LLH, mask, terrain)
+    fine = visibility.pass_windows(*densify(time, offsets, ecef, 1000), stations_LLH=stations_LLH, mask=mask,
+                                   terrain=terrain)
+    # the terrain wedge of the second station splits its passes in two
+    assert np.array_equal(coarse["pass"], [1, 1, 1, 1, 2, 1, 2, 1, 2])
+    for name in ["station", "case index", "pass"]:
+        assert np.array_equal(coarse[name], fine[name])
+    assert np.allclose(coarse["AOS(s)"], fine["AOS(s)"], rtol=0.0, atol=1e-3)
+    assert np.allclose(coarse["LOS(s)"], fine["LOS(s)"], rtol=0.0, atol=1e-3)
+    assert np.allclose(coarse["AOS azimuth(deg)"], fine["AOS azimuth(deg)"], rtol=0.0, atol=1e-3)
+    assert np.all(coarse["max elevation(deg)"] <= fine["max elevation(deg)"] + 1e-9)
+    # a case starting visible opens a window at its first row
+    late = visibility.pass_windows(time[10:offsets[1]], np.array([0, offsets[1] - 10]), ecef[10:offsets[1]],
+                                   stations_LLH, mask, terrain)
+    assert late["AOS(s)"][0] == time[10]
+    assert np.isclose(late["LOS(s)"][0], coarse["LOS(s)"][0])
+
+
+def test_statistics_of_cases_without_pass():
+    mask, terrain = visibility.station_masks(stations, 3.0)
+    time, offsets, ecef = trajectories(10.0)
+    windows = visibility.pass_windows(time, offsets, ecef, stations_LLH, mask, terrain)
+    table = visibility.pd.DataFrame(windows)
+    table["station"] = np.array(["Taiki", "Sea"], dtype=object)[table["station"]]
+    table = table.rename(columns={"case index": "caseNo"})
+    stats = visibility.pass_statistics(table, ["Taiki", "Sea", "None"], np.arange(3))
+    row = stats[(stats["station"] == "None") & (stats["quantity"] == "passes")].iloc[0]
+    assert row["cases"] == 3 and row["100%"] == 0.0
+    row = stats[(stats["station"] == "None") & (stats["quantity"] == "first AOS(s)")].iloc[0]
+    assert row["cases"] == 0 and np.isnan(row["mean"])
+
+
+def test_non_finite_rows_split_the_window():
+    mask, terrain = visibility.station_masks(stations, 3.0)
+    time, offsets, ecef = trajectories(10.0)
+    coarse = visibility.pass_windows(time, offsets, ecef, stations_LLH[:1], mask[:1], terrain)
+    # rows 4-5 of case 0 nan, at the end of the first case of two
+    llh = ecef[:10].copy()
+    llh[4:6] = np.nan
+    windows = visibility.pass_windows(time[:10], np.array([0, 6, 10]), llh, stations_LLH[:1], mask[:1], terrain)
+    assert np.array_equal(windows["case index"], [0, 1])
+    assert np.allclose(windows["AOS(s)"], [coarse["AOS(s)"][0], time[6]])
+    assert np.allclose(windows["LOS(s)"], [time[3], time[9]])
+    assert len(visibility.pd.DataFrame(windows)) == 2
+
+    # inside the case: the window closes before the gap and opens again after it
+    llh = ecef.copy()
+    llh[4:6] = np.nan
+    llh[offsets[2] - 1] = np.nan
+    windows = visibility.pass_windows(time, offsets, llh, stations_LLH[:1], mask[:1], terrain)
+    assert np.array_equal(windows["case index"], [0, 0, 1, 2]) and np.array_equal(windows["pass"], [1, 2, 1, 1])
+    assert np.allclose(windows["AOS(s)"], [coarse["AOS(s)"][0], time[6], coarse["AOS(s)"][1], coarse["AOS(s)"][2]])
+    assert np.allclose(windows["LOS(s)"], [time[3], coarse["LOS(s)"][0], time[offsets[2] - 2], coarse["LOS(s)"][2]])
+
+
+if __name__ == '__main__':
+    test_terrain_mask_wraps_around_north()
+    test_windows_match_fine_sampling()
+    test_statistics_of_cases_without_pass()
+    test_non_finite_rows_split_the_window()